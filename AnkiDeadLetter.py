@@ -0,0 +1,225 @@
+import argparse
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+import os
+from pathlib import Path
+import sys
+from typing import Any, Dict, List, Optional, Tuple
+
+from AnkiSync import invoke
+from utils import backends, media_index, notes, retry
+from utils.apkg import DeckPackage
+from utils.common import AUDIO_DIR, IMAGE_DIR
+from utils.notes import Note
+
+DEFAULT_REPLAY_WORKERS = 4
+MEDIA_KINDS = {"audio": "audio", "images": "image"}
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Inspect and replay cards the media scripts recorded as failed."
+    )
+    parser.add_argument(
+        "--file",
+        type=Path,
+        default=retry.DEAD_LETTER_PATH,
+        help="Dead-letter file to read (default: media/dead_letter.jsonl).",
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    for name, help_text in (
+        ("list", "Show the failed cards and why they failed."),
+        ("replay", "Reprocess only the failed cards; the ones that succeed are removed from the file."),
+    ):
+        subparser = subparsers.add_parser(name, help=help_text)
+        subparser.add_argument("--script", choices=sorted(MEDIA_KINDS), help="Only cards from this script.")
+        subparser.add_argument("--deck", help="Only cards from this deck.")
+        subparser.add_argument(
+            "--retryable-only",
+            action="store_true",
+            help="Only cards whose last error looked transient.",
+        )
+        if name == "replay":
+            subparser.add_argument(
+                "--workers",
+                type=int,
+                default=DEFAULT_REPLAY_WORKERS,
+                help="Cards reprocessed at the same time (default: %(default)s).",
+            )
+            subparser.add_argument(
+                "--attempts",
+                type=int,
+                default=retry.DEFAULT_ATTEMPTS,
+                help="Tries per card for transient errors (default: %(default)s).",
+            )
+    return parser.parse_args()
+
+
+def select_entries(
+    entries: List[Dict[str, Any]],
+    script: Optional[str] = None,
+    deck: Optional[str] = None,
+    retryable_only: bool = False,
+) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """Split entries into ``(selected, untouched)``."""
+    selected, untouched = [], []
+    for entry in entries:
+        if (
+            (script is None or entry.get("script") == script)
+            and (deck is None or entry.get("deck") == deck)
+            and (not retryable_only or entry.get("retryable"))
+        ):
+            selected.append(entry)
+        else:
+            untouched.append(entry)
+    return selected, untouched
+
+
+def current_cards(note_ids: List[int], package: Optional[DeckPackage]) -> Dict[int, Note]:
+    """The notes as they are now, so a replay never writes back stale text."""
+    infos = package.notes_info(note_ids) if package is not None else invoke("notesInfo", notes=note_ids)
+    return {note.note_id: note for note in notes.from_notes_info(infos)}
+
+
+def replay_card(
+    entry: Dict[str, Any], card: Tuple[int, str, str], api_key: str, package: Optional[DeckPackage]
+) -> Tuple[str, str, Any]:
+    # Imported here because both scripts import ``invoke`` from AnkiSync, as this one does.
+    import AnkiDeckToImages as image_script
+    import AnkiDeckToSpeech as speech_script
+
+    options = entry.get("options") or {}
+    inline = package is not None or bool(options.get("inline_media"))
+    if entry["script"] == "audio":
+        return speech_script.process_card(
+            card,
+            api_key,
+            options.get("model", speech_script.DEFAULT_MODEL),
+            options.get("voice", speech_script.DEFAULT_VOICE),
+            options.get("instructions", speech_script.DEFAULT_INSTRUCTIONS),
+            package,
+            inline,
+            bool(options.get("cache_media")),
+        )
+    return image_script.process_card(
+        card,
+        api_key,
+        options.get("image_model", image_script.DEFAULT_IMAGE_MODEL),
+        options.get("prompt", image_script.DEFAULT_PROMPT),
+        bool(options.get("skip_gating")),
+        package,
+        # The card already passed gating if it failed while generating.
+        gating_decision=True if entry.get("stage") == "generation" else None,
+        inline=inline,
+        # A --draft run records its draft size and quality here.
+        image_options=options.get("image_options"),
+        cache_local=bool(options.get("cache_media")),
+    )
+
+
+def replay(
+    entries: List[Dict[str, Any]], workers: int = DEFAULT_REPLAY_WORKERS
+) -> Tuple[Dict[str, int], List[Dict[str, Any]]]:
+    """Reprocess ``entries``; return counts and the entries that still fail."""
+    counts = {"resolved": 0, "failed": 0, "dropped": 0}
+    still_failing: List[Dict[str, Any]] = []
+    groups: Dict[Tuple[Any, ...], List[Dict[str, Any]]] = defaultdict(list)
+    for entry in entries:
+        backend_name = (entry.get("options") or {}).get("backend", backends.DEFAULT_BACKEND)
+        groups[(entry.get("apkg"), backend_name)].append(entry)
+
+    for (apkg, backend_name), group in groups.items():
+        api_key = os.environ.get("OPENAI_API_KEY", "")
+        if not api_key and backends.requires_api_key(backend_name):
+            sys.exit("Environment variable OPENAI_API_KEY is not set.")
+        package = None
+        if apkg:
+            if not Path(apkg).exists():
+                print(f"Package {apkg} not found; keeping its {len(group)} card(s).")
+                still_failing.extend(group)
+                counts["failed"] += len(group)
+                continue
+            package = DeckPackage.load(Path(apkg))
+        index = None
+        if package is None:
+            AUDIO_DIR.mkdir(parents=True, exist_ok=True)
+            IMAGE_DIR.mkdir(parents=True, exist_ok=True)
+            index = media_index.enable(media_index.INDEX_PATH)
+        cards = current_cards([entry["note_id"] for entry in group], package)
+        runnable = []
+        for entry in group:
+            if entry["note_id"] in cards:
+                runnable.append(entry)
+            else:
+                print(f"Note {entry['note_id']} no longer exists; dropping it.")
+                counts["dropped"] += 1
+
+        with backends.selected(backend_name, api_key), ThreadPoolExecutor(
+            max_workers=max(1, min(workers, len(runnable) or 1))
+        ) as executor:
+            results = list(
+                executor.map(
+                    lambda entry: replay_card(entry, cards[entry["note_id"]], api_key, package), runnable
+                )
+            )
+        resolved = 0
+        for entry, (status, text, error) in zip(runnable, results):
+            if status == "error":
+                print(f"Still failing ({entry['script']}): {text} ({error})")
+                counts["failed"] += 1
+                details = {
+                    key: entry.get(key) for key in ("deck", "options", "apkg", "stage", "fingerprint")
+                }
+                updated = retry.dead_letter_entry(entry["script"], cards[entry["note_id"]], error, **details)
+                updated["attempts"] += entry.get("attempts", 1)
+                still_failing.append(updated)
+                continue
+            print(f"Replayed {entry['script']} for: {text} ({status})")
+            resolved += 1
+            if index is not None and entry.get("fingerprint") and status in ("added", "skip"):
+                fingerprint = entry["fingerprint"]
+                if status == "added" and (entry.get("options") or {}).get("image_options"):
+                    fingerprint = media_index.draft_fingerprint(fingerprint)
+                index.set_fingerprint(MEDIA_KINDS[entry["script"]], entry["note_id"], fingerprint)
+        if index is not None:
+            media_index.enable(None)
+        counts["resolved"] += resolved
+        if package is not None and resolved:
+            package.write(Path(apkg))
+            print(f"Wrote package: {apkg}")
+    return counts, still_failing
+
+
+def main() -> None:
+    args = parse_args()
+    dead_letters = retry.DeadLetterFile(args.file)
+    selected, untouched = select_entries(
+        dead_letters.entries(), args.script, args.deck, args.retryable_only
+    )
+    if not selected:
+        print(f"No failed cards recorded in {args.file}.")
+        return
+
+    if args.command == "list":
+        for entry in selected:
+            stage = f"/{entry['stage']}" if entry.get("stage") else ""
+            kind = "retryable" if entry.get("retryable") else "permanent"
+            print(
+                f"{entry['script']}{stage}  {entry.get('deck')}  note {entry['note_id']}  "
+                f"{entry.get('failed_at', '')}  {kind}, {entry.get('attempts', 1)} attempt(s): {entry.get('error')}"
+            )
+        retryable = sum(1 for entry in selected if entry.get("retryable"))
+        print(f"{len(selected)} failed card(s): {retryable} retryable, {len(selected) - retryable} permanent.")
+        return
+
+    retry.configure(args.attempts)
+    counts, still_failing = replay(selected, workers=args.workers)
+    dead_letters.rewrite(untouched + still_failing)
+    print(
+        f"Replay finished: {counts['resolved']} resolved, {counts['failed']} still failing, "
+        f"{counts['dropped']} dropped (note deleted)."
+    )
+
+
+if __name__ == "__main__":
+    main()
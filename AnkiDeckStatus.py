@@ -0,0 +1,56 @@
+import argparse
+import json
+from typing import Any, Dict, List, Optional
+
+from AnkiSync import invoke
+from utils.coverage import deck_coverage
+
+COLUMNS = (
+    ("total", "Notes"),
+    ("with_audio", "Audio"),
+    ("with_images", "Images"),
+    ("missing_both", "Neither"),
+)
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description=(
+            "Show how many notes in each deck have audio, images or neither, counted with "
+            "Anki searches (no note contents are downloaded)."
+        )
+    )
+    parser.add_argument("decks", nargs="*", help="Decks to report (default: every deck).")
+    parser.add_argument(
+        "--missing-only",
+        action="store_true",
+        help="Only list decks with notes that still lack audio or images.",
+    )
+    parser.add_argument("--json", action="store_true", help="Print the counts as JSON.")
+    return parser.parse_args(argv)
+
+
+def format_table(rows: List[Dict[str, Any]]) -> str:
+    width = max([len("Deck")] + [len(row["deck"]) for row in rows])
+    lines = ["  ".join([f"{'Deck':<{width}}"] + [f"{title:>7}" for _, title in COLUMNS])]
+    for row in rows:
+        lines.append("  ".join([f"{row['deck']:<{width}}"] + [f"{row[key]:>7}" for key, _ in COLUMNS]))
+    return "\n".join(lines)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    args = parse_args(argv)
+    rows = deck_coverage(invoke, args.decks or None)
+    if args.missing_only:
+        rows = [row for row in rows if row["missing_audio"] or row["missing_images"]]
+    if args.json:
+        print(json.dumps(rows, ensure_ascii=False, indent=2))
+        return
+    if not rows:
+        print("No decks to report.")
+        return
+    print(format_table(rows))
+
+
+if __name__ == "__main__":
+    main()
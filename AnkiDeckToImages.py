@@ -1,23 +1,45 @@
 import argparse
 import base64
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+import hashlib
+import heapq
+import itertools
+import json
 import os
 from pathlib import Path
-from typing import Any, List, Tuple
-
-from openai import OpenAI
+import signal
+import threading
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional, Tuple
 
 from AnkiSync import invoke
-from utils.common import (
-    BASE_DIR,
-    IMAGE_DIR,
-    HTML_TAG_RE,
-    IMG_TAG_RE,
+from utils import backends, costs, gating_filter, hedging, media_index, metrics, notes, retry, scheduling, tracing
+from utils.apkg import DeckPackage
+from utils.backends import (
+    DEFAULT_GATING_MODEL,
+    build_gating_payload,
+    parse_gating_decision,
+    parse_group_gating_decisions,
+    record_response_usage,
 )
-IMAGE_DIR.mkdir(parents=True, exist_ok=True)
+from utils.batch import DEFAULT_POLL_INTERVAL, BatchJob, response_text_from_body, state_path_for
+from utils.common import BASE_DIR, IMAGE_DIR
+from utils.notes import Note, strip_image_tags
+
+if TYPE_CHECKING:
+    import openai
+
 DEFAULT_MAX_WORKERS = 3
-GATING_PROMPT_ID = "pmpt_69194beaad7c819497842682bad97629040fc2c239b73233"
-GATING_PROMPT_VERSION = "4"
+DEFAULT_GATING_WORKERS = 10
+DEFAULT_IMAGE_MODEL = "gpt-image-1"
+DRAFT_SIZE = "1024x1024"
+DRAFT_QUALITY = "low"
+# Estimated size of a gating request beyond the card text, and of its answer.
+GATING_OVERHEAD_TOKENS = 300
+GATING_OUTPUT_TOKENS = 10
+DEFAULT_PROMPT = (
+    "Generate a memory aid illustration for this Anki flashcard concept: {text}. "
+    "Do not include any words or letters. Favor stylized anime/cartoon aesthetics, not photorealism."
+)
 
 
 def parse_args() -> argparse.Namespace:
@@ -27,233 +49,1068 @@ def parse_args() -> argparse.Namespace:
     parser.add_argument("deck", help="Name of the Anki deck to process.")
     parser.add_argument(
         "--image-model",
-        default="gpt-image-1",
+        default=DEFAULT_IMAGE_MODEL,
         help="Image generation model to use (default: %(default)s).",
     )
     parser.add_argument(
         "--prompt",
-        default=(
-            "Generate a memory aid illustration for this Anki flashcard concept: {text}. "
-            "Do not include any words or letters. Favor stylized anime/cartoon aesthetics, not photorealism."
-        ),
+        default=DEFAULT_PROMPT,
         help="Template used for image generation; {text} is replaced with the back of the card.",
     )
     parser.add_argument(
         "--workers",
         type=int,
         default=int(os.environ.get("ANKI_IMAGE_WORKERS", str(DEFAULT_MAX_WORKERS))),
-        help="Maximum number of concurrent generations (default: %(default)s).",
+        help="Maximum number of concurrent image generations (default: %(default)s).",
+    )
+    parser.add_argument(
+        "--gating-workers",
+        type=int,
+        default=int(os.environ.get("ANKI_GATING_WORKERS", str(DEFAULT_GATING_WORKERS))),
+        help="Maximum number of concurrent gating checks, independent of --workers (default: %(default)s).",
     )
     parser.add_argument(
         "--skip-gating",
         action="store_true",
         help="Generate images for every eligible card without the gating check.",
     )
+    parser.add_argument(
+        "--gating-group-size",
+        type=int,
+        default=int(os.environ.get("ANKI_GATING_GROUP_SIZE", "0")),
+        help=(
+            "Gate this many cards per request with a structured-output prompt instead of one "
+            "request per card; 0 keeps per-card gating (default: %(default)s)."
+        ),
+    )
+    parser.add_argument(
+        "--prefilter-threshold",
+        type=float,
+        default=float(os.environ.get("ANKI_PREFILTER_THRESHOLD", str(gating_filter.DEFAULT_THRESHOLD))),
+        help=(
+            "Confidence needed for the local pre-filter to answer a gating check without an API "
+            "call; 1.0 disables it (default: %(default)s)."
+        ),
+    )
+    parser.add_argument(
+        "--no-gating-history",
+        action="store_true",
+        help="Do not record remote gating decisions for training the local pre-filter.",
+    )
+    parser.add_argument(
+        "--gating-model",
+        default=DEFAULT_GATING_MODEL,
+        help="Model used for grouped gating requests (default: %(default)s).",
+    )
+    parser.add_argument(
+        "--draft",
+        action="store_true",
+        help=(
+            "Attach fast low-quality drafts first, then regenerate them at full quality in a "
+            "priority-ordered upgrade pass (Ctrl-C cancels the upgrade and keeps the drafts)."
+        ),
+    )
+    parser.add_argument(
+        "--draft-size",
+        default=DRAFT_SIZE,
+        help="Image size requested for drafts (default: %(default)s).",
+    )
+    parser.add_argument(
+        "--draft-quality",
+        default=DRAFT_QUALITY,
+        help="Image quality requested for drafts (default: %(default)s).",
+    )
+    parser.add_argument(
+        "--no-upgrade",
+        action="store_true",
+        help="With --draft, stop after the draft pass.",
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Process every card, even when its text, model and prompt are unchanged since the last run.",
+    )
+    parser.add_argument(
+        "--inline-media",
+        action="store_true",
+        default=os.environ.get("ANKI_INLINE_MEDIA") == "1",
+        help=(
+            "Send images to AnkiConnect as base64 data instead of a local file path, so Anki "
+            "can run on another host (default: on when ANKI_INLINE_MEDIA=1)."
+        ),
+    )
+    parser.add_argument(
+        "--cache-media",
+        action="store_true",
+        help="With --inline-media, also keep a local copy for the gallery and media index.",
+    )
+    parser.add_argument(
+        "--order",
+        choices=scheduling.ORDER_CHOICES,
+        default=os.environ.get("ANKI_MEDIA_ORDER", "deck"),
+        help=(
+            "Process cards in deck order or by upcoming review: learning, due reviews, then new "
+            "cards in the order Anki will introduce them (default: %(default)s)."
+        ),
+    )
+    parser.add_argument(
+        "--max-seconds",
+        type=float,
+        help=(
+            "Stop starting new cards (and upgrades) after this many seconds; in-flight "
+            "cards still finish."
+        ),
+    )
+    parser.add_argument(
+        "--max-cost",
+        type=float,
+        help=(
+            "Stop starting new cards (and upgrades) once the run's estimated OpenAI spend "
+            "reaches this many dollars; in-flight cards still finish."
+        ),
+    )
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="Print the projected spend for the deck and exit without calling OpenAI.",
+    )
+    parser.add_argument(
+        "--apkg",
+        type=Path,
+        help="Read notes from and write images into this .apkg package instead of AnkiConnect.",
+    )
+    parser.add_argument(
+        "--batch",
+        action="store_true",
+        help=(
+            "Run gating through the OpenAI Batch API before generating images. "
+            "Re-running after an interruption resumes the pending batch."
+        ),
+    )
+    parser.add_argument(
+        "--batch-poll-interval",
+        type=float,
+        default=DEFAULT_POLL_INTERVAL,
+        help="Seconds between batch status checks (default: %(default)s).",
+    )
+    retry.add_retry_arguments(parser)
+    hedging.add_hedge_arguments(parser)
+    backends.add_backend_argument(parser)
+    tracing.add_trace_arguments(parser)
     return parser.parse_args()
 
 
-def load_api_key() -> str:
-    api_key = os.environ.get("OPENAI_API_KEY")
-    if not api_key:
+def load_api_key(backend: str = backends.DEFAULT_BACKEND) -> str:
+    api_key = os.environ.get("OPENAI_API_KEY", "")
+    if not api_key and backends.requires_api_key(backend):
         raise SystemExit("Environment variable OPENAI_API_KEY is not set.")
     return api_key
 
 
-def get_candidate_cards(deckname: str) -> List[Tuple[int, str, str]]:
-    cards = invoke("findNotes", query=f"deck:{deckname}")
-    if not cards:
-        return []
-    notes_info = invoke("notesInfo", notes=cards)
-    candidates: List[Tuple[int, str, str]] = []
-    for card_id, note in zip(cards, notes_info):
-        front_text = note["fields"]["Front"]["value"]
-        back_text = note["fields"]["Back"]["value"]
-        candidates.append((card_id, front_text, back_text))
-    return candidates
+def get_candidate_cards(deckname: str, package: Optional[DeckPackage] = None) -> List[Note]:
+    if package is not None:
+        cards = package.find_notes(deckname)
+        notes_info = package.notes_info(cards)
+    else:
+        cards = invoke("findNotes", query=f"deck:{deckname}")
+        if not cards:
+            return []
+        notes_info = invoke("notesInfo", notes=cards)
+    return notes.from_notes_info(notes_info, cards)
+
+
+def update_note(note: Dict[str, Any], package: Optional[DeckPackage] = None) -> None:
+    """Send an ``updateNoteFields`` payload to AnkiConnect or the open package."""
+    if package is not None:
+        package.update_note_fields(note)
+    else:
+        invoke("updateNoteFields", note=note)
+
+
+def store_media_file(
+    filename: str,
+    package: Optional[DeckPackage] = None,
+    *,
+    path: Optional[Path] = None,
+    data: Optional[str] = None,
+) -> None:
+    """Replace a media file the note already references, leaving the note untouched.
+
+    Pass either a local ``path`` or base64 ``data``; only ``data`` works when
+    Anki cannot see our filesystem.
+    """
+    if package is not None:
+        package.add_media(filename, base64.b64decode(data) if data is not None else path)
+    elif data is not None:
+        invoke("storeMediaFile", filename=filename, data=data, deleteExisting=True)
+    else:
+        invoke("storeMediaFile", filename=filename, path=path.as_posix(), deleteExisting=True)
+
 
+def image_fingerprint(front_text: str, back_text: str, image_model: str, prompt_template: str) -> str:
+    return media_index.fingerprint(
+        "image",
+        media_index.media_free_text(front_text),
+        media_index.media_free_text(back_text),
+        image_model,
+        prompt_template,
+    )
 
-def sanitize_text(text: str) -> str:
-    """Strip HTML tags and collapse whitespace for cleaner prompts."""
-    without_tags = HTML_TAG_RE.sub(" ", text)
-    return " ".join(without_tags.split())
 
+def select_changed_cards(
+    candidates: List[Tuple[int, str, str]],
+    index: media_index.MediaIndex,
+    fingerprints: Dict[int, str],
+    drafts: Optional[List[Tuple[int, str, str]]] = None,
+) -> List[Tuple[int, str, str]]:
+    """Keep cards whose fingerprint changed since they were last gated or illustrated.
 
-def strip_image_tags(text: str) -> str:
-    """Remove any <img> tags so we can replace or delete them cleanly."""
-    return IMG_TAG_RE.sub("", text)
+    Cards that already carry an image but have no stored fingerprint were
+    illustrated before fingerprints existed; their current fingerprint is
+    adopted as the baseline. Cards still carrying an unchanged draft are
+    collected in ``drafts`` for the upgrade pass; without that list they
+    count as changed and are illustrated again.
+    """
+    stored = index.fingerprints("image", fingerprints)
+    changed = []
+    for card in candidates:
+        card_id = card[0]
+        previous = stored.get(card_id)
+        if previous == fingerprints[card_id]:
+            continue
+        if drafts is not None and previous == media_index.draft_fingerprint(fingerprints[card_id]):
+            drafts.append(card)
+            continue
+        if previous is None and Note.of(card).has_image:
+            index.set_fingerprint("image", card_id, fingerprints[card_id])
+            continue
+        changed.append(card)
+    return changed
 
 
 def build_image_prompt(template: str, concept: str) -> str:
     return template.format(text=concept)
 
 
+def request_image(
+    backend: backends.GenerationBackend,
+    prompt: str,
+    *,
+    model: str,
+    size: Optional[str] = None,
+    quality: Optional[str] = None,
+) -> str:
+    """Generate an image and return it base64-encoded, as the API delivers it."""
+    options = {key: value for key, value in (("size", size), ("quality", quality)) if value}
+    with tracing.span("images.generate", model=model, **options):
+        return backend.image(prompt, model=model, size=size, quality=quality)
+
+
 def generate_image(
-    client: OpenAI,
+    backend: backends.GenerationBackend,
     prompt: str,
     filename: str,
     *,
     model: str,
+    size: Optional[str] = None,
+    quality: Optional[str] = None,
 ) -> Path:
-    result = client.images.generate(
-        model=model,
-        prompt=prompt,
-    )
-    image_base64 = result.data[0].b64_json
+    image_base64 = request_image(backend, prompt, model=model, size=size, quality=quality)
+    return save_image(image_base64, filename)
+
+
+def save_image(image_base64: str, filename: str) -> Path:
+    with tracing.span("b64decode"):
+        image_bytes = base64.b64decode(image_base64)
     target_path = IMAGE_DIR / filename
-    with open(target_path, "wb") as handle:
-        handle.write(base64.b64decode(image_base64))
+    # Write beside the target and rename, so an upgrade swaps the file atomically
+    # and the gallery never serves a half-written image.
+    partial_path = target_path.with_name(f".{filename}.partial")
+    with tracing.span("write_image", bytes=len(image_bytes)):
+        with open(partial_path, "wb") as handle:
+            handle.write(image_bytes)
+        os.replace(partial_path, target_path)
     return target_path.resolve()
 
 
-def get_response_text(resp: Any) -> str:
-    text = getattr(resp, "output_text", None)
-    if text:
-        return text
-    output = getattr(resp, "output", None)
-    if not output:
-        return ""
-    parts: List[str] = []
-    for item in output:
-        for content_piece in getattr(item, "content", []):
-            maybe_text = getattr(content_piece, "text", None)
-            if maybe_text:
-                parts.append(maybe_text)
-    return "".join(parts)
+def gating_inputs(card: Tuple[int, str, str]) -> Tuple[str, str]:
+    """Return the (front, back) strings the gating prompt sees for a card."""
+    note = Note.of(card)
+    return note.gating_front, note.prompt_back
 
 
 def should_generate_image(
-    client: OpenAI,
+    backend: backends.GenerationBackend,
     front_text: str,
     back_text: str,
 ) -> bool:
-    prompt_payload = {
-        "id": GATING_PROMPT_ID,
-        "version": GATING_PROMPT_VERSION,
-        "variables": {
-            "front": front_text,
-            "back": back_text,
-        },
+    with tracing.span("gating"):
+        decision = hedging.call("gating", lambda: backend.gate(front_text, back_text))
+    gating_filter.record_decisions([(front_text, back_text, decision)])
+    return decision
+
+
+def prefilter_gate(
+    prefilter: gating_filter.GatingPrefilter,
+    candidates: List[Tuple[int, str, str]],
+) -> Dict[int, bool]:
+    """Answer the confident cases locally; the rest are left for remote gating."""
+    decisions: Dict[int, bool] = {}
+    for card in candidates:
+        front, back = gating_inputs(card)
+        if not back:
+            continue
+        decision = prefilter.decide(front, back)
+        if decision is not None:
+            decisions[card[0]] = decision
+    return decisions
+
+
+def project_spend(
+    cards: List[Tuple[int, str, str]],
+    local_decisions: Dict[int, bool],
+    *,
+    image_model: str,
+    gating_model: str,
+    skip_gating: bool,
+    group_size: int,
+    batch: bool,
+    image_options: Optional[Dict[str, str]],
+    upgrade: bool,
+) -> Dict[str, Any]:
+    """Upper-bound spend for ``cards``: every card that may pass gating is assumed to get an image."""
+    eligible = [card for card in cards if gating_inputs(card)[1]]
+    remote = [] if skip_gating else [
+        " ".join(gating_inputs(card)) for card in eligible if card[0] not in local_decisions
+    ]
+    if group_size > 1:
+        gating_calls = -(-len(remote) // group_size)
+        gating = costs.token_cost(
+            gating_model,
+            gating_calls * GATING_OVERHEAD_TOKENS + sum(costs.estimate_tokens(text) for text in remote),
+            len(remote) * GATING_OUTPUT_TOKENS,
+        )
+    else:
+        gating_calls = len(remote)
+        gating = costs.project_text(
+            gating_model, remote, overhead_tokens=GATING_OVERHEAD_TOKENS, output_tokens=GATING_OUTPUT_TOKENS
+        )
+    if gating is not None and batch:
+        gating *= costs.BATCH_DISCOUNT
+    images = len(eligible) if skip_gating else sum(1 for card in eligible if local_decisions.get(card[0]) is not False)
+    per_image = costs.image_cost(image_model, **(image_options or {}))
+    if per_image is not None and image_options and upgrade:
+        full = costs.image_cost(image_model)
+        per_image = per_image + full if full is not None else None
+    return {
+        "gating_calls": gating_calls,
+        "gating": gating,
+        "images": images,
+        "per_image": per_image,
+        "image_total": per_image * images if per_image is not None else None,
     }
-    response = client.responses.create(
-        prompt=prompt_payload,
+
+
+def gate_card_group(
+    backend: backends.GenerationBackend, model: str, cards: List[Tuple[str, str, str]]
+) -> Dict[str, bool]:
+    with tracing.span("gating_group", cards=len(cards)):
+        decisions = backend.gate_group(cards, model=model)
+    gating_filter.record_decisions(
+        (front, back, decisions[card_id]) for card_id, front, back in cards if card_id in decisions
     )
-    decision = get_response_text(response).strip().lower()
-    return decision == "true"
+    return decisions
 
 
-def process_card(
+def group_gate(
+    backend: backends.GenerationBackend,
+    candidates: List[Tuple[int, str, str]],
+    *,
+    group_size: int,
+    model: str = DEFAULT_GATING_MODEL,
+    max_workers: int = 1,
+) -> Dict[int, bool]:
+    """Gate candidates ``group_size`` at a time; map decisions by card ID.
+
+    Cards the model dropped or garbled are left out so ``process_card``
+    gates them individually.
+    """
+    cards = []
+    for card in candidates:
+        front, back = gating_inputs(card)
+        if back:
+            cards.append((str(card[0]), front, back))
+    groups = [cards[index:index + group_size] for index in range(0, len(cards), group_size)]
+    if not groups:
+        return {}
+
+    def run_group(group: List[Tuple[str, str, str]]) -> Dict[str, bool]:
+        try:
+            return gate_card_group(backend, model, group)
+        except Exception as exc:
+            print(f"Grouped gating request failed for {len(group)} card(s): {exc}")
+            return {}
+
+    decisions: Dict[int, bool] = {}
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(groups)))) as executor:
+        for group_decisions in executor.map(run_group, groups):
+            decisions.update({int(card_id): value for card_id, value in group_decisions.items()})
+    fallback = len(cards) - len(decisions)
+    print(
+        f"Grouped gating decided {len(decisions)} of {len(cards)} card(s) in {len(groups)} request(s)"
+        + (f"; {fallback} will be gated individually." if fallback else ".")
+    )
+    return decisions
+
+
+def batch_gate(
+    client: "openai.OpenAI",
+    deckname: str,
+    candidates: List[Tuple[int, str, str]],
+    *,
+    poll_interval: float = DEFAULT_POLL_INTERVAL,
+) -> Dict[int, bool]:
+    """Gate every candidate through one Batch API job; map decisions by card ID.
+
+    Cards whose request failed are absent from the result and fall back to
+    synchronous gating in ``process_card``.
+    """
+    requests = []
+    inputs: Dict[int, Tuple[str, str]] = {}
+    for card in candidates:
+        card_id = card[0]
+        front, back = gating_inputs(card)
+        if back:
+            inputs[card_id] = (front, back)
+            requests.append((f"gate-{card_id}", {"prompt": build_gating_payload(front, back)}))
+    if not requests:
+        return {}
+    key = hashlib.sha256(
+        json.dumps(requests, sort_keys=True, ensure_ascii=False).encode("utf-8")
+    ).hexdigest()
+    job = BatchJob(client, state_path_for("gating", deckname))
+    if job.resumable(key):
+        print(f"Resuming gating batch {job.batch_id} for {len(requests)} card(s).")
+    else:
+        batch_id = job.submit(requests, key)
+        print(f"Submitted gating batch {batch_id} for {len(requests)} card(s).")
+    results = job.wait(poll_interval)
+    for body in results.values():
+        record_response_usage("batch.gating", body, DEFAULT_GATING_MODEL, batch=True)
+    decisions = {
+        int(custom_id.split("-", 1)[1]): parse_gating_decision(response_text_from_body(body))
+        for custom_id, body in results.items()
+    }
+    gating_filter.record_decisions(
+        (*inputs[card_id], decision) for card_id, decision in decisions.items() if card_id in inputs
+    )
+    job.clear()
+    return decisions
+
+
+def gate_card(
     card: Tuple[int, str, str],
     api_key: str,
-    image_model: str,
-    prompt_template: str,
     skip_gating: bool,
+    package: Optional[DeckPackage] = None,
+    gating_decision: Optional[bool] = None,
 ) -> Tuple[str, str, Any]:
-    card_id, front_text, back_text = card
-    local_client = OpenAI(api_key=api_key)
-    front_without_images = strip_image_tags(front_text)
-    back_without_images = strip_image_tags(back_text)
-    cleaned_back = sanitize_text(back_without_images)
-    if not cleaned_back:
+    """First stage: return ("approved", ...) or a final skip/error result."""
+    note = Note.of(card)
+    card_id, front_text, back_text = note
+    front_without_images = note.front_without_images
+    back_without_images = note.back_without_images
+    if not note.prompt_back:
         return ("skip", back_without_images, "No descriptive text after cleaning.")
+    if skip_gating or gating_decision:
+        return ("approved", back_text, None)
 
     try:
-        if not skip_gating:
-            cleaned_front = sanitize_text(front_without_images)
-            if not should_generate_image(
-                local_client,
-                cleaned_front or front_without_images,
-                cleaned_back,
+        with tracing.span("gate_card", card_id=card_id):
+            if gating_decision is None:
+                gating_decision = should_generate_image(
+                    backends.current(api_key),
+                    *gating_inputs(note),
+                )
+            if gating_decision:
+                return ("approved", back_text, None)
+            if (
+                front_without_images != front_text
+                or back_without_images != back_text
             ):
-                if (
-                    front_without_images != front_text
-                    or back_without_images != back_text
-                ):
-                    invoke(
-                        "updateNoteFields",
-                        note={
-                            "id": card_id,
-                            "fields": {
-                                "Front": front_without_images,
-                                "Back": back_without_images,
-                            },
+                update_note(
+                    {
+                        "id": card_id,
+                        "fields": {
+                            "Front": front_without_images,
+                            "Back": back_without_images,
                         },
+                    },
+                    package,
+                )
+                return (
+                    "skip",
+                    back_without_images,
+                    "Gating model returned false; existing image removed.",
+                )
+            return ("skip", back_without_images, "Gating model returned false.")
+    except Exception as exc:
+        return ("error", back_text, exc)
+
+
+def generate_card_image(
+    card: Tuple[int, str, str],
+    api_key: str,
+    image_model: str,
+    prompt_template: str,
+    package: Optional[DeckPackage] = None,
+    image_options: Optional[Dict[str, str]] = None,
+    inline: bool = False,
+    cache_local: bool = False,
+) -> Tuple[str, str, Any]:
+    """Second stage: generate the image for an approved card and attach it.
+
+    With ``inline`` the image goes to Anki as base64 ``data`` straight from
+    the API response; it is written locally only when ``cache_local`` is set.
+    Generation and the Anki write are retried separately, so a failed write
+    reuses the image instead of paying for another one.
+    """
+    note = Note.of(card)
+    card_id, back_text = note.note_id, note.back
+    filename = f"{card_id}.png"
+    attachment: Dict[str, str] = {}
+
+    def render_image() -> Tuple[str, str, Any]:
+        try:
+            with tracing.span("generate_card", card_id=card_id):
+                prompt = build_image_prompt(prompt_template, note.prompt_back)
+                backend = backends.current(api_key)
+                file_path: Optional[Path] = None
+                if inline:
+                    image_base64 = request_image(backend, prompt, model=image_model, **(image_options or {}))
+                    attachment["data"] = image_base64
+                    if cache_local:
+                        file_path = save_image(image_base64, filename)
+                else:
+                    file_path = generate_image(
+                        backend, prompt, filename, model=image_model, **(image_options or {})
                     )
-                    return (
-                        "skip",
-                        back_without_images,
-                        "Gating model returned false; existing image removed.",
+                    attachment["path"] = file_path.as_posix()
+                if file_path is not None:
+                    media_index.record(
+                        "image", card_id, file_path, {"model": image_model, "prompt": prompt, **(image_options or {})}
                     )
-                return ("skip", back_without_images, "Gating model returned false.")
-
-        filename = f"{card_id}.png"
-        prompt = build_image_prompt(prompt_template, cleaned_back)
-        file_path = generate_image(local_client, prompt, filename, model=image_model)
-        invoke(
-            "updateNoteFields",
-            note={
-                "id": card_id,
-                "fields": {
-                    "Front": front_without_images,
-                    "Back": back_without_images,
+            return ("rendered", back_text, None)
+        except Exception as exc:
+            return ("error", back_text, exc)
+
+    def attach_image() -> Tuple[str, str, Any]:
+        try:
+            update_note(
+                {
+                    "id": card_id,
+                    "fields": {
+                        "Front": note.front_without_images,
+                        "Back": note.back_without_images,
+                    },
+                    "picture": [
+                        {
+                            "filename": filename,
+                            "fields": ["Front"],
+                            **attachment,
+                        }
+                    ],
                 },
-                "picture": [
-                    {
-                        "filename": filename,
-                        "fields": ["Front"],
-                        "path": file_path.as_posix(),
-                    }
-                ],
-            },
+                package,
+            )
+            return ("added", back_text, None)
+        except Exception as exc:
+            return ("error", back_text, exc)
+
+    result = retry.call(render_image)
+    if result[0] == "error":
+        return result
+    return retry.call(attach_image)
+
+
+def upgrade_card_image(
+    card: Tuple[int, str, str],
+    api_key: str,
+    image_model: str,
+    prompt_template: str,
+    package: Optional[DeckPackage] = None,
+    inline: bool = False,
+    cache_local: bool = False,
+) -> Tuple[str, str, Any]:
+    """Regenerate a drafted card at full quality and swap the media file in place.
+
+    As in ``generate_card_image``, a failed write is retried with the same image.
+    """
+    note = Note.of(card)
+    card_id, back_text = note.note_id, note.back
+    filename = f"{card_id}.png"
+    media: Dict[str, Any] = {}
+
+    def render_upgrade() -> Tuple[str, str, Any]:
+        try:
+            with tracing.span("upgrade_card", card_id=card_id):
+                prompt = build_image_prompt(prompt_template, note.prompt_back)
+                params = {"model": image_model, "prompt": prompt}
+                if inline:
+                    media["data"] = request_image(backends.current(api_key), prompt, model=image_model)
+                    if cache_local:
+                        media_index.record("image", card_id, save_image(media["data"], filename), params)
+                else:
+                    media["path"] = generate_image(backends.current(api_key), prompt, filename, model=image_model)
+                    media_index.record("image", card_id, media["path"], params)
+            return ("rendered", back_text, None)
+        except Exception as exc:
+            return ("error", back_text, exc)
+
+    def store_upgrade() -> Tuple[str, str, Any]:
+        try:
+            store_media_file(filename, package, **media)
+            return ("upgraded", back_text, None)
+        except Exception as exc:
+            return ("error", back_text, exc)
+
+    result = retry.call(render_upgrade)
+    if result[0] == "error":
+        return result
+    return retry.call(store_upgrade)
+
+
+class UpgradeQueue:
+    """Priority-ordered work queue for the upgrade pass; lowest priority value first.
+
+    ``cancel`` stops hand-out of further cards; upgrades already in flight
+    finish, and every card not yet upgraded keeps its draft.
+    """
+
+    def __init__(self) -> None:
+        self._heap: List[Tuple[Any, int, Tuple[int, str, str]]] = []
+        self._order = itertools.count()
+        self._lock = threading.Lock()
+        self._cancelled = threading.Event()
+
+    def push(self, priority: Any, card: Tuple[int, str, str]) -> None:
+        with self._lock:
+            heapq.heappush(self._heap, (priority, next(self._order), card))
+
+    def pop(self) -> Optional[Tuple[int, str, str]]:
+        if self._cancelled.is_set():
+            return None
+        with self._lock:
+            if not self._heap:
+                return None
+            return heapq.heappop(self._heap)[2]
+
+    def cancel(self) -> None:
+        self._cancelled.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._heap)
+
+
+def run_upgrade_pass(
+    queue: UpgradeQueue,
+    api_key: str,
+    image_model: str,
+    prompt_template: str,
+    *,
+    workers: int,
+    package: Optional[DeckPackage] = None,
+    inline: bool = False,
+    cache_local: bool = False,
+    on_upgraded: Optional[Callable[[Tuple[int, str, str]], None]] = None,
+    budget: Optional[scheduling.RunBudget] = None,
+) -> Dict[str, int]:
+    """Drain ``queue`` with ``workers`` threads; Ctrl-C, SIGTERM or a spent ``budget`` cancels the rest."""
+    total = len(queue)
+    counts = {"upgraded": 0, "error": 0}
+    counts_lock = threading.Lock()
+    metrics.CARDS_PENDING.set(total, script="images", stage="upgrade")
+
+    def worker() -> None:
+        while True:
+            if budget is not None and budget.exhausted():
+                queue.cancel()
+            card = queue.pop()
+            if card is None:
+                return
+            status, back_text, error = upgrade_card_image(
+                card, api_key, image_model, prompt_template, package, inline, cache_local
+            )
+            metrics.CARDS_PENDING.dec(script="images", stage="upgrade")
+            metrics.CARDS_PROCESSED.inc(script="images", status=status)
+            with counts_lock:
+                counts[status] += 1
+                done = counts["upgraded"] + counts["error"]
+            if status == "upgraded":
+                if on_upgraded is not None:
+                    on_upgraded(card)
+                print(f"Upgraded image for: {back_text} [upgrade {done}/{total}]")
+            else:
+                print(f"Failed to upgrade image for: {back_text} ({error}); keeping draft.")
+
+    previous_handler = None
+    if threading.current_thread() is threading.main_thread():
+        previous_handler = signal.signal(signal.SIGTERM, lambda *_: queue.cancel())
+    threads = [
+        threading.Thread(target=worker, name=f"upgrade_{index}", daemon=True)
+        for index in range(max(1, min(workers, total)))
+    ]
+    try:
+        for thread in threads:
+            thread.start()
+        while any(thread.is_alive() for thread in threads):
+            for thread in threads:
+                thread.join(timeout=0.2)
+    except KeyboardInterrupt:
+        queue.cancel()
+        print("Cancelling upgrade pass; waiting for in-flight images...")
+        for thread in threads:
+            thread.join()
+    finally:
+        if previous_handler is not None:
+            signal.signal(signal.SIGTERM, previous_handler)
+    counts["cancelled"] = len(queue) if queue.cancelled else 0
+    metrics.CARDS_PENDING.set(0, script="images", stage="upgrade")
+    return counts
+
+
+def process_card(
+    card: Tuple[int, str, str],
+    api_key: str,
+    image_model: str,
+    prompt_template: str,
+    skip_gating: bool,
+    package: Optional[DeckPackage] = None,
+    gating_decision: Optional[bool] = None,
+    inline: bool = False,
+    image_options: Optional[Dict[str, str]] = None,
+    cache_local: bool = False,
+) -> Tuple[str, str, Any]:
+    """Run both stages for one card on the calling thread, as ``main`` runs them."""
+    with tracing.span("process_card", card_id=card[0]):
+        result = retry.call(gate_card, card, api_key, skip_gating, package, gating_decision)
+        if result[0] != "approved":
+            return result
+        return generate_card_image(
+            card,
+            api_key,
+            image_model,
+            prompt_template,
+            package,
+            image_options,
+            inline,
+            cache_local,
         )
-        return ("added", back_text, None)
-    except Exception as exc:
-        return ("error", back_text, exc)
+
+
+def print_projection(projection: Dict[str, Any], total: int, args: argparse.Namespace, paid: bool) -> None:
+    if not paid:
+        print(f"Dry run: {total} card(s); backend '{args.backend}' makes no paid calls.")
+        return
+    unknown = "no price known for this model"
+    gating = projection["gating"]
+    print(
+        f"Dry run: {total} card(s). Gating: {projection['gating_calls']} call(s) with {args.gating_model}, "
+        + (f"about {costs.format_usd(gating)}" if gating is not None else unknown)
+        + f"{' (batch price)' if args.batch else ''}. Images: up to {projection['images']} with {args.image_model}, "
+        + (
+            f"at most {costs.format_usd(projection['image_total'])} ({costs.format_usd(projection['per_image'])} each)"
+            if projection["image_total"] is not None
+            else unknown
+        )
+        + "."
+    )
+    if gating is not None and projection["image_total"] is not None:
+        total_cost = gating + projection["image_total"]
+        print(f"Projected spend: at most {costs.format_usd(total_cost)}.")
+        if args.max_cost and total_cost > args.max_cost:
+            print(f"--max-cost {costs.format_usd(args.max_cost)} may stop the run before every card is done.")
 
 
 def main() -> None:
     args = parse_args()
-    api_key = load_api_key()
+    api_key = os.environ.get("OPENAI_API_KEY", "") if args.dry_run else load_api_key(args.backend)
+    with tracing.session_from_args(args), backends.selected(args.backend, api_key) as backend:
+        IMAGE_DIR.mkdir(parents=True, exist_ok=True)
+        package = None
+        index = None
+        if args.apkg:
+            if not args.apkg.exists():
+                raise SystemExit(f"Package not found: {args.apkg}")
+            package = DeckPackage.load(args.apkg)
+        else:
+            index = media_index.enable(media_index.INDEX_PATH)
 
-    print(f"Fetching notes for deck: {args.deck}")
-    candidates = get_candidate_cards(args.deck)
-    if not candidates:
-        print(f"No cards eligible for image generation in deck '{args.deck}'.")
-        return
+        prompt_template = args.prompt.strip()
+        print(f"Fetching notes for deck: {args.deck}")
+        candidates = get_candidate_cards(args.deck, package)
+        # Images from another backend are not what a later OpenAI run would produce.
+        model_key = (
+            args.image_model if args.backend == backends.DEFAULT_BACKEND else f"{args.backend}/{args.image_model}"
+        )
+        fingerprints = {
+            card[0]: image_fingerprint(card[1], card[2], model_key, prompt_template)
+            for card in candidates
+        }
+        # Drafts left by an earlier run whose upgrade never happened.
+        drafts: List[Tuple[int, str, str]] = []
+        if index is not None and not args.force:
+            total = len(candidates)
+            candidates = select_changed_cards(candidates, index, fingerprints, drafts)
+            print(f"{total - len(candidates)} of {total} card(s) unchanged since they were last processed.")
+            if drafts:
+                print(f"{len(drafts)} of them still carry a draft image and will be upgraded.")
+        if not candidates and not (drafts and not args.no_upgrade):
+            print(f"No cards eligible for image generation in deck '{args.deck}'.")
+            return
+        if args.order == "review":
+            if package is not None:
+                print("Review order needs AnkiConnect scheduling data; keeping package order.")
+            else:
+                candidates = scheduling.order_by_review(
+                    candidates, scheduling.review_priorities(args.deck, invoke)
+                )
+                print("Processing cards in order of upcoming review.")
+        budget = scheduling.RunBudget(args.max_seconds, args.max_cost)
+        retry.configure(args.attempts, budget)
+        hedger = hedging.enable_from_args(args)
+        dead_letters = retry.enable_dead_letters(None if args.no_dead_letter else args.dead_letter)
+        image_options = {"size": args.draft_size, "quality": args.draft_quality} if args.draft else None
+        options = {
+            "image_model": args.image_model,
+            "prompt": prompt_template,
+            "skip_gating": args.skip_gating,
+            "gating_model": args.gating_model,
+            "image_options": image_options,
+            "backend": args.backend,
+            "inline_media": args.inline_media,
+            "cache_media": args.cache_media,
+        }
 
-    worker_limit = max(1, args.workers)
-    max_workers = max(1, min(worker_limit, len(candidates)))
-    prompt_template = args.prompt.strip()
-    print(
-        f"Generating images with up to {max_workers} worker(s) using image model {args.image_model} "
-        f"and {'skipping' if args.skip_gating else 'using prompt-configured'} gating."
-    )
+        if not args.no_gating_history:
+            gating_filter.enable_history()
+        gating_decisions: Dict[int, bool] = {}
+        prefilter = None
+        if not args.skip_gating and args.prefilter_threshold < 1.0:
+            prefilter = gating_filter.GatingPrefilter(args.prefilter_threshold)
+            gating_decisions = prefilter_gate(prefilter, candidates)
+        remote_candidates = [card for card in candidates if card[0] not in gating_decisions]
+        if args.dry_run:
+            projection = project_spend(
+                candidates,
+                gating_decisions,
+                image_model=args.image_model,
+                gating_model=args.gating_model,
+                skip_gating=args.skip_gating,
+                group_size=args.gating_group_size,
+                batch=args.batch,
+                image_options=image_options,
+                upgrade=args.draft and not args.no_upgrade,
+            )
+            print_projection(projection, len(candidates), args, paid=backend.requires_api_key)
+            if drafts and not args.no_upgrade:
+                per_image = costs.image_cost(args.image_model)
+                upgrade_cost = costs.format_usd(per_image * len(drafts)) if per_image is not None else None
+                print(
+                    f"Upgrading {len(drafts)} earlier draft(s): "
+                    + (f"at most {upgrade_cost}." if upgrade_cost is not None else "no price known for this model.")
+                )
+            return
+        if args.batch and not args.skip_gating and remote_candidates:
+            if not backend.supports_batch:
+                raise SystemExit(f"--batch needs the OpenAI Batch API, which backend '{args.backend}' does not offer.")
+            batch_decisions = batch_gate(
+                backend.client,
+                args.deck,
+                remote_candidates,
+                poll_interval=args.batch_poll_interval,
+            )
+            approved = sum(batch_decisions.values())
+            print(f"Batch gating approved {approved} of {len(batch_decisions)} card(s).")
+            gating_decisions.update(batch_decisions)
+        elif args.gating_group_size > 1 and not args.skip_gating:
+            gating_decisions.update(
+                group_gate(
+                    backend,
+                    remote_candidates,
+                    group_size=args.gating_group_size,
+                    model=args.gating_model,
+                    max_workers=max(1, args.gating_workers),
+                )
+            )
+
+        positions = {card[0]: index for index, card in enumerate(candidates)}
+        upgrades = UpgradeQueue()
+        # Earlier drafts have waited longest; they go first.
+        for position, card in enumerate(drafts):
+            upgrades.push(position - len(drafts), card)
+
+        gating_workers = max(1, min(args.gating_workers, len(candidates)))
+        image_workers = max(1, min(max(1, args.workers), len(candidates)))
+        print(
+            f"Gating with up to {gating_workers} worker(s) "
+            f"({'skipped' if args.skip_gating else 'prompt-configured'}) and generating "
+            f"{'draft ' if args.draft else ''}images with "
+            f"up to {image_workers} worker(s) using image model {args.image_model}."
+        )
+
+        added = skipped = failed = deferred = 0
+        gated = approved = rendered = 0
+        total = len(candidates)
+        progress_step = max(1, total // 10)
+        metrics.CARDS_PENDING.set(total, script="images", stage="gating")
+        with ThreadPoolExecutor(max_workers=gating_workers, thread_name_prefix="gate") as gate_executor, \
+                ThreadPoolExecutor(max_workers=image_workers, thread_name_prefix="image") as image_executor:
+            image_futures: Dict[Any, Tuple[int, str, str]] = {}
+            gate_futures = {
+                gate_executor.submit(
+                    budget.call,
+                    card[2],
+                    retry.call,
+                    gate_card,
+                    card,
+                    api_key,
+                    args.skip_gating,
+                    package,
+                    gating_decisions.get(card[0]),
+                ): card
+                for card in candidates
+            }
+            pending = set(gate_futures)
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    status, back_text, error = future.result()
+                    card = gate_futures.get(future) or image_futures[future]
+                    if index is not None and status in ("skip", "added"):
+                        # A draft is marked so a later run upgrades it if this run's upgrade never happens.
+                        fingerprint = fingerprints[card[0]]
+                        if status == "added" and args.draft:
+                            fingerprint = media_index.draft_fingerprint(fingerprint)
+                        index.set_fingerprint("image", card[0], fingerprint)
+                    if future in gate_futures:
+                        gated += 1
+                        metrics.CARDS_PENDING.dec(script="images", stage="gating")
+                        if status == "approved":
+                            approved += 1
+                            metrics.CARDS_PENDING.inc(script="images", stage="generation")
+                            image_future = image_executor.submit(
+                                budget.call,
+                                card[2],
+                                generate_card_image,
+                                card,
+                                api_key,
+                                args.image_model,
+                                prompt_template,
+                                package,
+                                image_options,
+                                args.inline_media,
+                                args.cache_media,
+                            )
+                            image_futures[image_future] = card
+                            pending.add(image_future)
+                        if gated % progress_step == 0 or gated == total:
+                            spend = f"; spend {costs.format_usd(costs.spent())}" if costs.LEDGER else ""
+                            print(
+                                f"Gating progress: {gated}/{total} checked, {approved} approved; "
+                                f"images {rendered}/{approved} done{spend}."
+                            )
+                        if status == "approved":
+                            continue
+                    else:
+                        rendered += 1
+                        metrics.CARDS_PENDING.dec(script="images", stage="generation")
+                    metrics.CARDS_PROCESSED.inc(script="images", status=status)
+                    if status == "added":
+                        print(f"Adding image for: {back_text} [images {rendered}/{approved}]")
+                        added += 1
+                        if args.draft:
+                            upgrades.push(positions[card[0]], card)
+                    elif status == "skip":
+                        print(f"Skipping image for: {back_text} ({error})")
+                        skipped += 1
+                    elif status == "deferred":
+                        deferred += 1
+                    else:
+                        print(f"Failed image for: {back_text} ({error})")
+                        failed += 1
+                        retry.dead_letter(
+                            "images",
+                            card,
+                            error,
+                            deck=args.deck,
+                            options=options,
+                            apkg=args.apkg,
+                            stage="gating" if future in gate_futures else "generation",
+                            fingerprint=fingerprints[card[0]],
+                        )
 
-    added = skipped = failed = 0
-    with ThreadPoolExecutor(max_workers=max_workers) as executor:
-        futures = [
-            executor.submit(
-                process_card,
-                card,
+        print(f"Completed image generation: {added} added, {skipped} skipped, {failed} failed.")
+        if costs.LEDGER:
+            print(costs.LEDGER.summary())
+        if hedger is not None:
+            print(hedger.summary())
+        if failed and dead_letters is not None:
+            print(f"Recorded failed card(s) in {dead_letters.path}; retry them with: python AnkiDeadLetter.py replay")
+        if deferred:
+            print(f"Deferred {deferred} card(s): {budget.exhausted()}; re-run to continue.")
+        if prefilter is not None:
+            print(
+                f"Local gating pre-filter avoided {prefilter.avoided} API call(s) "
+                f"(rules: {prefilter.stats['rules']}, model: {prefilter.stats['model']}, "
+                f"deferred: {prefilter.stats['deferred']})."
+            )
+        if package is not None:
+            package.write(args.apkg)
+            print(f"Wrote package: {args.apkg}")
+
+        if not args.no_upgrade and len(upgrades) and budget.exhausted():
+            print(f"Skipping upgrade of {len(upgrades)} draft image(s): {budget.exhausted()}; re-run to upgrade them.")
+        elif not args.no_upgrade and len(upgrades):
+            print(f"Upgrading {len(upgrades)} draft image(s) at full quality; press Ctrl-C to stop.")
+            remaining = budget.remaining()
+            deadline = threading.Timer(remaining, upgrades.cancel) if remaining is not None else None
+            if deadline is not None:
+                deadline.daemon = True
+                deadline.start()
+            counts = run_upgrade_pass(
+                upgrades,
                 api_key,
                 args.image_model,
                 prompt_template,
-                args.skip_gating,
+                workers=image_workers,
+                package=package,
+                inline=args.inline_media,
+                cache_local=args.cache_media,
+                budget=budget,
+                on_upgraded=(
+                    (lambda card: index.set_fingerprint("image", card[0], fingerprints[card[0]]))
+                    if index is not None
+                    else None
+                ),
             )
-            for card in candidates
-        ]
-        for future in as_completed(futures):
-            status, back_text, error = future.result()
-            if status == "added":
-                print(f"Adding image for: {back_text}")
-                added += 1
-            elif status == "skip":
-                print(f"Skipping image for: {back_text} ({error})")
-                skipped += 1
-            else:
-                print(f"Failed image for: {back_text} ({error})")
-                failed += 1
-
-    print(f"Completed image generation: {added} added, {skipped} skipped, {failed} failed.")
+            if deadline is not None:
+                deadline.cancel()
+            print(
+                f"Completed upgrade pass: {counts['upgraded']} upgraded, {counts['error']} failed"
+                + (f", {counts['cancelled']} cancelled (drafts kept)." if counts["cancelled"] else ".")
+            )
+            if costs.LEDGER:
+                print(costs.LEDGER.summary())
+            if package is not None and counts["upgraded"]:
+                package.write(args.apkg)
+                print(f"Wrote package: {args.apkg}")
+        metrics.report_run()
 
 
 if __name__ == "__main__":
@@ -1,20 +1,32 @@
 import argparse
+import base64
 from concurrent.futures import ThreadPoolExecutor, as_completed
 import os
 from pathlib import Path
-import re
-from typing import Any, List, Tuple
-
-from openai import OpenAI
+import uuid
+from typing import Any, Dict, List, Optional, Tuple
 
 from AnkiSync import invoke
+from utils import backends, costs, hedging, media_index, metrics, notes, retry, scheduling, tracing
+from utils.apkg import DeckPackage
+from utils.audio_split import pcm_to_wav, split_on_silence
+from utils.common import AUDIO_DIR
+from utils.notes import Note
 
-BASE_DIR = Path(__file__).resolve().parent
-MEDIA_DIR = BASE_DIR / "media"
-AUDIO_DIR = MEDIA_DIR / "audio"
-AUDIO_DIR.mkdir(parents=True, exist_ok=True)
 DEFAULT_MAX_WORKERS = 10
-HTML_TAG_RE = re.compile(r"<[^>]+>")
+DEFAULT_MODEL = "gpt-4o-mini-tts"
+DEFAULT_VOICE = "onyx"
+DEFAULT_INSTRUCTIONS = (
+    "Speak like a native speaker for the passed in language. "
+    "Treat the provided text as plain text, ignoring HTML tags or parenthetical notes."
+)
+BATCH_INSTRUCTIONS = (
+    "The input is a list with one item per line. Read each line exactly once, in order, "
+    "with a pause of about one second between lines, and say nothing else."
+)
+# Only short fronts are batched; longer text has pauses of its own that could
+# be mistaken for the boundary between two cards.
+BATCH_MAX_WORDS = 4
 
 
 def parse_args() -> argparse.Namespace:
@@ -27,7 +39,7 @@ def parse_args() -> argparse.Namespace:
     )
     parser.add_argument(
         "--model",
-        default="gpt-4o-mini-tts",
+        default=DEFAULT_MODEL,
         help=(
             "OpenAI TTS model to use (default: %(default)s). "
             "Consider alternatives like 'gpt-4o-realtime-preview-tts' if available."
@@ -35,15 +47,12 @@ def parse_args() -> argparse.Namespace:
     )
     parser.add_argument(
         "--voice",
-        default="onyx",
+        default=DEFAULT_VOICE,
         help="Voice to use for the TTS model (default: %(default)s).",
     )
     parser.add_argument(
         "--instructions",
-        default=(
-            "Speak like a native speaker for the passed in language. "
-            "Treat the provided text as plain text, ignoring HTML tags or parenthetical notes."
-        ),
+        default=DEFAULT_INSTRUCTIONS,
         help="Additional instructions passed to the TTS model.",
     )
     parser.add_argument(
@@ -52,39 +61,144 @@ def parse_args() -> argparse.Namespace:
         default=int(os.environ.get("ANKI_AUDIO_WORKERS", str(DEFAULT_MAX_WORKERS))),
         help="Maximum number of concurrent audio generations (default: %(default)s).",
     )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Regenerate audio for every card, even when its front and settings are unchanged.",
+    )
+    parser.add_argument(
+        "--inline-media",
+        action="store_true",
+        default=os.environ.get("ANKI_INLINE_MEDIA") == "1",
+        help=(
+            "Send audio to AnkiConnect as base64 data instead of a local file path, so Anki "
+            "can run on another host (default: on when ANKI_INLINE_MEDIA=1)."
+        ),
+    )
+    parser.add_argument(
+        "--cache-media",
+        action="store_true",
+        help="With --inline-media, also keep a local copy for the media index.",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=int(os.environ.get("ANKI_TTS_BATCH_SIZE", "1")),
+        help=(
+            "Synthesize up to this many short fronts in one speech request and split the result "
+            "at the pauses; 1 turns batching off (default: %(default)s)."
+        ),
+    )
+    parser.add_argument(
+        "--order",
+        choices=scheduling.ORDER_CHOICES,
+        default=os.environ.get("ANKI_MEDIA_ORDER", "deck"),
+        help=(
+            "Process cards in deck order or by upcoming review: learning, due reviews, then new "
+            "cards in the order Anki will introduce them (default: %(default)s)."
+        ),
+    )
+    parser.add_argument(
+        "--max-seconds",
+        type=float,
+        help="Stop starting new cards after this many seconds; in-flight cards still finish.",
+    )
+    parser.add_argument(
+        "--max-cost",
+        type=float,
+        help=(
+            "Stop starting new cards once the run's estimated OpenAI spend reaches this many "
+            "dollars; in-flight cards still finish."
+        ),
+    )
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="Print the projected spend for the deck and exit without calling OpenAI.",
+    )
+    parser.add_argument(
+        "--apkg",
+        type=Path,
+        help="Read notes from and write audio into this .apkg package instead of AnkiConnect.",
+    )
+    retry.add_retry_arguments(parser)
+    hedging.add_hedge_arguments(parser)
+    backends.add_backend_argument(parser)
+    tracing.add_trace_arguments(parser)
     return parser.parse_args()
 
 
-def load_api_key() -> str:
-    api_key = os.environ.get("OPENAI_API_KEY")
-    if not api_key:
+def load_api_key(backend: str = backends.DEFAULT_BACKEND) -> str:
+    api_key = os.environ.get("OPENAI_API_KEY", "")
+    if not api_key and backends.requires_api_key(backend):
         raise SystemExit("Environment variable OPENAI_API_KEY is not set.")
     return api_key
 
 
-def get_candidate_cards(deckname: str) -> List[Tuple[int, str, str]]:
-    cards = invoke("findNotes", query=f"deck:{deckname}")
-    if not cards:
-        return []
-    notes_info = invoke("notesInfo", notes=cards)
-    candidates: List[Tuple[int, str, str]] = []
-    for card_id, note in zip(cards, notes_info):
-        front_text = note["fields"]["Front"]["value"]
-        back_text = note["fields"]["Back"]["value"]
-        if "[sound" in front_text:
-            print(f"Skipping audio for (already has sound): {front_text}")
+def get_candidate_cards(
+    deckname: str, package: Optional[DeckPackage] = None, *, include_voiced: bool = False
+) -> List[Note]:
+    if package is not None:
+        cards = package.find_notes(deckname)
+        notes_info = package.notes_info(cards)
+    else:
+        cards = invoke("findNotes", query=f"deck:{deckname}")
+        if not cards:
+            return []
+        notes_info = invoke("notesInfo", notes=cards)
+    candidates: List[Note] = []
+    for note in notes.from_notes_info(notes_info, cards):
+        if note.has_sound and not include_voiced:
+            print(f"Skipping audio for (already has sound): {note.front}")
             continue
-        candidates.append((card_id, front_text, back_text))
+        candidates.append(note)
     return candidates
 
 
+def audio_fingerprint(front_text: str, model: str, voice: str, instructions: str) -> str:
+    return media_index.fingerprint(
+        "audio", media_index.media_free_text(front_text), model, voice, instructions
+    )
+
+
+def select_changed_cards(
+    candidates: List[Tuple[int, str, str]],
+    index: media_index.MediaIndex,
+    fingerprints: Dict[int, str],
+) -> List[Tuple[int, str, str]]:
+    """Keep cards whose fingerprint changed since their audio was made.
+
+    Cards that already have sound but no stored fingerprint were voiced before
+    fingerprints existed; their current fingerprint is adopted as the baseline.
+    """
+    stored = index.fingerprints("audio", fingerprints)
+    changed = []
+    for card in candidates:
+        card_id = card[0]
+        previous = stored.get(card_id)
+        if previous == fingerprints[card_id]:
+            continue
+        if previous is None and Note.of(card).has_sound:
+            index.set_fingerprint("audio", card_id, fingerprints[card_id])
+            continue
+        changed.append(card)
+    return changed
+
+
 def prepare_text_for_tts(text: str) -> str:
     """Strip HTML tags and collapse whitespace for cleaner TTS input."""
-    without_tags = HTML_TAG_RE.sub(" ", text)
-    return " ".join(without_tags.split())
+    return notes.clean_text(text)
+
+def update_note(note: Dict[str, Any], package: Optional[DeckPackage] = None) -> None:
+    """Send an ``updateNoteFields`` payload to AnkiConnect or the open package."""
+    if package is not None:
+        package.update_note_fields(note)
+    else:
+        invoke("updateNoteFields", note=note)
+
 
 def create_audio_file(
-    client: OpenAI,
+    backend: backends.GenerationBackend,
     text: str,
     filename: str,
     *,
@@ -92,15 +206,46 @@ def create_audio_file(
     voice: str,
     instructions: str,
 ) -> None:
-    """Generate speech audio for the supplied text and persist it to disk."""
+    """Generate speech audio for the supplied text and persist it to disk.
+
+    Each request writes its own partial file, so a hedged duplicate never
+    writes over the one that answered first.
+    """
     target_path = AUDIO_DIR / filename
-    with client.audio.speech.with_streaming_response.create(
-        model=model,
-        voice=voice,
-        input=text,
-        instructions=instructions,
-    ) as response:
-        response.stream_to_file(target_path)
+
+    def attempt() -> Path:
+        partial = target_path.with_name(f"{target_path.name}.{uuid.uuid4().hex}.partial")
+        try:
+            backend.speech_to_file(partial, text, model=model, voice=voice, instructions=instructions)
+        except BaseException:
+            partial.unlink(missing_ok=True)
+            raise
+        return partial
+
+    with tracing.span("audio.speech", model=model):
+        written = hedging.call("audio.speech", attempt, discard=lambda path: path.unlink(missing_ok=True))
+    os.replace(written, target_path)
+
+
+def request_audio(
+    backend: backends.GenerationBackend,
+    text: str,
+    *,
+    model: str,
+    voice: str,
+    instructions: str,
+    response_format: Optional[str] = None,
+) -> bytes:
+    """Generate speech audio for the supplied text and return it in memory."""
+    # Batched requests are far longer, so they keep latencies of their own.
+    operation = "audio.speech" if response_format is None else f"audio.speech.{response_format}"
+    with tracing.span("audio.speech", model=model):
+        return hedging.call(
+            operation,
+            lambda: backend.speech(
+                text, model=model, voice=voice, instructions=instructions, response_format=response_format
+            ),
+        )
 
 
 def process_card(
@@ -109,42 +254,239 @@ def process_card(
     model: str,
     voice: str,
     instructions: str,
+    package: Optional[DeckPackage] = None,
+    inline: bool = False,
+    cache_local: bool = False,
+) -> Tuple[str, str, Any]:
+    note = Note.of(card)
+    with tracing.span("process_card", card_id=note.note_id):
+        return retry.call(
+            _process_card,
+            note, api_key, model, voice, instructions, package, inline, cache_local,
+        )
+
+
+def _process_card(
+    note: Note,
+    api_key: str,
+    model: str,
+    voice: str,
+    instructions: str,
+    package: Optional[DeckPackage],
+    inline: bool = False,
+    cache_local: bool = False,
 ) -> Tuple[str, str, Any]:
-    card_id, front_text, back_text = card
-    local_client = OpenAI(api_key=api_key)
-    filename = f"{card_id}.mp3"
-    tts_input = prepare_text_for_tts(front_text)
+    backend = backends.current(api_key)
+    card_id, back_text = note.note_id, note.back
+    filename = f"{card_id}.{backend.audio_format}"
+    # Stale audio is replaced, not appended to.
+    front_text = note.front_without_sound
+    tts_input = note.spoken_front
     if not tts_input:
         return ("skip", front_text, "No speakable text after cleaning.")
     try:
-        create_audio_file(
-            local_client,
-            tts_input,
+        file_path: Optional[Path] = None
+        if inline:
+            audio_bytes = request_audio(
+                backend,
+                tts_input,
+                model=model,
+                voice=voice,
+                instructions=instructions,
+            )
+            attachment = {"data": base64.b64encode(audio_bytes).decode("ascii")}
+            if cache_local:
+                file_path = (AUDIO_DIR / filename).resolve()
+                file_path.write_bytes(audio_bytes)
+        else:
+            create_audio_file(
+                backend,
+                tts_input,
+                filename,
+                model=model,
+                voice=voice,
+                instructions=instructions,
+            )
+            file_path = (AUDIO_DIR / filename).resolve()
+            attachment = {"path": file_path.as_posix()}
+        attach_audio(
+            card_id,
+            front_text,
+            back_text,
             filename,
-            model=model,
-            voice=voice,
-            instructions=instructions,
-        )
-        file_path = (AUDIO_DIR / filename).resolve()
-        invoke(
-            "updateNoteFields",
-            note={
-                "id": card_id,
-                "fields": {"Front": front_text, "Back": back_text},
-                "audio": [
-                    {
-                        "filename": filename,
-                        "fields": ["Front"],
-                        "path": file_path.as_posix(),
-                    }
-                ],
-            },
+            attachment,
+            file_path,
+            {"model": model, "voice": voice, "instructions": instructions, "text": tts_input},
+            package,
         )
         return ("added", front_text, None)
     except Exception as exc:
         return ("error", front_text, exc)
 
 
+def attach_audio(
+    card_id: int,
+    front_text: str,
+    back_text: str,
+    filename: str,
+    attachment: Dict[str, str],
+    file_path: Optional[Path],
+    params: Dict[str, Any],
+    package: Optional[DeckPackage],
+) -> None:
+    if file_path is not None:
+        media_index.record("audio", card_id, file_path, params)
+    update_note(
+        {
+            "id": card_id,
+            "fields": {"Front": front_text, "Back": back_text},
+            "audio": [
+                {
+                    "filename": filename,
+                    "fields": ["Front"],
+                    **attachment,
+                }
+            ],
+        },
+        package,
+    )
+    discard_other_formats(card_id, filename)
+
+
+def discard_other_formats(card_id: int, filename: str) -> None:
+    """Delete this card's earlier audio saved under another extension, and its index row.
+
+    Batched clips are WAV while single requests use the backend's format, so
+    switching between the two modes renames a card's audio.
+    """
+    stale = [
+        path
+        for path in AUDIO_DIR.glob(f"{card_id}.*")
+        if path.stem == str(card_id) and path.name != filename
+    ]
+    for path in stale:
+        path.unlink(missing_ok=True)
+    if stale:
+        media_index.remove("audio", [path.name for path in stale])
+
+
+def project_spend(cards: List[Tuple[int, str, str]], model: str) -> Tuple[int, Optional[float]]:
+    """Characters that would be voiced, and what they would cost (None if the model has no price)."""
+    characters = sum(len(Note.of(card).spoken_front) for card in cards)
+    return characters, costs.speech_cost(model, characters)
+
+
+def plan_batches(
+    cards: List[Tuple[int, str, str]], batch_size: int
+) -> Tuple[List[List[Tuple[int, str, str]]], List[Tuple[int, str, str]]]:
+    """Group short, speakable fronts into batches; everything else is voiced on its own."""
+    batchable: List[Tuple[int, str, str]] = []
+    singles: List[Tuple[int, str, str]] = []
+    for card in cards:
+        text = Note.of(card).spoken_front
+        if batch_size > 1 and text and len(text.split()) <= BATCH_MAX_WORDS:
+            batchable.append(card)
+        else:
+            singles.append(card)
+    batches = [batchable[start:start + batch_size] for start in range(0, len(batchable), batch_size)]
+    # A batch of one saves nothing and still risks a bad split.
+    if batches and len(batches[-1]) == 1:
+        singles.extend(batches.pop())
+    return batches, singles
+
+
+def process_batch(
+    cards: List[Tuple[int, str, str]],
+    api_key: str,
+    model: str,
+    voice: str,
+    instructions: str,
+    package: Optional[DeckPackage] = None,
+    inline: bool = False,
+    cache_local: bool = False,
+) -> List[Tuple[int, str, str, Any]]:
+    """Voice several short fronts with one request and split the audio at the pauses.
+
+    Returns ``(card_id, status, front, error)`` per card. When the number of
+    pauses does not match the number of cards, every card is voiced on its own.
+    """
+    with tracing.span("process_batch", cards=len(cards)):
+        batch = [Note.of(card) for card in cards]
+        fronts = [note.front_without_sound for note in batch]
+        lines = [note.spoken_front for note in batch]
+        clips = None
+        try:
+            pcm = request_audio(
+                backends.current(api_key),
+                "\n".join(lines),
+                model=model,
+                voice=voice,
+                instructions=f"{instructions} {BATCH_INSTRUCTIONS}".strip(),
+                response_format="pcm",
+            )
+            clips = split_on_silence(pcm, len(cards))
+        except Exception as exc:
+            print(f"Batched speech request failed ({exc}); voicing {len(cards)} card(s) one by one.")
+        if clips is None:
+            metrics.TTS_BATCHES.inc(outcome="fallback")
+            return [
+                (card[0], *process_card(card, api_key, model, voice, instructions, package, inline, cache_local))
+                for card in cards
+            ]
+        metrics.TTS_BATCHES.inc(outcome="split")
+
+        results: List[Tuple[int, str, str, Any]] = []
+        for (card_id, _, back_text), front_text, line, clip in zip(cards, fronts, lines, clips):
+            filename = f"{card_id}.wav"
+            try:
+                audio_bytes = pcm_to_wav(clip)
+                file_path: Optional[Path] = None
+                if inline:
+                    attachment = {"data": base64.b64encode(audio_bytes).decode("ascii")}
+                    if cache_local:
+                        file_path = (AUDIO_DIR / filename).resolve()
+                        file_path.write_bytes(audio_bytes)
+                else:
+                    file_path = (AUDIO_DIR / filename).resolve()
+                    file_path.write_bytes(audio_bytes)
+                    attachment = {"path": file_path.as_posix()}
+                attach_audio(
+                    card_id,
+                    front_text,
+                    back_text,
+                    filename,
+                    attachment,
+                    file_path,
+                    {"model": model, "voice": voice, "instructions": instructions, "text": line, "batched": True},
+                    package,
+                )
+                results.append((card_id, "added", front_text, None))
+            except Exception as exc:
+                results.append((card_id, "error", front_text, exc))
+        return results
+
+
+def process_work(
+    work: List[Tuple[int, str, str]],
+    budget: scheduling.RunBudget,
+    api_key: str,
+    model: str,
+    voice: str,
+    instructions: str,
+    package: Optional[DeckPackage] = None,
+    inline: bool = False,
+    cache_local: bool = False,
+) -> List[Tuple[int, str, str, Any]]:
+    """Voice one unit of work (a batch or a single card) unless the run budget is spent."""
+    reason = budget.exhausted()
+    if reason is not None:
+        return [(card[0], "deferred", card[1], reason) for card in work]
+    if len(work) > 1:
+        return process_batch(work, api_key, model, voice, instructions, package, inline, cache_local)
+    card = work[0]
+    return [(card[0], *process_card(card, api_key, model, voice, instructions, package, inline, cache_local))]
+
+
 def main() -> None:
     """
     Given a deck name, this script adds audio to all cards in that deck.
@@ -152,47 +494,152 @@ def main() -> None:
     The filename of the sound file is the card id.
     """
     args = parse_args()
-    api_key = load_api_key()
-
-    print(f"Fetching notes for deck: {args.deck}")
-    candidates = get_candidate_cards(args.deck)
-    if not candidates:
-        print(f"No cards eligible for audio generation in deck '{args.deck}'.")
-        return
-
-    worker_limit = max(1, args.workers)
-    max_workers = max(1, min(worker_limit, len(candidates)))
-    instructions = args.instructions.strip()
-    print(
-        f"Generating audio with up to {max_workers} worker(s) using model {args.model} and voice {args.voice}."
-    )
-
-    added = skipped = failed = 0
-    with ThreadPoolExecutor(max_workers=max_workers) as executor:
-        futures = [
-            executor.submit(
-                process_card,
-                card,
-                api_key,
-                args.model,
-                args.voice,
-                instructions,
+    api_key = os.environ.get("OPENAI_API_KEY", "") if args.dry_run else load_api_key(args.backend)
+    with tracing.session_from_args(args), backends.selected(args.backend, api_key) as backend:
+        AUDIO_DIR.mkdir(parents=True, exist_ok=True)
+        package = None
+        index = None
+        if args.apkg:
+            if not args.apkg.exists():
+                raise SystemExit(f"Package not found: {args.apkg}")
+            package = DeckPackage.load(args.apkg)
+        else:
+            index = media_index.enable(media_index.INDEX_PATH)
+
+        instructions = args.instructions.strip()
+        print(f"Fetching notes for deck: {args.deck}")
+        candidates = get_candidate_cards(args.deck, package, include_voiced=index is not None)
+        # Audio from another backend is not what a later OpenAI run would produce.
+        model_key = args.model if args.backend == backends.DEFAULT_BACKEND else f"{args.backend}/{args.model}"
+        fingerprints = {
+            card[0]: audio_fingerprint(card[1], model_key, args.voice, instructions) for card in candidates
+        }
+        if index is not None and not args.force:
+            total = len(candidates)
+            candidates = select_changed_cards(candidates, index, fingerprints)
+            print(f"{total - len(candidates)} of {total} card(s) unchanged since their audio was made.")
+        if not candidates:
+            print(f"No cards eligible for audio generation in deck '{args.deck}'.")
+            return
+        if args.dry_run:
+            characters, projected = project_spend(candidates, args.model)
+            if not backend.requires_api_key:
+                projected = 0.0
+            print(
+                f"Dry run: {len(candidates)} card(s), {characters} character(s) to voice with {args.model}; "
+                + (
+                    f"projected spend {costs.format_usd(projected)}."
+                    if projected is not None
+                    else "no price known for this model."
+                )
             )
-            for card in candidates
-        ]
-        for future in as_completed(futures):
-            status, front_text, error = future.result()
-            if status == "added":
-                print(f"Adding audio for: {front_text}")
-                added += 1
-            elif status == "skip":
-                print(f"Skipping audio for: {front_text} ({error})")
-                skipped += 1
+            if projected and args.max_cost and projected > args.max_cost:
+                print(
+                    f"--max-cost {costs.format_usd(args.max_cost)} would stop the run after about "
+                    f"{int(len(candidates) * args.max_cost / projected)} card(s)."
+                )
+            return
+        if args.order == "review":
+            if package is not None:
+                print("Review order needs AnkiConnect scheduling data; keeping package order.")
             else:
-                print(f"Failed audio for: {front_text} ({error})")
-                failed += 1
+                candidates = scheduling.order_by_review(
+                    candidates, scheduling.review_priorities(args.deck, invoke)
+                )
+                print("Processing cards in order of upcoming review.")
+        budget = scheduling.RunBudget(args.max_seconds, args.max_cost)
+        retry.configure(args.attempts, budget)
+        hedger = hedging.enable_from_args(args)
+        dead_letters = retry.enable_dead_letters(None if args.no_dead_letter else args.dead_letter)
+        cards_by_id = {card[0]: card for card in candidates}
+        options = {
+            "model": args.model,
+            "voice": args.voice,
+            "instructions": instructions,
+            "backend": args.backend,
+            "inline_media": args.inline_media,
+            "cache_media": args.cache_media,
+        }
+
+        batches, singles = plan_batches(candidates, args.batch_size)
+        positions = {card[0]: position for position, card in enumerate(candidates)}
+        work = sorted(batches + [[card] for card in singles], key=lambda item: positions[item[0][0]])
+        worker_limit = max(1, args.workers)
+        max_workers = max(1, min(worker_limit, len(work)))
+        print(
+            f"Generating audio with up to {max_workers} worker(s) using model {args.model} and voice {args.voice}."
+        )
+        if batches:
+            print(
+                f"Batching {sum(len(batch) for batch in batches)} short front(s) into "
+                f"{len(batches)} request(s); {len(singles)} card(s) voiced individually."
+            )
+
+        added = skipped = failed = deferred = 0
+        total = len(candidates)
+        progress_step = max(1, total // 10)
+        metrics.CARDS_PENDING.set(total, script="audio")
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            # Submission order is start order, so priority order carries through.
+            futures = [
+                executor.submit(
+                    process_work,
+                    item,
+                    budget,
+                    api_key,
+                    args.model,
+                    args.voice,
+                    instructions,
+                    package,
+                    args.inline_media,
+                    args.cache_media,
+                )
+                for item in work
+            ]
+            for future in as_completed(futures):
+                for card_id, status, front_text, error in future.result():
+                    if index is not None and status in ("added", "skip"):
+                        index.set_fingerprint("audio", card_id, fingerprints[card_id])
+                    metrics.CARDS_PENDING.dec(script="audio")
+                    metrics.CARDS_PROCESSED.inc(script="audio", status=status)
+                    if status == "added":
+                        print(f"Adding audio for: {front_text}")
+                        added += 1
+                    elif status == "skip":
+                        print(f"Skipping audio for: {front_text} ({error})")
+                        skipped += 1
+                    elif status == "deferred":
+                        deferred += 1
+                    else:
+                        print(f"Failed audio for: {front_text} ({error})")
+                        failed += 1
+                        retry.dead_letter(
+                            "audio",
+                            cards_by_id[card_id],
+                            error,
+                            deck=args.deck,
+                            options=options,
+                            apkg=args.apkg,
+                            fingerprint=fingerprints[card_id],
+                        )
+                    done = added + skipped + failed + deferred
+                    if done % progress_step == 0 or done == total:
+                        spend = f", spend {costs.format_usd(costs.spent())}" if costs.LEDGER else ""
+                        print(f"Audio progress: {done}/{total} card(s){spend}.")
 
-    print(f"Completed audio generation: {added} added, {skipped} skipped, {failed} failed.")
+        print(f"Completed audio generation: {added} added, {skipped} skipped, {failed} failed.")
+        if costs.LEDGER:
+            print(costs.LEDGER.summary())
+        if hedger is not None:
+            print(hedger.summary())
+        if failed and dead_letters is not None:
+            print(f"Recorded failed card(s) in {dead_letters.path}; retry them with: python AnkiDeadLetter.py replay")
+        if deferred:
+            print(f"Deferred {deferred} card(s): {budget.exhausted()}; re-run to continue.")
+        if package is not None:
+            package.write(args.apkg)
+            print(f"Wrote package: {args.apkg}")
+        metrics.report_run()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,444 @@
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import os
+from pathlib import Path
+import signal
+import socket
+import sys
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+from AnkiSync import invoke
+from utils import backends, media_index, metrics, retry
+from utils.notes import Note
+from utils.work_queue import DEFAULT_LEASE_SECONDS, QUEUE_PATH, RecordedWrites, RemoteError, WorkQueue
+
+DEFAULT_POLL_SECONDS = 2.0
+DEFAULT_WORKERS = 4
+# Results applied per AnkiConnect ``multi`` request; each can carry an image inline.
+APPLY_BATCH = 20
+MEDIA_KINDS = {"audio": "audio", "images": "image"}
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description=(
+            "Generate a deck's audio or images on several machines: a coordinator queues the cards "
+            "and writes the results to Anki, workers anywhere claim cards and generate the media."
+        )
+    )
+    parser.add_argument(
+        "--queue",
+        type=Path,
+        default=Path(os.environ.get("ANKI_WORK_QUEUE", QUEUE_PATH)),
+        help="Shared SQLite queue file every process opens (default: ANKI_WORK_QUEUE or media/work_queue.sqlite3).",
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    coordinator = subparsers.add_parser(
+        "coordinator",
+        help="Queue a deck's candidate cards and apply the workers' results to Anki.",
+        epilog=(
+            "Workers gate image cards one at a time with the stored gating prompt; grouped or batched "
+            "gating, the local prefilter and the draft upgrade pass are single-machine only. The web "
+            "UI does not see the coordinator's writes until its cached listings expire (up to 5 "
+            "minutes) or are reloaded with ?refresh=1."
+        ),
+    )
+    coordinator.add_argument("deck", nargs="?", help="Deck whose cards are queued.")
+    coordinator.add_argument("--script", choices=sorted(MEDIA_KINDS), default="audio")
+    coordinator.add_argument(
+        "--job",
+        type=int,
+        help="Resume applying the results of an existing job instead of queueing a new one.",
+    )
+    coordinator.add_argument("--model", help="Speech model (audio).")
+    coordinator.add_argument("--voice", help="Speech voice (audio).")
+    coordinator.add_argument("--instructions", help="Speech instructions (audio).")
+    coordinator.add_argument("--image-model", help="Image model (images).")
+    coordinator.add_argument("--prompt", help="Image prompt template with a {text} placeholder (images).")
+    coordinator.add_argument("--skip-gating", action="store_true", help="Illustrate every card (images).")
+    coordinator.add_argument(
+        "--draft",
+        action="store_true",
+        help=(
+            "Attach low-quality drafts, like the image script's --draft --no-upgrade; its next run "
+            "upgrades them (images)."
+        ),
+    )
+    coordinator.add_argument("--draft-size", help="Image size requested for drafts (default: the image script's).")
+    coordinator.add_argument(
+        "--draft-quality", help="Image quality requested for drafts (default: the image script's)."
+    )
+    coordinator.add_argument(
+        "--force",
+        action="store_true",
+        help="Queue every candidate, even cards whose text and settings are unchanged.",
+    )
+    coordinator.add_argument(
+        "--poll-interval",
+        type=float,
+        default=DEFAULT_POLL_SECONDS,
+        help="Seconds between checks for reported results (default: %(default)s).",
+    )
+    coordinator.add_argument(
+        "--dead-letter",
+        type=Path,
+        default=retry.DEAD_LETTER_PATH,
+        help="JSONL file that records cards which failed, for AnkiDeadLetter.py replay.",
+    )
+    coordinator.add_argument("--no-dead-letter", action="store_true", help="Do not record failed cards.")
+    backends.add_backend_argument(coordinator)
+
+    worker = subparsers.add_parser("worker", help="Claim queued cards and generate their media.")
+    worker.add_argument(
+        "--workers",
+        type=int,
+        default=DEFAULT_WORKERS,
+        help="Cards this process works on at the same time (default: %(default)s).",
+    )
+    worker.add_argument(
+        "--lease-seconds",
+        type=float,
+        default=DEFAULT_LEASE_SECONDS,
+        help=(
+            "How long a claimed card stays this worker's without a heartbeat; heartbeats are sent "
+            "every third of it (default: %(default)s)."
+        ),
+    )
+    worker.add_argument(
+        "--poll-interval",
+        type=float,
+        default=DEFAULT_POLL_SECONDS,
+        help="Seconds between claims while the queue is empty (default: %(default)s).",
+    )
+    worker.add_argument(
+        "--until-empty",
+        action="store_true",
+        help="Exit once no card is left to claim instead of waiting for more.",
+    )
+    worker.add_argument("--name", help="Worker name in the queue (default: hostname-pid).")
+    worker.add_argument(
+        "--attempts",
+        type=int,
+        default=int(os.environ.get("ANKI_RETRY_ATTEMPTS", str(retry.DEFAULT_ATTEMPTS))),
+        help="Tries per card for transient errors (default: ANKI_RETRY_ATTEMPTS or %(default)s).",
+    )
+    backends.add_backend_argument(worker)
+
+    subparsers.add_parser("status", help="Show every job in the queue and its cards per state.")
+    return parser.parse_args(argv)
+
+
+def load_api_key(backend: str) -> str:
+    api_key = os.environ.get("OPENAI_API_KEY", "")
+    if not api_key and backends.requires_api_key(backend):
+        raise SystemExit("Environment variable OPENAI_API_KEY is not set.")
+    return api_key
+
+
+def plan_job(
+    args: argparse.Namespace, index: media_index.MediaIndex
+) -> Tuple[List[Note], Dict[int, str], Dict[str, Any]]:
+    """Candidate cards, their fingerprints and the options workers generate with.
+
+    The same selection the single-machine script makes: the script's
+    candidates, minus cards unchanged since their media was made.
+    """
+    # Imported here; each script imports ``invoke`` from AnkiSync, as this one does.
+    if args.script == "audio":
+        import AnkiDeckToSpeech as script
+
+        model = args.model or script.DEFAULT_MODEL
+        voice = args.voice or script.DEFAULT_VOICE
+        instructions = (args.instructions or script.DEFAULT_INSTRUCTIONS).strip()
+        candidates = script.get_candidate_cards(args.deck, include_voiced=True)
+        model_key = model if args.backend == backends.DEFAULT_BACKEND else f"{args.backend}/{model}"
+        fingerprints = {
+            card[0]: script.audio_fingerprint(card[1], model_key, voice, instructions) for card in candidates
+        }
+        options = {"model": model, "voice": voice, "instructions": instructions, "backend": args.backend}
+    else:
+        import AnkiDeckToImages as script
+
+        image_model = args.image_model or script.DEFAULT_IMAGE_MODEL
+        prompt_template = (args.prompt or script.DEFAULT_PROMPT).strip()
+        candidates = script.get_candidate_cards(args.deck)
+        model_key = image_model if args.backend == backends.DEFAULT_BACKEND else f"{args.backend}/{image_model}"
+        fingerprints = {
+            card[0]: script.image_fingerprint(card[1], card[2], model_key, prompt_template) for card in candidates
+        }
+        image_options = (
+            {
+                "size": args.draft_size or script.DRAFT_SIZE,
+                "quality": args.draft_quality or script.DRAFT_QUALITY,
+            }
+            if args.draft
+            else None
+        )
+        options = {
+            "image_model": image_model,
+            "prompt": prompt_template,
+            "skip_gating": args.skip_gating,
+            "image_options": image_options,
+            "backend": args.backend,
+        }
+    if not args.force:
+        total = len(candidates)
+        candidates = script.select_changed_cards(candidates, index, fingerprints)
+        print(f"{total - len(candidates)} of {total} card(s) unchanged since they were last processed.")
+    return candidates, fingerprints, options
+
+
+def apply_results(
+    queue: WorkQueue, job: Dict[str, Any], index: Optional[media_index.MediaIndex], counts: Dict[str, int]
+) -> int:
+    """Write one batch of reported results to Anki; return how many were handled."""
+    results = queue.reported(job["id"], APPLY_BATCH)
+    if not results:
+        return 0
+    actions = [action for result in results for action in result["operations"]]
+    answers = invoke("multi", actions=actions) if actions else []
+    position = 0
+    for result in results:
+        status, text, error = result["status"], result["text"], result["error"]
+        error = RemoteError(error, result["retryable"]) if error is not None else None
+        for answer in answers[position:position + len(result["operations"])]:
+            if answer.get("error") is not None and status != "error":
+                status, error = "error", RemoteError(f"AnkiConnect: {answer['error']}")
+        position += len(result["operations"])
+        card = (result["note_id"], result["front"], result["back"])
+        if index is not None and result["fingerprint"] and status in ("added", "skip"):
+            fingerprint = result["fingerprint"]
+            if status == "added" and job["options"].get("image_options"):
+                fingerprint = media_index.draft_fingerprint(fingerprint)
+            index.set_fingerprint(MEDIA_KINDS[job["script"]], result["note_id"], fingerprint)
+        metrics.CARDS_PROCESSED.inc(script=job["script"], status=status)
+        if status == "error":
+            print(f"Failed {job['script']} for: {text} ({error})")
+            counts["failed"] += 1
+            retry.dead_letter(
+                job["script"], card, error, deck=job["deck"], options=job["options"], fingerprint=result["fingerprint"]
+            )
+        elif status == "added":
+            print(f"Added {job['script']} for: {text} (by {result['worker']})")
+            counts["added"] += 1
+        else:
+            print(f"Skipped {job['script']} for: {text} ({error})")
+            counts["skipped"] += 1
+    queue.mark_done(result["id"] for result in results)
+    return len(results)
+
+
+def coordinate(
+    queue: WorkQueue,
+    job_id: int,
+    index: Optional[media_index.MediaIndex] = None,
+    poll_interval: float = DEFAULT_POLL_SECONDS,
+    stop: Optional[threading.Event] = None,
+) -> Dict[str, int]:
+    """Apply results as workers report them until every card of the job is done."""
+    stop = stop or threading.Event()
+    job = queue.job(job_id)
+    if job is None:
+        raise SystemExit(f"No job {job_id} in {queue.path}.")
+    counts = {"added": 0, "skipped": 0, "failed": 0}
+    last_progress = None
+    while not stop.is_set():
+        # Also fails cards whose leases keep expiring when no worker is left to claim them.
+        queue.reclaim()
+        if apply_results(queue, job, index, counts):
+            continue
+        state = queue.counts(job_id)
+        if not state["pending"] and not state["leased"] and not state["reported"]:
+            break
+        progress = (state["pending"], state["leased"], state["done"])
+        if progress != last_progress:
+            print(f"Job {job_id}: {state['done']} done, {state['leased']} in progress, {state['pending']} waiting.")
+            last_progress = progress
+        stop.wait(poll_interval)
+    return counts
+
+
+def run_coordinator(args: argparse.Namespace) -> None:
+    queue = WorkQueue(args.queue)
+    index = media_index.enable(media_index.INDEX_PATH)
+    if args.job is None:
+        if not args.deck:
+            raise SystemExit("Give a deck to queue, or --job to resume an existing job.")
+        print(f"Fetching notes for deck: {args.deck}")
+        candidates, fingerprints, options = plan_job(args, index)
+        if not candidates:
+            print(f"No cards eligible for {args.script} in deck '{args.deck}'.")
+            return
+        job_id = queue.submit(args.script, args.deck, args.backend, options, candidates, fingerprints)
+        print(
+            f"Queued {len(candidates)} card(s) as job {job_id}. Start workers with: "
+            f"python AnkiDistributed.py --queue {args.queue} worker --backend {args.backend}"
+        )
+    else:
+        job_id = args.job
+    dead_letters = retry.enable_dead_letters(None if args.no_dead_letter else args.dead_letter)
+    stop = threading.Event()
+    previous_handler = signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    try:
+        counts = coordinate(queue, job_id, index, args.poll_interval, stop)
+    except KeyboardInterrupt:
+        print(f"Stopping; workers keep going. Resume with: python AnkiDistributed.py coordinator --job {job_id}")
+        return
+    finally:
+        signal.signal(signal.SIGTERM, previous_handler)
+        queue.close()
+    print(
+        f"Completed job {job_id}: {counts['added']} added, {counts['skipped']} skipped, {counts['failed']} failed."
+    )
+    if counts["failed"] and dead_letters is not None:
+        print(f"Recorded failed card(s) in {dead_letters.path}; retry them with: python AnkiDeadLetter.py replay")
+    metrics.report_run()
+
+
+def process_task(task: Dict[str, Any], api_key: str) -> Tuple[str, str, Any, List[Dict[str, Any]]]:
+    """Generate one card's media; its Anki writes are recorded, not sent."""
+    # Imported here because it imports both scripts, which import ``invoke`` from AnkiSync.
+    from AnkiDeadLetter import replay_card
+
+    writes = RecordedWrites()
+    # Media has to travel inline: the coordinator's Anki cannot read this machine's files.
+    entry = {"script": task["script"], "options": {**task["options"], "inline_media": True, "cache_media": False}}
+    status, text, error = replay_card(entry, Note(task["note_id"], task["front"], task["back"]), api_key, writes)
+    return status, text, error, writes.actions
+
+
+def work(
+    queue: WorkQueue,
+    worker_id: str,
+    backend_name: str,
+    api_key: str,
+    workers: int = DEFAULT_WORKERS,
+    lease_seconds: float = DEFAULT_LEASE_SECONDS,
+    poll_interval: float = DEFAULT_POLL_SECONDS,
+    until_empty: bool = False,
+    stop: Optional[threading.Event] = None,
+) -> Dict[str, int]:
+    """Claim and process cards until stopped (or, with ``until_empty``, until none are left)."""
+    stop = stop or threading.Event()
+    workers = max(1, workers)
+    held: Dict[int, str] = {}
+    held_lock = threading.Lock()
+    counts = {"reported": 0, "lost": 0}
+    idle = threading.Semaphore(workers)
+
+    # Separate from ``stop``: leases are renewed until the cards in progress finish.
+    beat_stop = threading.Event()
+
+    def heartbeat() -> None:
+        while not beat_stop.wait(lease_seconds / 3):
+            with held_lock:
+                leases = dict(held)
+            for task_id in queue.heartbeat(leases, lease_seconds):
+                print(f"Lost the lease on task {task_id}; another worker will take it over.")
+
+    def run(task: Dict[str, Any]) -> None:
+        try:
+            status, text, error, operations = process_task(task, api_key)
+            if status == "error":
+                operations = []
+            reported = queue.report(task["id"], task["token"], status, text, error, operations)
+            with held_lock:
+                counts["reported" if reported else "lost"] += 1
+            if reported:
+                print(f"{task['script']} {status} for: {text}" + (f" ({error})" if error else ""))
+            else:
+                print(f"Discarded the result for note {task['note_id']}: its lease had expired.")
+        except Exception as exc:
+            print(f"Failed to process task {task['id']}: {exc}")
+        finally:
+            with held_lock:
+                held.pop(task["id"], None)
+            idle.release()
+
+    beat = threading.Thread(target=heartbeat, name="queue_heartbeat", daemon=True)
+    beat.start()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        while not stop.is_set():
+            free = 0
+            while idle.acquire(blocking=False):
+                free += 1
+            tasks = queue.claim(worker_id, backend_name, free, lease_seconds) if free else []
+            for _ in range(free - len(tasks)):
+                idle.release()
+            with held_lock:
+                held.update((task["id"], task["token"]) for task in tasks)
+                busy = bool(held)
+            for task in tasks:
+                executor.submit(run, task)
+            if tasks:
+                continue
+            if until_empty and not busy and free == workers:
+                break
+            stop.wait(poll_interval)
+    beat_stop.set()
+    beat.join()
+    return counts
+
+
+def run_worker(args: argparse.Namespace) -> None:
+    api_key = load_api_key(args.backend)
+    worker_id = args.name or f"{socket.gethostname()}-{os.getpid()}"
+    queue = WorkQueue(args.queue)
+    retry.configure(args.attempts)
+    stop = threading.Event()
+    previous_handler = signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    print(f"Worker {worker_id} claiming {args.backend} cards from {args.queue}.")
+    try:
+        with backends.selected(args.backend, api_key):
+            counts = work(
+                queue,
+                worker_id,
+                args.backend,
+                api_key,
+                workers=args.workers,
+                lease_seconds=args.lease_seconds,
+                poll_interval=args.poll_interval,
+                until_empty=args.until_empty,
+                stop=stop,
+            )
+    except KeyboardInterrupt:
+        print("Stopping; cards in progress go back to the queue when their leases expire.")
+        return
+    finally:
+        signal.signal(signal.SIGTERM, previous_handler)
+        queue.close()
+    print(f"Worker {worker_id} finished: {counts['reported']} card(s) reported, {counts['lost']} lost to expiry.")
+    metrics.report_run()
+
+
+def print_status(queue: WorkQueue) -> None:
+    jobs = queue.jobs()
+    if not jobs:
+        print(f"No jobs in {queue.path}.")
+        return
+    for job in jobs:
+        state = queue.counts(job["id"])
+        print(
+            f"Job {job['id']}  {job['script']}  {job['deck']}  {job['backend']}  "
+            + ", ".join(f"{count} {name}" for name, count in state.items())
+        )
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    args = parse_args(argv)
+    if args.command == "coordinator":
+        run_coordinator(args)
+    elif args.command == "worker":
+        run_worker(args)
+    else:
+        queue = WorkQueue(args.queue)
+        try:
+            print_status(queue)
+        finally:
+            queue.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,108 @@
+import argparse
+from pathlib import Path
+from typing import Dict, Iterable, List, Set
+
+from AnkiSync import invoke
+from utils.media_index import INDEX_PATH, MEDIA_DIRS, MediaIndex
+
+# Note IDs per findNotes query; keeps the search string well under URL/body limits.
+NOTE_QUERY_CHUNK = 200
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Maintain the local media index and reclaim space from orphaned media files."
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("stats", help="Show how many files and bytes the index tracks.")
+    subparsers.add_parser("rebuild", help="Index media files on disk that have no entry yet.")
+    gc_parser = subparsers.add_parser(
+        "gc", help="Delete media whose notes no longer exist in Anki (runs rebuild first)."
+    )
+    gc_parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="List what would be deleted without deleting anything.",
+    )
+    gc_parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Delete even when every indexed note appears to be missing.",
+    )
+    return parser.parse_args()
+
+
+def existing_note_ids(note_ids: Iterable[int]) -> Set[int]:
+    ids = sorted(set(note_ids))
+    found: Set[int] = set()
+    for start in range(0, len(ids), NOTE_QUERY_CHUNK):
+        chunk = ids[start:start + NOTE_QUERY_CHUNK]
+        found.update(invoke("findNotes", query="nid:" + ",".join(str(note_id) for note_id in chunk)))
+    return found
+
+
+def find_orphans(index: MediaIndex) -> List[Dict]:
+    """Rows whose note is gone from Anki; files not named after a note are left alone."""
+    rows = [row for row in index.rows() if row["note_id"] is not None]
+    alive = existing_note_ids(row["note_id"] for row in rows)
+    return [row for row in rows if row["note_id"] not in alive]
+
+
+def collect_garbage(
+    index: MediaIndex,
+    orphans: List[Dict],
+    dry_run: bool = False,
+    media_dirs: Dict[str, Path] = MEDIA_DIRS,
+) -> int:
+    """Delete orphaned files and their rows; return the bytes reclaimed."""
+    reclaimed = 0
+    for row in orphans:
+        path = media_dirs[row["kind"]] / row["filename"]
+        print(f"{'Would delete' if dry_run else 'Deleting'} {row['kind']} {row['filename']} ({row['size']} bytes)")
+        reclaimed += row["size"]
+        if dry_run:
+            continue
+        try:
+            path.unlink()
+        except FileNotFoundError:
+            pass
+        index.remove(row["kind"], [row["filename"]])
+    return reclaimed
+
+
+def main() -> None:
+    args = parse_args()
+    index = MediaIndex(INDEX_PATH)
+    try:
+        if args.command == "stats":
+            rows = index.rows()
+            for kind in MEDIA_DIRS:
+                kind_rows = [row for row in rows if row["kind"] == kind]
+                total = sum(row["size"] for row in kind_rows)
+                print(f"{kind}: {len(kind_rows)} file(s), {total / 1_048_576:.1f} MiB")
+            return
+
+        added = index.rebuild()
+        print(f"Indexed {added} new file(s); {len(index)} file(s) tracked in {INDEX_PATH}.")
+        if args.command == "rebuild":
+            return
+
+        orphans = find_orphans(index)
+        if not orphans:
+            print("No orphaned media found.")
+            return
+        tracked = sum(1 for row in index.rows() if row["note_id"] is not None)
+        if len(orphans) == tracked and not args.force:
+            raise SystemExit(
+                f"All {tracked} indexed note(s) are missing from Anki; is the right profile open? "
+                "Re-run with --force to delete anyway."
+            )
+        reclaimed = collect_garbage(index, orphans, dry_run=args.dry_run)
+        verb = "Would reclaim" if args.dry_run else "Reclaimed"
+        print(f"{verb} {reclaimed / 1_048_576:.1f} MiB from {len(orphans)} orphaned file(s).")
+    finally:
+        index.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,6 @@
 import argparse
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
 import json
 import os
 from pathlib import Path
@@ -6,21 +8,26 @@ import sys
 import shutil
 import urllib.error
 import urllib.request
-from typing import Any, Dict, List
-
-from openai import OpenAI
-
-ANKI_CONNECT_URL = "http://127.0.0.1:8765"
-
-# Function to create a file with the Files API
-def create_file(client: OpenAI, file_path: Path) -> str:
-    with open(file_path, "rb") as file_content:
-        result = client.files.create(
-            file=file_content,
-            purpose="assistants",
-        )
-    return result.id
-
+from typing import TYPE_CHECKING, Any, Dict, List, Optional
+
+from utils import backends, costs, metrics, tracing
+from utils.apkg import DeckPackage
+from utils.backends import (
+    build_extraction_request,
+    continue_extraction,
+    create_file,
+    parse_extraction_output,
+    record_response_usage,
+    response_incomplete,
+)
+from utils.batch import DEFAULT_POLL_INTERVAL, BatchJob, response_text_from_body, state_path_for
+from utils.common import normalize_json_payload
+from utils.notes import from_notes_info
+
+if TYPE_CHECKING:
+    import openai
+
+ANKI_CONNECT_URL = os.environ.get("ANKI_CONNECT_URL", "http://127.0.0.1:8765")
 
 def request(action: str, **params: Any) -> Dict[str, Any]:
     return {"action": action, "params": params, "version": 6}
@@ -29,20 +36,22 @@ def request(action: str, **params: Any) -> Dict[str, Any]:
 def invoke(action: str, **params: Any) -> Any:
     request_json = json.dumps(request(action, **params)).encode("utf-8")
     req = urllib.request.Request(ANKI_CONNECT_URL, request_json)
-    try:
-        with urllib.request.urlopen(req) as response_handle:
-            response = json.load(response_handle)
-    except urllib.error.URLError as exc:
-        raise RuntimeError(f"Failed to reach AnkiConnect at {ANKI_CONNECT_URL}: {exc}") from exc
-    if len(response) != 2:
-        raise Exception('response has an unexpected number of fields')
-    if 'error' not in response:
-        raise Exception('response is missing required error field')
-    if 'result' not in response:
-        raise Exception('response is missing required result field')
-    if response['error'] is not None:
-        raise Exception(response['error'])
-    return response['result']
+    # The response is checked inside the timer, so an AnkiConnect error counts as one.
+    with tracing.span(f"anki:{action}"), metrics.track_anki(action):
+        try:
+            with urllib.request.urlopen(req) as response_handle:
+                response = json.load(response_handle)
+        except urllib.error.URLError as exc:
+            raise RuntimeError(f"Failed to reach AnkiConnect at {ANKI_CONNECT_URL}: {exc}") from exc
+        if len(response) != 2:
+            raise Exception('response has an unexpected number of fields')
+        if 'error' not in response:
+            raise Exception('response is missing required error field')
+        if 'result' not in response:
+            raise Exception('response is missing required result field')
+        if response['error'] is not None:
+            raise Exception(response['error'])
+        return response['result']
 
 
 def parse_args():
@@ -76,68 +85,110 @@ def parse_args():
         help="Skip romanized text in the generated cards.",
     )
     parser.set_defaults(include_romanized=False)
+    parser.add_argument(
+        "--apkg",
+        type=Path,
+        help=(
+            "Write the notes into this .apkg package instead of AnkiConnect "
+            "(an existing package is extended)."
+        ),
+    )
+    parser.add_argument(
+        "--audio",
+        action="store_true",
+        help="Generate pronunciation audio for the new notes in the same run.",
+    )
+    parser.add_argument(
+        "--images",
+        action="store_true",
+        help="Generate images for the new notes in the same run.",
+    )
+    parser.add_argument(
+        "--skip-gating",
+        action="store_true",
+        help="With --images, generate an image for every note without the gating check.",
+    )
+    parser.add_argument(
+        "--batch",
+        action="store_true",
+        help=(
+            "Run extraction through the OpenAI Batch API (cheaper, not real-time). "
+            "Re-running after an interruption resumes the pending batch."
+        ),
+    )
+    parser.add_argument(
+        "--batch-poll-interval",
+        type=float,
+        default=DEFAULT_POLL_INTERVAL,
+        help="Seconds between batch status checks (default: %(default)s).",
+    )
+    backends.add_backend_argument(parser)
+    tracing.add_trace_arguments(parser)
     return parser.parse_args()
 
 
 def build_prompt(include_romanized: bool) -> str:
     romanized_line = (
-        'Include a "romanized" key only when a romanization is available.\n'
+        'Set "romanized" to the romanization when one is available, otherwise to null.\n'
         if include_romanized
-        else "Do not include romanization keys in the output.\n"
+        else 'Set "romanized" to null.\n'
     )
     return (
         "Read the attached PDF and extract vocabulary pairs.\n"
-        'Return a JSON array where each item contains the keys "english" and "foreign" '
-        "with string values.\n"
+        'Return a JSON object whose "pairs" array has one item per pair, with the keys '
+        '"english" and "foreign" as strings.\n'
         f"{romanized_line}"
-        "Respond with JSON only—no commentary, explanations, or additional fields."
+        "Keep the order of the PDF. Respond with JSON only—no commentary, explanations, or additional fields."
     )
 
 
-def get_response_text(resp: Any) -> str:
-    text = getattr(resp, "output_text", None)
-    if text:
-        return text
-
-    output = getattr(resp, "output", None)
-    if not output:
-        return ""
-
-    parts: List[str] = []
-    for item in output:
-        for content_piece in getattr(item, "content", []):
-            maybe_text = getattr(content_piece, "text", None)
-            if maybe_text:
-                parts.append(maybe_text)
-    return "".join(parts)
-
-
-def normalize_json_payload(raw_output: str) -> str:
-    raw_output = raw_output.strip()
-    if raw_output.startswith("```"):
-        lines = raw_output.splitlines()
-        if lines:
-            lines = lines[1:]
-        if lines and lines[-1].strip() == "```":
-            lines = lines[:-1]
-        raw_output = "\n".join(lines).strip()
-    return raw_output
+def extract_via_batch(
+    client: "openai.OpenAI",
+    pdf: Path,
+    model: str,
+    prompt_text: str,
+    poll_interval: float = DEFAULT_POLL_INTERVAL,
+) -> str:
+    """Run the extraction request as a one-line batch and return its output text."""
+    key = hashlib.sha256(
+        pdf.read_bytes() + f"\x00{model}\x00{prompt_text}".encode("utf-8")
+    ).hexdigest()
+    custom_id = f"extract-{pdf.name}"
+    job = BatchJob(client, state_path_for("extract", pdf.stem))
+    if job.resumable(key):
+        print(f"Resuming extraction batch {job.batch_id} for {pdf.name}.")
+    else:
+        print(f"Uploading PDF to OpenAI: {pdf}")
+        with tracing.span("upload_pdf", pdf=pdf.name):
+            file_id = create_file(client, pdf)
+        batch_id = job.submit([(custom_id, build_extraction_request(model, prompt_text, file_id))], key)
+        print(f"Submitted extraction batch {batch_id} for {pdf.name}.")
+    results = job.wait(poll_interval)
+    job.clear()
+    body = results.get(custom_id)
+    if body is None:
+        raise RuntimeError(f"Batch extraction request for {pdf.name} failed.")
+    record_response_usage("batch.responses", body, model, batch=True)
+    # A cut-off batch answer is finished with ordinary requests rather than another day-long batch.
+    return continue_extraction(
+        client, model, response_text_from_body(body), body.get("id"), incomplete=response_incomplete(body)
+    )
 
 
 def parse_word_pairs(raw_output: str) -> List[Dict[str, Any]]:
+    """Vocabulary pairs from extraction output; a cut-off list keeps its complete items."""
     cleaned_output = normalize_json_payload(raw_output)
     if not cleaned_output:
         raise RuntimeError("Model returned an empty response; unable to extract vocabulary.")
-    try:
-        parsed = json.loads(cleaned_output)
-    except json.JSONDecodeError as exc:
+    pairs, complete = parse_extraction_output(cleaned_output)
+    if not pairs and not complete:
         snippet = cleaned_output[:200] + ("..." if len(cleaned_output) > 200 else "")
         raise RuntimeError(
             f"Failed to parse vocabulary JSON from model output. First 200 chars: {snippet}"
-        ) from exc
-    if not isinstance(parsed, list):
-        raise RuntimeError("Model response was not a JSON array as requested.")
-    return parsed
+        )
+    if not complete:
+        print(f"Vocabulary JSON was cut off; keeping the {len(pairs)} complete pair(s).")
+    return pairs
 
 
 def build_note(deckname: str, front: str, back: str) -> Dict[str, Any]:
@@ -151,51 +202,80 @@ def build_note(deckname: str, front: str, back: str) -> Dict[str, Any]:
     }
 
 
-def main(): 
-    """
-    Given a PDF file, this script converts it to a list of English word to foreign word pairs.
-    The pairs are then added to an Anki deck as flashcards.
-    The foreign word is the front of the card and the English word is the back.
-    The deck name defaults to the PDF stem or can be provided via --deck.
-    """
-    args = parse_args()
-
-    if not args.pdf.exists():
-        sys.exit(f"PDF not found: {args.pdf}")
-
-    deckname = args.deck or args.pdf.stem
-    print(f"Using deck name: {deckname}")
-
-    api_key = os.environ.get("OPENAI_API_KEY")
-    if not api_key:
-        sys.exit("Environment variable OPENAI_API_KEY is not set.")
-    client = OpenAI(api_key=api_key)
-    # Getting the file ID
-    print(f"Uploading PDF to OpenAI: {args.pdf}")
-    file_id = create_file(client, args.pdf)
-
-    prompt_text = build_prompt(args.include_romanized)
-
-    response = client.responses.create(
-        model=args.model,
-        input=[{
-            "role": "user",
-            "content": [
-                {"type": "input_text", "text": prompt_text},
-                {
-                    "type": "input_file",
-                    "file_id": file_id,
-                },
-            ],
-        }],
-    )
+def attach_media(
+    note_ids: List[int],
+    api_key: Optional[str],
+    *,
+    audio: bool,
+    images: bool,
+    skip_gating: bool,
+    package: Optional[DeckPackage] = None,
+) -> None:
+    """Generate audio and/or images for new notes and attach them in place.
 
-    raw_output = get_response_text(response)
-    word_pairs = parse_word_pairs(raw_output)
+    Notes live in ``package`` when one is given, otherwise in Anki.
+    """
+    # Imported here because both scripts import ``invoke`` from this module.
+    import AnkiDeckToImages as image_script
+    import AnkiDeckToSpeech as speech_script
+
+    # Media goes into a package as bytes (``inline``), so nothing is left in media/.
+    inline = package is not None
+    if not inline:
+        speech_script.AUDIO_DIR.mkdir(parents=True, exist_ok=True)
+        image_script.IMAGE_DIR.mkdir(parents=True, exist_ok=True)
+    stages = []
+    if audio:
+        stages.append((
+            "audio",
+            speech_script.DEFAULT_MAX_WORKERS,
+            lambda card: speech_script.process_card(
+                card,
+                api_key,
+                speech_script.DEFAULT_MODEL,
+                speech_script.DEFAULT_VOICE,
+                speech_script.DEFAULT_INSTRUCTIONS,
+                package,
+                inline=inline,
+            ),
+        ))
+    if images:
+        stages.append((
+            "images",
+            image_script.DEFAULT_MAX_WORKERS,
+            lambda card: image_script.process_card(
+                card,
+                api_key,
+                image_script.DEFAULT_IMAGE_MODEL,
+                image_script.DEFAULT_PROMPT,
+                skip_gating,
+                package,
+                inline=inline,
+            ),
+        ))
+
+    # Stages run one after another so each sees the fields the previous one wrote.
+    for label, worker_limit, process in stages:
+        infos = package.notes_info(note_ids) if package is not None else invoke("notesInfo", notes=note_ids)
+        cards = from_notes_info(infos)
+        if not cards:
+            return
+        counts = {"added": 0, "skip": 0, "error": 0}
+        with ThreadPoolExecutor(max_workers=max(1, min(worker_limit, len(cards)))) as executor:
+            for status, text, error in executor.map(process, cards):
+                counts[status] += 1
+                if status == "error":
+                    print(f"Failed {label} for: {text} ({error})")
+        print(
+            f"Attached {label}: {counts['added']} added, {counts['skip']} skipped, "
+            f"{counts['error']} failed."
+        )
 
-    invoke('createDeck', deck=deckname)
-    print(f"Deck '{deckname}' created. Preparing notes...")
 
+def build_notes(
+    word_pairs: List[Dict[str, Any]], deckname: str, include_romanized: bool
+) -> Dict[str, Dict[str, Any]]:
+    """Turn extracted pairs into notes keyed by foreign word, dropping blanks and duplicates."""
     notes: Dict[str, Dict[str, Any]] = {}
     for vocab_pair in word_pairs:
         english = vocab_pair.get("english")
@@ -206,7 +286,7 @@ def main():
         foreign_clean = foreign_word.strip()
         if not english_clean or not foreign_clean:
             continue
-        romanized = vocab_pair.get("romanized") if args.include_romanized else None
+        romanized = vocab_pair.get("romanized") if include_romanized else None
         if romanized:
             romanized = romanized.strip()
             if not romanized:
@@ -219,20 +299,126 @@ def main():
             print(f"Skipping duplicate entry for: {foreign_clean}")
             continue
         notes[foreign_clean] = build_note(deckname, foreign_display, english_clean)
-
-    invoke("addNotes", notes=list(notes.values()))
-    print(f"Added {len(notes)} notes to deck '{deckname}'.")
+    return notes
+
+
+def sync_pdf(
+    pdf: Path,
+    backend: backends.GenerationBackend,
+    *,
+    deckname: str,
+    model: str,
+    include_romanized: bool,
+    api_key: Optional[str] = None,
+    apkg: Optional[Path] = None,
+    batch: bool = False,
+    batch_poll_interval: float = DEFAULT_POLL_INTERVAL,
+    audio: bool = False,
+    images: bool = False,
+    skip_gating: bool = False,
+) -> int:
+    """Extract one PDF into ``deckname`` and optionally attach media; return the notes added."""
+    prompt_text = build_prompt(include_romanized)
+    if batch:
+        if not backend.supports_batch:
+            raise RuntimeError(f"--batch needs the OpenAI Batch API, which backend '{backend.name}' does not offer.")
+        raw_output = extract_via_batch(backend.client, pdf, model, prompt_text, batch_poll_interval)
+    else:
+        with tracing.span("extract", model=model):
+            raw_output = backend.extract(pdf, model=model, prompt_text=prompt_text)
+
+    with tracing.span("parse_word_pairs"):
+        word_pairs = parse_word_pairs(raw_output)
+
+    if not apkg:
+        invoke('createDeck', deck=deckname)
+        print(f"Deck '{deckname}' created. Preparing notes...")
+
+    notes = build_notes(word_pairs, deckname, include_romanized)
+
+    if apkg:
+        package = DeckPackage.open(apkg)
+        note_ids = package.add_notes(notes.values())
+        print(f"Added {len(note_ids)} notes to deck '{deckname}' in package {apkg}.")
+        if audio or images:
+            attach_media(note_ids, api_key, audio=audio, images=images, skip_gating=skip_gating, package=package)
+        package.write(apkg)
+        print(f"Wrote package: {apkg}")
+        return len(note_ids)
+
+    # addNotes answers null for notes Anki rejected (duplicates, for example).
+    note_ids = [note_id for note_id in invoke("addNotes", notes=list(notes.values())) or [] if note_id]
+    print(f"Added {len(note_ids)} notes to deck '{deckname}'.")
+    if audio or images:
+        attach_media(note_ids, api_key, audio=audio, images=images, skip_gating=skip_gating)
+    return len(note_ids)
+
+
+def archive_pdf(pdf: Path, archive_dir: Optional[Path] = None, *, keep_both: bool = False) -> Optional[Path]:
+    """Move a processed PDF into ``pdfs/``; return where it went, or None if it stayed put.
+
+    An existing archive copy is left alone; with ``keep_both`` the new file is
+    archived under a numbered name instead of staying where it is.
+    """
     try:
-        pdf_archive_dir = Path.cwd() / "pdfs"
+        pdf_archive_dir = archive_dir or Path.cwd() / "pdfs"
         pdf_archive_dir.mkdir(exist_ok=True)
-        destination = pdf_archive_dir / args.pdf.name
+        destination = pdf_archive_dir / pdf.name
+        counter = 1
+        while keep_both and destination.exists():
+            counter += 1
+            destination = pdf_archive_dir / f"{pdf.stem}-{counter}{pdf.suffix}"
         if destination.exists():
             print(f"PDF already exists at {destination}; skipping move.")
-        else:
-            shutil.move(str(args.pdf), destination)
-            print(f"Moved processed PDF to {destination}.")
+            return None
+        shutil.move(str(pdf), destination)
+        print(f"Moved processed PDF to {destination}.")
+        return destination
     except Exception as exc:
         print(f"Warning: Failed to archive PDF: {exc}")
+        return None
+
+
+def main(): 
+    """
+    Given a PDF file, this script converts it to a list of English word to foreign word pairs.
+    The pairs are then added to an Anki deck as flashcards.
+    The foreign word is the front of the card and the English word is the back.
+    The deck name defaults to the PDF stem or can be provided via --deck.
+    """
+    args = parse_args()
+    api_key = os.environ.get("OPENAI_API_KEY")
+    with tracing.session_from_args(args), backends.selected(args.backend, api_key) as backend:
+        if not args.pdf.exists():
+            sys.exit(f"PDF not found: {args.pdf}")
+
+        deckname = args.deck or args.pdf.stem
+        print(f"Using deck name: {deckname}")
+
+        if not api_key and backend.requires_api_key:
+            sys.exit("Environment variable OPENAI_API_KEY is not set.")
+        if args.batch and not backend.supports_batch:
+            sys.exit(f"--batch needs the OpenAI Batch API, which backend '{args.backend}' does not offer.")
+
+        sync_pdf(
+            args.pdf,
+            backend,
+            deckname=deckname,
+            model=args.model,
+            include_romanized=args.include_romanized,
+            api_key=api_key,
+            apkg=args.apkg,
+            batch=args.batch,
+            batch_poll_interval=args.batch_poll_interval,
+            audio=args.audio,
+            images=args.images,
+            skip_gating=args.skip_gating,
+        )
+        archive_pdf(args.pdf)
+        if costs.LEDGER:
+            print(costs.LEDGER.summary())
+        metrics.report_run()
+
 
 if __name__=="__main__":
     main()
@@ -0,0 +1,246 @@
+import argparse
+import os
+from pathlib import Path
+import queue
+import signal
+import sys
+import threading
+import time
+from typing import Callable, List, Optional
+
+from AnkiSync import archive_pdf, sync_pdf
+from utils import backends, metrics, tracing
+from utils.common import BASE_DIR
+from utils.hot_folder import DEFAULT_POLL_SECONDS, DEFAULT_SETTLE_SECONDS, HotFolder
+
+DEFAULT_WATCH_DIR = BASE_DIR / "uploads"
+# Settled PDFs waiting for a worker; more are left in the folder until there is room.
+DEFAULT_QUEUE_SIZE = 8
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description=(
+            "Watch a folder and sync every new or changed PDF into Anki as it arrives, "
+            "archiving each processed file to pdfs/."
+        )
+    )
+    parser.add_argument(
+        "directory",
+        type=Path,
+        nargs="?",
+        default=DEFAULT_WATCH_DIR,
+        help="Folder to watch (default: uploads/).",
+    )
+    parser.add_argument(
+        "--deck",
+        help="Add every PDF to this deck (default: one deck per PDF, named after the file).",
+    )
+    parser.add_argument(
+        "--model",
+        default="gpt-4.1-mini",
+        help="OpenAI model used to extract vocabulary (default: %(default)s).",
+    )
+    romanized_group = parser.add_mutually_exclusive_group()
+    romanized_group.add_argument(
+        "--romanized",
+        dest="include_romanized",
+        action="store_true",
+        help="Include romanized text when available.",
+    )
+    romanized_group.add_argument(
+        "--no-romanized",
+        dest="include_romanized",
+        action="store_false",
+        help="Skip romanized text in the generated cards (default).",
+    )
+    parser.set_defaults(include_romanized=False)
+    parser.add_argument(
+        "--audio",
+        action="store_true",
+        help="Generate pronunciation audio for each PDF's new notes.",
+    )
+    parser.add_argument(
+        "--images",
+        action="store_true",
+        help="Generate images for each PDF's new notes.",
+    )
+    parser.add_argument(
+        "--skip-gating",
+        action="store_true",
+        help="With --images, generate an image for every note without the gating check.",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=int(os.environ.get("ANKI_WATCH_WORKERS", 1)),
+        help="PDFs processed at the same time (default: ANKI_WATCH_WORKERS or 1).",
+    )
+    parser.add_argument(
+        "--queue-size",
+        type=int,
+        default=DEFAULT_QUEUE_SIZE,
+        help="Settled PDFs that may wait for a worker (default: %(default)s).",
+    )
+    parser.add_argument(
+        "--settle-seconds",
+        type=float,
+        default=DEFAULT_SETTLE_SECONDS,
+        help=(
+            "How long a file's size and modification time must stay unchanged before it "
+            "is picked up, so partial copies are skipped (default: %(default)s)."
+        ),
+    )
+    parser.add_argument(
+        "--poll-interval",
+        type=float,
+        default=DEFAULT_POLL_SECONDS,
+        help="Seconds between folder scans (default: %(default)s).",
+    )
+    parser.add_argument(
+        "--archive-dir",
+        type=Path,
+        help="Where processed PDFs are moved (default: pdfs/ in the working directory).",
+    )
+    parser.add_argument(
+        "--once",
+        action="store_true",
+        help="Process the PDFs already in the folder, then exit.",
+    )
+    backends.add_backend_argument(parser)
+    tracing.add_trace_arguments(parser)
+    return parser.parse_args()
+
+
+def watch(
+    folder: HotFolder,
+    handle: Callable[[Path], object],
+    *,
+    workers: int = 1,
+    queue_size: int = DEFAULT_QUEUE_SIZE,
+    poll_interval: float = DEFAULT_POLL_SECONDS,
+    until_idle: bool = False,
+    stop: Optional[threading.Event] = None,
+) -> None:
+    """Hand settled files from ``folder`` to ``handle`` on worker threads.
+
+    Runs until ``stop`` is set, Ctrl-C, or SIGTERM; with ``until_idle`` it
+    also returns once nothing is waiting to settle or in progress. Files in
+    progress finish; queued files that never started stay in the folder and
+    are picked up by the next run.
+    """
+    stop = stop or threading.Event()
+    jobs: "queue.Queue[Optional[Path]]" = queue.Queue(maxsize=max(1, queue_size))
+    in_flight = 0
+    in_flight_lock = threading.Lock()
+
+    def worker() -> None:
+        nonlocal in_flight
+        while True:
+            path = jobs.get()
+            if path is None:
+                return
+            try:
+                handle(path)
+            except Exception as exc:
+                print(f"Failed to process {path.name}: {exc}")
+            finally:
+                with in_flight_lock:
+                    in_flight -= 1
+
+    threads: List[threading.Thread] = [
+        threading.Thread(target=worker, name=f"watch_{index}", daemon=True)
+        for index in range(max(1, workers))
+    ]
+    for thread in threads:
+        thread.start()
+    previous_handler = None
+    if threading.current_thread() is threading.main_thread():
+        previous_handler = signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    try:
+        while not stop.is_set():
+            for path in folder.scan():
+                with in_flight_lock:
+                    in_flight += 1
+                try:
+                    jobs.put_nowait(path)
+                except queue.Full:
+                    with in_flight_lock:
+                        in_flight -= 1
+                    folder.release(path)
+            if until_idle and not folder.pending:
+                with in_flight_lock:
+                    if in_flight == 0:
+                        break
+            stop.wait(poll_interval)
+    except KeyboardInterrupt:
+        print("Stopping; waiting for PDFs in progress...")
+    finally:
+        while True:
+            try:
+                jobs.get_nowait()
+            except queue.Empty:
+                break
+        for _ in threads:
+            jobs.put(None)
+        for thread in threads:
+            thread.join()
+        if previous_handler is not None:
+            signal.signal(signal.SIGTERM, previous_handler)
+
+
+def sync_file(pdf: Path, args: argparse.Namespace, backend: backends.GenerationBackend, api_key: Optional[str]) -> bool:
+    """Sync one settled PDF and archive it; failures leave it in place until it changes."""
+    deckname = args.deck or pdf.stem
+    started = time.monotonic()
+    print(f"Syncing {pdf.name} into deck '{deckname}'...")
+    try:
+        with tracing.span("watch_file", pdf=pdf.name):
+            added = sync_pdf(
+                pdf,
+                backend,
+                deckname=deckname,
+                model=args.model,
+                include_romanized=args.include_romanized,
+                api_key=api_key,
+                audio=args.audio,
+                images=args.images,
+                skip_gating=args.skip_gating,
+            )
+    except Exception as exc:
+        metrics.WATCH_FILES.inc(outcome="failed")
+        print(f"Failed to sync {pdf.name}: {exc}. It will be retried when the file changes.")
+        return False
+    archive_pdf(pdf, args.archive_dir, keep_both=True)
+    metrics.WATCH_FILES.inc(outcome="synced")
+    print(f"Synced {pdf.name}: {added} note(s) in {time.monotonic() - started:.1f}s.")
+    return True
+
+
+def main() -> None:
+    args = parse_args()
+    api_key = os.environ.get("OPENAI_API_KEY")
+    with tracing.session_from_args(args), backends.selected(args.backend, api_key) as backend:
+        if not api_key and backend.requires_api_key:
+            sys.exit("Environment variable OPENAI_API_KEY is not set.")
+        args.directory.mkdir(parents=True, exist_ok=True)
+        folder = HotFolder(args.directory, settle_seconds=args.settle_seconds)
+        workers = max(1, args.workers)
+        print(
+            f"Watching {args.directory} for PDFs ({workers} worker(s), files picked up after "
+            f"{args.settle_seconds:g}s without changes)."
+            + ("" if args.once else " Press Ctrl-C to stop.")
+        )
+        watch(
+            folder,
+            lambda pdf: sync_file(pdf, args, backend, api_key),
+            workers=workers,
+            queue_size=args.queue_size,
+            poll_interval=args.poll_interval,
+            until_idle=args.once,
+        )
+        metrics.report_run()
+
+
+if __name__ == "__main__":
+    main()
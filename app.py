@@ -1,26 +1,80 @@
 import os
 import subprocess
 import sys
-from functools import lru_cache
+import tempfile
+import threading
 from pathlib import Path
-from typing import List, Tuple
+from typing import Any, Dict, List, Optional, Tuple
 
 from dotenv import load_dotenv
-from flask import Flask, jsonify, render_template, request, send_from_directory, url_for
+from flask import Flask, Response, jsonify, render_template, request, send_from_directory, url_for
 from werkzeug.utils import secure_filename
 
-from openai import OpenAI
 from AnkiSync import invoke
-from utils.common import BASE_DIR, IMAGE_DIR, MEDIA_DIR, HTML_TAG_RE, IMG_SRC_RE
+from utils import backends, coverage, metrics
+from utils.clients import OpenAI
+from utils.common import BASE_DIR, IMAGE_DIR, MEDIA_DIR
+from utils.listing_cache import ListingCache
+from utils.media_index import MediaIndex
+from utils.notes import from_notes_info, image_filename
 
 UPLOAD_DIR = BASE_DIR / "uploads"
-UPLOAD_DIR.mkdir(exist_ok=True)
+# /sync runs AnkiSync itself, so its uploads stay out of sight of AnkiWatch.py on uploads/.
+WEB_UPLOAD_DIR = UPLOAD_DIR / ".web"
 
 ALLOWED_EXTENSIONS = {".pdf"}
+# Seconds before a cached listing is refreshed in the background.
+MODEL_LIST_TTL = 3600
+DECK_LIST_TTL = 300
 
 load_dotenv(BASE_DIR / ".env")
 
 app = Flask(__name__)
+_media_index: Optional[MediaIndex] = None
+_media_index_lock = threading.Lock()
+_warmed = False
+_warm_lock = threading.Lock()
+LISTINGS = ListingCache()
+
+
+def get_media_index() -> MediaIndex:
+    global _media_index
+    with _media_index_lock:
+        if _media_index is None:
+            _media_index = MediaIndex()
+        return _media_index
+
+
+def warm_media_index() -> None:
+    """On the first start after upgrading, index media written before the index existed.
+
+    Runs in the background; until it finishes the gallery shows what is indexed so far.
+    """
+
+    def rebuild() -> None:
+        index = get_media_index()
+        if not len(index):
+            print(f"Indexed {index.rebuild()} existing media file(s).")
+
+    threading.Thread(target=rebuild, name="media-index-rebuild", daemon=True).start()
+
+
+def warm() -> None:
+    """Start the background listing refresh and index backfill, once per process."""
+    global _warmed
+    with _warm_lock:
+        if _warmed:
+            return
+        _warmed = True
+    warm_listings()
+    warm_media_index()
+
+
+@app.before_request
+def warm_on_first_request() -> None:
+    # ``flask run`` never reaches ``__main__``; the first request starts the warm-up instead.
+    if not _warmed and not app.testing:
+        warm()
 
 
 def allowed_file(filename: str) -> bool:
@@ -29,17 +83,35 @@ def allowed_file(filename: str) -> bool:
 
 def run_script(script_path: Path, args: List[str]):
     env = os.environ.copy()
-    if "OPENAI_API_KEY" not in env:
+    backend = env.get(backends.BACKEND_ENV, backends.DEFAULT_BACKEND)
+    if "OPENAI_API_KEY" not in env and backends.requires_api_key(backend):
         raise RuntimeError("OPENAI_API_KEY is not set on the server.")
 
     command = [sys.executable, str(script_path)] + args
-    return subprocess.run(
-        command,
-        check=True,
-        capture_output=True,
-        text=True,
-        env=env,
-    )
+    script = script_path.stem
+    handle, metrics_path = tempfile.mkstemp(prefix="anki-metrics-", suffix=".json")
+    os.close(handle)
+    env[metrics.METRICS_FILE_ENV] = metrics_path
+    metrics.JOBS_IN_PROGRESS.inc(script=script)
+    outcome = "error"
+    try:
+        result = subprocess.run(
+            command,
+            check=True,
+            capture_output=True,
+            text=True,
+            env=env,
+        )
+        outcome = "ok"
+        return result
+    finally:
+        metrics.JOBS_IN_PROGRESS.dec(script=script)
+        metrics.JOBS_TOTAL.inc(script=script, status=outcome)
+        metrics.merge_file(Path(metrics_path))
+        try:
+            os.unlink(metrics_path)
+        except OSError:
+            pass
 
 
 @app.route("/", methods=["GET"])
@@ -47,23 +119,61 @@ def index():
     return render_template("index.html")
 
 
+@app.route("/metrics", methods=["GET"])
+def metrics_endpoint():
+    return Response(metrics.REGISTRY.render_prometheus(), mimetype="text/plain; version=0.0.4")
+
+
 @app.route("/api/decks", methods=["GET"])
 def list_decks():
     try:
-        decks = invoke("deckNames")
+        decks = LISTINGS.get("decks", fetch_deck_names, ttl=DECK_LIST_TTL)
         return jsonify({"ok": True, "decks": decks})
     except Exception as exc:
         return jsonify({"ok": False, "message": str(exc)}), 500
 
 
-@lru_cache(maxsize=1)
-def cached_model_ids() -> List[str]:
+@app.route("/api/deck-status", methods=["GET"])
+def deck_status():
+    """Per-deck media coverage for the whole collection, from AnkiConnect searches only."""
+    if request.args.get("refresh") == "1":
+        LISTINGS.invalidate("deck_status")
+    try:
+        decks = LISTINGS.get("deck_status", fetch_deck_status, ttl=DECK_LIST_TTL)
+        return jsonify({"ok": True, "decks": decks})
+    except Exception as exc:
+        return jsonify({"ok": False, "message": str(exc)}), 500
+
+
+def fetch_deck_names() -> List[str]:
+    names = invoke("deckNames")
+    # Card counts of decks that were deleted or renamed would otherwise stay on disk forever.
+    LISTINGS.prune("deck_count:", set(names))
+    return names
+
+
+def fetch_deck_status() -> List[Dict[str, Any]]:
+    return coverage.deck_coverage(invoke)
+
+
+def fetch_model_ids() -> List[str]:
     client = OpenAI()
-    response = client.models.list()
+    with metrics.track_openai("models.list", "n/a"):
+        response = client.models.list()
     data = getattr(response, "data", [])
     return [getattr(model, "id", "") for model in data if getattr(model, "id", "")]
 
 
+def cached_model_ids() -> List[str]:
+    return LISTINGS.get("models", fetch_model_ids, ttl=MODEL_LIST_TTL)
+
+
+def warm_listings() -> None:
+    """Fill the model and deck listings in the background so the first page load is instant."""
+    LISTINGS.warm("models", fetch_model_ids)
+    LISTINGS.warm("decks", fetch_deck_names)
+
+
 def filter_models(kind: str) -> List[str]:
     kind = kind.lower()
     ids = cached_model_ids()
@@ -95,7 +205,7 @@ def list_models(kind: str):
         return jsonify({"ok": False, "message": "Unsupported model type."}), 400
 
     if request.args.get("refresh") == "1":
-        cached_model_ids.cache_clear()
+        LISTINGS.invalidate("models")
 
     try:
         models = filter_models(kind)
@@ -116,32 +226,30 @@ def deck_images():
         note_ids = invoke("findNotes", query=f'deck:"{deck}"')
         if not note_ids:
             return jsonify({"ok": True, "images": []})
-        notes = invoke("notesInfo", notes=note_ids)
+        entries = [
+            note for note in from_notes_info(invoke("notesInfo", notes=note_ids), note_ids) if note.image_filename
+        ]
+
+        # Answer from the media index: one query by note ID, one by referenced filename.
+        media = get_media_index()
+        indexed = media.lookup([note.note_id for note in entries], "image")
+        by_name = media.by_filenames(
+            [name for note in entries for name in image_name_candidates(note.image_filename)], "image"
+        )
+        # No file is checked here; serve_image_file drops rows whose file is gone.
         results = []
-        for note_id, note in zip(note_ids, notes):
-            front = note["fields"]["Front"]["value"]
-            back = note["fields"]["Back"]["value"]
-            filename = extract_image_filename(front) or extract_image_filename(back)
-            if not filename:
+        for note in entries:
+            row = indexed.get(note.note_id) or next(
+                (by_name[name] for name in image_name_candidates(note.image_filename) if name in by_name), None
+            )
+            if row is None:
                 continue
-            local_path = IMAGE_DIR / filename
-            if not local_path.exists():
-                stem, suffix = os.path.splitext(filename)
-                if "-" in stem:
-                    base = stem.split("-", 1)[0] + suffix
-                    alt_path = IMAGE_DIR / base
-                    if alt_path.exists():
-                        local_path = alt_path
-                    else:
-                        continue
-                else:
-                    continue
             results.append(
                 {
-                    "card_id": note_id,
-                    "english": clean_field_text(back),
-                    "korean": clean_field_text(front),
-                    "image_url": url_for("serve_image_file", filename=local_path.name),
+                    "card_id": note.note_id,
+                    "english": note.clean_back,
+                    "korean": note.clean_front,
+                    "image_url": url_for("serve_image_file", filename=row["filename"]),
                 }
             )
         return jsonify({"ok": True, "images": results})
@@ -171,23 +279,30 @@ def estimate_media_duration(card_count: int, per_card_seconds: float) -> Tuple[i
 
 def get_deck_card_count(deckname: str) -> int:
     try:
-        cards = invoke("findNotes", query=f"deck:{deckname}")
-        return len(cards)
+        return LISTINGS.get(
+            f"deck_count:{deckname}",
+            lambda: len(invoke("findNotes", query=f"deck:{deckname}")),
+            ttl=DECK_LIST_TTL,
+        )
     except Exception:
         return 0
 
 
-def clean_field_text(raw: str) -> str:
-    raw = raw or ""
-    without_tags = HTML_TAG_RE.sub(" ", raw)
-    return " ".join(without_tags.split())
+def invalidate_deck(deckname: str) -> None:
+    """Forget listings a job may have changed; the next read fetches them again."""
+    LISTINGS.invalidate("decks", "deck_status", f"deck_count:{deckname}")
 
 
 def extract_image_filename(html: str) -> str:
-    match = IMG_SRC_RE.search(html or "")
-    if match:
-        return Path(match.group(1)).name
-    return ""
+    return image_filename(html)
+
+
+def image_name_candidates(filename: str) -> List[str]:
+    """Anki may store ``123.png`` as ``123-<hash>.png``; try the original name too."""
+    stem, suffix = os.path.splitext(filename)
+    if "-" in stem:
+        return [filename, stem.split("-", 1)[0] + suffix]
+    return [filename]
 
 
 @app.route("/sync", methods=["POST"])
@@ -204,7 +319,8 @@ def sync_deck():
         return jsonify({"ok": False, "message": "Only PDF files are supported."}), 400
 
     safe_name = secure_filename(uploaded_file.filename)
-    saved_path = UPLOAD_DIR / safe_name
+    WEB_UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
+    saved_path = WEB_UPLOAD_DIR / safe_name
     uploaded_file.save(saved_path)
 
     command_args = [str(saved_path)]
@@ -217,9 +333,10 @@ def sync_deck():
     else:
         command_args.append("--no-romanized")
 
+    deck_for_estimate = deck_name or safe_name.rsplit(".", 1)[0]
     try:
         result = run_script(BASE_DIR / "AnkiSync.py", command_args)
-        deck_for_estimate = deck_name or safe_name.rsplit(".", 1)[0]
+        invalidate_deck(deck_for_estimate)
         count = get_deck_card_count(deck_for_estimate)
         eta_seconds, eta_text = estimate_sync_duration(count)
         return jsonify(
@@ -234,6 +351,8 @@ def sync_deck():
             }
         )
     except subprocess.CalledProcessError as exc:
+        # A failed run may still have written some notes or media before it stopped.
+        invalidate_deck(deck_for_estimate)
         return (
             jsonify(
                 {
@@ -246,6 +365,7 @@ def sync_deck():
             500,
         )
     except RuntimeError as exc:
+        invalidate_deck(deck_for_estimate)
         return jsonify({"ok": False, "message": str(exc)}), 500
 
 
@@ -273,6 +393,7 @@ def generate_audio():
 
     try:
         result = run_script(BASE_DIR / "AnkiDeckToSpeech.py", args)
+        invalidate_deck(deck)
         card_count = get_deck_card_count(deck)
         eta_seconds, eta_text = estimate_media_duration(card_count, per_card_seconds=6.0)
         return jsonify(
@@ -287,6 +408,8 @@ def generate_audio():
             }
         )
     except subprocess.CalledProcessError as exc:
+        # A failed run may still have written some notes or media before it stopped.
+        invalidate_deck(deck)
         return (
             jsonify(
                 {
@@ -299,6 +422,7 @@ def generate_audio():
             500,
         )
     except RuntimeError as exc:
+        invalidate_deck(deck)
         return jsonify({"ok": False, "message": str(exc)}), 500
 
 
@@ -313,7 +437,9 @@ def generate_images():
     image_model = data.get("image_model")
     prompt = data.get("prompt")
     workers = data.get("workers")
+    gating_workers = data.get("gating_workers")
     skip_gating = data.get("skip_gating", False)
+    draft = data.get("draft", False)
 
     if image_model:
         args.extend(["--image-model", image_model])
@@ -321,11 +447,16 @@ def generate_images():
         args.extend(["--prompt", prompt])
     if workers:
         args.extend(["--workers", str(workers)])
+    if gating_workers:
+        args.extend(["--gating-workers", str(gating_workers)])
     if skip_gating:
         args.append("--skip-gating")
+    if draft:
+        args.append("--draft")
 
     try:
         result = run_script(BASE_DIR / "AnkiDeckToImages.py", args)
+        invalidate_deck(deck)
         card_count = get_deck_card_count(deck)
         eta_seconds, eta_text = estimate_media_duration(card_count, per_card_seconds=12.0)
         return jsonify(
@@ -340,6 +471,8 @@ def generate_images():
             }
         )
     except subprocess.CalledProcessError as exc:
+        # A failed run may still have written some notes or media before it stopped.
+        invalidate_deck(deck)
         return (
             jsonify(
                 {
@@ -352,6 +485,7 @@ def generate_images():
             500,
         )
     except RuntimeError as exc:
+        invalidate_deck(deck)
         return jsonify({"ok": False, "message": str(exc)}), 500
 
 
@@ -359,9 +493,12 @@ def generate_images():
 def serve_image_file(filename: str):
     target = IMAGE_DIR / filename
     if not target.exists():
+        # Deleted or moved since it was indexed: keep it out of the next gallery listing.
+        get_media_index().remove("image", [Path(filename).name])
         return jsonify({"ok": False, "message": "Image not found."}), 404
     return send_from_directory(IMAGE_DIR, filename)
 
 
 if __name__ == "__main__":
+    warm()
     app.run(debug=True)
@@ -0,0 +1,677 @@
+"""Local stand-ins for AnkiConnect and the OpenAI API.
+
+Both servers run on a background thread bound to 127.0.0.1 with an
+ephemeral port, so benchmarks and tests can exercise the real scripts
+(``invoke``, the OpenAI client, thread pools) without network access.
+"""
+
+from array import array
+import base64
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import itertools
+import json
+import math
+import operator
+import random
+import re
+import threading
+import time
+import zlib
+from typing import Any, Dict, List, Optional, Tuple
+
+# 1x1 transparent PNG.
+PNG_BYTES = base64.b64decode(
+    "iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAQAAAC1HAwCAAAAC0lEQVR42mNkYAAAAAYAAjCB0C8AAAAASUVORK5CYII="
+)
+# Minimal MPEG audio frame header followed by silence.
+MP3_BYTES = b"\xff\xfb\x90\x64" + b"\x00" * 413
+PCM_RATE = 24_000
+
+# Search terms: an optional "-", then a group bracket or a (possibly quoted) term.
+SEARCH_TOKEN_RE = re.compile(r'-?\(|\)|-?[^\s()"]*"(?:[^"\\]|\\.)*"|-?[^\s()]+')
+# ``prop:due`` counts days from today; only review and day-learning cards match.
+PROP_DUE_RE = re.compile(r"\s*\bprop:due(<=|>=|=|<|>)(-?\d+)")
+PROP_COMPARE = {"<=": operator.le, ">=": operator.ge, "=": operator.eq, "<": operator.lt, ">": operator.gt}
+
+
+def _search_pattern(text: str) -> "re.Pattern[str]":
+    """Anki wildcards: ``*`` any run, ``_`` one character, backslash escapes either."""
+    parts = []
+    for escaped, char in re.findall(r"\\(.)|(.)", text, re.DOTALL):
+        if escaped:
+            parts.append(re.escape(escaped))
+        elif char == "*":
+            parts.append(".*")
+        elif char == "_":
+            parts.append(".")
+        else:
+            parts.append(re.escape(char))
+    return re.compile("".join(parts), re.IGNORECASE | re.DOTALL)
+
+
+def _term_matches(note: Dict[str, Any], term: str) -> bool:
+    name, colon, value = term.partition(":")
+    if colon and name.lower() == "deck":
+        deck = note["deckName"]
+        pattern = _search_pattern(value)
+        return bool(pattern.fullmatch(deck)) or any(
+            pattern.fullmatch(deck[:index]) for index in range(len(deck)) if deck.startswith("::", index)
+        )
+    if colon and name.lower() == "nid":
+        return str(note["noteId"]) in value.split(",")
+    fields = {field.lower(): text for field, text in note["fields"].items()}
+    if colon and name.lower() in fields:
+        return bool(_search_pattern(value).fullmatch(fields[name.lower()]))
+    return any(_search_pattern(f"*{term}*").fullmatch(text) for text in fields.values())
+
+
+def search_matches(note: Dict[str, Any], query: str) -> bool:
+    """Evaluate the subset of Anki's search syntax the scripts use against ``note``.
+
+    Terms are ANDed; ``OR``, ``-`` negation, parentheses, quoting and
+    ``deck:``/``nid:``/``field:`` terms with wildcards are understood.
+    """
+    tokens = SEARCH_TOKEN_RE.findall(query)
+    position = 0
+
+    def expression() -> bool:
+        nonlocal position
+        result = conjunction()
+        while position < len(tokens) and tokens[position] == "OR":
+            position += 1
+            result = conjunction() or result
+        return result
+
+    def conjunction() -> bool:
+        nonlocal position
+        result = True
+        while position < len(tokens) and tokens[position] not in ("OR", ")"):
+            token = tokens[position]
+            position += 1
+            negate = token.startswith("-")
+            token = token[1:] if negate else token
+            if token == "(":
+                value = expression()
+                position += 1  # ")"
+            else:
+                if token.endswith('"'):
+                    prefix, _, quoted = token.partition('"')
+                    token = prefix + re.sub(r'\\(["\\])', r"\1", quoted[:-1])
+                value = _term_matches(note, token)
+            result = (not value if negate else value) and result
+        return result
+
+    return expression()
+
+
+class _QuietServer(ThreadingHTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class _FakeServer:
+    handler_class: type = BaseHTTPRequestHandler
+
+    def __init__(self) -> None:
+        self._server: Optional[_QuietServer] = None
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        if not self._server:
+            raise RuntimeError("Server is not running.")
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> str:
+        fake = self
+
+        class Handler(self.handler_class):
+            server_state = fake
+
+            def log_message(self, format: str, *args: Any) -> None:
+                return
+
+        self._server = _QuietServer(("127.0.0.1", 0), Handler)
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self.url
+
+    def stop(self) -> None:
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.stop()
+
+
+class _AnkiHandler(BaseHTTPRequestHandler):
+    server_state: "FakeAnkiConnect"
+
+    def do_POST(self) -> None:
+        length = int(self.headers.get("Content-Length", 0))
+        payload = json.loads(self.rfile.read(length) or b"{}")
+        try:
+            result = self.server_state.dispatch(payload.get("action", ""), payload.get("params", {}))
+            body = {"result": result, "error": None}
+        except Exception as exc:
+            body = {"result": None, "error": str(exc)}
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class FakeAnkiConnect(_FakeServer):
+    """In-memory collection speaking the AnkiConnect v6 JSON protocol."""
+
+    handler_class = _AnkiHandler
+
+    def __init__(self, latency: float = 0.0) -> None:
+        super().__init__()
+        self.latency = latency
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1_700_000_000_000)
+        self.decks: Dict[str, None] = {"Default": None}
+        self.notes: Dict[int, Dict[str, Any]] = {}
+        self.media: Dict[str, str] = {}
+        # One card per note: card ID is derived from the note ID, queue/due default to new.
+        self.schedule: Dict[int, Dict[str, int]] = {}
+        # Collection day number that review ``due`` values count from, and the new-cards/day limit.
+        self.today = 0
+        self.new_per_day = 20
+        self.calls: Dict[str, int] = {}
+
+    def add_deck(self, deck: str, cards: List[tuple]) -> List[int]:
+        """Seed ``deck`` with ``(front, back)`` pairs and return the new note IDs."""
+        return self.dispatch(
+            "addNotes",
+            {
+                "notes": [
+                    {
+                        "deckName": deck,
+                        "modelName": "Basic (type in the answer)",
+                        "fields": {"Front": front, "Back": back},
+                    }
+                    for front, back in cards
+                ]
+            },
+        )
+
+    def dispatch(self, action: str, params: Dict[str, Any]) -> Any:
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            self.calls[action] = self.calls.get(action, 0) + 1
+        handler = getattr(self, f"_action_{action}", None)
+        if handler is None:
+            raise ValueError(f"unsupported action: {action}")
+        return handler(**params)
+
+    def _action_version(self) -> int:
+        return 6
+
+    def _action_deckNames(self) -> List[str]:
+        with self._lock:
+            return list(self.decks)
+
+    def _action_createDeck(self, deck: str) -> int:
+        with self._lock:
+            self.decks.setdefault(deck, None)
+        return 1
+
+    def _action_addNotes(self, notes: List[Dict[str, Any]]) -> List[Optional[int]]:
+        added: List[Optional[int]] = []
+        with self._lock:
+            for note in notes:
+                note_id = next(self._ids)
+                self.decks.setdefault(note["deckName"], None)
+                self.notes[note_id] = {
+                    "noteId": note_id,
+                    "deckName": note["deckName"],
+                    "modelName": note.get("modelName", ""),
+                    "tags": list(note.get("tags", [])),
+                    "fields": dict(note["fields"]),
+                }
+                self.schedule[note_id] = {"queue": 0, "due": len(self.schedule) + 1}
+                added.append(note_id)
+        return added
+
+    def _action_findNotes(self, query: str) -> List[int]:
+        with self._lock:
+            return [note_id for note_id, note in self.notes.items() if search_matches(note, query)]
+
+    def _action_findCards(self, query: str) -> List[int]:
+        prop_due = PROP_DUE_RE.search(query)
+        note_ids = self._action_findNotes(PROP_DUE_RE.sub("", query))
+        if prop_due:
+            compare, days = PROP_COMPARE[prop_due.group(1)], int(prop_due.group(2))
+            with self._lock:
+                note_ids = [
+                    note_id
+                    for note_id in note_ids
+                    if self.schedule[note_id]["queue"] in (2, 3)
+                    and compare(self.schedule[note_id]["due"] - self.today, days)
+                ]
+        return [note_id * 10 for note_id in note_ids]
+
+    def _action_getDeckConfig(self, deck: str) -> Any:
+        with self._lock:
+            if deck not in self.decks:
+                return False
+            return {"name": "Default", "new": {"perDay": self.new_per_day}, "rev": {"perDay": 200}}
+
+    def _action_cardsInfo(self, cards: List[int]) -> List[Dict[str, Any]]:
+        with self._lock:
+            infos = []
+            for card_id in cards:
+                note = self.notes.get(card_id // 10)
+                if note is None:
+                    infos.append({})
+                    continue
+                schedule = self.schedule[note["noteId"]]
+                infos.append(
+                    {
+                        "cardId": card_id,
+                        "note": note["noteId"],
+                        "deckName": note["deckName"],
+                        "queue": schedule["queue"],
+                        "type": max(schedule["queue"], 0),
+                        "due": schedule["due"],
+                    }
+                )
+            return infos
+
+    def _action_notesInfo(self, notes: List[int]) -> List[Dict[str, Any]]:
+        with self._lock:
+            infos = []
+            for note_id in notes:
+                note = self.notes.get(note_id)
+                if note is None:
+                    infos.append({})
+                    continue
+                infos.append(
+                    {
+                        "noteId": note_id,
+                        "modelName": note["modelName"],
+                        "tags": list(note["tags"]),
+                        "fields": {
+                            name: {"value": value, "order": order}
+                            for order, (name, value) in enumerate(note["fields"].items())
+                        },
+                    }
+                )
+            return infos
+
+    def _action_updateNoteFields(self, note: Dict[str, Any]) -> None:
+        with self._lock:
+            stored = self.notes.get(note["id"])
+            if stored is None:
+                raise ValueError(f"note was not found: {note['id']}")
+            stored["fields"].update(note.get("fields", {}))
+            for media in note.get("audio", []):
+                self.media[media["filename"]] = media.get("path") or media.get("data", "")
+                for field in media.get("fields", []):
+                    stored["fields"][field] += f"[sound:{media['filename']}]"
+            for media in note.get("picture", []):
+                self.media[media["filename"]] = media.get("path") or media.get("data", "")
+                for field in media.get("fields", []):
+                    stored["fields"][field] += f'<img src="{media["filename"]}">'
+        return None
+
+    def _action_storeMediaFile(
+        self,
+        filename: str,
+        path: Optional[str] = None,
+        data: Optional[str] = None,
+        url: Optional[str] = None,
+        deleteExisting: bool = True,
+    ) -> str:
+        with self._lock:
+            if filename in self.media and not deleteExisting:
+                raise ValueError(f"media file already exists: {filename}")
+            self.media[filename] = path or data or url or ""
+        return filename
+
+    def _action_multi(self, actions: List[Dict[str, Any]]) -> List[Any]:
+        results = []
+        for item in actions:
+            try:
+                results.append(
+                    {"result": self.dispatch(item["action"], item.get("params", {})), "error": None}
+                )
+            except Exception as exc:
+                results.append({"result": None, "error": str(exc)})
+        return results
+
+
+class _OpenAIHandler(BaseHTTPRequestHandler):
+    server_state: "FakeOpenAI"
+
+    def _send(self, status: int, body: bytes, content_type: str, headers: Optional[Dict[str, str]] = None) -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, status: int, payload: Any, headers: Optional[Dict[str, str]] = None) -> None:
+        self._send(status, json.dumps(payload).encode("utf-8"), "application/json", headers)
+
+    def do_GET(self) -> None:
+        state = self.server_state
+        endpoint = self.path.split("/v1/", 1)[-1].split("?", 1)[0].rstrip("/")
+        state.record(f"GET {endpoint.split('/', 1)[0]}")
+        if endpoint == "models":
+            self._send_json(200, {"object": "list", "data": [
+                {"id": model_id, "object": "model", "created": 0, "owned_by": "fake"}
+                for model_id in state.model_ids
+            ]})
+        elif endpoint.startswith("batches/"):
+            batch = state.poll_batch(endpoint.split("/", 1)[1])
+            if batch is None:
+                self._send_json(404, {"error": {"message": "No such batch"}})
+            else:
+                self._send_json(200, batch)
+        elif endpoint.startswith("files/") and endpoint.endswith("/content"):
+            content = state.files.get(endpoint.split("/")[1])
+            if content is None:
+                self._send_json(404, {"error": {"message": "No such file"}})
+            else:
+                self._send(200, content, "application/octet-stream")
+        else:
+            self._send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+
+    def do_POST(self) -> None:
+        length = int(self.headers.get("Content-Length", 0))
+        raw = self.rfile.read(length)
+        state = self.server_state
+        endpoint = self.path.split("/v1/", 1)[-1].split("?", 1)[0].rstrip("/")
+        state.record(endpoint)
+        failure = state.roll_failure()
+        if failure == 429:
+            self._send_json(
+                429,
+                {"error": {"message": "Rate limit reached", "type": "rate_limit_error"}},
+                {"retry-after-ms": str(int(state.retry_after * 1000))},
+            )
+            return
+        if failure == 500:
+            self._send_json(500, {"error": {"message": "Injected server error", "type": "server_error"}})
+            return
+        time.sleep(state.latency_for(endpoint))
+
+        if endpoint == "files":
+            file_id = f"file-{state.next_id()}"
+            content, purpose = _multipart_file(self.headers.get("Content-Type", ""), raw)
+            state.files[file_id] = content
+            self._send_json(200, {
+                "id": file_id,
+                "object": "file",
+                "bytes": len(content),
+                "created_at": 0,
+                "filename": "upload",
+                "purpose": purpose,
+                "status": "processed",
+            })
+        elif endpoint == "batches":
+            payload = json.loads(raw or b"{}")
+            self._send_json(200, state.create_batch(payload))
+        elif endpoint == "responses":
+            payload = json.loads(raw or b"{}")
+            self._send_json(200, state.response_body(payload))
+        elif endpoint == "images/generations":
+            self._send_json(200, {
+                "created": 0,
+                "data": [{"b64_json": base64.b64encode(PNG_BYTES).decode("ascii")}],
+            })
+        elif endpoint == "audio/speech":
+            payload = json.loads(raw or b"{}")
+            if payload.get("response_format") == "pcm":
+                self._send(200, state.speech_pcm(payload.get("input", "")), "audio/pcm")
+            else:
+                self._send(200, MP3_BYTES, "audio/mpeg")
+        else:
+            self._send_json(404, {"error": {"message": f"Unknown endpoint {endpoint}"}})
+
+
+def _multipart_file(content_type: str, raw: bytes) -> tuple:
+    """Return ``(file bytes, purpose)`` from a multipart/form-data upload."""
+    match = re.search(r'boundary="?([^";]+)"?', content_type)
+    if not match:
+        return raw, ""
+    boundary = b"--" + match.group(1).encode("ascii")
+    content, purpose = b"", ""
+    for part in raw.split(boundary):
+        headers, _, body = part.partition(b"\r\n\r\n")
+        body = body[:-2] if body.endswith(b"\r\n") else body
+        if b'name="file"' in headers:
+            content = body
+        elif b'name="purpose"' in headers:
+            purpose = body.decode("utf-8", "replace")
+    return content, purpose
+
+
+class FakeOpenAI(_FakeServer):
+    """Serves the subset of the OpenAI REST API the scripts call.
+
+    ``latency`` is a base delay in seconds (optionally per endpoint), with
+    ``jitter`` added uniformly. ``error_rate`` and ``rate_limit_rate`` are
+    probabilities of answering 500 or 429 instead of the real payload.
+    ``extraction_limit`` cuts extraction answers off after that many pairs;
+    a request with ``previous_response_id`` continues where it stopped.
+    """
+
+    handler_class = _OpenAIHandler
+
+    def __init__(
+        self,
+        *,
+        latency: float = 0.0,
+        endpoint_latency: Optional[Dict[str, float]] = None,
+        jitter: float = 0.0,
+        error_rate: float = 0.0,
+        rate_limit_rate: float = 0.0,
+        retry_after: float = 0.01,
+        batch_delay: float = 0.0,
+        gate_true_ratio: float = 1.0,
+        extraction_pairs: int = 20,
+        extraction_limit: Optional[int] = None,
+        seed: Optional[int] = None,
+    ) -> None:
+        super().__init__()
+        self.latency = latency
+        self.endpoint_latency = dict(endpoint_latency or {})
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self.batch_delay = batch_delay
+        self.gate_true_ratio = gate_true_ratio
+        self.extraction_pairs = extraction_pairs
+        # Pairs per extraction response; longer lists are cut off mid-item as at a token limit.
+        self.extraction_limit = extraction_limit
+        self.extraction_cursors: Dict[str, int] = {}
+        self.model_ids = ["gpt-4.1-mini", "gpt-4o-mini-tts", "gpt-image-1"]
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self.requests: Dict[str, int] = {}
+        self.files: Dict[str, bytes] = {}
+        self.batches: Dict[str, Dict[str, Any]] = {}
+
+    @property
+    def base_url(self) -> str:
+        return f"{self.url}/v1"
+
+    def next_id(self) -> int:
+        with self._lock:
+            return next(self._ids)
+
+    def record(self, endpoint: str) -> None:
+        with self._lock:
+            self.requests[endpoint] = self.requests.get(endpoint, 0) + 1
+
+    def roll_failure(self) -> Optional[int]:
+        with self._lock:
+            roll = self._random.random()
+        if roll < self.rate_limit_rate:
+            return 429
+        if roll < self.rate_limit_rate + self.error_rate:
+            return 500
+        return None
+
+    def latency_for(self, endpoint: str) -> float:
+        base = self.endpoint_latency.get(endpoint, self.latency)
+        if not self.jitter:
+            return base
+        with self._lock:
+            return base + self._random.uniform(0, self.jitter)
+
+    def gate(self, front: str, back: str) -> bool:
+        bucket = zlib.crc32(f"{front}\x00{back}".encode("utf-8")) % 1000
+        return bucket < self.gate_true_ratio * 1000
+
+    def speech_pcm(self, text: str) -> bytes:
+        """A short tone per non-empty input line with a pause between lines."""
+        tone = array("h", (int(8000 * math.sin(2 * math.pi * 440 * i / PCM_RATE)) for i in range(PCM_RATE * 3 // 10)))
+        pause = array("h", [0]) * (PCM_RATE * 8 // 10)
+        samples = array("h", [0]) * (PCM_RATE // 10)
+        lines = [line for line in text.split("\n") if line.strip()]
+        for index in range(len(lines)):
+            if index:
+                samples.extend(pause)
+            samples.extend(tone)
+        samples.extend(array("h", [0]) * (PCM_RATE // 10))
+        return samples.tobytes()
+
+    def extraction_output(self, payload: Dict[str, Any], response_id: str) -> Tuple[str, bool]:
+        """The vocabulary answer for ``payload`` and whether it was cut off."""
+        schema = ((payload.get("text") or {}).get("format") or {}).get("name") == "vocabulary"
+        with self._lock:
+            start = self.extraction_cursors.get(payload.get("previous_response_id") or "", 0)
+        end = self.extraction_pairs
+        if self.extraction_limit:
+            end = min(end, start + self.extraction_limit)
+
+        def pair(index: int) -> str:
+            item = {"english": f"word {index}", "foreign": f"단어{index}"}
+            if schema:
+                item["romanized"] = None
+            return json.dumps(item, ensure_ascii=False)
+
+        body = ", ".join(pair(index) for index in range(start, end))
+        truncated = end < self.extraction_pairs
+        if truncated:
+            with self._lock:
+                self.extraction_cursors[response_id] = end
+            partial = pair(end)
+            body += (", " if body else "") + partial[: len(partial) // 2]
+        else:
+            body += "]}" if schema else "]"
+        return ('{"pairs": [' if schema else "[") + body, truncated
+
+    def response_text(self, payload: Dict[str, Any]) -> str:
+        text_format = (payload.get("text") or {}).get("format") or {}
+        if text_format.get("name") == "gating_decisions":
+            cards = json.loads(payload.get("input") or "{}").get("cards", [])
+            return json.dumps({"decisions": [
+                {"id": card["id"], "illustrate": self.gate(card["front"], card["back"])}
+                for card in cards
+            ]})
+        prompt = payload.get("prompt")
+        if prompt:
+            variables = prompt.get("variables", {})
+            return "true" if self.gate(variables.get("front", ""), variables.get("back", "")) else "false"
+        return self.extraction_output(payload, "")[0]
+
+    def create_batch(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        batch_id = f"batch_{self.next_id()}"
+        lines = self.files.get(payload.get("input_file_id", ""), b"").decode("utf-8").splitlines()
+        batch = {
+            "id": batch_id,
+            "object": "batch",
+            "endpoint": payload.get("endpoint"),
+            "completion_window": payload.get("completion_window", "24h"),
+            "input_file_id": payload.get("input_file_id"),
+            "created_at": int(time.time()),
+            "status": "in_progress",
+            "output_file_id": None,
+            "error_file_id": None,
+            "request_counts": {"total": len([line for line in lines if line.strip()]), "completed": 0, "failed": 0},
+        }
+        with self._lock:
+            self.batches[batch_id] = {"batch": batch, "started": time.monotonic(), "lines": lines}
+        return batch
+
+    def poll_batch(self, batch_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self.batches.get(batch_id)
+        if entry is None:
+            return None
+        batch = entry["batch"]
+        if batch["status"] == "in_progress" and time.monotonic() - entry["started"] >= self.batch_delay:
+            output = []
+            for line in entry["lines"]:
+                if not line.strip():
+                    continue
+                request = json.loads(line)
+                output.append(json.dumps({
+                    "id": f"batch_req_{self.next_id()}",
+                    "custom_id": request["custom_id"],
+                    "response": {"status_code": 200, "request_id": "", "body": self.response_body(request["body"])},
+                    "error": None,
+                }, ensure_ascii=False))
+            output_id = f"file-{self.next_id()}"
+            self.files[output_id] = "\n".join(output).encode("utf-8")
+            batch.update(
+                status="completed",
+                output_file_id=output_id,
+                request_counts={"total": len(output), "completed": len(output), "failed": 0},
+            )
+        return batch
+
+    def response_body(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        identifier = self.next_id()
+        response_id = f"resp_{identifier}"
+        truncated = False
+        is_extraction = not payload.get("prompt") and (
+            ((payload.get("text") or {}).get("format") or {}).get("name") != "gating_decisions"
+        )
+        if is_extraction:
+            text, truncated = self.extraction_output(payload, response_id)
+        else:
+            text = self.response_text(payload)
+        return {
+            "id": response_id,
+            "object": "response",
+            "created_at": 0,
+            "status": "incomplete" if truncated else "completed",
+            "incomplete_details": {"reason": "max_output_tokens"} if truncated else None,
+            "model": payload.get("model", "fake-model"),
+            "output": [
+                {
+                    "type": "message",
+                    "id": f"msg_{identifier}",
+                    "role": "assistant",
+                    "status": "completed",
+                    "content": [
+                        {"type": "output_text", "text": text, "annotations": []}
+                    ],
+                }
+            ],
+            "parallel_tool_calls": True,
+            "tool_choice": "auto",
+            "tools": [],
+            "usage": {"input_tokens": 10, "output_tokens": 10, "total_tokens": 20},
+        }
@@ -0,0 +1,109 @@
+"""Micro-benchmark for reading note fields: per-stage tuples versus ``Note`` records.
+
+Usage (from the repository root):
+
+    python -m benchmarks.notes --notes 10000 --stages 4
+
+Builds a deck's worth of ``notesInfo`` entries and reads the views an image
+run needs (gating inputs, prompt text, fields without images) once per
+stage. The ``tuples`` variant re-derives them from the raw strings every
+time, as the scripts did before ``utils.notes``; the ``records`` variant
+reads them from ``Note``. CPU time and peak traced memory are reported
+per note.
+"""
+
+import argparse
+import sys
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from utils.notes import Note, clean_text, from_notes_info, strip_image_tags
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--notes", type=int, default=10_000)
+    parser.add_argument(
+        "--stages",
+        type=int,
+        default=4,
+        help="Times each view is read per note; an image run reads them in about four places.",
+    )
+    parser.add_argument("--repeat", type=int, default=3, help="Timed runs per variant; the fastest counts.")
+    return parser.parse_args(argv)
+
+
+def sample_infos(count: int) -> List[Dict[str, Any]]:
+    infos = []
+    for index in range(count):
+        front = f"<div>단어{index}&nbsp;<b>예문</b></div>[sound:{index}.mp3]"
+        back = f'<div>word {index}, as in <i>an example</i></div><img src="{index}.png">'
+        infos.append(
+            {"noteId": index, "fields": {"Front": {"value": front, "order": 0}, "Back": {"value": back, "order": 1}}}
+        )
+    return infos
+
+
+def tuples(infos: List[Dict[str, Any]], stages: int) -> int:
+    cards: List[Tuple[int, str, str]] = [
+        (info["noteId"], info["fields"]["Front"]["value"], info["fields"]["Back"]["value"]) for info in infos
+    ]
+    total = 0
+    for _ in range(stages):
+        for _, front, back in cards:
+            front_without_images = strip_image_tags(front)
+            back_without_images = strip_image_tags(back)
+            gating_front = clean_text(front_without_images) or front_without_images
+            total += len(gating_front) + len(clean_text(back_without_images)) + len(back_without_images)
+    return total
+
+
+def records(infos: List[Dict[str, Any]], stages: int) -> int:
+    notes: List[Note] = from_notes_info(infos)
+    total = 0
+    for _ in range(stages):
+        for note in notes:
+            total += len(note.gating_front) + len(note.prompt_back) + len(note.back_without_images)
+    return total
+
+
+def measure(
+    variant: Callable[[List[Dict[str, Any]], int], int], infos: List[Dict[str, Any]], stages: int, repeat: int
+) -> Dict[str, float]:
+    seconds = []
+    for _ in range(max(1, repeat)):
+        started = time.process_time()
+        variant(infos, stages)
+        seconds.append(time.process_time() - started)
+    tracemalloc.start()
+    try:
+        variant(infos, stages)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    count = max(1, len(infos))
+    return {
+        "us_per_note": min(seconds) / count * 1e6,
+        "peak_bytes_per_note": peak / count,
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    infos = sample_infos(args.notes)
+    if tuples(infos, 1) != records(infos, 1):
+        print("The two variants disagree; the benchmark is not comparing like with like.")
+        return 1
+    for name, variant in (("tuples", tuples), ("records", records)):
+        result = measure(variant, infos, args.stages, args.repeat)
+        print(
+            f"{name:<8} {result['us_per_note']:>7.2f} us/note  "
+            f"peak {result['peak_bytes_per_note']:>7.0f} B/note  "
+            f"(notes={args.notes}, stages={args.stages})"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
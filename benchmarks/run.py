@@ -0,0 +1,293 @@
+"""Offline throughput benchmarks for the sync, audio, image and invoke paths.
+
+Usage (from the repository root):
+
+    python -m benchmarks.run --workers 1 4 8 --deck-sizes 50 200 --latency 0.05
+
+Each pipeline runs its real ``main()`` against ``benchmarks.fakes`` servers
+and the results are written as JSON. Pass ``--baseline`` with an earlier
+results file to fail when throughput drops by more than ``--tolerance``.
+"""
+
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, redirect_stderr, redirect_stdout
+import io
+import json
+import os
+from pathlib import Path
+import platform
+import sys
+import tempfile
+import time
+from typing import Any, Dict, Iterator, List, Optional
+
+import AnkiDeckToImages as images
+import AnkiDeckToSpeech as speech
+import AnkiSync as sync
+from benchmarks.fakes import FakeAnkiConnect, FakeOpenAI
+from utils import media_index, metrics
+
+PIPELINES = ("sync", "audio", "images", "invoke")
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pipelines", nargs="+", choices=PIPELINES, default=list(PIPELINES))
+    parser.add_argument("--workers", nargs="+", type=int, default=[1, 4, 8])
+    parser.add_argument("--deck-sizes", nargs="+", type=int, default=[50, 200])
+    parser.add_argument("--latency", type=float, default=0.05, help="Base OpenAI latency in seconds.")
+    parser.add_argument(
+        "--image-latency",
+        type=float,
+        help="Latency for image generation (defaults to 4x --latency).",
+    )
+    parser.add_argument("--jitter", type=float, default=0.0, help="Uniform extra latency in seconds.")
+    parser.add_argument("--anki-latency", type=float, default=0.0, help="AnkiConnect latency in seconds.")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Probability of a 500 response.")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Probability of a 429 response.")
+    parser.add_argument("--gate-true-ratio", type=float, default=0.5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--inline-media",
+        action="store_true",
+        help="Run the audio and image pipelines with --inline-media (no local media files).",
+    )
+    parser.add_argument(
+        "--tts-batch-size",
+        type=int,
+        default=1,
+        help="Run the audio pipeline with --batch-size N (default: %(default)s, no batching).",
+    )
+    parser.add_argument("--output", type=Path, default=Path("bench_results.json"))
+    parser.add_argument("--baseline", type=Path, help="Earlier results file to compare against.")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.2,
+        help="Allowed fractional drop in items/second versus --baseline (default: %(default)s).",
+    )
+    return parser.parse_args(argv)
+
+
+@contextmanager
+def patched(target: Any, name: str, value: Any) -> Iterator[None]:
+    original = getattr(target, name)
+    setattr(target, name, value)
+    try:
+        yield
+    finally:
+        setattr(target, name, original)
+
+
+def run_main(module: Any, argv: List[str]) -> str:
+    output = io.StringIO()
+    with patched(sys, "argv", [module.__file__] + argv), redirect_stdout(output), redirect_stderr(output):
+        module.main()
+    return output.getvalue()
+
+
+def card_counts(script: str) -> Dict[str, int]:
+    return {
+        status: int(metrics.CARDS_PROCESSED.value(script=script, status=status))
+        for status in ("added", "skip", "error")
+    }
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def seed_deck(anki: FakeAnkiConnect, name: str, size: int) -> List[int]:
+    return anki.add_deck(name, [(f"단어{index}", f"word {index}") for index in range(size)])
+
+
+def bench_media(
+    module: Any,
+    script: str,
+    anki: FakeAnkiConnect,
+    workers: int,
+    size: int,
+    workdir: Path,
+    inline_media: bool = False,
+    tts_batch_size: int = 1,
+) -> Dict[str, Any]:
+    deck = f"bench-{script}-{workers}-{size}"
+    seed_deck(anki, deck, size)
+    media_attr = "AUDIO_DIR" if script == "audio" else "IMAGE_DIR"
+    argv = [deck, "--workers", str(workers), "--dead-letter", str(workdir / "dead_letter.jsonl")]
+    if inline_media:
+        argv.append("--inline-media")
+    if script == "audio" and tts_batch_size > 1:
+        argv += ["--batch-size", str(tts_batch_size)]
+    if script == "images":
+        # Keep runs comparable: no local pre-filter, no training history.
+        argv += ["--prefilter-threshold", "1.0", "--no-gating-history"]
+    started = time.perf_counter()
+    with patched(module, media_attr, workdir), patched(media_index, "INDEX_PATH", workdir / "media_index.sqlite3"):
+        run_main(module, argv)
+    elapsed = time.perf_counter() - started
+    return {"seconds": elapsed, "items": size, "cards": card_counts(script)}
+
+
+def bench_sync(openai_fake: FakeOpenAI, size: int, workdir: Path) -> Dict[str, Any]:
+    pdf = workdir / f"bench-sync-{size}.pdf"
+    pdf.write_bytes(b"%PDF-1.4\n% benchmark placeholder\n")
+    openai_fake.extraction_pairs = size
+    previous_cwd = Path.cwd()
+    os.chdir(workdir)
+    started = time.perf_counter()
+    try:
+        run_main(sync, [str(pdf), "--deck", pdf.stem])
+    finally:
+        os.chdir(previous_cwd)
+    elapsed = time.perf_counter() - started
+    return {"seconds": elapsed, "items": size}
+
+
+def bench_invoke(anki: FakeAnkiConnect, workers: int, size: int) -> Dict[str, Any]:
+    note_ids = seed_deck(anki, f"bench-invoke-{workers}-{size}", size)
+
+    def call(note_id: int) -> float:
+        started = time.perf_counter()
+        sync.invoke("notesInfo", notes=[note_id])
+        return time.perf_counter() - started
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        latencies = list(executor.map(call, note_ids))
+    elapsed = time.perf_counter() - started
+    return {
+        "seconds": elapsed,
+        "items": size,
+        "latency_p50": percentile(latencies, 0.5),
+        "latency_p95": percentile(latencies, 0.95),
+        "latency_max": max(latencies) if latencies else 0.0,
+    }
+
+
+def run_case(
+    pipeline: str,
+    workers: int,
+    size: int,
+    anki: FakeAnkiConnect,
+    openai_fake: FakeOpenAI,
+    workdir: Path,
+    inline_media: bool = False,
+    tts_batch_size: int = 1,
+) -> Dict[str, Any]:
+    metrics.REGISTRY.reset()
+    requests_before = dict(openai_fake.requests)
+    if pipeline == "sync":
+        result = bench_sync(openai_fake, size, workdir)
+    elif pipeline == "audio":
+        result = bench_media(speech, "audio", anki, workers, size, workdir, inline_media, tts_batch_size)
+    elif pipeline == "images":
+        result = bench_media(images, "images", anki, workers, size, workdir, inline_media)
+    else:
+        result = bench_invoke(anki, workers, size)
+    openai_requests = {
+        endpoint: count - requests_before.get(endpoint, 0)
+        for endpoint, count in openai_fake.requests.items()
+        if count - requests_before.get(endpoint, 0)
+    }
+    seconds = result.pop("seconds")
+    return {
+        "pipeline": pipeline,
+        "workers": workers,
+        "deck_size": size,
+        "seconds": round(seconds, 4),
+        "items_per_second": round(result["items"] / seconds, 3) if seconds else 0.0,
+        "openai_requests": openai_requests,
+        **result,
+    }
+
+
+def compare(results: List[Dict[str, Any]], baseline_path: Path, tolerance: float) -> List[str]:
+    baseline = json.loads(baseline_path.read_text(encoding="utf-8"))
+    previous = {
+        (row["pipeline"], row["workers"], row["deck_size"]): row["items_per_second"]
+        for row in baseline.get("results", [])
+    }
+    regressions = []
+    for row in results:
+        key = (row["pipeline"], row["workers"], row["deck_size"])
+        before = previous.get(key)
+        if before and row["items_per_second"] < before * (1 - tolerance):
+            regressions.append(
+                f"{key[0]} workers={key[1]} deck={key[2]}: "
+                f"{row['items_per_second']:.2f}/s vs baseline {before:.2f}/s"
+            )
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    image_latency = args.image_latency if args.image_latency is not None else args.latency * 4
+    openai_fake = FakeOpenAI(
+        latency=args.latency,
+        endpoint_latency={"images/generations": image_latency},
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        gate_true_ratio=args.gate_true_ratio,
+        seed=args.seed,
+    )
+    anki = FakeAnkiConnect(latency=args.anki_latency)
+    results: List[Dict[str, Any]] = []
+    with openai_fake, anki, tempfile.TemporaryDirectory() as tmp:
+        env = {"OPENAI_API_KEY": "benchmark", "OPENAI_BASE_URL": openai_fake.base_url}
+        previous_env = {key: os.environ.get(key) for key in env}
+        os.environ.update(env)
+        try:
+            with patched(sync, "ANKI_CONNECT_URL", anki.url):
+                for pipeline in args.pipelines:
+                    worker_counts = [1] if pipeline == "sync" else args.workers
+                    for size in args.deck_sizes:
+                        for workers in worker_counts:
+                            row = run_case(
+                                pipeline,
+                                workers,
+                                size,
+                                anki,
+                                openai_fake,
+                                Path(tmp),
+                                args.inline_media,
+                                args.tts_batch_size,
+                            )
+                            results.append(row)
+                            print(
+                                f"{pipeline:<7} workers={workers:<3} deck={size:<5} "
+                                f"{row['seconds']:>8.3f}s {row['items_per_second']:>9.2f} items/s"
+                            )
+        finally:
+            for key, value in previous_env.items():
+                if value is None:
+                    os.environ.pop(key, None)
+                else:
+                    os.environ[key] = value
+
+    report = {
+        "generated_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "config": {key: (str(value) if isinstance(value, Path) else value) for key, value in vars(args).items()},
+        "results": results,
+    }
+    args.output.write_text(json.dumps(report, indent=2, ensure_ascii=False), encoding="utf-8")
+    print(f"Wrote {len(results)} result(s) to {args.output}.")
+
+    if args.baseline:
+        regressions = compare(results, args.baseline, args.tolerance)
+        for line in regressions:
+            print(f"Regression: {line}")
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
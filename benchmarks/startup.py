@@ -0,0 +1,110 @@
+"""Import-time budget check for the CLI entry points and the web app.
+
+Usage (from the repository root):
+
+    python -m benchmarks.startup --repeat 5
+
+Each module is imported in a fresh interpreter with ``-X importtime`` (as
+``app.run_script`` does for every job), and the median cumulative import
+time is compared against its budget. The check also fails when a module
+listed in ``DEFERRED_MODULES`` is loaded at import time.
+"""
+
+import argparse
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+
+from utils.common import BASE_DIR
+
+# Median cumulative import time allowed per entry point, in milliseconds.
+BUDGETS_MS = {
+    "AnkiSync": 200,
+    "AnkiDeckToSpeech": 200,
+    "AnkiDeckToImages": 200,
+    "AnkiMediaIndex": 200,
+    "AnkiWatch": 200,
+    "AnkiDeadLetter": 200,
+    "AnkiDistributed": 200,
+    "AnkiDeckStatus": 200,
+    "app": 450,
+}
+# Heavy dependencies that must only load when first used.
+DEFERRED_MODULES = ("openai", "pydantic", "httpx")
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--modules", nargs="+", choices=sorted(BUDGETS_MS), default=list(BUDGETS_MS))
+    parser.add_argument("--repeat", type=int, default=5, help="Fresh interpreters per module.")
+    parser.add_argument(
+        "--budget-scale",
+        type=float,
+        default=1.0,
+        help="Multiply every budget, e.g. 2.0 on slow CI machines (default: %(default)s).",
+    )
+    return parser.parse_args(argv)
+
+
+def parse_importtime(stderr: str, module: str) -> Tuple[float, Set[str]]:
+    """Return (cumulative ms for ``module``, top-level packages imported)."""
+    cumulative_ms = 0.0
+    packages: Set[str] = set()
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|", 2)
+        if not cumulative.strip().isdigit():
+            continue  # header row
+        name = name.strip()
+        packages.add(name.split(".", 1)[0])
+        if name == module:
+            cumulative_ms = int(cumulative) / 1000
+    return cumulative_ms, packages
+
+
+def measure(module: str, cwd: Path = BASE_DIR) -> Tuple[float, Set[str]]:
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=cwd,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return parse_importtime(result.stderr, module)
+
+
+def check(modules: List[str], repeat: int, budget_scale: float) -> Tuple[Dict[str, float], List[str]]:
+    medians: Dict[str, float] = {}
+    problems: List[str] = []
+    for module in modules:
+        timings = []
+        loaded: Set[str] = set()
+        for _ in range(max(1, repeat)):
+            elapsed, packages = measure(module)
+            timings.append(elapsed)
+            loaded |= packages
+        medians[module] = statistics.median(timings)
+        budget = BUDGETS_MS[module] * budget_scale
+        if medians[module] > budget:
+            problems.append(f"{module}: {medians[module]:.0f} ms exceeds budget of {budget:.0f} ms")
+        eager = sorted(loaded.intersection(DEFERRED_MODULES))
+        if eager:
+            problems.append(f"{module}: imports {', '.join(eager)} at startup")
+    return medians, problems
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    medians, problems = check(args.modules, args.repeat, args.budget_scale)
+    for module, median in medians.items():
+        print(f"{module:<18} {median:>7.1f} ms  (budget {BUDGETS_MS[module] * args.budget_scale:.0f} ms)")
+    for problem in problems:
+        print(f"Startup regression: {problem}")
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
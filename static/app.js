@@ -16,8 +16,10 @@ const statusLogAudio = document.getElementById("statusLogAudio");
 const imageDeckSelect = document.getElementById("imageDeckSelect");
 const imageModelSelect = document.getElementById("imageModelSelect");
 const skipGatingToggle = document.getElementById("skipGatingToggle");
+const draftImagesToggle = document.getElementById("draftImagesToggle");
 const refreshDecksImages = document.getElementById("refreshDecksImages");
 const imageWorkerSelect = document.getElementById("imageWorkerSelect");
+const gatingWorkerSelect = document.getElementById("gatingWorkerSelect");
 const generateImagesButton = document.getElementById("generateImages");
 const statusLogImages = document.getElementById("statusLogImages");
 
@@ -27,6 +29,11 @@ const loadGalleryButton = document.getElementById("loadGallery");
 const statusLogGallery = document.getElementById("statusLogGallery");
 const galleryGrid = document.getElementById("galleryGrid");
 
+const coverageTableBody = document.querySelector("#coverageTable tbody");
+const refreshCoverageButton = document.getElementById("refreshCoverage");
+const statusLogCoverage = document.getElementById("statusLogCoverage");
+let coverageLoaded = false;
+
 const tabButtons = document.querySelectorAll(".tab-button");
 const tabPanels = document.querySelectorAll(".tab-panel");
 
@@ -96,6 +103,9 @@ function switchTab(tabName) {
     tabPanels.forEach((panel) => {
         panel.classList.toggle("active", panel.id === `tab-${tabName}`);
     });
+    if (tabName === "status" && !coverageLoaded) {
+        loadCoverage();
+    }
 }
 
 tabButtons.forEach((button) => {
@@ -353,7 +363,9 @@ async function generateImages() {
         deck,
         image_model: imageModel,
         skip_gating: skipGating,
+        draft: draftImagesToggle.checked,
         workers: Number(workers),
+        gating_workers: Number(gatingWorkerSelect.value),
     };
 
     try {
@@ -458,6 +470,77 @@ async function loadGallery() {
     }
 }
 
+function escapeHtml(text) {
+    const node = document.createElement("span");
+    node.textContent = text;
+    return node.innerHTML;
+}
+
+function pickDeck(select, deck, tabName, update) {
+    if (!select) return;
+    if (![...select.options].some((option) => option.value === deck)) {
+        const option = document.createElement("option");
+        option.value = deck;
+        option.textContent = deck;
+        select.appendChild(option);
+    }
+    select.value = deck;
+    update();
+    switchTab(tabName);
+}
+
+function renderCoverage(decks) {
+    if (!coverageTableBody) return;
+    coverageTableBody.innerHTML = decks
+        .map(
+            (deck, index) => `
+            <tr>
+                <td>${escapeHtml(deck.deck)}</td>
+                <td>${deck.total}</td>
+                <td>${deck.with_audio}</td>
+                <td>${deck.with_images}</td>
+                <td>${deck.missing_both}</td>
+                <td class="coverage-actions">
+                    <button class="secondary-button" data-deck="${index}" data-tab="audio"
+                        ${deck.missing_audio ? "" : "disabled"}>Add audio</button>
+                    <button class="secondary-button" data-deck="${index}" data-tab="images"
+                        ${deck.missing_images ? "" : "disabled"}>Add images</button>
+                </td>
+            </tr>`
+        )
+        .join("");
+    coverageTableBody.querySelectorAll("button").forEach((button) => {
+        button.addEventListener("click", () => {
+            const deck = decks[Number(button.dataset.deck)].deck;
+            if (button.dataset.tab === "audio") {
+                pickDeck(audioDeckSelect, deck, "audio", updateAudioControls);
+            } else {
+                pickDeck(imageDeckSelect, deck, "images", updateImageControls);
+            }
+        });
+    });
+}
+
+async function loadCoverage(refresh = false) {
+    coverageLoaded = true;
+    setStatus(statusLogCoverage, "Counting notes...");
+    try {
+        const response = await fetch(`/api/deck-status${refresh ? "?refresh=1" : ""}`);
+        const data = await response.json();
+        if (!response.ok || !data.ok) {
+            throw new Error(data.message || "Failed to fetch deck status.");
+        }
+        renderCoverage(data.decks || []);
+        const pending = (data.decks || []).filter((deck) => deck.missing_audio || deck.missing_images).length;
+        setStatus(statusLogCoverage, `${data.decks.length} deck(s); ${pending} still missing audio or images.`);
+    } catch (error) {
+        coverageLoaded = false;
+        setStatus(statusLogCoverage, `❌ Failed to load deck status: ${error}`);
+    }
+}
+
+refreshCoverageButton?.addEventListener("click", () => loadCoverage(true));
+
 loadDecks();
 loadModels("text", textModelSelect, "gpt-4.1-mini", statusLogSync, updateSyncButton);
 loadModels("audio", audioModelSelect, "gpt-4o-mini-tts", statusLogAudio, updateAudioControls);
@@ -1,9 +1,15 @@
+import json
+import tempfile
 import unittest
 from pathlib import Path
 from types import SimpleNamespace
 from unittest.mock import MagicMock, patch
 
 import AnkiDeckToImages as images
+import AnkiSync as sync
+from benchmarks.fakes import FakeAnkiConnect
+from utils import backends, media_index, retry
+from utils.media_index import MediaIndex
 
 
 class TestAnkiDeckToImages(unittest.TestCase):
@@ -14,7 +20,7 @@ class TestAnkiDeckToImages(unittest.TestCase):
         self.assertEqual(result.strip(), "<div>front</div><p></p>")
 
     @patch("AnkiDeckToImages.invoke")
-    @patch("AnkiDeckToImages.OpenAI")
+    @patch("utils.backends.OpenAI")
     def test_process_card_removes_existing_image_when_gating_false(
         self, mock_openai: MagicMock, mock_invoke: MagicMock
     ) -> None:
@@ -43,7 +49,7 @@ class TestAnkiDeckToImages(unittest.TestCase):
 
     @patch("AnkiDeckToImages.generate_image", return_value=Path("fake.png"))
     @patch("AnkiDeckToImages.invoke")
-    @patch("AnkiDeckToImages.OpenAI")
+    @patch("utils.backends.OpenAI")
     def test_process_card_generates_and_attaches_image_when_gating_true(
         self,
         mock_openai: MagicMock,
@@ -70,5 +76,202 @@ class TestAnkiDeckToImages(unittest.TestCase):
         self.assertIn("picture", kwargs["note"])
 
 
+    def test_parse_group_gating_decisions_drops_garbled_and_unknown_items(self) -> None:
+        raw = json.dumps(
+            {
+                "decisions": [
+                    {"id": "1", "illustrate": True},
+                    {"id": "2", "illustrate": "maybe"},
+                    {"id": "99", "illustrate": False},
+                    {"id": "1", "illustrate": False},
+                ]
+            }
+        )
+        decisions = images.parse_group_gating_decisions(raw, ["1", "2", "3"])
+        self.assertEqual(decisions, {"1": True})
+        self.assertEqual(images.parse_group_gating_decisions("not json", ["1"]), {})
+
+    def test_group_gate_packs_cards_and_leaves_dropped_ones_for_fallback(self) -> None:
+        mock_client = MagicMock()
+        mock_client.responses.create.side_effect = [
+            SimpleNamespace(output_text='{"decisions": [{"id": "1", "illustrate": true}]}'),
+            SimpleNamespace(output_text='{"decisions": [{"id": "3", "illustrate": false}]}'),
+        ]
+        candidates = [(1, "사과", "apple"), (2, "은/는", "topic particle"), (3, "그리고", "and")]
+        with patch("builtins.print"):
+            decisions = images.group_gate(backends.OpenAIBackend(client=mock_client), candidates, group_size=2)
+        self.assertEqual(decisions, {1: True, 3: False})
+        self.assertEqual(mock_client.responses.create.call_count, 2)
+        first_request = mock_client.responses.create.call_args_list[0].kwargs
+        self.assertEqual(len(json.loads(first_request["input"])["cards"]), 2)
+
+    @patch("AnkiDeckToImages.generate_image", return_value=Path("fake.png"))
+    @patch("AnkiDeckToImages.invoke")
+    @patch("utils.backends.OpenAI")
+    def test_process_card_uses_precomputed_gating_decision(
+        self,
+        mock_openai: MagicMock,
+        mock_invoke: MagicMock,
+        mock_generate: MagicMock,
+    ) -> None:
+        status, _, _ = images.process_card(
+            card=(7, "사과", "apple"),
+            api_key="test",
+            image_model="gpt-image-1",
+            prompt_template="{text}",
+            skip_gating=False,
+            gating_decision=True,
+        )
+        self.assertEqual(status, "added")
+        mock_openai.return_value.responses.create.assert_not_called()
+
+
+    @patch("utils.backends.OpenAI")
+    def test_gate_card_approves_without_generating(self, mock_openai: MagicMock) -> None:
+        mock_openai.return_value.responses.create.return_value = SimpleNamespace(output_text="true")
+        status, _, reason = images.gate_card((3, "사과", "apple"), api_key="test", skip_gating=False)
+        self.assertEqual(status, "approved")
+        self.assertIsNone(reason)
+        mock_openai.return_value.images.generate.assert_not_called()
+
+    @patch("AnkiDeckToImages.generate_image", return_value=Path("fake.png"))
+    @patch("AnkiDeckToImages.invoke")
+    @patch("utils.backends.OpenAI")
+    def test_generate_card_image_passes_draft_options(
+        self, mock_openai: MagicMock, mock_invoke: MagicMock, mock_generate: MagicMock
+    ) -> None:
+        status, _, _ = images.generate_card_image(
+            (5, "개", "dog"), "test", "gpt-image-1", "{text}",
+            image_options={"size": "1024x1024", "quality": "low"},
+        )
+        self.assertEqual(status, "added")
+        self.assertEqual(mock_generate.call_args.kwargs["quality"], "low")
+
+    @patch("AnkiDeckToImages.generate_image", return_value=Path("/tmp/7.png"))
+    @patch("AnkiDeckToImages.invoke")
+    @patch("utils.backends.OpenAI")
+    def test_upgrade_card_image_swaps_media_without_touching_note(
+        self, mock_openai: MagicMock, mock_invoke: MagicMock, mock_generate: MagicMock
+    ) -> None:
+        status, _, _ = images.upgrade_card_image((7, "개", "dog"), "test", "gpt-image-1", "{text}")
+        self.assertEqual(status, "upgraded")
+        self.assertNotIn("quality", mock_generate.call_args.kwargs)
+        mock_invoke.assert_called_once_with(
+            "storeMediaFile", filename="7.png", path="/tmp/7.png", deleteExisting=True
+        )
+
+    def test_upgrade_queue_pops_by_priority_until_cancelled(self) -> None:
+        queue = images.UpgradeQueue()
+        for priority, card_id in ((2, 20), (0, 0), (1, 10), (0, 1)):
+            queue.push(priority, (card_id, "", ""))
+        self.assertEqual(queue.pop()[0], 0)
+        self.assertEqual(queue.pop()[0], 1)
+        queue.cancel()
+        self.assertIsNone(queue.pop())
+        self.assertEqual(len(queue), 2)
+
+    def test_run_upgrade_pass_reports_cancelled_drafts(self) -> None:
+        queue = images.UpgradeQueue()
+        for card_id in range(5):
+            queue.push(card_id, (card_id, "", f"word {card_id}"))
+        upgraded = []
+
+        def fake_upgrade(card, *args):
+            upgraded.append(card[0])
+            if len(upgraded) == 2:
+                queue.cancel()
+            return ("upgraded", card[2], None)
+
+        with patch.object(images, "upgrade_card_image", side_effect=fake_upgrade), patch("builtins.print"):
+            counts = images.run_upgrade_pass(queue, "test", "gpt-image-1", "{text}", workers=1)
+        self.assertEqual(upgraded, [0, 1])
+        self.assertEqual(counts, {"upgraded": 2, "error": 0, "cancelled": 3})
+
+    @patch("AnkiDeckToImages.save_image")
+    @patch("AnkiDeckToImages.request_image", return_value="aW1hZ2U=")
+    @patch("AnkiDeckToImages.invoke")
+    @patch("utils.backends.OpenAI")
+    def test_inline_generate_card_image_passes_api_base64_through(
+        self,
+        mock_openai: MagicMock,
+        mock_invoke: MagicMock,
+        mock_request: MagicMock,
+        mock_save: MagicMock,
+    ) -> None:
+        status, _, _ = images.generate_card_image((8, "개", "dog"), "test", "gpt-image-1", "{text}", inline=True)
+        self.assertEqual(status, "added")
+        mock_save.assert_not_called()
+        picture = mock_invoke.call_args.kwargs["note"]["picture"][0]
+        self.assertEqual(picture, {"filename": "8.png", "fields": ["Front"], "data": "aW1hZ2U="})
+
+    @patch("AnkiDeckToImages.request_image", return_value="aW1hZ2U=")
+    @patch("AnkiDeckToImages.invoke")
+    @patch("utils.backends.OpenAI")
+    def test_failed_anki_write_is_retried_without_a_new_image(
+        self,
+        mock_openai: MagicMock,
+        mock_invoke: MagicMock,
+        mock_request: MagicMock,
+    ) -> None:
+        mock_invoke.side_effect = [RuntimeError("collection is not available"), None]
+        policy = retry.configure(3)
+        policy._sleep = lambda seconds: None
+        self.addCleanup(retry.configure)
+        status, _, _ = images.generate_card_image((8, "개", "dog"), "test", "gpt-image-1", "{text}", inline=True)
+        self.assertEqual(status, "added")
+        self.assertEqual((mock_request.call_count, mock_invoke.call_count), (1, 2))
+
+    @patch("AnkiDeckToImages.invoke")
+    def test_store_media_file_sends_data_when_inline(self, mock_invoke: MagicMock) -> None:
+        images.store_media_file("9.png", data="aW1hZ2U=")
+        mock_invoke.assert_called_once_with(
+            "storeMediaFile", filename="9.png", data="aW1hZ2U=", deleteExisting=True
+        )
+
+    def test_select_changed_cards_uses_text_model_and_prompt(self) -> None:
+        with tempfile.TemporaryDirectory() as tmp:
+            index = MediaIndex(Path(tmp) / "index.sqlite3")
+            cards = [(1, '사과<img src="1.png">', "apple"), (2, "개", "dog"), (3, "집", "house")]
+            fingerprints = {card[0]: images.image_fingerprint(card[1], card[2], "m", "{text}") for card in cards}
+            index.set_fingerprint("image", 2, fingerprints[2])
+            index.set_fingerprint("image", 3, images.image_fingerprint("집", "house", "m", "other {text}"))
+            changed = images.select_changed_cards(cards, index, fingerprints)
+            self.assertEqual([card[0] for card in changed], [3])
+            self.assertIn(1, index.fingerprints("image", [1]))
+            index.close()
+
+
+class TestDraftUpgrades(unittest.TestCase):
+    def run_main(self, *argv: str) -> None:
+        with patch("sys.argv", ["AnkiDeckToImages.py", "D", "--backend", "offline", "--skip-gating",
+                                "--no-gating-history", "--no-dead-letter", *argv]), \
+                patch("builtins.print"), patch("sys.stderr"):
+            images.main()
+
+    def test_drafts_left_by_an_interrupted_run_are_upgraded_next_time(self) -> None:
+        with tempfile.TemporaryDirectory() as tmp, FakeAnkiConnect() as anki, \
+                patch.object(sync, "ANKI_CONNECT_URL", anki.url), \
+                patch.object(images, "IMAGE_DIR", Path(tmp) / "images"), \
+                patch.object(media_index, "INDEX_PATH", Path(tmp) / "index.sqlite3"):
+            self.addCleanup(media_index.enable, None)
+            note_ids = anki.add_deck("D", [("사과", "apple"), ("개", "dog")])
+            # Ctrl-C once the drafts are attached: the upgrade pass never runs.
+            with patch.object(images, "run_upgrade_pass", side_effect=KeyboardInterrupt):
+                with self.assertRaises(KeyboardInterrupt):
+                    self.run_main("--draft")
+            self.assertTrue(all("<img" in anki.notes[note_id]["fields"]["Front"] for note_id in note_ids))
+
+            with patch.object(images, "upgrade_card_image", return_value=("upgraded", "x", None)) as upgrade, \
+                    patch.object(images, "gate_card") as gate:
+                self.run_main()
+            self.assertEqual(sorted(call.args[0][0] for call in upgrade.call_args_list), sorted(note_ids))
+            gate.assert_not_called()
+
+            # Upgraded cards now carry their final fingerprint and are left alone.
+            with patch.object(images, "upgrade_card_image") as upgrade:
+                self.run_main()
+            upgrade.assert_not_called()
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -1,7 +1,12 @@
+import tempfile
 import unittest
+from pathlib import Path
 from unittest.mock import MagicMock, patch
 
 import AnkiDeckToSpeech as speech
+from benchmarks.fakes import FakeOpenAI
+from utils import media_index
+from utils.media_index import MediaIndex
 
 
 class TestAnkiDeckToSpeech(unittest.TestCase):
@@ -11,7 +16,7 @@ class TestAnkiDeckToSpeech(unittest.TestCase):
 
     @patch("AnkiDeckToSpeech.invoke")
     @patch("AnkiDeckToSpeech.create_audio_file")
-    @patch("AnkiDeckToSpeech.OpenAI")
+    @patch("utils.backends.OpenAI")
     def test_process_card_skips_when_no_speakable_text(
         self,
         mock_openai: MagicMock,
@@ -32,7 +37,7 @@ class TestAnkiDeckToSpeech(unittest.TestCase):
 
     @patch("AnkiDeckToSpeech.invoke")
     @patch("AnkiDeckToSpeech.create_audio_file")
-    @patch("AnkiDeckToSpeech.OpenAI")
+    @patch("utils.backends.OpenAI")
     def test_process_card_generates_audio_and_updates_note(
         self,
         mock_openai: MagicMock,
@@ -59,6 +64,90 @@ class TestAnkiDeckToSpeech(unittest.TestCase):
         self.assertIn("audio", kwargs["note"])
         self.assertIsNone(reason)
 
+    @patch("AnkiDeckToSpeech.invoke")
+    @patch("AnkiDeckToSpeech.request_audio", return_value=b"ID3audio")
+    @patch("AnkiDeckToSpeech.create_audio_file")
+    @patch("utils.backends.OpenAI")
+    def test_inline_process_card_sends_base64_data_without_writing(
+        self,
+        mock_openai: MagicMock,
+        mock_create_audio: MagicMock,
+        mock_request_audio: MagicMock,
+        mock_invoke: MagicMock,
+    ) -> None:
+        status, _, _ = speech.process_card(
+            (6, "사과", "apple"), "fake", "gpt", "onyx", "speak", inline=True
+        )
+        self.assertEqual(status, "added")
+        mock_create_audio.assert_not_called()
+        attachment = mock_invoke.call_args.kwargs["note"]["audio"][0]
+        self.assertNotIn("path", attachment)
+        self.assertEqual(attachment["data"], "SUQzYXVkaW8=")
+
+    def test_select_changed_cards_skips_unchanged_and_adopts_legacy_audio(self) -> None:
+        with tempfile.TemporaryDirectory() as tmp:
+            index = MediaIndex(Path(tmp) / "index.sqlite3")
+            cards = [(1, "사과", "apple"), (2, "개[sound:2.mp3]", "dog"), (3, "집 (edited)[sound:3.mp3]", "house")]
+            fingerprints = {card[0]: speech.audio_fingerprint(card[1], "m", "v", "i") for card in cards}
+            index.set_fingerprint("audio", 1, fingerprints[1])
+            index.set_fingerprint("audio", 3, speech.audio_fingerprint("집", "m", "v", "i"))
+            changed = speech.select_changed_cards(cards, index, fingerprints)
+            self.assertEqual([card[0] for card in changed], [3])
+            self.assertEqual(index.fingerprints("audio", [2]), {2: fingerprints[2]})
+            index.close()
+
+    @patch("AnkiDeckToSpeech.invoke")
+    @patch("AnkiDeckToSpeech.create_audio_file")
+    @patch("utils.backends.OpenAI")
+    def test_process_card_replaces_stale_sound_tag(
+        self, mock_openai: MagicMock, mock_create_audio: MagicMock, mock_invoke: MagicMock
+    ) -> None:
+        speech.process_card((4, "집[sound:4.mp3]", "house"), "fake", "gpt", "onyx", "speak")
+        self.assertEqual(mock_create_audio.call_args.args[1], "집")
+        self.assertEqual(mock_invoke.call_args.kwargs["note"]["fields"]["Front"], "집")
+
+    def test_plan_batches_keeps_long_fronts_and_stragglers_single(self) -> None:
+        cards = [(1, "사과", "apple"), (2, "개", "dog"), (3, "이것은 아주 긴 문장입니다 정말로", "long"), (4, "집", "house")]
+        batches, singles = speech.plan_batches(cards, 2)
+        self.assertEqual([[card[0] for card in batch] for batch in batches], [[1, 2]])
+        self.assertEqual([card[0] for card in singles], [3, 4])
+        self.assertEqual(speech.plan_batches(cards, 1), ([], cards))
+
+    @patch("AnkiDeckToSpeech.invoke")
+    @patch("utils.backends.OpenAI")
+    def test_process_batch_splits_audio_per_card(self, mock_openai: MagicMock, mock_invoke: MagicMock) -> None:
+        cards = [(1, "사과", "apple"), (2, "개[sound:2.mp3]", "dog")]
+        with tempfile.TemporaryDirectory() as tmp, \
+                patch.object(speech, "AUDIO_DIR", Path(tmp) / "audio"), \
+                patch.object(speech, "request_audio", return_value=FakeOpenAI().speech_pcm("사과\n개")) as mock_request:
+            audio_dir = Path(tmp) / "audio"
+            audio_dir.mkdir()
+            # Card 2 was voiced on its own before; its MP3 must not linger next to the new WAV.
+            (audio_dir / "2.mp3").write_bytes(b"ID3")
+            index = media_index.enable(Path(tmp) / "index.sqlite3")
+            self.addCleanup(media_index.enable, None)
+            index.record("audio", 2, audio_dir / "2.mp3")
+            results = speech.process_batch(cards, "fake", "gpt", "onyx", "speak")
+            self.assertEqual(sorted(path.name for path in audio_dir.iterdir()), ["1.wav", "2.wav"])
+            self.assertEqual(sorted(row["filename"] for row in index.rows("audio")), ["1.wav", "2.wav"])
+        self.assertEqual([result[:3] for result in results], [(1, "added", "사과"), (2, "added", "개")])
+        self.assertEqual(mock_request.call_args.args[1], "사과\n개")
+        self.assertEqual(mock_request.call_args.kwargs["response_format"], "pcm")
+        notes = [call.kwargs["note"] for call in mock_invoke.call_args_list]
+        self.assertEqual([note["audio"][0]["filename"] for note in notes], ["1.wav", "2.wav"])
+        self.assertEqual(notes[1]["fields"]["Front"], "개")
+
+    @patch("AnkiDeckToSpeech.process_card", return_value=("added", "front", None))
+    @patch("utils.backends.OpenAI")
+    def test_process_batch_falls_back_when_clip_count_mismatches(
+        self, mock_openai: MagicMock, mock_process_card: MagicMock
+    ) -> None:
+        cards = [(1, "사과", "apple"), (2, "개", "dog"), (3, "집", "house")]
+        with patch.object(speech, "request_audio", return_value=FakeOpenAI().speech_pcm("사과 개\n집")):
+            results = speech.process_batch(cards, "fake", "gpt", "onyx", "speak")
+        self.assertEqual(mock_process_card.call_count, 3)
+        self.assertEqual([result[0] for result in results], [1, 2, 3])
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -1,4 +1,5 @@
 import unittest
+from unittest.mock import patch
 
 import AnkiSync as sync
 
@@ -14,6 +15,14 @@ class TestAnkiSyncHelpers(unittest.TestCase):
         self.assertEqual(len(result), 1)
         self.assertEqual(result[0]["english"], "hi")
 
+    def test_parse_word_pairs_salvages_cut_off_output(self) -> None:
+        content = '```json\n{"pairs": [{"english": "hi", "foreign": "안녕"}, {"english": "by'
+        with patch("builtins.print"):
+            result = sync.parse_word_pairs(content)
+        self.assertEqual(result, [{"english": "hi", "foreign": "안녕"}])
+        with self.assertRaises(RuntimeError):
+            sync.parse_word_pairs('{"pairs": [{"english": "by')
+
     def test_build_note_structure(self) -> None:
         note = sync.build_note("Deck", "Front", "Back")
         self.assertEqual(note["deckName"], "Deck")
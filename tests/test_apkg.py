@@ -0,0 +1,58 @@
+import json
+import sqlite3
+import tempfile
+import unittest
+import zipfile
+from pathlib import Path
+
+import AnkiSync as sync
+from utils.apkg import FIELD_SEPARATOR, MODEL_NAME, DeckPackage
+
+
+class TestDeckPackage(unittest.TestCase):
+    def test_write_creates_collection_with_type_in_answer_model(self) -> None:
+        package = DeckPackage()
+        package.add_notes([sync.build_note("Korean", "안녕", "hello")])
+        with tempfile.TemporaryDirectory() as tmp:
+            target = package.write(Path(tmp) / "deck.apkg")
+            with zipfile.ZipFile(target) as archive:
+                archive.extract("collection.anki2", tmp)
+                self.assertEqual(json.loads(archive.read("media")), {})
+            connection = sqlite3.connect(Path(tmp) / "collection.anki2")
+            models, decks = connection.execute("SELECT models, decks FROM col").fetchone()
+            flds = connection.execute("SELECT flds FROM notes").fetchone()[0]
+            card_count = connection.execute("SELECT COUNT(*) FROM cards").fetchone()[0]
+            connection.close()
+        self.assertEqual([model["name"] for model in json.loads(models).values()], [MODEL_NAME])
+        self.assertIn("Korean", [deck["name"] for deck in json.loads(decks).values()])
+        self.assertEqual(flds, f"안녕{FIELD_SEPARATOR}hello")
+        self.assertEqual(card_count, 1)
+
+    def test_update_note_fields_attaches_media_like_anki_connect(self) -> None:
+        package = DeckPackage()
+        note_id = package.add_note(sync.build_note("Korean", "안녕", "hello"))
+        with tempfile.TemporaryDirectory() as tmp:
+            audio_path = Path(tmp) / f"{note_id}.mp3"
+            audio_path.write_bytes(b"mp3")
+            package.update_note_fields(
+                {
+                    "id": note_id,
+                    "fields": {"Front": "안녕", "Back": "hello"},
+                    "audio": [{"filename": audio_path.name, "fields": ["Front"], "path": str(audio_path)}],
+                }
+            )
+            target = package.write(Path(tmp) / "deck.apkg")
+            reloaded = DeckPackage.load(target)
+        info = reloaded.notes_info(reloaded.find_notes("Korean"))[0]
+        self.assertEqual(info["fields"]["Front"]["value"], f"안녕[sound:{note_id}.mp3]")
+        self.assertEqual(reloaded.media[f"{note_id}.mp3"], b"mp3")
+
+    def test_add_note_rejects_other_models(self) -> None:
+        note = sync.build_note("Korean", "안녕", "hello")
+        note["modelName"] = "Cloze"
+        with self.assertRaises(ValueError):
+            DeckPackage().add_note(note)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,11 +1,25 @@
 import os
+import tempfile
 import unittest
+from pathlib import Path
 from unittest.mock import patch
 
 import app
+from utils.listing_cache import ListingCache
+from utils.media_index import MediaIndex
 
 
 class TestAppHelpers(unittest.TestCase):
+    def test_first_request_starts_the_warm_up_once(self) -> None:
+        with patch.object(app, "_warmed", False), patch.dict(app.app.config, {"TESTING": False}), \
+                patch.object(app, "warm_listings") as listings, patch.object(app, "warm_media_index") as backfill, \
+                patch.object(app, "LISTINGS", ListingCache(path=None)), patch.object(app, "invoke", return_value=[]):
+            client = app.app.test_client()
+            client.get("/api/decks")
+            client.get("/api/decks")
+        listings.assert_called_once_with()
+        backfill.assert_called_once_with()
+
     def test_extract_image_filename_handles_single_quotes(self) -> None:
         html = "<div><img src='12345.png' /></div>"
         self.assertEqual(app.extract_image_filename(html), "12345.png")
@@ -19,13 +33,26 @@ class TestDeckImagesRoute(unittest.TestCase):
     def setUp(self) -> None:
         self.client = app.app.test_client()
         app.app.testing = True
+        self.tmp = tempfile.TemporaryDirectory()
+        self.index = MediaIndex(Path(self.tmp.name) / "index.sqlite3")
+        patcher = patch.object(app, "get_media_index", return_value=self.index)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        image_dir = patch.object(app, "IMAGE_DIR", Path(self.tmp.name))
+        image_dir.start()
+        self.addCleanup(image_dir.stop)
+
+    def tearDown(self) -> None:
+        self.index.close()
+        self.tmp.cleanup()
 
     @patch("app.invoke")
     def test_deck_images_returns_entries_with_fallback_names(self, mock_invoke) -> None:
         hashed_filename = "12345-abcdef.png"
         base_name = "12345.png"
-        image_path = app.IMAGE_DIR / base_name
+        image_path = Path(self.tmp.name) / base_name
         image_path.write_bytes(b"fake")
+        self.index.record("image", 12345, image_path)
 
         mock_invoke.side_effect = [
             [42],
@@ -45,7 +72,52 @@ class TestDeckImagesRoute(unittest.TestCase):
         self.assertEqual(len(data["images"]), 1)
         self.assertTrue(data["images"][0]["image_url"].endswith(base_name))
 
+    @patch("app.invoke")
+    def test_deck_images_prefers_index_row_for_note(self, mock_invoke) -> None:
+        image_path = Path(self.tmp.name) / "42.png"
+        image_path.write_bytes(b"fake")
+        self.index.record("image", 42, image_path)
+        mock_invoke.side_effect = [
+            [42, 43],
+            [
+                {"fields": {"Front": {"value": '<img src="42-0f1e.png">'}, "Back": {"value": "Hi"}}},
+                {"fields": {"Front": {"value": "no image"}, "Back": {"value": "Bye"}}},
+            ],
+        ]
+        with patch("pathlib.Path.exists") as mock_exists:
+            data = self.client.get("/api/deck-images?deck=Test").get_json()
+        mock_exists.assert_not_called()
+        self.assertEqual([item["card_id"] for item in data["images"]], [42])
+        self.assertTrue(data["images"][0]["image_url"].endswith("42.png"))
+
+    def test_missing_image_drops_its_index_row(self) -> None:
+        image_path = Path(self.tmp.name) / "42.png"
+        image_path.write_bytes(b"fake")
+        self.index.record("image", 42, image_path)
         image_path.unlink()
+        self.assertEqual(self.client.get("/media/images/42.png").status_code, 404)
+        self.assertEqual(len(self.index), 0)
+
+
+class TestMetricsRoute(unittest.TestCase):
+    def setUp(self) -> None:
+        self.client = app.app.test_client()
+        app.app.testing = True
+        listings = patch.object(app, "LISTINGS", ListingCache(path=None))
+        listings.start()
+        self.addCleanup(listings.stop)
+
+    @patch("AnkiSync.urllib.request.urlopen")
+    def test_metrics_reports_anki_connect_round_trips(self, mock_urlopen) -> None:
+        mock_urlopen.return_value.__enter__.return_value.read.return_value = (
+            b'{"result": ["Default"], "error": null}'
+        )
+        self.client.get("/api/decks")
+        response = self.client.get("/metrics")
+        body = response.get_data(as_text=True)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("# TYPE anki_connect_request_seconds histogram", body)
+        self.assertIn('anki_connect_requests_total{action="deckNames",status="ok"}', body)
 
 
 if __name__ == "__main__":
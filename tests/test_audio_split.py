@@ -0,0 +1,41 @@
+import io
+import unittest
+import wave
+
+from benchmarks.fakes import FakeOpenAI
+from utils.audio_split import SAMPLE_RATE, pcm_to_wav, split_on_silence
+
+
+class TestAudioSplit(unittest.TestCase):
+    def setUp(self) -> None:
+        self.fake = FakeOpenAI()
+
+    def test_splits_one_clip_per_line(self) -> None:
+        pcm = self.fake.speech_pcm("사과\n개\n집")
+        clips = split_on_silence(pcm, 3)
+        self.assertIsNotNone(clips)
+        self.assertEqual(len(clips), 3)
+        for clip in clips:
+            # 0.3 s tone plus padding on both sides.
+            self.assertAlmostEqual(len(clip) / 2 / SAMPLE_RATE, 0.42, delta=0.03)
+
+    def test_returns_none_when_pause_count_does_not_match(self) -> None:
+        pcm = self.fake.speech_pcm("사과\n개")
+        self.assertIsNone(split_on_silence(pcm, 3))
+        self.assertIsNone(split_on_silence(b"\x00" * 4800, 1))
+
+    def test_short_pauses_do_not_split(self) -> None:
+        pcm = self.fake.speech_pcm("사과\n개")
+        self.assertIsNone(split_on_silence(pcm, 2, min_gap_ms=1000))
+
+    def test_pcm_to_wav_wraps_mono_16_bit(self) -> None:
+        data = pcm_to_wav(b"\x01\x00" * 240)
+        with wave.open(io.BytesIO(data)) as handle:
+            self.assertEqual(
+                (handle.getnchannels(), handle.getsampwidth(), handle.getframerate(), handle.getnframes()),
+                (1, 2, SAMPLE_RATE, 240),
+            )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,104 @@
+import base64
+import json
+import struct
+import tempfile
+import unittest
+import zlib
+from pathlib import Path
+from unittest.mock import patch
+
+from utils import backends
+from utils.audio_split import split_on_silence
+
+
+class TestOfflineBackend(unittest.TestCase):
+    def setUp(self) -> None:
+        self.backend = backends.OfflineBackend()
+
+    def test_batched_speech_splits_one_clip_per_line(self) -> None:
+        pcm = self.backend.speech("사과\n개\n집", model="m", voice="v", instructions="", response_format="pcm")
+        clips = split_on_silence(pcm, 3)
+        self.assertIsNotNone(clips)
+        self.assertEqual(len(clips), 3)
+
+    def test_speech_without_espeak_is_a_wav(self) -> None:
+        with patch.object(backends.shutil, "which", return_value=None):
+            backend = backends.OfflineBackend()
+        audio = backend.speech("사과", model="m", voice="v", instructions="")
+        self.assertEqual((audio[:4], audio[8:12]), (b"RIFF", b"WAVE"))
+        self.assertEqual(backend.audio_format, "wav")
+
+    def test_image_is_a_png_of_the_requested_size(self) -> None:
+        data = base64.b64decode(self.backend.image("apple", model="m", size="64x32"))
+        self.assertEqual(data[:8], b"\x89PNG\r\n\x1a\n")
+        width, height = struct.unpack(">II", data[16:24])
+        self.assertEqual((width, height), (64, 32))
+
+    def test_extract_reads_pairs_from_pdf_text(self) -> None:
+        content = zlib.compress(b"BT (\xec\x82\xac\xea\xb3\xbc - apple) Tj T* (dog = \xea\xb0\x9c) Tj ET")
+        pdf = b"%PDF-1.4\n1 0 obj\n<< /Filter /FlateDecode >>\nstream\n" + content + b"\nendstream\nendobj\n%%EOF"
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "words.pdf"
+            path.write_bytes(pdf)
+            pairs = json.loads(self.backend.extract(path, model="m", prompt_text=""))
+        self.assertEqual(pairs, [{"english": "apple", "foreign": "사과"}, {"english": "dog", "foreign": "개"}])
+
+    def test_extract_without_pairs_raises(self) -> None:
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "notes.txt"
+            path.write_text("just a heading\n", encoding="utf-8")
+            with self.assertRaises(RuntimeError):
+                self.backend.extract(path, model="m", prompt_text="")
+
+
+class TestExtraction(unittest.TestCase):
+    def test_cut_off_output_keeps_every_complete_item(self) -> None:
+        raw = '{"pairs": [{"english": "apple", "foreign": "사과"}, {"english": "dog", "foreign": "개"}, {"engl'
+        pairs, complete = backends.parse_extraction_output(raw)
+        self.assertEqual([pair["english"] for pair in pairs], ["apple", "dog"])
+        self.assertFalse(complete)
+        pairs, complete = backends.parse_extraction_output('Here you go: [{"english": "a", "foreign": "b"}] Done.')
+        self.assertEqual((len(pairs), complete), (1, True))
+
+    def test_extract_continues_until_the_list_is_complete(self) -> None:
+        from openai import OpenAI
+
+        from benchmarks.fakes import FakeOpenAI
+
+        with FakeOpenAI(extraction_pairs=25, extraction_limit=10) as fake, tempfile.TemporaryDirectory() as tmp:
+            backend = backends.OpenAIBackend(client=OpenAI(api_key="test", base_url=fake.base_url))
+            pdf = Path(tmp) / "lesson.pdf"
+            pdf.write_bytes(b"%PDF-1.4")
+            with patch("builtins.print"):
+                pairs = json.loads(backend.extract(pdf, model="gpt-4.1-mini", prompt_text="prompt"))
+            self.assertEqual([pair["foreign"] for pair in pairs], [f"단어{index}" for index in range(25)])
+            self.assertEqual(fake.requests["responses"], 3)
+
+
+class TestBackendSelection(unittest.TestCase):
+    def test_registry_names_and_module_factories(self) -> None:
+        self.assertIsInstance(backends.create_backend("offline"), backends.OfflineBackend)
+        self.assertIsInstance(backends.create_backend("utils.backends:OfflineBackend"), backends.OfflineBackend)
+        self.assertTrue(backends.requires_api_key("openai"))
+        self.assertFalse(backends.requires_api_key("offline"))
+        with self.assertRaises(ValueError):
+            backends.create_backend("nonexistent")
+
+    def test_backend_missing_a_method_fails_when_created(self) -> None:
+        class SpeechOnly(backends.GenerationBackend):
+            def speech(self, text, **options):
+                return b""
+
+        backends.register_backend("speech-only", lambda api_key: SpeechOnly())
+        self.addCleanup(backends.BACKENDS.pop, "speech-only")
+        with self.assertRaises(TypeError):
+            backends.create_backend("speech-only")
+
+    def test_selected_backend_is_current_until_the_run_ends(self) -> None:
+        with backends.selected("offline") as backend:
+            self.assertIs(backends.current("key"), backend)
+        self.assertIsInstance(backends.current("key"), backends.OpenAIBackend)
+
+
+if __name__ == "__main__":
+    unittest.main()
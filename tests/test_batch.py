@@ -0,0 +1,68 @@
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+from openai import OpenAI
+
+import AnkiDeckToImages as images
+import AnkiSync as sync
+from benchmarks.fakes import FakeOpenAI
+from utils.batch import BatchJob, response_text_from_body
+
+
+class TestBatchJob(unittest.TestCase):
+    def setUp(self) -> None:
+        self.fake = FakeOpenAI(gate_true_ratio=1.0)
+        self.fake.start()
+        self.client = OpenAI(api_key="test", base_url=self.fake.base_url)
+        self.tmp = tempfile.TemporaryDirectory()
+        self.state_path = Path(self.tmp.name) / "gating-deck.json"
+
+    def tearDown(self) -> None:
+        self.fake.stop()
+        self.tmp.cleanup()
+
+    def test_submit_and_wait_maps_results_by_custom_id(self) -> None:
+        job = BatchJob(self.client, self.state_path)
+        job.submit([("gate-1", {"prompt": {"variables": {"front": "a", "back": "b"}}})], key="k")
+        with patch("builtins.print"):
+            results = job.wait(poll_interval=0)
+        self.assertEqual(response_text_from_body(results["gate-1"]), "true")
+
+    def test_restarted_poller_resumes_existing_batch(self) -> None:
+        BatchJob(self.client, self.state_path).submit([("gate-1", {"prompt": {}})], key="k")
+        resumed = BatchJob(self.client, self.state_path)
+        self.assertTrue(resumed.resumable("k"))
+        self.assertFalse(resumed.resumable("other"))
+        with patch("builtins.print"):
+            self.assertIn("gate-1", resumed.wait(poll_interval=0))
+        self.assertEqual(len(self.fake.batches), 1)
+
+    def test_batch_gate_returns_decisions_by_card_id(self) -> None:
+        candidates = [(1, "안녕", "hello"), (2, "<img src='x.png'>", "<br>")]
+        with patch.object(images, "state_path_for", return_value=self.state_path), patch("builtins.print"):
+            decisions = images.batch_gate(self.client, "Deck", candidates, poll_interval=0)
+        self.assertEqual(decisions, {1: True})
+        self.assertFalse(self.state_path.exists())
+
+    def test_extract_via_batch_returns_model_output(self) -> None:
+        self.fake.extraction_pairs = 2
+        pdf = Path(self.tmp.name) / "lesson.pdf"
+        pdf.write_bytes(b"%PDF-1.4")
+        with patch.object(sync, "state_path_for", return_value=self.state_path), patch("builtins.print"):
+            raw = sync.extract_via_batch(self.client, pdf, "gpt-4.1-mini", "prompt", poll_interval=0)
+        self.assertEqual(len(sync.parse_word_pairs(raw)), 2)
+
+    def test_cut_off_batch_extraction_is_continued(self) -> None:
+        self.fake.extraction_pairs = 5
+        self.fake.extraction_limit = 3
+        pdf = Path(self.tmp.name) / "lesson.pdf"
+        pdf.write_bytes(b"%PDF-1.4")
+        with patch.object(sync, "state_path_for", return_value=self.state_path), patch("builtins.print"):
+            raw = sync.extract_via_batch(self.client, pdf, "gpt-4.1-mini", "prompt", poll_interval=0)
+        self.assertEqual([pair["english"] for pair in sync.parse_word_pairs(raw)], [f"word {i}" for i in range(5)])
+
+
+if __name__ == "__main__":
+    unittest.main()
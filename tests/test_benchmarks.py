@@ -0,0 +1,104 @@
+import json
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+import AnkiSync as sync
+from benchmarks import notes, run, startup
+from benchmarks.fakes import FakeAnkiConnect, FakeOpenAI
+
+
+class TestFakeAnkiConnect(unittest.TestCase):
+    def test_invoke_round_trips_against_in_memory_collection(self) -> None:
+        with FakeAnkiConnect() as anki, patch.object(sync, "ANKI_CONNECT_URL", anki.url):
+            note_ids = anki.add_deck("Deck", [("안녕", "hello")])
+            self.assertEqual(sync.invoke("findNotes", query='deck:"Deck"'), note_ids)
+            sync.invoke(
+                "multi",
+                actions=[
+                    {
+                        "action": "updateNoteFields",
+                        "params": {"note": {"id": note_ids[0], "fields": {"Back": "hi"}}},
+                    }
+                ],
+            )
+            info = sync.invoke("notesInfo", notes=note_ids)[0]
+            self.assertEqual(info["fields"]["Back"]["value"], "hi")
+
+    def test_unknown_action_surfaces_as_error(self) -> None:
+        with FakeAnkiConnect() as anki, patch.object(sync, "ANKI_CONNECT_URL", anki.url):
+            with self.assertRaises(Exception):
+                sync.invoke("guiBrowse", query="")
+
+
+class TestFakeOpenAI(unittest.TestCase):
+    def test_failure_injection_rates(self) -> None:
+        fake = FakeOpenAI(rate_limit_rate=1.0)
+        self.assertEqual(fake.roll_failure(), 429)
+        fake = FakeOpenAI(error_rate=1.0)
+        self.assertEqual(fake.roll_failure(), 500)
+        self.assertIsNone(FakeOpenAI().roll_failure())
+
+
+class TestBenchmarkRun(unittest.TestCase):
+    def test_sweep_writes_results_for_each_case(self) -> None:
+        with tempfile.TemporaryDirectory() as tmp:
+            output = Path(tmp) / "results.json"
+            with patch("sys.stdout"):
+                exit_code = run.main(
+                    [
+                        "--pipelines", "audio", "images", "invoke",
+                        "--workers", "1", "2",
+                        "--deck-sizes", "3",
+                        "--latency", "0",
+                        "--output", str(output),
+                    ]
+                )
+            report = json.loads(output.read_text())
+        self.assertEqual(exit_code, 0)
+        self.assertEqual(len(report["results"]), 6)
+        audio = [row for row in report["results"] if row["pipeline"] == "audio"]
+        self.assertEqual(audio[0]["cards"]["added"], 3)
+        self.assertEqual(audio[0]["openai_requests"]["audio/speech"], 3)
+
+    def test_compare_flags_throughput_drop(self) -> None:
+        with tempfile.TemporaryDirectory() as tmp:
+            baseline = Path(tmp) / "baseline.json"
+            baseline.write_text(json.dumps({"results": [
+                {"pipeline": "audio", "workers": 1, "deck_size": 3, "items_per_second": 10.0}
+            ]}))
+            rows = [{"pipeline": "audio", "workers": 1, "deck_size": 3, "items_per_second": 5.0}]
+            self.assertEqual(len(run.compare(rows, baseline, 0.2)), 1)
+            rows[0]["items_per_second"] = 9.0
+            self.assertEqual(run.compare(rows, baseline, 0.2), [])
+
+
+class TestNotesBenchmark(unittest.TestCase):
+    def test_variants_agree_and_report_per_note(self) -> None:
+        infos = notes.sample_infos(20)
+        self.assertEqual(notes.tuples(infos, 2), notes.records(infos, 2))
+        with patch("builtins.print") as printed:
+            self.assertEqual(notes.main(["--notes", "20", "--stages", "2", "--repeat", "1"]), 0)
+        self.assertEqual(printed.call_count, 2)
+
+
+class TestStartup(unittest.TestCase):
+    def test_parse_importtime_reads_cumulative_time_and_packages(self) -> None:
+        stderr = (
+            "import time: self [us] | cumulative | imported package\n"
+            "import time:       120 |        300 |   utils.common\n"
+            "import time:      1000 |       4500 | AnkiSync\n"
+        )
+        elapsed, packages = startup.parse_importtime(stderr, "AnkiSync")
+        self.assertEqual(elapsed, 4.5)
+        self.assertEqual(packages, {"utils", "AnkiSync"})
+
+    def test_entry_points_defer_openai_sdk(self) -> None:
+        for module in ("AnkiDeckToImages", "app"):
+            _, packages = startup.measure(module)
+            self.assertFalse(packages.intersection(startup.DEFERRED_MODULES), module)
+
+
+if __name__ == "__main__":
+    unittest.main()
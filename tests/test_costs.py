@@ -0,0 +1,93 @@
+import json
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+import AnkiDeckToImages as images
+import AnkiDeckToSpeech as speech
+from utils import costs, scheduling
+
+
+class TestPrices(unittest.TestCase):
+    def setUp(self) -> None:
+        costs.reset()
+
+    def test_dated_snapshots_use_the_base_model_price(self) -> None:
+        self.assertEqual(costs.price_for("gpt-4.1-mini-2025-04-14"), costs.DEFAULT_PRICES["gpt-4.1-mini"])
+        self.assertEqual(costs.price_for("gpt-4.1-2025-04-14"), costs.DEFAULT_PRICES["gpt-4.1"])
+        self.assertIsNone(costs.price_for("some-new-model"))
+
+    def test_overrides_are_merged_into_the_defaults(self) -> None:
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "prices.json"
+            path.write_text(json.dumps({"gpt-4.1-mini": {"input": 1.0}, "local": {"characters": 2.0}}))
+            prices = costs.load_prices(path)
+        self.assertEqual(prices["gpt-4.1-mini"], {"input": 1.0, "output": 1.60})
+        self.assertEqual(prices["local"], {"characters": 2.0})
+
+    def test_unit_prices(self) -> None:
+        self.assertAlmostEqual(costs.token_cost("gpt-4.1-mini", 1_000_000, 500_000), 0.40 + 0.80)
+        self.assertAlmostEqual(costs.speech_cost("gpt-4o-mini-tts", 1_000), 0.018)
+        self.assertAlmostEqual(costs.image_cost("gpt-image-1", "1024x1024", "low"), 0.011)
+        self.assertAlmostEqual(costs.image_cost("gpt-image-1", "1536x1024", "low"), 0.011 * costs.LARGE_IMAGE_FACTOR)
+        self.assertAlmostEqual(costs.image_cost("gpt-image-1"), 0.167)
+        self.assertIsNone(costs.speech_cost("gpt-4.1-mini", 10))
+
+
+class TestLedger(unittest.TestCase):
+    def setUp(self) -> None:
+        costs.reset()
+
+    def test_records_usage_with_the_batch_discount(self) -> None:
+        costs.record_tokens("responses", "gpt-4.1-mini", {"input_tokens": 1_000_000, "output_tokens": 0})
+        costs.record_tokens(
+            "batch.responses", "gpt-4.1-mini", {"prompt_tokens": 1_000_000}, discount=costs.BATCH_DISCOUNT
+        )
+        costs.record_speech("audio.speech", "gpt-4o-mini-tts", "x" * 1_000)
+        self.assertAlmostEqual(costs.spent(), 0.40 + 0.20 + 0.018)
+        self.assertIn("batch.responses $0.2000", costs.LEDGER.summary())
+
+    def test_unpriced_models_are_reported_once_and_not_counted(self) -> None:
+        with patch("builtins.print") as printed:
+            costs.record_tokens("responses", "mystery", {"input_tokens": 10})
+            costs.record_tokens("responses", "mystery", {"input_tokens": 10})
+        self.assertEqual(printed.call_count, 1)
+        self.assertEqual(costs.spent(), 0.0)
+        self.assertTrue(costs.LEDGER)
+
+    def test_cost_budget_stops_new_work(self) -> None:
+        spent = [0.0]
+        budget = scheduling.RunBudget(max_cost=1.0, spent=lambda: spent[0])
+        self.assertEqual(budget.call("front", lambda: ("added", "front", None)), ("added", "front", None))
+        spent[0] = 1.0
+        status, _, reason = budget.call("front", lambda: ("added", "front", None))
+        self.assertEqual((status, reason), ("deferred", "cost budget of $1.00 reached"))
+
+
+class TestProjections(unittest.TestCase):
+    def test_speech_projection_counts_only_spoken_characters(self) -> None:
+        cards = [(1, "사과 [sound:old.mp3]", "apple"), (2, "<b>개</b>", "dog")]
+        characters, cost = speech.project_spend(cards, "gpt-4o-mini-tts")
+        self.assertEqual(characters, len("사과") + len("개"))
+        self.assertAlmostEqual(cost, characters * 18.0 / 1_000_000)
+
+    def test_image_projection_skips_locally_rejected_cards(self) -> None:
+        cards = [(1, "사과", "apple"), (2, "개", "dog"), (3, "그리고", "and")]
+        projection = images.project_spend(
+            cards,
+            {3: False},
+            image_model="gpt-image-1",
+            gating_model="gpt-4.1-mini",
+            skip_gating=False,
+            group_size=1,
+            batch=False,
+            image_options={"size": "1024x1024", "quality": "low"},
+            upgrade=False,
+        )
+        self.assertEqual((projection["gating_calls"], projection["images"]), (2, 2))
+        self.assertAlmostEqual(projection["image_total"], 2 * 0.011)
+
+
+if __name__ == "__main__":
+    unittest.main()
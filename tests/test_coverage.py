@@ -0,0 +1,73 @@
+import io
+import unittest
+from contextlib import redirect_stdout
+from unittest.mock import patch
+
+import AnkiDeckStatus as deck_status_cli
+import AnkiSync as sync
+import app
+from benchmarks.fakes import FakeAnkiConnect
+from utils import coverage
+from utils.listing_cache import ListingCache
+
+
+class TestDeckCoverage(unittest.TestCase):
+    def setUp(self) -> None:
+        self.anki = FakeAnkiConnect()
+        self.anki.__enter__()
+        self.addCleanup(self.anki.__exit__, None, None, None)
+        url = patch.object(sync, "ANKI_CONNECT_URL", self.anki.url)
+        url.start()
+        self.addCleanup(url.stop)
+        self.anki.add_deck(
+            "Korean",
+            [
+                ("사과[sound:1.mp3]", "apple"),
+                ('개<img src="2.png">', "dog"),
+                ('집[sound:3.mp3]<img src="3.png">', "house"),
+                ("물", "water"),
+                ("책", 'book<img src="5.png">'),
+            ],
+        )
+        self.anki.add_deck("Korean::Verbs", [("가다", "to go")])
+        self.anki.add_deck("a_b", [("x", "y")])
+        self.anki.add_deck("axb", [('x[sound:9.mp3]<img src="9.png">', "y")])
+
+    def test_counts_every_deck_from_searches_alone(self) -> None:
+        rows = {row["deck"]: row for row in coverage.deck_coverage(sync.invoke)}
+        self.assertEqual(
+            rows["Korean"],
+            {
+                "deck": "Korean",
+                "total": 6,
+                "with_audio": 2,
+                "with_images": 3,
+                "missing_both": 2,
+                "missing_audio": 4,
+                "missing_images": 3,
+            },
+        )
+        self.assertEqual((rows["Korean::Verbs"]["total"], rows["Korean::Verbs"]["missing_both"]), (1, 1))
+        self.assertEqual((rows["a_b"]["total"], rows["a_b"]["with_audio"]), (1, 0))
+        self.assertEqual(rows["Default"]["total"], 0)
+        self.assertEqual(self.anki.calls.get("multi"), 1)
+        self.assertNotIn("notesInfo", self.anki.calls)
+
+    def test_endpoint_and_cli_report_the_same_counts(self) -> None:
+        app.app.testing = True
+        client = app.app.test_client()
+        with patch.object(app, "LISTINGS", ListingCache(path=None)):
+            data = client.get("/api/deck-status").get_json()
+        self.assertTrue(data["ok"])
+        self.assertEqual([row["deck"] for row in data["decks"]], ["Default", "Korean", "Korean::Verbs", "a_b", "axb"])
+
+        output = io.StringIO()
+        with redirect_stdout(output):
+            deck_status_cli.main(["Korean", "axb", "--missing-only"])
+        lines = output.getvalue().splitlines()
+        self.assertEqual(len(lines), 2)
+        self.assertEqual(lines[1].split(), ["Korean", "6", "2", "3", "2"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,79 @@
+import json
+import tempfile
+import unittest
+from pathlib import Path
+
+from utils import gating_filter
+from utils.gating_filter import GatingPrefilter, NaiveBayesGate, load_history, record_decisions, rule_decision
+
+
+def training_examples():
+    concrete = ["apple", "dog", "house", "tree", "car", "river", "book", "cat", "bread", "chair"]
+    abstract = ["to be able to", "however", "maybe", "although", "even so", "still", "just", "yet", "also", "therefore"]
+    examples = [(f"f{index}", word, True) for index, word in enumerate(concrete * 2)]
+    examples += [(f"a{index}", phrase, False) for index, phrase in enumerate(abstract * 2)]
+    return examples
+
+
+class TestRules(unittest.TestCase):
+    def test_rejects_grammar_terms_and_long_sentences(self) -> None:
+        self.assertFalse(rule_decision("-는", "topic particle"))
+        self.assertFalse(rule_decision("문장", "I would like to go to the market tomorrow"))
+        self.assertFalse(rule_decision("그리고", "and then"))
+
+    def test_defers_concrete_nouns(self) -> None:
+        self.assertIsNone(rule_decision("사과", "apple"))
+        self.assertIsNone(rule_decision("x", ""))
+
+
+class TestHistory(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = Path(self.tmp.name) / "history.jsonl"
+
+    def tearDown(self) -> None:
+        gating_filter.enable_history(None)
+        self.tmp.cleanup()
+
+    def test_recording_is_off_until_enabled(self) -> None:
+        record_decisions([("사과", "apple", True)])
+        self.assertFalse(self.path.exists())
+        gating_filter.enable_history(self.path)
+        record_decisions([("사과", "apple", True)])
+        record_decisions([("사과", "apple", False)])
+        self.assertEqual(load_history(self.path), [("사과", "apple", False)])
+
+    def test_prefilter_uses_model_trained_on_history(self) -> None:
+        self.path.write_text(
+            "\n".join(json.dumps({"front": f, "back": b, "decision": d}) for f, b, d in training_examples()),
+            encoding="utf-8",
+        )
+        prefilter = GatingPrefilter(threshold=0.8, history_path=self.path)
+        self.assertTrue(prefilter.model.trained)
+        self.assertTrue(prefilter.decide("개", "dog"))
+        self.assertEqual(prefilter.stats["model"], 1)
+
+    def test_prefilter_defers_without_history(self) -> None:
+        prefilter = GatingPrefilter(threshold=0.9, history_path=self.path)
+        self.assertIsNone(prefilter.decide("사과", "apple"))
+        self.assertFalse(prefilter.decide("-는", "topic particle"))
+        self.assertEqual(prefilter.avoided, 1)
+
+    def test_threshold_above_rule_confidence_disables_rules(self) -> None:
+        prefilter = GatingPrefilter(threshold=0.99, history_path=self.path)
+        self.assertIsNone(prefilter.decide("-는", "topic particle"))
+
+
+class TestNaiveBayesGate(unittest.TestCase):
+    def test_untrained_until_both_classes_seen(self) -> None:
+        model = NaiveBayesGate().fit([("f", "apple", True)] * 40)
+        self.assertFalse(model.trained)
+
+    def test_probability_separates_classes(self) -> None:
+        model = NaiveBayesGate().fit(training_examples())
+        self.assertGreater(model.probability_true("x", "tree"), 0.5)
+        self.assertLess(model.probability_true("x", "however"), 0.5)
+
+
+if __name__ == "__main__":
+    unittest.main()
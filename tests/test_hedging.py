@@ -0,0 +1,124 @@
+import tempfile
+import threading
+import time
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+import AnkiDeckToSpeech as speech
+from utils import hedging
+
+
+class Calls:
+    """Answers in call order; the first call blocks until ``release`` is set."""
+
+    def __init__(self, *answers) -> None:
+        self.answers = list(answers)
+        self.count = 0
+        self.release = threading.Event()
+        self._lock = threading.Lock()
+
+    def __call__(self):
+        with self._lock:
+            self.count += 1
+            number = self.count
+            answer = self.answers[number - 1]
+        if number == 1:
+            self.release.wait(5)
+        if isinstance(answer, BaseException):
+            raise answer
+        return answer
+
+
+def warmed(max_extra: float = 1.0) -> hedging.Hedger:
+    hedger = hedging.Hedger(max_extra, min_samples=5, min_delay=0.01)
+    for _ in range(5):
+        hedger.observe("op", 0.01)
+    return hedger
+
+
+class TestHedger(unittest.TestCase):
+    def test_no_hedging_until_enough_latencies_are_known(self) -> None:
+        hedger = hedging.Hedger(1.0, min_samples=5)
+        self.assertIsNone(hedger.threshold("op"))
+        self.assertEqual(hedger.call("op", lambda: "a"), "a")
+        self.assertEqual(sum(hedger.issued.values()), 0)
+
+    def test_threshold_is_the_recent_p95(self) -> None:
+        hedger = hedging.Hedger(1.0, min_samples=20, min_delay=0.0)
+        for value in range(1, 101):
+            hedger.observe("op", value / 100)
+        self.assertEqual(hedger.threshold("op"), 0.95)
+
+    def test_duplicate_wins_and_the_late_answer_is_discarded(self) -> None:
+        hedger = warmed()
+        calls = Calls("slow", "fast")
+        discarded = []
+        done = threading.Event()
+
+        def discard(value):
+            discarded.append(value)
+            done.set()
+
+        self.assertEqual(hedger.call("op", calls, discard), "fast")
+        calls.release.set()
+        self.assertTrue(done.wait(5))
+        self.assertEqual(discarded, ["slow"])
+        self.assertEqual((hedger.issued["op"], hedger.won["op"]), (1, 1))
+        self.assertIn("Hedged 1 of 1 call(s)", hedger.summary())
+
+    def test_extra_requests_are_capped(self) -> None:
+        hedger = warmed(max_extra=0.0)
+        calls = Calls("slow")
+        threading.Timer(0.1, calls.release.set).start()
+        self.assertEqual(hedger.call("op", calls), "slow")
+        self.assertEqual((calls.count, hedger.issued["op"]), (1, 0))
+
+    def test_a_failure_waits_for_the_other_request(self) -> None:
+        def answers(*results):
+            queue = list(results)
+            lock = threading.Lock()
+
+            def call():
+                with lock:
+                    delay, result = queue.pop(0)
+                time.sleep(delay)
+                if isinstance(result, BaseException):
+                    raise result
+                return result
+
+            return call
+
+        # The first request fails after the duplicate was sent; the duplicate still answers.
+        self.assertEqual(warmed().call("op", answers((0.1, TimeoutError("slow")), (0.3, "late"))), "late")
+        with self.assertRaises(TimeoutError):
+            warmed().call("op", answers((0.1, TimeoutError("slow")), (0.2, ValueError("bad"))))
+
+
+class TestHedgedSpeech(unittest.TestCase):
+    def test_only_the_winning_file_is_kept(self) -> None:
+        class Backend:
+            def __init__(self) -> None:
+                self.calls = Calls(b"slow", b"fast")
+
+            def speech_to_file(self, path, text, **options):
+                Path(path).write_bytes(self.calls())
+
+        backend = Backend()
+        hedger = hedging.enable(1.0)
+        self.addCleanup(hedging.enable, None)
+        hedger.min_samples, hedger.min_delay = 5, 0.01
+        for _ in range(5):
+            hedger.observe("audio.speech", 0.01)
+        with tempfile.TemporaryDirectory() as tmp, patch.object(speech, "AUDIO_DIR", Path(tmp)):
+            speech.create_audio_file(backend, "사과", "1.mp3", model="m", voice="v", instructions="")
+            self.assertEqual((Path(tmp) / "1.mp3").read_bytes(), b"fast")
+            backend.calls.release.set()
+            for thread in threading.enumerate():
+                if thread.name.startswith("hedged_"):
+                    thread.join(5)
+            self.assertEqual(sorted(path.name for path in Path(tmp).iterdir()), ["1.mp3"])
+
+
+if __name__ == "__main__":
+    unittest.main()
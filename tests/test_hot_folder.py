@@ -0,0 +1,115 @@
+import os
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+import AnkiSync as sync
+import AnkiWatch as watcher
+from benchmarks.fakes import FakeAnkiConnect
+from utils import backends
+from utils.hot_folder import HotFolder
+
+
+class Clock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class TestHotFolder(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.directory = Path(self.tmp.name)
+        self.clock = Clock()
+        self.folder = HotFolder(self.directory, settle_seconds=5, clock=self.clock)
+
+    def write(self, name: str, data: bytes, mtime_ns: int) -> Path:
+        path = self.directory / name
+        path.write_bytes(data)
+        os.utime(path, ns=(mtime_ns, mtime_ns))
+        return path
+
+    def test_file_is_offered_once_it_stops_changing(self) -> None:
+        path = self.write("lesson.pdf", b"%PDF-1", 1_000)
+        self.assertEqual(self.folder.scan(), [])
+        self.clock.now = 3
+        self.write("lesson.pdf", b"%PDF-1.4 more", 2_000)
+        self.assertEqual(self.folder.scan(), [])
+        self.clock.now = 7
+        self.assertEqual(self.folder.scan(), [])
+        self.clock.now = 8
+        self.assertEqual(self.folder.scan(), [path])
+        self.clock.now = 20
+        self.assertEqual(self.folder.scan(), [])
+
+    def test_changed_file_is_offered_again(self) -> None:
+        path = self.write("lesson.pdf", b"%PDF-1", 1_000)
+        self.folder.scan()
+        self.clock.now = 5
+        self.assertEqual(self.folder.scan(), [path])
+        self.write("lesson.pdf", b"%PDF-2 fixed", 2_000)
+        self.clock.now = 6
+        self.assertEqual(self.folder.scan(), [])
+        self.clock.now = 11
+        self.assertEqual(self.folder.scan(), [path])
+
+    def test_partial_hidden_and_empty_files_are_ignored(self) -> None:
+        for name in ("lesson.pdf.part", ".lesson.pdf", "notes.txt", "lesson.pdf.crdownload"):
+            self.write(name, b"%PDF", 1_000)
+        self.write("empty.pdf", b"", 1_000)
+        self.folder.scan()
+        self.clock.now = 10
+        self.assertEqual(self.folder.scan(), [])
+
+    def test_released_file_is_offered_on_the_next_scan(self) -> None:
+        path = self.write("lesson.pdf", b"%PDF-1", 1_000)
+        self.folder.scan()
+        self.clock.now = 5
+        self.assertEqual(self.folder.scan(), [path])
+        self.folder.release(path)
+        self.assertEqual(self.folder.scan(), [path])
+
+
+class TestWatch(unittest.TestCase):
+    def test_once_syncs_and_archives_each_pdf(self) -> None:
+        with tempfile.TemporaryDirectory() as tmp, FakeAnkiConnect() as anki, patch.object(
+            sync, "ANKI_CONNECT_URL", anki.url
+        ):
+            inbox = Path(tmp) / "uploads"
+            archive = Path(tmp) / "pdfs"
+            inbox.mkdir()
+            (inbox / "lesson1.pdf").write_text("사과 - apple\n개 - dog\n", encoding="utf-8")
+            (inbox / "lesson2.pdf").write_text("집 - house\n", encoding="utf-8")
+            (inbox / "broken.pdf").write_text("no pairs here\n", encoding="utf-8")
+            args = watcher.argparse.Namespace(
+                deck=None,
+                model="m",
+                include_romanized=False,
+                audio=False,
+                images=False,
+                skip_gating=False,
+                archive_dir=archive,
+            )
+            backend = backends.OfflineBackend()
+            with patch("builtins.print"):
+                watcher.watch(
+                    HotFolder(inbox, settle_seconds=0),
+                    lambda pdf: watcher.sync_file(pdf, args, backend, None),
+                    workers=2,
+                    queue_size=1,
+                    poll_interval=0.01,
+                    until_idle=True,
+                )
+
+            decks = sorted((note["deckName"], note["fields"]["Front"]) for note in anki.notes.values())
+            self.assertEqual(decks, [("lesson1", "개"), ("lesson1", "사과"), ("lesson2", "집")])
+            self.assertEqual(sorted(path.name for path in archive.iterdir()), ["lesson1.pdf", "lesson2.pdf"])
+            self.assertEqual([path.name for path in inbox.iterdir()], ["broken.pdf"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,152 @@
+import json
+import subprocess
+import tempfile
+import threading
+import time
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+import app
+from utils.listing_cache import ListingCache
+
+
+class Loader:
+    def __init__(self, *values) -> None:
+        self.values = list(values)
+        self.calls = 0
+        self.release = threading.Event()
+        self.release.set()
+
+    def __call__(self):
+        self.release.wait(5)
+        self.calls += 1
+        return self.values[min(self.calls, len(self.values)) - 1]
+
+
+class TestListingCache(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = Path(self.tmp.name) / "listings.json"
+
+    def tearDown(self) -> None:
+        self.tmp.cleanup()
+
+    def wait_idle(self, cache: ListingCache) -> None:
+        deadline = time.time() + 5
+        while cache._inflight and time.time() < deadline:
+            time.sleep(0.01)
+
+    def test_first_get_loads_and_later_gets_hit(self) -> None:
+        cache = ListingCache(self.path)
+        loader = Loader(["Default"])
+        self.assertEqual(cache.get("decks", loader, ttl=60), ["Default"])
+        self.assertEqual(cache.get("decks", loader, ttl=60), ["Default"])
+        self.assertEqual(loader.calls, 1)
+
+    def test_stale_value_is_served_while_refreshing(self) -> None:
+        cache = ListingCache(self.path)
+        loader = Loader(["old"], ["new"])
+        cache.get("decks", loader, ttl=60)
+        loader.release.clear()
+        # Expired: the old value comes back immediately and one refresh starts.
+        self.assertEqual(cache.get("decks", loader, ttl=0), ["old"])
+        self.assertEqual(cache.get("decks", loader, ttl=0), ["old"])
+        loader.release.set()
+        self.wait_idle(cache)
+        self.assertEqual(loader.calls, 2)
+        self.assertEqual(cache.get("decks", loader, ttl=60), ["new"])
+
+    def test_failed_refresh_keeps_stale_value(self) -> None:
+        cache = ListingCache(None)
+        cache.get("models", lambda: ["gpt-4.1-mini"], ttl=60)
+
+        def broken():
+            raise RuntimeError("offline")
+
+        with patch("sys.stderr"):
+            self.assertEqual(cache.get("models", broken, ttl=0), ["gpt-4.1-mini"])
+            self.wait_idle(cache)
+        self.assertEqual(cache.get("models", broken, ttl=60), ["gpt-4.1-mini"])
+
+    def test_entries_survive_restart(self) -> None:
+        ListingCache(self.path).get("decks", lambda: ["Korean"], ttl=60)
+        stored = json.loads(self.path.read_text(encoding="utf-8"))
+        self.assertEqual(stored["decks"]["value"], ["Korean"])
+
+        loader = Loader(["unused"])
+        self.assertEqual(ListingCache(self.path).get("decks", loader, ttl=60), ["Korean"])
+        self.assertEqual(loader.calls, 0)
+
+    def test_invalidate_reloads_in_background(self) -> None:
+        cache = ListingCache(self.path)
+        loader = Loader(["Default"], ["Default", "Korean"])
+        cache.get("decks", loader, ttl=3600)
+        cache.invalidate("decks")
+        self.assertEqual(cache.get("decks", loader, ttl=3600), ["Default", "Korean"])
+        self.assertEqual(loader.calls, 2)
+
+    def test_invalidate_supersedes_a_load_already_in_flight(self) -> None:
+        cache = ListingCache(self.path)
+        cache.get("decks", lambda: ["old"], ttl=60)
+        started, release = threading.Event(), threading.Event()
+
+        def before_the_job():
+            started.set()
+            release.wait(5)
+            return ["old"]
+
+        self.assertEqual(cache.get("decks", before_the_job, ttl=0), ["old"])
+        self.assertTrue(started.wait(5))
+        superseded = cache._inflight["decks"]
+        cache._loaders["decks"] = lambda: ["old", "new"]
+        cache.invalidate("decks")
+        self.assertEqual(cache.get("decks", before_the_job, ttl=60), ["old", "new"])
+        release.set()
+        superseded.result(5)
+        self.assertEqual(cache.get("decks", before_the_job, ttl=60), ["old", "new"])
+
+    def test_prune_drops_keys_for_missing_names(self) -> None:
+        cache = ListingCache(self.path)
+        cache.get("deck_count:Korean", lambda: 3, ttl=60)
+        cache.get("deck_count:Gone", lambda: 5, ttl=60)
+        cache.prune("deck_count:", {"Korean"})
+        stored = json.loads(self.path.read_text(encoding="utf-8"))
+        self.assertEqual(sorted(stored), ["deck_count:Korean"])
+
+
+class TestAppListings(unittest.TestCase):
+    def setUp(self) -> None:
+        self.client = app.app.test_client()
+        app.app.testing = True
+        listings = patch.object(app, "LISTINGS", ListingCache(path=None))
+        listings.start()
+        self.addCleanup(listings.stop)
+
+    def test_deck_list_is_cached_until_a_job_changes_the_deck(self) -> None:
+        with patch.object(app, "invoke", return_value=["Default"]) as mock_invoke:
+            self.client.get("/api/decks")
+            self.client.get("/api/decks")
+            self.assertEqual(mock_invoke.call_count, 1)
+            mock_invoke.return_value = ["Default", "Korean"]
+            app.invalidate_deck("Korean")
+            response = self.client.get("/api/decks")
+        self.assertEqual(response.get_json()["decks"], ["Default", "Korean"])
+
+    def test_failed_job_still_invalidates_the_deck(self) -> None:
+        error = subprocess.CalledProcessError(1, "AnkiDeckToSpeech.py", output="", stderr="boom")
+        with patch.object(app, "run_script", side_effect=error), patch.object(app, "invalidate_deck") as invalidate:
+            response = self.client.post("/generate/audio", json={"deck": "Korean"})
+        self.assertEqual(response.status_code, 500)
+        invalidate.assert_called_once_with("Korean")
+
+    def test_model_refresh_parameter_forces_reload(self) -> None:
+        ids = iter([["gpt-4.1-mini"], ["gpt-4.1-mini", "gpt-4o-mini-tts"]])
+        with patch.object(app, "fetch_model_ids", side_effect=lambda: next(ids)):
+            self.assertEqual(self.client.get("/api/models/audio").status_code, 404)
+            response = self.client.get("/api/models/audio?refresh=1")
+        self.assertEqual(response.get_json()["models"], ["gpt-4o-mini-tts"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,91 @@
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+import AnkiMediaIndex as media_tool
+from utils import media_index
+from utils.media_index import MediaIndex, fingerprint, media_free_text, note_id_from_filename
+
+
+class TestMediaIndex(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = Path(self.tmp.name)
+        self.dirs = {"image": self.root / "images", "audio": self.root / "audio"}
+        for directory in self.dirs.values():
+            directory.mkdir()
+        self.index = MediaIndex(self.root / "index.sqlite3")
+
+    def tearDown(self) -> None:
+        self.index.close()
+        media_index.enable(None)
+        self.tmp.cleanup()
+
+    def write(self, kind: str, name: str, data: bytes = b"data") -> Path:
+        path = self.dirs[kind] / name
+        path.write_bytes(data)
+        return path
+
+    def test_record_stores_hash_size_and_params(self) -> None:
+        path = self.write("image", "7.png", b"png")
+        self.index.record("image", 7, path, {"model": "gpt-image-1", "quality": "low"})
+        self.index.record("image", 7, self.write("image", "7.png", b"better"), {"model": "gpt-image-1"})
+        row = self.index.lookup([7, 8], "image")[7]
+        self.assertEqual(row["size"], 6)
+        self.assertEqual(len(self.index), 1)
+        self.assertNotIn("quality", row["params"])
+
+    def test_module_record_is_noop_until_enabled(self) -> None:
+        path = self.write("audio", "3.mp3")
+        media_index.record("audio", 3, path)
+        index = media_index.enable(self.root / "default.sqlite3")
+        media_index.record("audio", 3, path)
+        self.assertIn(3, index.lookup([3], "audio"))
+
+    def test_rebuild_indexes_untracked_files_and_drops_missing(self) -> None:
+        self.write("image", "11-abc.png")
+        self.write("image", ".12.png.partial")
+        gone = self.write("audio", "13.mp3")
+        self.index.record("audio", 13, gone)
+        gone.unlink()
+        self.assertEqual(self.index.rebuild(self.dirs), 1)
+        self.assertEqual([row["note_id"] for row in self.index.rows()], [11])
+
+    def test_fingerprint_ignores_attached_media_and_markup(self) -> None:
+        plain = media_free_text("<div>사과&nbsp;</div>")
+        attached = media_free_text('사과[sound:1.mp3]<img src="1.png">')
+        self.assertEqual(plain, attached)
+        self.assertEqual(fingerprint("audio", plain, "tts"), fingerprint("audio", attached, "tts"))
+        self.assertNotEqual(fingerprint("audio", plain, "tts"), fingerprint("audio", plain, "tts-hd"))
+
+    def test_fingerprints_round_trip_per_kind(self) -> None:
+        self.index.set_fingerprint("audio", 1, "a")
+        self.index.set_fingerprint("audio", 1, "b")
+        self.index.set_fingerprint("image", 1, "c")
+        self.assertEqual(self.index.fingerprints("audio", [1, 2]), {1: "b"})
+
+    def test_note_id_from_filename(self) -> None:
+        self.assertEqual(note_id_from_filename("123.png"), 123)
+        self.assertEqual(note_id_from_filename("123-f00.png"), 123)
+        self.assertIsNone(note_id_from_filename("cover.png"))
+
+    def test_gc_deletes_only_files_of_missing_notes(self) -> None:
+        kept = self.write("image", "1.png")
+        orphan = self.write("audio", "2.mp3", b"12345")
+        self.index.record("image", 1, kept)
+        self.index.record("audio", 2, orphan)
+        self.index.record("image", None, self.write("image", "cover.png"))
+        with patch.object(media_tool, "invoke", return_value=[1]) as mock_invoke:
+            orphans = media_tool.find_orphans(self.index)
+        self.assertEqual(mock_invoke.call_args.kwargs["query"], "nid:1,2")
+        with patch("builtins.print"):
+            reclaimed = media_tool.collect_garbage(self.index, orphans, media_dirs=self.dirs)
+        self.assertEqual(reclaimed, 5)
+        self.assertTrue(kept.exists())
+        self.assertFalse(orphan.exists())
+        self.assertEqual(len(self.index), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,77 @@
+import json
+import tempfile
+import unittest
+from unittest.mock import patch
+from pathlib import Path
+
+import AnkiSync as sync
+from utils import metrics
+
+
+class TestRegistry(unittest.TestCase):
+    def setUp(self) -> None:
+        self.registry = metrics.Registry()
+
+    def test_counter_renders_prometheus_text_with_labels(self) -> None:
+        counter = self.registry.counter("calls_total", "Calls.")
+        counter.inc(endpoint="images", status="ok")
+        counter.inc(2, endpoint="images", status="ok")
+        text = self.registry.render_prometheus()
+        self.assertIn("# TYPE calls_total counter", text)
+        self.assertIn('calls_total{endpoint="images",status="ok"} 3', text)
+
+    def test_histogram_buckets_are_cumulative(self) -> None:
+        histogram = self.registry.histogram("latency_seconds", "Latency.", buckets=(0.1, 1.0))
+        histogram.observe(0.05)
+        histogram.observe(0.5)
+        histogram.observe(5.0)
+        text = self.registry.render_prometheus()
+        self.assertIn('latency_seconds_bucket{le="0.1"} 1', text)
+        self.assertIn('latency_seconds_bucket{le="1"} 2', text)
+        self.assertIn('latency_seconds_bucket{le="+Inf"} 3', text)
+        self.assertIn("latency_seconds_count 3", text)
+
+    def test_registering_same_name_as_other_kind_fails(self) -> None:
+        self.registry.counter("thing", "Thing.")
+        with self.assertRaises(ValueError):
+            self.registry.gauge("thing", "Thing.")
+
+    def test_merge_adds_counters_and_histograms_but_not_gauges(self) -> None:
+        counter = self.registry.counter("calls_total", "Calls.")
+        gauge = self.registry.gauge("pending", "Pending.")
+        histogram = self.registry.histogram("latency_seconds", "Latency.", buckets=(1.0,))
+        counter.inc(status="ok")
+        histogram.observe(0.5)
+        gauge.set(4)
+        self.registry.merge(json.loads(json.dumps(self.registry.summary())))
+        self.assertEqual(counter.value(status="ok"), 2)
+        self.assertEqual(histogram.count(), 2)
+        self.assertEqual(gauge.value(), 4)
+
+
+class TestReportRun(unittest.TestCase):
+    def test_report_run_writes_metrics_file(self) -> None:
+        with tempfile.TemporaryDirectory() as tmp:
+            target = Path(tmp) / "metrics.json"
+            with patch.dict("os.environ", {metrics.METRICS_FILE_ENV: str(target)}):
+                with open(Path(tmp) / "stderr.txt", "w") as stream:
+                    metrics.report_run(stream=stream)
+            self.assertIn("counter", json.loads(target.read_text()))
+
+
+
+class TestAnkiTracking(unittest.TestCase):
+    @patch("AnkiSync.urllib.request.urlopen")
+    def test_action_error_in_response_counts_as_an_error(self, mock_urlopen) -> None:
+        mock_urlopen.return_value.__enter__.return_value.read.return_value = (
+            b'{"result": null, "error": "deck was not found"}'
+        )
+        before = metrics.ANKI_REQUESTS.value(action="findCards", status="error")
+        with self.assertRaises(Exception):
+            sync.invoke("findCards", query="deck:Missing")
+        self.assertEqual(metrics.ANKI_REQUESTS.value(action="findCards", status="error"), before + 1)
+        self.assertEqual(metrics.ANKI_REQUESTS.value(action="findCards", status="ok"), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
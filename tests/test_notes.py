@@ -0,0 +1,61 @@
+import unittest
+
+from utils.common import HTML_TAG_RE, IMG_TAG_RE, NBSP_RE, SOUND_TAG_RE
+from utils.media_index import media_free_text
+from utils.notes import Note, from_notes_info
+
+
+def info(note_id: int, front: str, back: str) -> dict:
+    return {"noteId": note_id, "fields": {"Front": {"value": front}, "Back": {"value": back}}}
+
+
+class TestNote(unittest.TestCase):
+    def test_views_are_derived_from_the_fields(self) -> None:
+        note = Note(7, '<div>사과</div><img src="7.png">[sound:7.mp3]', '<b>apple</b>  <IMG src="x.png">')
+        self.assertEqual(note.front_without_images, "<div>사과</div>[sound:7.mp3]")
+        self.assertEqual(note.front_without_sound, '<div>사과</div><img src="7.png">')
+        self.assertEqual(note.spoken_front, "사과")
+        self.assertEqual(note.gating_front, "사과 [sound:7.mp3]")
+        self.assertEqual(note.prompt_back, "apple")
+        self.assertEqual(note.clean_back, "apple")
+        self.assertEqual(note.image_filename, "7.png")
+        self.assertTrue(note.has_sound and note.has_image)
+
+    def test_views_are_computed_once(self) -> None:
+        note = Note(1, "<b>개</b>", "dog")
+        self.assertIs(note.gating_front, note.gating_front)
+        note.front = "changed"
+        self.assertEqual(note.gating_front, "개")
+
+    def test_behaves_like_the_card_tuple(self) -> None:
+        note = Note(3, "집", "house")
+        card_id, front, back = note
+        self.assertEqual((card_id, front, back), (3, "집", "house"))
+        self.assertEqual((note[0], note[2], len(note)), (3, "house", 3))
+        self.assertEqual(note, (3, "집", "house"))
+        self.assertIs(Note.of(note), note)
+        self.assertEqual(Note.of((3, "집", "house")), note)
+
+    def test_from_notes_info_skips_deleted_notes(self) -> None:
+        infos = [info(1, "a", "b"), {}, info(3, "c", "d")]
+        self.assertEqual(from_notes_info(infos), [(1, "a", "b"), (3, "c", "d")])
+        self.assertEqual(from_notes_info([info(9, "a", "b")], [1]), [(1, "a", "b")])
+
+
+class TestMediaFreeText(unittest.TestCase):
+    def test_one_pass_matches_the_separate_substitutions(self) -> None:
+        def separate(html: str) -> str:
+            text = SOUND_TAG_RE.sub(" ", IMG_TAG_RE.sub(" ", html))
+            return " ".join(HTML_TAG_RE.sub(" ", NBSP_RE.sub(" ", text)).split())
+
+        for html in (
+            "<div>사과&nbsp;</div>",
+            '사과[sound:1.mp3]<img src="1.png">',
+            "a&NBSP;b&nbspc<br/>d [sound:x y.mp3] e",
+            "<img src='a.png'><p>개</p>",
+        ):
+            self.assertEqual(media_free_text(html), separate(html), html)
+
+
+if __name__ == "__main__":
+    unittest.main()
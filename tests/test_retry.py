@@ -0,0 +1,166 @@
+import json
+import tempfile
+import unittest
+import urllib.error
+from pathlib import Path
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import AnkiDeadLetter as dead_letter_cli
+import AnkiDeckToSpeech as speech
+import AnkiSync as sync
+from benchmarks.fakes import FakeAnkiConnect
+from utils import media_index, retry
+
+
+class APIConnectionError(Exception):
+    pass
+
+
+class StatusError(Exception):
+    def __init__(self, status_code: int, headers=None) -> None:
+        super().__init__(f"status {status_code}")
+        self.status_code = status_code
+        self.response = SimpleNamespace(headers=headers or {})
+
+
+class RateLimitError(StatusError):
+    def __init__(self, code: str) -> None:
+        super().__init__(429)
+        self.code = code
+
+
+class Flaky:
+    def __init__(self, *errors) -> None:
+        self.errors = list(errors)
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        if self.errors:
+            return ("error", "front", self.errors.pop(0))
+        return ("added", "front", None)
+
+
+class TestClassification(unittest.TestCase):
+    def test_transient_errors_are_retryable(self) -> None:
+        for error in (
+            StatusError(429),
+            RateLimitError("rate_limit_exceeded"),
+            StatusError(503),
+            APIConnectionError("reset"),
+            TimeoutError("slow"),
+            Exception("collection is not available"),
+        ):
+            self.assertTrue(retry.is_retryable(error), error)
+        try:
+            try:
+                raise urllib.error.URLError("refused")
+            except urllib.error.URLError as exc:
+                raise RuntimeError("Failed to reach AnkiConnect") from exc
+        except RuntimeError as wrapped:
+            self.assertTrue(retry.is_retryable(wrapped))
+
+    def test_other_errors_are_permanent(self) -> None:
+        for error in (
+            StatusError(400),
+            StatusError(409),
+            RateLimitError("insufficient_quota"),
+            Exception("cannot create note because it is a duplicate"),
+            ValueError("x"),
+        ):
+            self.assertFalse(retry.is_retryable(error), error)
+
+
+class TestRetryPolicy(unittest.TestCase):
+    def setUp(self) -> None:
+        self.sleeps = []
+        self.policy = retry.RetryPolicy(attempts=3, base_delay=1.0, max_delay=30.0, sleep=self.sleeps.append, rng=lambda: 1.0)
+
+    def test_retries_transient_errors_with_exponential_backoff(self) -> None:
+        flaky = Flaky(StatusError(500), StatusError(500))
+        self.assertEqual(self.policy.call(flaky), ("added", "front", None))
+        self.assertEqual((flaky.calls, self.sleeps), (3, [1.0, 2.0]))
+
+    def test_permanent_errors_are_not_retried(self) -> None:
+        flaky = Flaky(StatusError(400))
+        status, _, error = self.policy.call(flaky)
+        self.assertEqual((status, flaky.calls, self.sleeps), ("error", 1, []))
+        self.assertIsInstance(error, StatusError)
+
+    def test_gives_up_after_the_last_attempt(self) -> None:
+        status, _, error = self.policy.call(Flaky(*[StatusError(429)] * 5))
+        self.assertEqual(status, "error")
+        self.assertIsInstance(error, retry.RetriesExhausted)
+        self.assertEqual(error.attempts, 3)
+
+    def test_honours_retry_after_and_the_run_budget(self) -> None:
+        self.assertEqual(self.policy.backoff(1, StatusError(429, {"retry-after": "7"})), 7.0)
+        self.policy.budget = SimpleNamespace(remaining=lambda: 0.5)
+        flaky = Flaky(StatusError(503))
+        self.assertEqual(self.policy.call(flaky)[0], "error")
+        self.assertEqual((flaky.calls, self.sleeps), (1, []))
+
+
+class TestDeadLetters(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.path = Path(self.tmp.name) / "dead_letter.jsonl"
+        retry.enable_dead_letters(self.path)
+        self.addCleanup(retry.enable_dead_letters, None)
+
+    def test_latest_entry_per_card_is_kept(self) -> None:
+        options = {"model": "m"}
+        retry.dead_letter("audio", (1, "사과", "apple"), StatusError(400), deck="D", options=options)
+        retry.dead_letter("audio", (1, "사과", "apple"), retry.RetriesExhausted(StatusError(503), 3), deck="D", options=options)
+        retry.dead_letter("images", (1, "사과", "apple"), ValueError("bad"), deck="D", options=options, stage="gating")
+        entries = retry.DeadLetterFile(self.path).entries()
+        self.assertEqual([(entry["script"], entry["retryable"], entry["attempts"]) for entry in entries], [
+            ("audio", True, 3),
+            ("images", False, 1),
+        ])
+        retry.DeadLetterFile(self.path).rewrite([])
+        self.assertFalse(self.path.exists())
+
+    def test_replay_reprocesses_only_dead_lettered_cards(self) -> None:
+        with FakeAnkiConnect() as anki, patch.object(sync, "ANKI_CONNECT_URL", anki.url), \
+                patch.object(speech, "AUDIO_DIR", Path(self.tmp.name)), \
+                patch.object(dead_letter_cli, "AUDIO_DIR", Path(self.tmp.name)), \
+                patch.object(dead_letter_cli, "IMAGE_DIR", Path(self.tmp.name)), \
+                patch.object(media_index, "INDEX_PATH", Path(self.tmp.name) / "index.sqlite3"):
+            kept, deleted, other = anki.add_deck("D", [("사과", "apple"), ("개", "dog"), ("집", "house")])
+            del anki.notes[deleted]
+            options = {"backend": "offline", "model": "m", "voice": "v", "instructions": ""}
+            for note_id in (kept, deleted):
+                retry.dead_letter("audio", (note_id, "x", "y"), StatusError(503), deck="D", options=options)
+            with patch("builtins.print"):
+                counts, still_failing = dead_letter_cli.replay(retry.DeadLetterFile(self.path).entries())
+
+            self.assertEqual(counts, {"resolved": 1, "failed": 0, "dropped": 1})
+            self.assertEqual(still_failing, [])
+            self.assertIn("[sound:", anki.notes[kept]["fields"]["Front"])
+            self.assertNotIn("[sound:", anki.notes[other]["fields"]["Front"])
+            self.assertEqual(json.loads(self.path.read_text().splitlines()[0])["front"], "x")
+
+    def test_image_replay_keeps_the_recorded_draft_and_cache_settings(self) -> None:
+        import AnkiDeckToImages as images
+
+        entry = {
+            "script": "images",
+            "stage": "generation",
+            "options": {
+                "image_model": "gpt-image-1",
+                "prompt": "{text}",
+                "image_options": {"size": "1024x1024", "quality": "low"},
+                "cache_media": True,
+            },
+        }
+        with patch.object(images, "generate_card_image", return_value=("added", "apple", None)) as generate:
+            dead_letter_cli.replay_card(entry, (1, "사과", "apple"), "", None)
+        args = generate.call_args.args
+        self.assertEqual(args[5:], ({"size": "1024x1024", "quality": "low"}, False, True))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,82 @@
+import time
+import unittest
+from unittest.mock import patch
+
+from benchmarks.fakes import FakeAnkiConnect
+from utils import scheduling
+
+
+class TestReviewOrder(unittest.TestCase):
+    def setUp(self) -> None:
+        self.anki = FakeAnkiConnect()
+        self.anki.today = 1000
+
+    def order(self, note_ids) -> list:
+        priorities = scheduling.review_priorities("Deck", lambda action, **params: self.anki.dispatch(action, params))
+        cards = [(note_id, "", "") for note_id in note_ids]
+        return [card[0] for card in scheduling.order_by_review(cards, priorities)]
+
+    def test_review_priorities_follow_the_day_each_card_is_due(self) -> None:
+        new_late, new_early, review, learning, suspended = self.anki.add_deck(
+            "Deck", [("a", "a"), ("b", "b"), ("c", "c"), ("d", "d"), ("e", "e")]
+        )
+        self.anki.schedule[new_late] = {"queue": 0, "due": 20}
+        self.anki.schedule[new_early] = {"queue": 0, "due": 3}
+        self.anki.schedule[review] = {"queue": 2, "due": 1000}
+        self.anki.schedule[learning] = {"queue": 1, "due": int(time.time()) - 60}
+        self.anki.schedule[suspended] = {"queue": -1, "due": 1}
+
+        ordered = self.order((new_late, new_early, review, learning, suspended, 42))
+
+        self.assertEqual(ordered, [learning, review, new_early, new_late, suspended, 42])
+
+    def test_far_off_review_ranks_below_a_new_card_due_tomorrow(self) -> None:
+        self.anki.new_per_day = 1
+        far_review, new_today, new_tomorrow, review_tomorrow = self.anki.add_deck(
+            "Deck", [("a", "a"), ("b", "b"), ("c", "c"), ("d", "d")]
+        )
+        self.anki.schedule[far_review] = {"queue": 2, "due": 1090}
+        self.anki.schedule[new_today] = {"queue": 0, "due": 1}
+        self.anki.schedule[new_tomorrow] = {"queue": 0, "due": 2}
+        self.anki.schedule[review_tomorrow] = {"queue": 2, "due": 1001}
+
+        ordered = self.order((far_review, new_today, new_tomorrow, review_tomorrow))
+
+        self.assertEqual(ordered, [new_today, review_tomorrow, new_tomorrow, far_review])
+
+    def test_note_takes_its_most_urgent_card(self) -> None:
+        cards = [
+            {"cardId": 10, "note": 1, "queue": 0, "due": 5},
+            {"cardId": 11, "note": 1, "queue": 2, "due": 1004},
+        ]
+
+        def invoke(action, **params):
+            if action == "cardsInfo":
+                return [cards[params["cards"][0] - 10]]
+            if action == "findCards":
+                return [10, 11]
+            if action == "multi":
+                return [{"result": [], "error": None} for _ in params["actions"]]
+            return {"new": {"perDay": 1}}
+
+        with patch.object(scheduling, "CARD_QUERY_CHUNK", 1):
+            priorities = scheduling.review_priorities("Deck", invoke)
+        self.assertEqual(priorities, {1: (0, scheduling.QUEUE_RANKS[0], 5)})
+
+
+class TestRunBudget(unittest.TestCase):
+    def test_unlimited_budget_runs_everything(self) -> None:
+        budget = scheduling.RunBudget(None)
+        self.assertIsNone(budget.remaining())
+        self.assertEqual(budget.call("front", lambda: ("added", "front", None)), ("added", "front", None))
+
+    def test_spent_budget_defers_new_work(self) -> None:
+        budget = scheduling.RunBudget(0.01)
+        time.sleep(0.02)
+        status, text, reason = budget.call("front", lambda: ("added", "front", None))
+        self.assertEqual((status, text), ("deferred", "front"))
+        self.assertIn("time budget", reason)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,59 @@
+import json
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+
+from utils import tracing
+
+
+class TestTracer(unittest.TestCase):
+    def test_span_is_noop_when_disabled(self) -> None:
+        tracer = tracing.Tracer()
+        with tracer.span("idle"):
+            pass
+        self.assertEqual(tracer.events(), [])
+
+    def test_spans_record_thread_ids_and_names(self) -> None:
+        tracer = tracing.Tracer()
+        tracer.start()
+
+        def work() -> None:
+            with tracer.span("stage", card_id=7):
+                pass
+
+        worker = threading.Thread(target=work, name="worker-1")
+        worker.start()
+        worker.join()
+        tracer.stop()
+
+        events = tracer.events()
+        complete = [event for event in events if event["ph"] == "X"]
+        metadata = [event for event in events if event["ph"] == "M"]
+        self.assertEqual(complete[0]["name"], "stage")
+        self.assertEqual(complete[0]["args"], {"card_id": "7"})
+        self.assertEqual(metadata[0]["tid"], complete[0]["tid"])
+        self.assertEqual(metadata[0]["args"]["name"], "worker-1")
+
+    def test_session_writes_trace_file(self) -> None:
+        with tempfile.TemporaryDirectory() as tmp:
+            target = Path(tmp) / "trace.json"
+            with tracing.session(target):
+                with tracing.span("outer"):
+                    pass
+            payload = json.loads(target.read_text())
+        names = [event["name"] for event in payload["traceEvents"]]
+        self.assertIn("outer", names)
+        self.assertFalse(tracing.TRACER.enabled)
+
+    def test_session_sampled_out_writes_nothing(self) -> None:
+        with tempfile.TemporaryDirectory() as tmp:
+            target = Path(tmp) / "trace.json"
+            with tracing.session(target, sample_rate=0.0):
+                with tracing.span("outer"):
+                    pass
+            self.assertFalse(target.exists())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,145 @@
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import AnkiDistributed as distributed
+import AnkiSync as sync
+from benchmarks.fakes import FakeAnkiConnect
+from utils import backends, media_index, retry
+from utils.work_queue import RecordedWrites, RemoteError, WorkQueue
+
+
+class Clock:
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class TestWorkQueue(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.clock = Clock()
+        self.queue = WorkQueue(Path(self.tmp.name) / "queue.sqlite3", max_claims=2, clock=self.clock)
+        self.addCleanup(self.queue.close)
+        self.job_id = self.queue.submit(
+            "audio", "D", "offline", {"model": "m"}, [(1, "사과", "apple"), (2, "개", "dog")], {1: "fp1"}
+        )
+
+    def test_claims_only_jobs_for_the_workers_backend(self) -> None:
+        self.assertEqual(self.queue.claim("w", "openai", limit=5), [])
+        tasks = self.queue.claim("w", "offline", limit=5)
+        self.assertEqual([(task["note_id"], task["options"]) for task in tasks], [(1, {"model": "m"}), (2, {"model": "m"})])
+        self.assertEqual(self.queue.claim("w", "offline", limit=5), [])
+
+    def test_expired_lease_is_reclaimed_and_the_stale_report_rejected(self) -> None:
+        first = self.queue.claim("w1", "offline", lease_seconds=10)[0]
+        self.clock.now += 5
+        self.assertEqual(self.queue.heartbeat({first["id"]: first["token"]}, lease_seconds=10), [])
+        self.clock.now += 12
+        second = self.queue.claim("w2", "offline", lease_seconds=10)[0]
+        self.assertEqual(second["note_id"], first["note_id"])
+
+        self.assertEqual(self.queue.heartbeat({first["id"]: first["token"]}, lease_seconds=10), [first["id"]])
+        self.assertFalse(self.queue.report(first["id"], first["token"], "added", "사과"))
+        self.assertTrue(self.queue.report(second["id"], second["token"], "added", "사과", operations=[{"action": "x"}]))
+        reported = self.queue.reported(self.job_id)
+        self.assertEqual([(row["note_id"], row["operations"]) for row in reported], [(1, [{"action": "x"}])])
+
+        self.queue.mark_done([row["id"] for row in reported])
+        self.assertEqual(self.queue.counts(self.job_id), {"pending": 1, "leased": 0, "reported": 0, "done": 1})
+
+    def test_card_is_failed_after_too_many_expired_leases(self) -> None:
+        for _ in range(2):
+            self.queue.claim("w", "offline", limit=2, lease_seconds=10)
+            self.clock.now += 11
+        self.assertEqual(self.queue.reclaim(), 2)
+        reported = self.queue.reported(self.job_id)
+        self.assertEqual([row["status"] for row in reported], ["error", "error"])
+        self.assertTrue(all(row["retryable"] for row in reported))
+        self.assertTrue(retry.is_retryable(RemoteError(reported[0]["error"], reported[0]["retryable"])))
+
+    def test_recorded_writes_carry_media_inline(self) -> None:
+        writes = RecordedWrites()
+        writes.add_media("1.png", b"png")
+        self.assertEqual(writes.actions[0]["params"]["data"], "cG5n")
+
+
+class TestDistributedRun(unittest.TestCase):
+    def test_workers_generate_and_the_coordinator_writes_each_card_once(self) -> None:
+        with tempfile.TemporaryDirectory() as tmp, FakeAnkiConnect() as anki, \
+                patch.object(sync, "ANKI_CONNECT_URL", anki.url), \
+                patch.object(media_index, "INDEX_PATH", Path(tmp) / "index.sqlite3"), \
+                patch("builtins.print"):
+            note_ids = anki.add_deck("D", [("사과", "apple"), ("개", "dog"), ("집", "house")])
+            queue = WorkQueue(Path(tmp) / "queue.sqlite3")
+            self.addCleanup(queue.close)
+            index = media_index.enable(media_index.INDEX_PATH)
+            self.addCleanup(media_index.enable, None)
+            args = SimpleNamespace(
+                script="audio", deck="D", model=None, voice=None, instructions=None, backend="offline", force=False
+            )
+            candidates, fingerprints, options = distributed.plan_job(args, index)
+            job_id = queue.submit("audio", "D", "offline", options, candidates, fingerprints)
+
+            with backends.selected("offline"):
+                workers = [
+                    threading.Thread(
+                        target=distributed.work,
+                        args=(queue, f"w{number}", "offline", ""),
+                        kwargs={"workers": 2, "poll_interval": 0.01, "until_empty": True},
+                    )
+                    for number in range(2)
+                ]
+                for thread in workers:
+                    thread.start()
+                for thread in workers:
+                    thread.join()
+            counts = distributed.coordinate(queue, job_id, index, poll_interval=0.01)
+
+            self.assertEqual(counts, {"added": 3, "skipped": 0, "failed": 0})
+            for note_id in note_ids:
+                self.assertEqual(anki.notes[note_id]["fields"]["Front"].count("[sound:"), 1)
+            self.assertEqual(anki.calls["multi"], 1)
+            self.assertEqual(queue.counts(job_id)["done"], 3)
+            # A second run finds nothing changed.
+            self.assertEqual(distributed.plan_job(args, index)[0], [])
+
+    def test_draft_images_job_generates_with_the_draft_options(self) -> None:
+        with tempfile.TemporaryDirectory() as tmp, FakeAnkiConnect() as anki, \
+                patch.object(sync, "ANKI_CONNECT_URL", anki.url), \
+                patch.object(media_index, "INDEX_PATH", Path(tmp) / "index.sqlite3"), \
+                patch("builtins.print"):
+            anki.add_deck("D", [("사과", "apple"), ("개", "dog")])
+            queue = WorkQueue(Path(tmp) / "queue.sqlite3")
+            self.addCleanup(queue.close)
+            index = media_index.enable(media_index.INDEX_PATH)
+            self.addCleanup(media_index.enable, None)
+            args = SimpleNamespace(
+                script="images", deck="D", image_model=None, prompt=None, skip_gating=True, draft=True,
+                draft_size=None, draft_quality="low", backend="offline", force=False,
+            )
+            candidates, fingerprints, options = distributed.plan_job(args, index)
+            self.assertEqual(options["image_options"], {"size": "1024x1024", "quality": "low"})
+            job_id = queue.submit("images", "D", "offline", options, candidates, fingerprints)
+
+            import AnkiDeckToImages as images
+
+            generate = images.generate_card_image
+            with backends.selected("offline"), patch.object(
+                images, "generate_card_image", side_effect=generate
+            ) as spy:
+                distributed.work(queue, "w", "offline", "", workers=1, poll_interval=0.01, until_empty=True)
+            self.assertEqual([call.args[5] for call in spy.call_args_list], [options["image_options"]] * 2)
+            counts = distributed.coordinate(queue, job_id, index, poll_interval=0.01)
+
+            self.assertEqual(counts, {"added": 2, "skipped": 0, "failed": 0})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,364 @@
+"""Read and write Anki deck packages (.apkg) without AnkiConnect.
+
+A package is a zip holding a legacy ``collection.anki2`` SQLite database,
+a ``media`` JSON map, and the media files renamed to ``0``, ``1``, ...
+``DeckPackage.update_note_fields`` accepts the same ``note`` payload as
+AnkiConnect's ``updateNoteFields`` so the media scripts can target either.
+"""
+
+import base64
+import hashlib
+import json
+from pathlib import Path
+import sqlite3
+import tempfile
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
+import zipfile
+
+from utils.common import HTML_TAG_RE
+
+MODEL_NAME = "Basic (type in the answer)"
+FIELD_SEPARATOR = "\x1f"
+GUID_ALPHABET = (
+    "abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789"
+    "!#$%&()*+,-./:;<=>?@[]^_`{|}~"
+)
+
+SCHEMA = """
+CREATE TABLE col (
+    id integer primary key, crt integer not null, mod integer not null,
+    scm integer not null, ver integer not null, dty integer not null,
+    usn integer not null, ls integer not null, conf text not null,
+    models text not null, decks text not null, dconf text not null,
+    tags text not null
+);
+CREATE TABLE notes (
+    id integer primary key, guid text not null, mid integer not null,
+    mod integer not null, usn integer not null, tags text not null,
+    flds text not null, sfld integer not null, csum integer not null,
+    flags integer not null, data text not null
+);
+CREATE TABLE cards (
+    id integer primary key, nid integer not null, did integer not null,
+    ord integer not null, mod integer not null, usn integer not null,
+    type integer not null, queue integer not null, due integer not null,
+    ivl integer not null, factor integer not null, reps integer not null,
+    lapses integer not null, left integer not null, odue integer not null,
+    odid integer not null, flags integer not null, data text not null
+);
+CREATE TABLE revlog (
+    id integer primary key, cid integer not null, usn integer not null,
+    ease integer not null, ivl integer not null, lastIvl integer not null,
+    factor integer not null, time integer not null, type integer not null
+);
+CREATE TABLE graves (usn integer not null, oid integer not null, type integer not null);
+CREATE INDEX ix_notes_usn on notes (usn);
+CREATE INDEX ix_cards_usn on cards (usn);
+CREATE INDEX ix_revlog_usn on revlog (usn);
+CREATE INDEX ix_cards_nid on cards (nid);
+CREATE INDEX ix_cards_sched on cards (did, queue, due);
+CREATE INDEX ix_revlog_cid on revlog (cid);
+CREATE INDEX ix_notes_csum on notes (csum);
+"""
+
+DECK_CONFIG = {
+    "id": 1,
+    "name": "Default",
+    "mod": 0,
+    "usn": 0,
+    "maxTaken": 60,
+    "autoplay": True,
+    "timer": 0,
+    "replayq": True,
+    "dyn": False,
+    "new": {
+        "bury": True,
+        "delays": [1, 10],
+        "initialFactor": 2500,
+        "ints": [1, 4, 7],
+        "order": 1,
+        "perDay": 20,
+        "separate": True,
+    },
+    "lapse": {"delays": [10], "leechAction": 0, "leechFails": 8, "minInt": 1, "mult": 0},
+    "rev": {
+        "bury": True,
+        "ease4": 1.3,
+        "fuzz": 0.05,
+        "ivlFct": 1,
+        "maxIvl": 36500,
+        "minSpace": 1,
+        "perDay": 100,
+    },
+}
+
+CARD_CSS = (
+    ".card {\n font-family: arial;\n font-size: 20px;\n text-align: center;\n"
+    " color: black;\n background-color: white;\n}\n"
+)
+
+
+def stable_id(*parts: str) -> int:
+    """Derive a positive 53-bit ID so re-exports update the same objects on import."""
+    digest = hashlib.sha1("\x00".join(parts).encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big") & ((1 << 53) - 1) or 1
+
+
+def note_guid(deck_name: str, front: str) -> str:
+    value = int.from_bytes(hashlib.sha1(f"{deck_name}\x00{front}".encode("utf-8")).digest()[:8], "big")
+    chars = []
+    while value:
+        value, index = divmod(value, len(GUID_ALPHABET))
+        chars.append(GUID_ALPHABET[index])
+    return "".join(reversed(chars)) or GUID_ALPHABET[0]
+
+
+def field_checksum(text: str) -> int:
+    stripped = HTML_TAG_RE.sub("", text)
+    return int(hashlib.sha1(stripped.encode("utf-8")).hexdigest()[:8], 16)
+
+
+def build_model(model_id: int, deck_id: int) -> Dict[str, Any]:
+    return {
+        "id": model_id,
+        "name": MODEL_NAME,
+        "type": 0,
+        "mod": 0,
+        "usn": 0,
+        "sortf": 0,
+        "did": deck_id,
+        "tmpls": [
+            {
+                "name": "Card 1",
+                "ord": 0,
+                "qfmt": "{{Front}}\n\n{{type:Back}}",
+                "afmt": "{{Front}}\n\n<hr id=answer>\n\n{{type:Back}}",
+                "did": None,
+                "bqfmt": "",
+                "bafmt": "",
+            }
+        ],
+        "flds": [
+            {"name": name, "ord": order, "sticky": False, "rtl": False, "font": "Arial", "size": 20, "media": []}
+            for order, name in enumerate(("Front", "Back"))
+        ],
+        "css": CARD_CSS,
+        "latexPre": "\\documentclass[12pt]{article}\n\\begin{document}\n",
+        "latexPost": "\\end{document}",
+        "tags": [],
+        "vers": [],
+        "req": [[0, "any", [0]]],
+    }
+
+
+def build_deck(deck_id: int, name: str) -> Dict[str, Any]:
+    return {
+        "id": deck_id,
+        "name": name,
+        "mod": 0,
+        "usn": -1,
+        "lrnToday": [0, 0],
+        "revToday": [0, 0],
+        "newToday": [0, 0],
+        "timeToday": [0, 0],
+        "collapsed": False,
+        "desc": "",
+        "dyn": 0,
+        "conf": 1,
+        "extendNew": 10,
+        "extendRev": 50,
+    }
+
+
+class PackageNote:
+    __slots__ = ("id", "deck", "fields", "tags", "guid")
+
+    def __init__(self, note_id: int, deck: str, fields: Dict[str, str], tags: Iterable[str] = (), guid: str = "") -> None:
+        self.id = note_id
+        self.deck = deck
+        self.fields = fields
+        self.tags = list(tags)
+        self.guid = guid or note_guid(deck, fields.get("Front", ""))
+
+
+class DeckPackage:
+    """In-memory deck package; notes use the ``build_note`` model and fields."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.notes: Dict[int, PackageNote] = {}
+        self.media: Dict[str, Union[bytes, Path]] = {}
+        self._next_id = int(time.time() * 1000)
+
+    def _allocate_id(self) -> int:
+        self._next_id += 1
+        while self._next_id in self.notes:
+            self._next_id += 1
+        return self._next_id
+
+    def add_note(self, note: Dict[str, Any]) -> int:
+        """Add a note shaped like ``AnkiSync.build_note`` and return its ID."""
+        if note.get("modelName", MODEL_NAME) != MODEL_NAME:
+            raise ValueError(f"Unsupported note model: {note.get('modelName')}")
+        fields = {"Front": note["fields"].get("Front", ""), "Back": note["fields"].get("Back", "")}
+        with self._lock:
+            note_id = self._allocate_id()
+            self.notes[note_id] = PackageNote(note_id, note["deckName"], fields, note.get("tags", ()))
+        return note_id
+
+    def add_notes(self, notes: Iterable[Dict[str, Any]]) -> List[int]:
+        return [self.add_note(note) for note in notes]
+
+    def add_media(self, filename: str, data: Union[bytes, Path]) -> None:
+        with self._lock:
+            self.media[filename] = data
+
+    def find_notes(self, deck: str) -> List[int]:
+        with self._lock:
+            return [note_id for note_id, note in self.notes.items() if note.deck == deck]
+
+    def notes_info(self, note_ids: Iterable[int]) -> List[Dict[str, Any]]:
+        """Mirror AnkiConnect's ``notesInfo`` shape for the given IDs."""
+        with self._lock:
+            return [
+                {
+                    "noteId": note_id,
+                    "modelName": MODEL_NAME,
+                    "tags": list(self.notes[note_id].tags),
+                    "fields": {
+                        name: {"value": value, "order": order}
+                        for order, (name, value) in enumerate(self.notes[note_id].fields.items())
+                    },
+                }
+                for note_id in note_ids
+            ]
+
+    def update_note_fields(self, note: Dict[str, Any]) -> None:
+        """Apply an AnkiConnect ``updateNoteFields`` payload, attaching media."""
+        attachments: List[Tuple[str, Dict[str, Any]]] = [
+            ("audio", item) for item in note.get("audio", [])
+        ] + [("picture", item) for item in note.get("picture", [])]
+        with self._lock:
+            stored = self.notes.get(note["id"])
+            if stored is None:
+                raise KeyError(f"Note {note['id']} is not in the package.")
+            for name, value in note.get("fields", {}).items():
+                stored.fields[name] = value
+            for kind, item in attachments:
+                filename = item["filename"]
+                if "data" in item:
+                    self.media[filename] = base64.b64decode(item["data"])
+                else:
+                    self.media[filename] = Path(item["path"])
+                reference = f"[sound:{filename}]" if kind == "audio" else f'<img src="{filename}">'
+                for field in item.get("fields", []):
+                    stored.fields[field] = stored.fields.get(field, "") + reference
+
+    def write(self, path: Path) -> Path:
+        path = Path(path)
+        now = int(time.time())
+        with self._lock:
+            notes = list(self.notes.values())
+            media = dict(self.media)
+        deck_names = sorted({note.deck for note in notes}) or ["Default"]
+        deck_ids = {name: stable_id("deck", name) for name in deck_names}
+        model_id = stable_id("model", MODEL_NAME)
+        decks = {"1": build_deck(1, "Default")}
+        decks.update({str(deck_id): build_deck(deck_id, name) for name, deck_id in deck_ids.items()})
+        models = {str(model_id): build_model(model_id, deck_ids[deck_names[0]])}
+        conf = {"nextPos": len(notes) + 1, "estTimes": True, "activeDecks": [1], "sortType": "noteFld",
+                "timeLim": 0, "sortBackwards": False, "addToCur": True, "curDeck": 1, "newBury": True,
+                "newSpread": 0, "dueCounts": True, "curModel": str(model_id), "collapseTime": 1200}
+
+        with tempfile.TemporaryDirectory() as tmp:
+            db_path = Path(tmp) / "collection.anki2"
+            connection = sqlite3.connect(db_path)
+            try:
+                connection.executescript(SCHEMA)
+                connection.execute(
+                    "INSERT INTO col VALUES (1, ?, ?, ?, 11, 0, 0, 0, ?, ?, ?, ?, '{}')",
+                    (
+                        now - now % 86400,
+                        now * 1000,
+                        now * 1000,
+                        json.dumps(conf),
+                        json.dumps(models),
+                        json.dumps(decks),
+                        json.dumps({"1": DECK_CONFIG}),
+                    ),
+                )
+                note_rows = []
+                card_rows = []
+                for position, note in enumerate(notes, start=1):
+                    front = note.fields.get("Front", "")
+                    flds = FIELD_SEPARATOR.join((front, note.fields.get("Back", "")))
+                    tags = f" {' '.join(note.tags)} " if note.tags else ""
+                    note_rows.append(
+                        (note.id, note.guid, model_id, now, -1, tags, flds,
+                         HTML_TAG_RE.sub("", front), field_checksum(front), 0, "")
+                    )
+                    card_rows.append(
+                        (note.id, note.id, deck_ids[note.deck], 0, now, -1,
+                         0, 0, position, 0, 0, 0, 0, 0, 0, 0, 0, "")
+                    )
+                connection.executemany("INSERT INTO notes VALUES (?,?,?,?,?,?,?,?,?,?,?)", note_rows)
+                connection.executemany(
+                    "INSERT INTO cards VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)", card_rows
+                )
+                connection.commit()
+            finally:
+                connection.close()
+
+            path.parent.mkdir(parents=True, exist_ok=True)
+            partial = path.with_name(path.name + ".partial")
+            media_map: Dict[str, str] = {}
+            with zipfile.ZipFile(partial, "w", zipfile.ZIP_DEFLATED) as archive:
+                archive.write(db_path, "collection.anki2")
+                for index, (filename, data) in enumerate(sorted(media.items())):
+                    media_map[str(index)] = filename
+                    # Audio and images are already compressed; storing avoids wasted CPU.
+                    if isinstance(data, Path):
+                        archive.write(data, str(index), compress_type=zipfile.ZIP_STORED)
+                    else:
+                        archive.writestr(str(index), data, compress_type=zipfile.ZIP_STORED)
+                archive.writestr("media", json.dumps(media_map))
+            partial.replace(path)
+        return path
+
+    @classmethod
+    def load(cls, path: Path) -> "DeckPackage":
+        """Read a package written by ``write`` (or any legacy schema-11 .apkg)."""
+        package = cls()
+        with zipfile.ZipFile(path) as archive, tempfile.TemporaryDirectory() as tmp:
+            archive.extract("collection.anki2", tmp)
+            media_map = json.loads(archive.read("media") or b"{}")
+            for index, filename in media_map.items():
+                package.media[filename] = archive.read(index)
+            connection = sqlite3.connect(Path(tmp) / "collection.anki2")
+            try:
+                decks = json.loads(connection.execute("SELECT decks FROM col").fetchone()[0])
+                deck_names = {int(deck_id): deck["name"] for deck_id, deck in decks.items()}
+                rows = connection.execute(
+                    "SELECT notes.id, notes.guid, notes.tags, notes.flds, MIN(cards.did) "
+                    "FROM notes JOIN cards ON cards.nid = notes.id GROUP BY notes.id ORDER BY notes.id"
+                ).fetchall()
+            finally:
+                connection.close()
+        for note_id, guid, tags, flds, deck_id in rows:
+            values = flds.split(FIELD_SEPARATOR)
+            fields = {"Front": values[0], "Back": values[1] if len(values) > 1 else ""}
+            package.notes[note_id] = PackageNote(
+                note_id, deck_names.get(deck_id, "Default"), fields, tags.split(), guid
+            )
+        if package.notes:
+            package._next_id = max(package._next_id, max(package.notes))
+        return package
+
+    @classmethod
+    def open(cls, path: Optional[Path]) -> "DeckPackage":
+        """Load ``path`` if it exists, otherwise start an empty package."""
+        if path is not None and Path(path).exists():
+            return cls.load(path)
+        return cls()
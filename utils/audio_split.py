@@ -0,0 +1,103 @@
+"""Split one synthesized speech clip into per-card clips at its pauses.
+
+Batched TTS asks for raw PCM (16-bit little-endian mono at 24 kHz, the
+format OpenAI returns for ``response_format="pcm"``), with one card per
+line and a long pause between lines. ``split_on_silence`` finds those
+pauses from short-window RMS levels and returns one clip per line, or None
+when the number of pauses does not match so the caller can fall back to
+one request per card.
+"""
+
+from array import array
+import io
+import math
+import sys
+from typing import List, Optional, Tuple
+import wave
+
+SAMPLE_RATE = 24_000
+SAMPLE_WIDTH = 2
+WINDOW_MS = 10
+# A pause between cards must be at least this long; pauses inside a word or
+# short phrase are much shorter.
+MIN_GAP_MS = 350
+# Silence kept on each side of a clip so words are not clipped.
+PAD_MS = 60
+# Windows quieter than this fraction of the loudest window count as silence.
+SILENCE_RATIO = 0.04
+
+
+def _samples(pcm: bytes) -> array:
+    samples = array("h")
+    samples.frombytes(pcm[: len(pcm) - len(pcm) % SAMPLE_WIDTH])
+    if sys.byteorder == "big":
+        samples.byteswap()
+    return samples
+
+
+def window_levels(pcm: bytes, sample_rate: int = SAMPLE_RATE) -> List[float]:
+    """RMS level of each ``WINDOW_MS`` window."""
+    samples = _samples(pcm)
+    size = max(1, sample_rate * WINDOW_MS // 1000)
+    levels = []
+    for start in range(0, len(samples), size):
+        window = samples[start:start + size]
+        levels.append(math.sqrt(sum(value * value for value in window) / len(window)))
+    return levels
+
+
+def find_gaps(levels: List[float], threshold: float, min_windows: int) -> List[Tuple[int, int]]:
+    """Return ``(start, end)`` window ranges of silence between the first and last sound."""
+    voiced = [index for index, level in enumerate(levels) if level > threshold]
+    if not voiced:
+        return []
+    gaps = []
+    run_start = None
+    for index in range(voiced[0], voiced[-1] + 1):
+        if levels[index] <= threshold:
+            if run_start is None:
+                run_start = index
+        elif run_start is not None:
+            if index - run_start >= min_windows:
+                gaps.append((run_start, index))
+            run_start = None
+    return gaps
+
+
+def split_on_silence(
+    pcm: bytes,
+    expected: int,
+    *,
+    sample_rate: int = SAMPLE_RATE,
+    min_gap_ms: int = MIN_GAP_MS,
+    pad_ms: int = PAD_MS,
+) -> Optional[List[bytes]]:
+    """Split ``pcm`` into ``expected`` clips, or return None if the pauses do not line up."""
+    levels = window_levels(pcm, sample_rate)
+    if expected < 1 or not levels or max(levels) == 0:
+        return None
+    threshold = max(levels) * SILENCE_RATIO
+    gaps = find_gaps(levels, threshold, max(1, min_gap_ms // WINDOW_MS))
+    if len(gaps) != expected - 1:
+        return None
+
+    voiced = [index for index, level in enumerate(levels) if level > threshold]
+    pad = pad_ms // WINDOW_MS
+    bounds = [voiced[0]] + [edge for gap in gaps for edge in gap] + [voiced[-1] + 1]
+    window_bytes = sample_rate * WINDOW_MS // 1000 * SAMPLE_WIDTH
+    clips = []
+    for start, end in zip(bounds[::2], bounds[1::2]):
+        start = max(0, start - pad) * window_bytes
+        end = min(len(levels), end + pad) * window_bytes
+        clips.append(pcm[start:end])
+    return clips
+
+
+def pcm_to_wav(pcm: bytes, sample_rate: int = SAMPLE_RATE) -> bytes:
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as handle:
+        handle.setnchannels(1)
+        handle.setsampwidth(SAMPLE_WIDTH)
+        handle.setframerate(sample_rate)
+        handle.writeframes(pcm)
+    return buffer.getvalue()
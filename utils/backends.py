@@ -0,0 +1,702 @@
+"""Generation backends for speech, images, gating and vocabulary extraction.
+
+The scripts ask the backend selected with ``--backend`` (or the
+``ANKI_BACKEND`` environment variable) for every generation call instead of
+calling the OpenAI SDK directly:
+
+- ``openai``: the OpenAI API, with one client shared by every worker thread.
+- ``offline``: no network and no API key. Speech is synthesized locally
+  (``espeak-ng``/``espeak`` when installed, otherwise a tone per letter),
+  images are procedurally rendered placeholders, gating uses the local
+  rules and extraction reads simple text PDFs. It runs at CPU speed, which
+  makes it useful for load testing and as a fallback when quota runs out.
+
+Other backends subclass ``GenerationBackend`` and are added with
+``register_backend``, or named on the command line as ``package.module:factory``.
+"""
+
+from abc import ABC, abstractmethod
+import argparse
+from array import array
+import base64
+from contextlib import contextmanager
+from functools import lru_cache
+import hashlib
+import importlib
+import json
+import math
+import os
+from pathlib import Path
+import re
+import shutil
+import struct
+import subprocess
+import threading
+import zlib
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from utils import costs, gating_filter, metrics, tracing
+from utils.audio_split import SAMPLE_RATE, pcm_to_wav
+from utils.clients import OpenAI
+from utils.common import normalize_json_payload
+
+if TYPE_CHECKING:
+    import openai
+
+BACKEND_ENV = "ANKI_BACKEND"
+DEFAULT_BACKEND = "openai"
+
+GATING_PROMPT_ID = "pmpt_69194beaad7c819497842682bad97629040fc2c239b73233"
+GATING_PROMPT_VERSION = "4"
+# Model for grouped gating, and what stored-prompt gating is priced as if the
+# response does not say.
+DEFAULT_GATING_MODEL = "gpt-4.1-mini"
+GATING_GROUP_INSTRUCTIONS = (
+    "You decide whether each language-learning flashcard would benefit from a memory-aid "
+    "illustration. Answer true for concrete, picturable concepts such as objects, animals, "
+    "places, actions, and emotions with clear imagery. Answer false for grammar particles, "
+    "function words, abstract terms without a clear image, and long example sentences. "
+    "Return exactly one decision per card, using the card's id."
+)
+GATING_GROUP_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "decisions": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "id": {"type": "string"},
+                    "illustrate": {"type": "boolean"},
+                },
+                "required": ["id", "illustrate"],
+                "additionalProperties": False,
+            },
+        }
+    },
+    "required": ["decisions"],
+    "additionalProperties": False,
+}
+
+
+EXTRACTION_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "pairs": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "english": {"type": "string"},
+                    "foreign": {"type": "string"},
+                    "romanized": {"type": ["string", "null"]},
+                },
+                "required": ["english", "foreign", "romanized"],
+                "additionalProperties": False,
+            },
+        }
+    },
+    "required": ["pairs"],
+    "additionalProperties": False,
+}
+EXTRACTION_FORMAT = {
+    "format": {
+        "type": "json_schema",
+        "name": "vocabulary",
+        "schema": EXTRACTION_SCHEMA,
+        "strict": True,
+    }
+}
+# Follow-up requests allowed when extraction output is cut off at the token limit.
+MAX_EXTRACTION_CONTINUATIONS = 20
+
+
+def create_file(client: "openai.OpenAI", file_path: Path) -> str:
+    with open(file_path, "rb") as file_content, metrics.track_openai("files", "n/a"):
+        result = client.files.create(
+            file=file_content,
+            purpose="assistants",
+        )
+    return result.id
+
+
+def build_extraction_request(model: str, prompt_text: str, file_id: str) -> Dict[str, Any]:
+    return {
+        "model": model,
+        "input": [{
+            "role": "user",
+            "content": [
+                {"type": "input_text", "text": prompt_text},
+                {
+                    "type": "input_file",
+                    "file_id": file_id,
+                },
+            ],
+        }],
+        "text": EXTRACTION_FORMAT,
+    }
+
+
+def build_continuation_request(
+    model: str, previous_response_id: str, last_pair: Optional[Dict[str, Any]]
+) -> Dict[str, Any]:
+    """Ask for the rest of a vocabulary list whose output was cut off after ``last_pair``."""
+    after = (
+        f" after this item: {json.dumps(last_pair, ensure_ascii=False)}"
+        if last_pair
+        else " from the beginning"
+    )
+    return {
+        "model": model,
+        "previous_response_id": previous_response_id,
+        "input": [{
+            "role": "user",
+            "content": [{
+                "type": "input_text",
+                "text": (
+                    f"Your answer was cut off. Continue the vocabulary list{after}. "
+                    "Return only the items that come after it, in the same format, without repeating any."
+                ),
+            }],
+        }],
+        "text": EXTRACTION_FORMAT,
+    }
+
+
+def parse_extraction_output(raw_output: str) -> Tuple[List[Dict[str, Any]], bool]:
+    """Return ``(pairs, complete)`` from extraction output, even when it was cut off.
+
+    Accepts a bare JSON array or the schema's ``{"pairs": [...]}``, fenced or
+    surrounded by prose. When the array never closes, every item that did
+    arrive whole is kept and ``complete`` is False.
+    """
+    text = normalize_json_payload(raw_output)
+    try:
+        parsed = json.loads(text)
+    except json.JSONDecodeError:
+        parsed = None
+    if isinstance(parsed, dict) and isinstance(parsed.get("pairs"), list):
+        parsed = parsed["pairs"]
+    if isinstance(parsed, list):
+        return [item for item in parsed if isinstance(item, dict)], True
+
+    key = text.find('"pairs"')
+    start = text.find("[", key if key >= 0 else 0)
+    if start < 0:
+        return [], False
+    decoder = json.JSONDecoder()
+    pairs: List[Dict[str, Any]] = []
+    position = start + 1
+    while True:
+        while position < len(text) and text[position] in " \t\r\n,":
+            position += 1
+        if position >= len(text):
+            return pairs, False
+        if text[position] == "]":
+            return pairs, True
+        try:
+            item, position = decoder.raw_decode(text, position)
+        except json.JSONDecodeError:
+            return pairs, False
+        if isinstance(item, dict):
+            pairs.append(item)
+
+
+def response_incomplete(response: Any) -> bool:
+    """True when the API stopped a response early, e.g. at ``max_output_tokens``."""
+    status = response.get("status") if isinstance(response, dict) else getattr(response, "status", None)
+    return status == "incomplete"
+
+
+def continue_extraction(
+    client: "openai.OpenAI",
+    model: str,
+    raw_output: str,
+    response_id: Optional[str],
+    *,
+    incomplete: bool = False,
+) -> str:
+    """Return ``raw_output``, or, if it was cut off, every pair after asking the model to go on.
+
+    Each follow-up continues the same conversation (``previous_response_id``)
+    after the last complete item. It stops when the list closes, a follow-up
+    adds nothing, or ``MAX_EXTRACTION_CONTINUATIONS`` is reached; whatever
+    arrived whole is kept either way.
+    """
+    pairs, complete = parse_extraction_output(raw_output)
+    if complete and not incomplete:
+        return raw_output
+    for _ in range(MAX_EXTRACTION_CONTINUATIONS):
+        if response_id is None:
+            break
+        print(f"Extraction output was cut off after {len(pairs)} pair(s); asking the model to continue.")
+        with metrics.track_openai("responses.continuation", model):
+            response = client.responses.create(
+                **build_continuation_request(model, response_id, pairs[-1] if pairs else None)
+            )
+        record_response_usage("responses.continuation", response, model)
+        more, complete = parse_extraction_output(get_response_text(response))
+        pairs.extend(more)
+        response_id = getattr(response, "id", None)
+        if complete and not response_incomplete(response):
+            return json.dumps(pairs, ensure_ascii=False)
+        if not more:
+            break
+    print(f"Extraction could not be completed; keeping the {len(pairs)} pair(s) received whole.")
+    return json.dumps(pairs, ensure_ascii=False)
+
+
+def get_response_text(resp: Any) -> str:
+    text = getattr(resp, "output_text", None)
+    if text:
+        return text
+    output = getattr(resp, "output", None)
+    if not output:
+        return ""
+    parts: List[str] = []
+    for item in output:
+        for content_piece in getattr(item, "content", []):
+            maybe_text = getattr(content_piece, "text", None)
+            if maybe_text:
+                parts.append(maybe_text)
+    return "".join(parts)
+
+
+def build_gating_payload(front_text: str, back_text: str) -> Dict[str, Any]:
+    return {
+        "id": GATING_PROMPT_ID,
+        "version": GATING_PROMPT_VERSION,
+        "variables": {
+            "front": front_text,
+            "back": back_text,
+        },
+    }
+
+
+def parse_gating_decision(text: str) -> bool:
+    return text.strip().lower() == "true"
+
+
+def build_group_gating_request(model: str, cards: List[Tuple[str, str, str]]) -> Dict[str, Any]:
+    payload = [{"id": card_id, "front": front, "back": back} for card_id, front, back in cards]
+    return {
+        "model": model,
+        "instructions": GATING_GROUP_INSTRUCTIONS,
+        "input": json.dumps({"cards": payload}, ensure_ascii=False),
+        "text": {
+            "format": {
+                "type": "json_schema",
+                "name": "gating_decisions",
+                "schema": GATING_GROUP_SCHEMA,
+                "strict": True,
+            }
+        },
+    }
+
+
+def parse_group_gating_decisions(raw_output: str, expected_ids: List[str]) -> Dict[str, bool]:
+    """Keep only well-formed decisions for requested IDs; first answer per ID wins."""
+    try:
+        parsed = json.loads(normalize_json_payload(raw_output))
+    except json.JSONDecodeError:
+        return {}
+    items = parsed.get("decisions") if isinstance(parsed, dict) else parsed
+    if not isinstance(items, list):
+        return {}
+    expected = set(expected_ids)
+    decisions: Dict[str, bool] = {}
+    for item in items:
+        if not isinstance(item, dict):
+            continue
+        card_id = str(item.get("id", ""))
+        illustrate = item.get("illustrate")
+        if card_id in expected and isinstance(illustrate, bool) and card_id not in decisions:
+            decisions[card_id] = illustrate
+    return decisions
+
+
+def record_response_usage(endpoint: str, response: Any, model: str, *, batch: bool = False) -> None:
+    """Price a Responses API result (an SDK object or a batch output body)."""
+    if isinstance(response, dict):
+        usage, reported = response.get("usage"), response.get("model")
+    else:
+        usage, reported = getattr(response, "usage", None), getattr(response, "model", None)
+    costs.record_tokens(
+        endpoint,
+        reported if isinstance(reported, str) and reported else model,
+        usage,
+        discount=costs.BATCH_DISCOUNT if batch else 1.0,
+    )
+
+
+class GenerationBackend(ABC):
+    """The generation calls the scripts make.
+
+    Subclasses must implement ``speech``, ``image``, ``gate`` and ``extract``;
+    one that misses any of them fails when it is created, not partway
+    through a run.
+    """
+
+    name = ""
+    # Extension of the files ``speech`` produces by default.
+    audio_format = "mp3"
+    requires_api_key = False
+    # Whether ``client`` is an OpenAI client usable for the Batch API.
+    supports_batch = False
+
+    @abstractmethod
+    def speech(
+        self,
+        text: str,
+        *,
+        model: str,
+        voice: str,
+        instructions: str,
+        response_format: Optional[str] = None,
+    ) -> bytes:
+        """Return audio for ``text``; ``response_format="pcm"`` asks for raw 24 kHz 16-bit mono."""
+        raise NotImplementedError
+
+    def speech_to_file(self, path: Path, text: str, *, model: str, voice: str, instructions: str) -> None:
+        Path(path).write_bytes(self.speech(text, model=model, voice=voice, instructions=instructions))
+
+    @abstractmethod
+    def image(self, prompt: str, *, model: str, size: Optional[str] = None, quality: Optional[str] = None) -> str:
+        """Return a PNG for ``prompt``, base64-encoded."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def gate(self, front: str, back: str) -> bool:
+        """Decide whether a card would benefit from an illustration."""
+        raise NotImplementedError
+
+    def gate_group(self, cards: List[Tuple[str, str, str]], *, model: str) -> Dict[str, bool]:
+        """Decide several ``(id, front, back)`` cards at once; missing IDs are gated singly."""
+        return {card_id: self.gate(front, back) for card_id, front, back in cards}
+
+    @abstractmethod
+    def extract(self, pdf: Path, *, model: str, prompt_text: str) -> str:
+        """Return the raw extraction output: a JSON array of vocabulary pairs (or ``{"pairs": [...]}``)."""
+        raise NotImplementedError
+
+
+class OpenAIBackend(GenerationBackend):
+    name = "openai"
+    requires_api_key = True
+    supports_batch = True
+
+    def __init__(self, api_key: Optional[str] = None, client: Optional["openai.OpenAI"] = None) -> None:
+        self.api_key = api_key
+        self._client = client
+        self._lock = threading.Lock()
+
+    @property
+    def client(self) -> "openai.OpenAI":
+        """One client for the whole run; it is thread-safe and pools connections."""
+        with self._lock:
+            if self._client is None:
+                self._client = OpenAI(api_key=self.api_key)
+            return self._client
+
+    def speech(
+        self,
+        text: str,
+        *,
+        model: str,
+        voice: str,
+        instructions: str,
+        response_format: Optional[str] = None,
+    ) -> bytes:
+        with metrics.track_openai("audio.speech", model):
+            with self.client.audio.speech.with_streaming_response.create(
+                model=model,
+                voice=voice,
+                input=text,
+                instructions=instructions,
+                response_format=response_format or self.audio_format,
+            ) as response:
+                audio = response.read()
+        costs.record_speech("audio.speech", model, text)
+        return audio
+
+    def speech_to_file(self, path: Path, text: str, *, model: str, voice: str, instructions: str) -> None:
+        with metrics.track_openai("audio.speech", model):
+            with self.client.audio.speech.with_streaming_response.create(
+                model=model,
+                voice=voice,
+                input=text,
+                instructions=instructions,
+            ) as response:
+                response.stream_to_file(path)
+        costs.record_speech("audio.speech", model, text)
+
+    def image(self, prompt: str, *, model: str, size: Optional[str] = None, quality: Optional[str] = None) -> str:
+        options = {key: value for key, value in (("size", size), ("quality", quality)) if value}
+        with metrics.track_openai("images.generate", model):
+            result = self.client.images.generate(
+                model=model,
+                prompt=prompt,
+                **options,
+            )
+        costs.record_image(
+            "images.generate", model, size=size, quality=quality, usage=getattr(result, "usage", None)
+        )
+        return result.data[0].b64_json
+
+    def gate(self, front: str, back: str) -> bool:
+        with metrics.track_openai("responses.gating", f"prompt-v{GATING_PROMPT_VERSION}"):
+            response = self.client.responses.create(
+                prompt=build_gating_payload(front, back),
+            )
+        # The stored prompt picks the model; the response says which one it was.
+        record_response_usage("responses.gating", response, DEFAULT_GATING_MODEL)
+        return parse_gating_decision(get_response_text(response))
+
+    def gate_group(self, cards: List[Tuple[str, str, str]], *, model: str) -> Dict[str, bool]:
+        request_body = build_group_gating_request(model, cards)
+        with metrics.track_openai("responses.gating_group", model):
+            response = self.client.responses.create(**request_body)
+        record_response_usage("responses.gating_group", response, model)
+        return parse_group_gating_decisions(get_response_text(response), [card[0] for card in cards])
+
+    def extract(self, pdf: Path, *, model: str, prompt_text: str) -> str:
+        print(f"Uploading PDF to OpenAI: {pdf}")
+        with tracing.span("upload_pdf", pdf=pdf.name):
+            file_id = create_file(self.client, pdf)
+        with metrics.track_openai("responses", model):
+            response = self.client.responses.create(
+                **build_extraction_request(model, prompt_text, file_id)
+            )
+        record_response_usage("responses", response, model)
+        return continue_extraction(
+            self.client,
+            model,
+            get_response_text(response),
+            getattr(response, "id", None),
+            incomplete=response_incomplete(response),
+        )
+
+
+# Offline speech: one short voiced tone per letter, pitched by the letter.
+OFFLINE_LETTER_MS = 70
+OFFLINE_WORD_PAUSE_MS = 90
+OFFLINE_LINE_PAUSE_MS = 800
+OFFLINE_EDGE_MS = 100
+OFFLINE_IMAGE_SIZE = "1024x1024"
+PDF_STREAM_RE = re.compile(rb"stream\r?\n(.*?)\r?\nendstream", re.DOTALL)
+PDF_TEXT_TOKEN_RE = re.compile(rb"\(((?:\\.|[^\\()])*)\)|(T\*|Td|TD|ET|')")
+PDF_ESCAPES = {b"n": b"\n", b"r": b"\r", b"t": b"\t", b"b": b"\b", b"f": b"\f"}
+PAIR_SEPARATOR_RE = re.compile(r"\s+[-–—=:|]\s+|\t+")
+
+
+def _silence(milliseconds: int) -> array:
+    return array("h", [0]) * (SAMPLE_RATE * milliseconds // 1000)
+
+
+@lru_cache(maxsize=None)
+def _letter_tone(letter: str) -> array:
+    pitch = 110 + ord(letter) % 90
+    count = SAMPLE_RATE * OFFLINE_LETTER_MS // 1000
+    samples = array("h")
+    for index in range(count):
+        phase = 2 * math.pi * pitch * index / SAMPLE_RATE
+        envelope = math.sin(math.pi * index / count)
+        value = math.sin(phase) + 0.5 * math.sin(2 * phase) + 0.25 * math.sin(3 * phase)
+        samples.append(int(5000 * envelope * value))
+    return samples
+
+
+def synthesize_pcm(text: str) -> bytes:
+    """Tones for each letter, short gaps between words and a long pause between lines."""
+    samples = _silence(OFFLINE_EDGE_MS)
+    lines = [line.split() for line in text.split("\n") if line.strip()]
+    for line_index, words in enumerate(lines):
+        if line_index:
+            samples.extend(_silence(OFFLINE_LINE_PAUSE_MS))
+        for word_index, word in enumerate(words):
+            if word_index:
+                samples.extend(_silence(OFFLINE_WORD_PAUSE_MS))
+            for letter in word:
+                samples.extend(_letter_tone(letter))
+    samples.extend(_silence(OFFLINE_EDGE_MS))
+    return samples.tobytes()
+
+
+def _png_chunk(kind: bytes, data: bytes) -> bytes:
+    return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data) & 0xFFFFFFFF)
+
+
+def render_placeholder_png(prompt: str, size: Optional[str] = None) -> bytes:
+    """A gradient with diagonal stripes whose colours are derived from ``prompt``."""
+    try:
+        width, height = (max(16, min(4096, int(part))) for part in (size or OFFLINE_IMAGE_SIZE).split("x"))
+    except ValueError:
+        width, height = (int(part) for part in OFFLINE_IMAGE_SIZE.split("x"))
+    digest = hashlib.sha256(prompt.encode("utf-8")).digest()
+    top, bottom, accent = digest[0:3], digest[3:6], digest[6:9]
+    stripe = 16 + digest[9] % 48
+    repeats = width // (2 * stripe) + 2
+    rows = []
+    for y in range(height):
+        t = y / max(1, height - 1)
+        base = bytes(int(a + (b - a) * t) for a, b in zip(top, bottom))
+        tint = bytes((2 * a + c) // 3 for a, c in zip(base, accent))
+        pattern = (base * stripe + tint * stripe) * repeats
+        offset = (y % (2 * stripe)) * 3
+        rows.append(b"\x00" + pattern[offset:offset + width * 3])
+    return (
+        b"\x89PNG\r\n\x1a\n"
+        + _png_chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+        + _png_chunk(b"IDAT", zlib.compress(b"".join(rows), 6))
+        + _png_chunk(b"IEND", b"")
+    )
+
+
+def _unescape_pdf_string(raw: bytes) -> bytes:
+    def replace(match: "re.Match[bytes]") -> bytes:
+        escaped = match.group(1)
+        if escaped[:1].isdigit():
+            return bytes([int(escaped, 8) & 0xFF])
+        return PDF_ESCAPES.get(escaped, escaped)
+
+    return re.sub(rb"\\([0-7]{1,3}|.)", replace, raw, flags=re.DOTALL)
+
+
+def pdf_text_lines(data: bytes) -> List[str]:
+    """Text lines from a PDF's content streams (simple, non-CID fonts only).
+
+    Files that are not PDFs are read as UTF-8 text.
+    """
+    if not data.startswith(b"%PDF"):
+        return data.decode("utf-8", "replace").splitlines()
+    lines: List[str] = []
+    for stream in PDF_STREAM_RE.findall(data):
+        try:
+            stream = zlib.decompress(stream)
+        except zlib.error:
+            pass
+        current = b""
+        for string, operator in PDF_TEXT_TOKEN_RE.findall(stream):
+            if operator:
+                if current.strip():
+                    lines.append(current)
+                current = b""
+            else:
+                current += _unescape_pdf_string(string)
+        if current.strip():
+            lines.append(current)
+    decoded = []
+    for line in lines:
+        try:
+            decoded.append(line.decode("utf-8"))
+        except UnicodeDecodeError:
+            decoded.append(line.decode("latin-1"))
+    return decoded
+
+
+def extract_pairs_from_lines(lines: List[str]) -> List[Dict[str, str]]:
+    """Read ``foreign - english`` lines (either order; also tabs, ``=``, ``:`` or ``|``)."""
+    pairs = []
+    for line in lines:
+        parts = PAIR_SEPARATOR_RE.split(line.strip(), maxsplit=1)
+        if len(parts) != 2 or not all(part.strip() for part in parts):
+            continue
+        left, right = (part.strip() for part in parts)
+        if left.isascii() and not right.isascii():
+            left, right = right, left
+        pairs.append({"english": right, "foreign": left})
+    return pairs
+
+
+class OfflineBackend(GenerationBackend):
+    name = "offline"
+    audio_format = "wav"
+
+    def __init__(self, api_key: Optional[str] = None) -> None:
+        self.espeak = shutil.which("espeak-ng") or shutil.which("espeak")
+
+    def speech(
+        self,
+        text: str,
+        *,
+        model: str,
+        voice: str,
+        instructions: str,
+        response_format: Optional[str] = None,
+    ) -> bytes:
+        if response_format == "pcm":
+            return synthesize_pcm(text)
+        if self.espeak:
+            return subprocess.run([self.espeak, "--stdout", text], capture_output=True, check=True).stdout
+        return pcm_to_wav(synthesize_pcm(text))
+
+    def image(self, prompt: str, *, model: str, size: Optional[str] = None, quality: Optional[str] = None) -> str:
+        return base64.b64encode(render_placeholder_png(prompt, size)).decode("ascii")
+
+    def gate(self, front: str, back: str) -> bool:
+        return gating_filter.rule_decision(front, back) is not False
+
+    def extract(self, pdf: Path, *, model: str, prompt_text: str) -> str:
+        pairs = extract_pairs_from_lines(pdf_text_lines(Path(pdf).read_bytes()))
+        if not pairs:
+            raise RuntimeError(f"No 'word - translation' lines found in {pdf} for offline extraction.")
+        return json.dumps(pairs, ensure_ascii=False)
+
+
+BACKENDS: Dict[str, Callable[[Optional[str]], GenerationBackend]] = {
+    "openai": OpenAIBackend,
+    "offline": OfflineBackend,
+}
+
+
+def register_backend(name: str, factory: Callable[[Optional[str]], GenerationBackend]) -> None:
+    BACKENDS[name] = factory
+
+
+def resolve_factory(name: str) -> Callable[[Optional[str]], GenerationBackend]:
+    """Look up a registered backend, or import ``package.module:factory``."""
+    if name in BACKENDS:
+        return BACKENDS[name]
+    module_name, _, attribute = name.partition(":")
+    if not attribute:
+        raise ValueError(f"Unknown backend {name!r}; choose from {', '.join(sorted(BACKENDS))} or use module:factory.")
+    return getattr(importlib.import_module(module_name), attribute)
+
+
+def requires_api_key(name: str) -> bool:
+    return bool(getattr(resolve_factory(name), "requires_api_key", False))
+
+
+def create_backend(name: str, api_key: Optional[str] = None) -> GenerationBackend:
+    return resolve_factory(name)(api_key)
+
+
+def add_backend_argument(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument(
+        "--backend",
+        default=os.environ.get(BACKEND_ENV, DEFAULT_BACKEND),
+        help=(
+            f"Generation backend: {', '.join(sorted(BACKENDS))} or package.module:factory "
+            f"(default: {BACKEND_ENV} or %(default)s)."
+        ),
+    )
+
+
+_active: Optional[GenerationBackend] = None
+
+
+@contextmanager
+def selected(name: str, api_key: Optional[str] = None) -> Iterator[GenerationBackend]:
+    """Make ``name`` the backend that ``current`` returns for the duration of a run."""
+    global _active
+    previous = _active
+    _active = create_backend(name, api_key)
+    try:
+        yield _active
+    finally:
+        _active = previous
+
+
+def current(api_key: Optional[str] = None) -> GenerationBackend:
+    """The selected backend, or a fresh OpenAI backend when none is (library use, tests)."""
+    return _active if _active is not None else OpenAIBackend(api_key)
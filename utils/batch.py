@@ -0,0 +1,149 @@
+"""Submit Responses requests through the OpenAI Batch API and collect results.
+
+A ``BatchJob`` keeps its batch ID in a small JSON state file, so a poller
+that is restarted with the same key picks up the existing batch instead of
+paying for a second submission.
+"""
+
+import json
+from pathlib import Path
+import time
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from utils import metrics
+from utils.common import BASE_DIR
+
+BATCH_DIR = BASE_DIR / "batches"
+DEFAULT_POLL_INTERVAL = 30.0
+TERMINAL_STATUSES = {"completed", "failed", "expired", "cancelled"}
+
+
+def state_path_for(kind: str, name: str) -> Path:
+    slug = "".join(char if char.isalnum() or char in "-_" else "_" for char in name) or "default"
+    return BATCH_DIR / f"{kind}-{slug}.json"
+
+
+def response_text_from_body(body: Dict[str, Any]) -> str:
+    """Dict counterpart of ``get_response_text`` for raw batch output bodies."""
+    text = body.get("output_text")
+    if text:
+        return text
+    parts: List[str] = []
+    for item in body.get("output") or []:
+        for content_piece in item.get("content") or []:
+            maybe_text = content_piece.get("text")
+            if maybe_text:
+                parts.append(maybe_text)
+    return "".join(parts)
+
+
+class BatchJob:
+    def __init__(self, client: Any, state_path: Path, endpoint: str = "/v1/responses") -> None:
+        self.client = client
+        self.state_path = Path(state_path)
+        self.endpoint = endpoint
+        self.state: Dict[str, Any] = {}
+        if self.state_path.exists():
+            try:
+                self.state = json.loads(self.state_path.read_text(encoding="utf-8"))
+            except ValueError:
+                self.state = {}
+
+    @property
+    def input_path(self) -> Path:
+        return self.state_path.with_suffix(".jsonl")
+
+    @property
+    def batch_id(self) -> Optional[str]:
+        return self.state.get("batch_id")
+
+    def resumable(self, key: str) -> bool:
+        """True when a batch for ``key`` was already submitted by an earlier run."""
+        return bool(self.batch_id) and self.state.get("key") == key
+
+    def submit(self, requests: Sequence[Tuple[str, Dict[str, Any]]], key: str) -> str:
+        """Write ``(custom_id, body)`` pairs as JSONL, upload them and create the batch."""
+        self.state_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.input_path, "w", encoding="utf-8") as handle:
+            for custom_id, body in requests:
+                line = {"custom_id": custom_id, "method": "POST", "url": self.endpoint, "body": body}
+                handle.write(json.dumps(line, ensure_ascii=False) + "\n")
+        with open(self.input_path, "rb") as handle, metrics.track_openai("files", "n/a"):
+            input_file = self.client.files.create(file=handle, purpose="batch")
+        with metrics.track_openai("batches.create", "n/a"):
+            batch = self.client.batches.create(
+                input_file_id=input_file.id,
+                endpoint=self.endpoint,
+                completion_window="24h",
+            )
+        self.state = {
+            "key": key,
+            "batch_id": batch.id,
+            "input_file_id": input_file.id,
+            "request_count": len(requests),
+            "submitted_at": time.time(),
+        }
+        self.state_path.write_text(json.dumps(self.state, indent=2), encoding="utf-8")
+        return batch.id
+
+    def wait(
+        self,
+        poll_interval: float = DEFAULT_POLL_INTERVAL,
+        timeout: Optional[float] = None,
+    ) -> Dict[str, Dict[str, Any]]:
+        """Poll until the batch finishes; return successful bodies by custom_id."""
+        if not self.batch_id:
+            raise RuntimeError("No batch has been submitted.")
+        started = time.monotonic()
+        last_status = None
+        while True:
+            with metrics.track_openai("batches.retrieve", "n/a"):
+                batch = self.client.batches.retrieve(self.batch_id)
+            if batch.status != last_status:
+                counts = getattr(batch, "request_counts", None)
+                progress = (
+                    f" ({counts.completed}/{counts.total} done)"
+                    if counts is not None and getattr(counts, "total", None)
+                    else ""
+                )
+                print(f"Batch {self.batch_id}: {batch.status}{progress}")
+                last_status = batch.status
+            if batch.status in TERMINAL_STATUSES:
+                break
+            if timeout is not None and time.monotonic() - started > timeout:
+                raise TimeoutError(
+                    f"Batch {self.batch_id} still {batch.status}; re-run to resume polling."
+                )
+            time.sleep(poll_interval)
+
+        if batch.status != "completed":
+            self.clear()
+            raise RuntimeError(f"Batch {batch.id} ended with status {batch.status}.")
+
+        results: Dict[str, Dict[str, Any]] = {}
+        failed = 0
+        if batch.output_file_id:
+            with metrics.track_openai("files.content", "n/a"):
+                content = self.client.files.content(batch.output_file_id).text
+            for line in content.splitlines():
+                if not line.strip():
+                    continue
+                item = json.loads(line)
+                response = item.get("response") or {}
+                if item.get("error") or response.get("status_code", 200) >= 400:
+                    failed += 1
+                    continue
+                results[item["custom_id"]] = response.get("body") or {}
+        expected = self.state.get("request_count", len(results))
+        missing = expected - len(results)
+        if missing:
+            print(f"Batch {self.batch_id}: {missing} request(s) failed or missing ({failed} errored).")
+        return results
+
+    def clear(self) -> None:
+        for path in (self.state_path, self.input_path):
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+        self.state = {}
@@ -0,0 +1,19 @@
+"""Deferred construction of OpenAI clients.
+
+Importing ``openai`` pulls in pydantic and httpx and costs more than half a
+second, which every CLI run and every job the web app launches would pay
+before doing anything (``--help`` included). Scripts import ``OpenAI`` from
+here instead; the SDK is loaded when the first client is built.
+"""
+
+from typing import TYPE_CHECKING, Any
+
+if TYPE_CHECKING:
+    import openai
+
+
+def OpenAI(*args: Any, **kwargs: Any) -> "openai.OpenAI":
+    """Drop-in for ``openai.OpenAI`` that imports the SDK on first use."""
+    from openai import OpenAI as client_class
+
+    return client_class(*args, **kwargs)
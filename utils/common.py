@@ -4,8 +4,22 @@ import re
 BASE_DIR = Path(__file__).resolve().parent.parent
 MEDIA_DIR = BASE_DIR / "media"
 IMAGE_DIR = MEDIA_DIR / "images"
+AUDIO_DIR = MEDIA_DIR / "audio"
 HTML_TAG_RE = re.compile(r"<[^>]+>")
 IMG_TAG_RE = re.compile(r"<img[^>]*?>", re.IGNORECASE)
 IMG_SRC_RE = re.compile(r'<img[^>]+src=["\']([^"\'>]+)["\']', re.IGNORECASE)
 SOUND_TAG_RE = re.compile(r"\[sound:[^\]]+\]")
 NBSP_RE = re.compile(r"&nbsp;?", re.IGNORECASE)
+
+
+def normalize_json_payload(raw_output: str) -> str:
+    """Strip a Markdown code fence that models sometimes wrap JSON in."""
+    raw_output = raw_output.strip()
+    if raw_output.startswith("```"):
+        lines = raw_output.splitlines()
+        if lines:
+            lines = lines[1:]
+        if lines and lines[-1].strip() == "```":
+            lines = lines[:-1]
+        raw_output = "\n".join(lines).strip()
+    return raw_output
@@ -0,0 +1,233 @@
+"""What a run spends on OpenAI, priced from a configurable table.
+
+Every OpenAI call made through ``utils.backends`` (and the Batch API paths)
+records its usage here: text tokens from the response's ``usage``, speech
+by input characters, images by count, size and quality (or their token
+usage when the API reports it). ``spent`` is the running total that
+``scheduling.RunBudget`` checks for ``--max-cost``, and the ``project_*``
+helpers price work before it runs for ``--dry-run``.
+
+Prices are USD and only as current as this table; put corrections or new
+models in a JSON file at ``ANKI_PRICES_FILE`` (default ``prices.json`` in
+the repository root) using the same shape, e.g.
+``{"gpt-4.1-mini": {"input": 0.4, "output": 1.6}}``.
+"""
+
+from collections import defaultdict
+import json
+import math
+import os
+from pathlib import Path
+import threading
+from typing import Any, Dict, Iterable, Optional, Set, Tuple
+
+from utils import metrics
+from utils.common import BASE_DIR
+
+PRICES_FILE_ENV = "ANKI_PRICES_FILE"
+PRICES_PATH = BASE_DIR / "prices.json"
+# "input"/"output": per 1M text tokens. "characters": per 1M characters of
+# speech input. "images": per 1024x1024 image by quality.
+DEFAULT_PRICES: Dict[str, Dict[str, Any]] = {
+    "gpt-4.1": {"input": 2.00, "output": 8.00},
+    "gpt-4.1-mini": {"input": 0.40, "output": 1.60},
+    "gpt-4.1-nano": {"input": 0.10, "output": 0.40},
+    "gpt-4o": {"input": 2.50, "output": 10.00},
+    "gpt-4o-mini": {"input": 0.15, "output": 0.60},
+    # Billed per audio minute (about $0.015); this is that rate at ~14 characters a second.
+    "gpt-4o-mini-tts": {"characters": 18.00},
+    "tts-1": {"characters": 15.00},
+    "tts-1-hd": {"characters": 30.00},
+    "gpt-image-1": {
+        "input": 5.00,
+        "output": 40.00,
+        "images": {"low": 0.011, "medium": 0.042, "high": 0.167},
+    },
+    "dall-e-3": {"images": {"standard": 0.04, "hd": 0.08}},
+    "dall-e-2": {"images": {"standard": 0.02}},
+}
+# Requests sent through the Batch API are billed at half price.
+BATCH_DISCOUNT = 0.5
+# Sizes above 1024x1024 cost about this much more.
+LARGE_IMAGE_FACTOR = 1.5
+# Quality assumed when none is requested ("auto" may pick the highest).
+DEFAULT_IMAGE_QUALITY = "high"
+
+_prices: Optional[Dict[str, Dict[str, Any]]] = None
+_prices_lock = threading.Lock()
+
+
+def load_prices(path: Optional[Path] = None) -> Dict[str, Dict[str, Any]]:
+    """Default prices with any overrides from ``path`` (or ``ANKI_PRICES_FILE``) applied."""
+    prices = {model: dict(entry) for model, entry in DEFAULT_PRICES.items()}
+    path = path or Path(os.environ.get(PRICES_FILE_ENV) or PRICES_PATH)
+    if path.exists():
+        overrides = json.loads(path.read_text(encoding="utf-8"))
+        for model, entry in overrides.items():
+            prices.setdefault(model, {}).update(entry)
+    return prices
+
+
+def prices() -> Dict[str, Dict[str, Any]]:
+    global _prices
+    with _prices_lock:
+        if _prices is None:
+            _prices = load_prices()
+        return _prices
+
+
+def price_for(model: str) -> Optional[Dict[str, Any]]:
+    """The entry for ``model``, matching dated snapshots (``gpt-4.1-mini-2025-04-14``) by prefix."""
+    table = prices()
+    if model in table:
+        return table[model]
+    matches = [name for name in table if model.startswith(f"{name}-")]
+    return table[max(matches, key=len)] if matches else None
+
+
+def _field(usage: Any, *names: str) -> int:
+    for name in names:
+        value = usage.get(name) if isinstance(usage, dict) else getattr(usage, name, None)
+        if isinstance(value, (int, float)):
+            return int(value)
+    return 0
+
+
+def token_cost(model: str, input_tokens: int, output_tokens: int) -> Optional[float]:
+    entry = price_for(model)
+    if entry is None or "input" not in entry:
+        return None
+    return (input_tokens * entry["input"] + output_tokens * entry.get("output", 0.0)) / 1_000_000
+
+
+def speech_cost(model: str, characters: int) -> Optional[float]:
+    entry = price_for(model)
+    if entry is None or "characters" not in entry:
+        return None
+    return characters * entry["characters"] / 1_000_000
+
+
+def image_cost(model: str, size: Optional[str] = None, quality: Optional[str] = None) -> Optional[float]:
+    entry = price_for(model)
+    if entry is None or "images" not in entry:
+        return None
+    by_quality = entry["images"]
+    quality = quality if quality in by_quality else None
+    if quality is None:
+        quality = DEFAULT_IMAGE_QUALITY if DEFAULT_IMAGE_QUALITY in by_quality else max(by_quality, key=by_quality.get)
+    factor = LARGE_IMAGE_FACTOR if size and size not in ("auto", "1024x1024") and _pixels(size) > 1024 * 1024 else 1.0
+    return by_quality[quality] * factor
+
+
+def _pixels(size: str) -> int:
+    try:
+        width, height = (int(part) for part in size.lower().split("x"))
+    except ValueError:
+        return 0
+    return width * height
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count: about four ASCII characters per token, one per other character."""
+    ascii_chars = sum(1 for char in text if char.isascii())
+    return math.ceil(ascii_chars / 4) + (len(text) - ascii_chars)
+
+
+def format_usd(amount: float) -> str:
+    return f"${amount:.4f}" if amount < 1 else f"${amount:.2f}"
+
+
+class CostLedger:
+    """Thread-safe running total of priced usage for one run."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.total = 0.0
+        self.by_endpoint: Dict[str, float] = defaultdict(float)
+        self.usage: Dict[Tuple[str, str], float] = defaultdict(float)
+        self.unpriced: Set[str] = set()
+
+    def add(self, endpoint: str, model: str, cost: Optional[float], units: Dict[str, float]) -> None:
+        warn = False
+        with self._lock:
+            for unit, amount in units.items():
+                if amount:
+                    self.usage[(endpoint, unit)] += amount
+            if cost is None:
+                warn = model not in self.unpriced
+                self.unpriced.add(model)
+            else:
+                self.total += cost
+                self.by_endpoint[endpoint] += cost
+        for unit, amount in units.items():
+            if amount:
+                metrics.OPENAI_USAGE.inc(amount, endpoint=endpoint, model=model, unit=unit)
+        if cost:
+            metrics.OPENAI_COST.inc(cost, endpoint=endpoint, model=model)
+        if warn:
+            print(f"No price known for model '{model}'; its usage is not counted in the spend.")
+
+    def summary(self) -> str:
+        with self._lock:
+            parts = ", ".join(
+                f"{endpoint} {format_usd(amount)}" for endpoint, amount in sorted(self.by_endpoint.items())
+            )
+            total = self.total
+        return f"Estimated OpenAI spend: {format_usd(total)}" + (f" ({parts})" if parts else "")
+
+    def __bool__(self) -> bool:
+        with self._lock:
+            return bool(self.usage) or bool(self.unpriced)
+
+
+LEDGER = CostLedger()
+
+
+def spent() -> float:
+    return LEDGER.total
+
+
+def record_tokens(endpoint: str, model: str, usage: Any, *, discount: float = 1.0) -> None:
+    """Record a Responses API call from its ``usage`` (an SDK object or a batch body dict)."""
+    if usage is None:
+        return
+    input_tokens = _field(usage, "input_tokens", "prompt_tokens")
+    output_tokens = _field(usage, "output_tokens", "completion_tokens")
+    cost = token_cost(model, input_tokens, output_tokens)
+    LEDGER.add(
+        endpoint,
+        model,
+        cost * discount if cost is not None else None,
+        {"input_tokens": input_tokens, "output_tokens": output_tokens},
+    )
+
+
+def record_speech(endpoint: str, model: str, text: str) -> None:
+    LEDGER.add(endpoint, model, speech_cost(model, len(text)), {"characters": len(text)})
+
+
+def record_image(
+    endpoint: str, model: str, *, size: Optional[str] = None, quality: Optional[str] = None, usage: Any = None
+) -> None:
+    """Record one generated image, from its token usage when the API reports it."""
+    cost = None
+    if usage is not None:
+        cost = token_cost(model, _field(usage, "input_tokens"), _field(usage, "output_tokens"))
+    if cost is None:
+        cost = image_cost(model, size, quality)
+    LEDGER.add(endpoint, model, cost, {"images": 1})
+
+
+def project_text(model: str, texts: Iterable[str], *, overhead_tokens: int = 0, output_tokens: int = 0) -> Optional[float]:
+    """Projected cost of one text request per item of ``texts``."""
+    total_in = total_out = 0
+    for text in texts:
+        total_in += overhead_tokens + estimate_tokens(text)
+        total_out += output_tokens
+    return token_cost(model, total_in, total_out)
+
+
+def reset() -> None:
+    """Start a fresh ledger (tests, or a long-running process between jobs)."""
+    global LEDGER
+    LEDGER = CostLedger()
@@ -0,0 +1,59 @@
+"""Per-deck media coverage from AnkiConnect searches, without reading any note.
+
+Anki answers each search from its own database, so a deck's counts cost
+one ``findNotes`` per category and no ``notesInfo``. Every deck's searches
+go in a single ``multi`` request. A deck's counts include its subdecks,
+like the ``deck:`` search the media scripts use to pick their cards.
+
+Four searches per deck are enough: with audio, with an image, with both,
+and with neither. The total is derived from them, so no search returns
+every note in the collection.
+"""
+
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+# The scripts attach audio as ``[sound:...]`` on the front and images as
+# ``<img>`` on the front; older notes may carry an image on the back.
+HAS_AUDIO = '"Front:*[sound:*"'
+HAS_IMAGE = '("Front:*<img*" OR "Back:*<img*")'
+SEARCHES = {
+    "with_audio": HAS_AUDIO,
+    "with_images": HAS_IMAGE,
+    "with_both": f"{HAS_AUDIO} {HAS_IMAGE}",
+    "missing_both": f'-{HAS_AUDIO} -"Front:*<img*" -"Back:*<img*"',
+}
+
+
+def deck_search(deck: str) -> str:
+    """A ``deck:`` search that matches ``deck`` literally (and its subdecks)."""
+    escaped = deck.replace("\\", "\\\\").replace('"', '\\"').replace("*", "\\*").replace("_", "\\_")
+    return f'"deck:{escaped}"'
+
+
+def deck_coverage(invoke: Callable[..., Any], decks: Optional[Iterable[str]] = None) -> List[Dict[str, Any]]:
+    """Coverage counts for ``decks`` (default: every deck) in one AnkiConnect request.
+
+    ``invoke`` is the AnkiConnect helper from ``AnkiSync``.
+    """
+    names = sorted(decks if decks is not None else invoke("deckNames"))
+    # Version 6 per action, so each answer is a result/error pair.
+    actions = [
+        {"action": "findNotes", "params": {"query": f"{deck_search(deck)} {search}"}, "version": 6}
+        for deck in names
+        for search in SEARCHES.values()
+    ]
+    answers = invoke("multi", actions=actions) if actions else []
+    results = []
+    for position, deck in enumerate(names):
+        counts: Dict[str, Any] = {"deck": deck}
+        for offset, key in enumerate(SEARCHES):
+            answer = answers[position * len(SEARCHES) + offset]
+            if answer.get("error") is not None:
+                raise RuntimeError(f"AnkiConnect search failed for deck '{deck}': {answer['error']}")
+            counts[key] = len(answer["result"])
+        counts["total"] = counts["with_audio"] + counts["with_images"] - counts["with_both"] + counts["missing_both"]
+        counts["missing_audio"] = counts["total"] - counts["with_audio"]
+        counts["missing_images"] = counts["total"] - counts["with_images"]
+        del counts["with_both"]
+        results.append(counts)
+    return results
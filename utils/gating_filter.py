@@ -0,0 +1,181 @@
+"""Local pre-filter that answers easy gating decisions without an API call.
+
+Every remote gating decision is appended to ``media/gating_history.jsonl``.
+At the start of a run ``GatingPrefilter`` trains a small naive Bayes model on
+that history and combines it with hand-written rules for cards that are
+plainly not illustratable (particles, function words, long sentences). Only
+answers at or above the confidence threshold are used; everything else goes
+to the remote gating prompt as before.
+"""
+
+from collections import Counter
+import json
+import math
+from pathlib import Path
+import re
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from utils import metrics
+from utils.common import MEDIA_DIR
+
+HISTORY_PATH = MEDIA_DIR / "gating_history.jsonl"
+DEFAULT_THRESHOLD = 0.9
+MIN_TRAINING_EXAMPLES = 30
+RULE_CONFIDENCE = 0.97
+
+WORD_RE = re.compile(r"[a-z']+")
+GRAMMAR_TERMS = {
+    "particle", "suffix", "prefix", "ending", "marker", "conjugation", "grammar",
+    "honorific", "counter", "copula", "auxiliary", "conjunction", "postposition",
+}
+FUNCTION_WORDS = {
+    "a", "an", "the", "and", "but", "or", "so", "if", "then", "because", "also", "too",
+    "very", "to", "of", "in", "on", "at", "by", "for", "with", "from", "about", "as",
+    "is", "am", "are", "was", "were", "be", "been", "do", "does", "did", "not", "no",
+    "yes", "this", "that", "these", "those", "it", "he", "she", "they", "we", "you",
+    "i", "me", "my", "your", "his", "her", "its", "our", "their", "which", "who",
+    "what", "when", "where", "why", "how", "however", "therefore", "although", "still",
+    "already", "yet", "just", "only", "even", "maybe", "please",
+}
+
+_history_lock = threading.Lock()
+_history_path: Optional[Path] = None
+
+
+def enable_history(path: Optional[Path] = HISTORY_PATH) -> None:
+    """Start (or, with ``None``, stop) recording remote decisions for training."""
+    global _history_path
+    _history_path = path
+
+
+def record_decisions(decisions: Iterable[Tuple[str, str, bool]]) -> None:
+    """Append remote ``(front, back, decision)`` results to the training history."""
+    path = _history_path
+    if path is None:
+        return
+    lines = [
+        json.dumps({"front": front, "back": back, "decision": bool(decision)}, ensure_ascii=False)
+        for front, back, decision in decisions
+    ]
+    if not lines:
+        return
+    with _history_lock:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "a", encoding="utf-8") as handle:
+            handle.write("\n".join(lines) + "\n")
+
+
+def load_history(path: Path = HISTORY_PATH) -> List[Tuple[str, str, bool]]:
+    if not path.exists():
+        return []
+    latest: Dict[Tuple[str, str], bool] = {}
+    with open(path, encoding="utf-8") as handle:
+        for line in handle:
+            try:
+                item = json.loads(line)
+                latest[(item["front"], item["back"])] = bool(item["decision"])
+            except (ValueError, KeyError, TypeError):
+                continue
+    return [(front, back, decision) for (front, back), decision in latest.items()]
+
+
+def rule_decision(front: str, back: str) -> Optional[bool]:
+    """Return False for cards the rules are sure about, otherwise None."""
+    words = WORD_RE.findall(back.lower())
+    if not words:
+        return None
+    if len(words) >= 8 or (len(words) >= 5 and back.rstrip()[-1:] in ".?!"):
+        return False
+    if GRAMMAR_TERMS.intersection(words):
+        return False
+    if all(word in FUNCTION_WORDS for word in words):
+        return False
+    return None
+
+
+def features(front: str, back: str) -> List[str]:
+    words = WORD_RE.findall(back.lower())
+    count = len(words)
+    bucket = "1" if count <= 1 else "2-3" if count <= 3 else "4-7" if count <= 7 else "8+"
+    result = [f"w:{word}" for word in words]
+    result.append(f"len:{bucket}")
+    result.append(f"flen:{min(len(front.strip()) // 4, 5)}")
+    if any(char in back for char in ".?!,;"):
+        result.append("punct")
+    if "(" in back or "/" in back:
+        result.append("alt")
+    return result
+
+
+class NaiveBayesGate:
+    """Multinomial naive Bayes with Laplace smoothing over ``features``."""
+
+    def __init__(self) -> None:
+        self.class_counts = {True: 0, False: 0}
+        self.feature_counts: Dict[bool, Counter] = {True: Counter(), False: Counter()}
+        self.totals = {True: 0, False: 0}
+        self.vocabulary: set = set()
+
+    @property
+    def trained(self) -> bool:
+        return (
+            sum(self.class_counts.values()) >= MIN_TRAINING_EXAMPLES
+            and all(self.class_counts.values())
+        )
+
+    def fit(self, examples: Iterable[Tuple[str, str, bool]]) -> "NaiveBayesGate":
+        for front, back, label in examples:
+            tokens = features(front, back)
+            self.class_counts[label] += 1
+            self.feature_counts[label].update(tokens)
+            self.totals[label] += len(tokens)
+            self.vocabulary.update(tokens)
+        return self
+
+    def probability_true(self, front: str, back: str) -> float:
+        total = sum(self.class_counts.values())
+        vocab_size = len(self.vocabulary) + 1
+        scores = {}
+        for label in (True, False):
+            score = math.log(self.class_counts[label] / total)
+            denominator = self.totals[label] + vocab_size
+            for token in features(front, back):
+                score += math.log((self.feature_counts[label][token] + 1) / denominator)
+            scores[label] = score
+        margin = scores[False] - scores[True]
+        if margin > 50:
+            return 0.0
+        return 1.0 / (1.0 + math.exp(margin))
+
+
+class GatingPrefilter:
+    def __init__(self, threshold: float = DEFAULT_THRESHOLD, history_path: Path = HISTORY_PATH) -> None:
+        self.threshold = threshold
+        self.model = NaiveBayesGate().fit(load_history(history_path))
+        self._lock = threading.Lock()
+        self.stats = {"rules": 0, "model": 0, "deferred": 0}
+
+    def _count(self, key: str) -> None:
+        with self._lock:
+            self.stats[key] += 1
+        metrics.PREFILTER_DECISIONS.inc(source=key)
+
+    def decide(self, front: str, back: str) -> Optional[bool]:
+        """Return a confident local decision, or None to defer to the API."""
+        if RULE_CONFIDENCE >= self.threshold:
+            decision = rule_decision(front, back)
+            if decision is not None:
+                self._count("rules")
+                return decision
+        if self.model.trained:
+            probability = self.model.probability_true(front, back)
+            if max(probability, 1.0 - probability) >= self.threshold:
+                self._count("model")
+                return probability >= 0.5
+        self._count("deferred")
+        return None
+
+    @property
+    def avoided(self) -> int:
+        return self.stats["rules"] + self.stats["model"]
@@ -0,0 +1,182 @@
+"""Hedge slow idempotent calls: send a duplicate when the first one runs late.
+
+A call that has not answered within its operation's recent p95 latency
+gets a second, identical request, and whichever answers first is used.
+This trims the few stragglers that otherwise hold up the end of a deck.
+Only calls that are safe to repeat are hedged (speech, gating).
+
+Python threads cannot be interrupted, so the losing request is abandoned
+rather than aborted: it runs to completion in the background, its result
+goes to ``discard`` (e.g. to delete its file) and it is still billed.
+``max_extra`` caps hedges as a fraction of all calls, so an API that is
+slow across the board cannot double the spend.
+
+Hedging is off until ``enable`` is called (``--hedge`` on the scripts).
+"""
+
+import argparse
+from collections import defaultdict, deque
+import math
+import os
+import queue
+import threading
+import time
+from typing import Any, Callable, Deque, Dict, Optional, TypeVar
+
+from utils import metrics
+
+T = TypeVar("T")
+
+DEFAULT_MAX_EXTRA_PERCENT = 5.0
+QUANTILE = 0.95
+# Latencies kept per operation; old samples age out as conditions change.
+WINDOW = 200
+# Successful calls seen before an operation is hedged at all.
+MIN_SAMPLES = 20
+# Never hedge sooner than this, however fast the operation usually is.
+MIN_DELAY = 0.05
+
+
+class Hedger:
+    def __init__(
+        self,
+        max_extra: float = DEFAULT_MAX_EXTRA_PERCENT / 100,
+        quantile: float = QUANTILE,
+        window: int = WINDOW,
+        min_samples: int = MIN_SAMPLES,
+        min_delay: float = MIN_DELAY,
+    ) -> None:
+        self.max_extra = max(0.0, max_extra)
+        self.quantile = quantile
+        self.min_samples = max(1, min_samples)
+        self.min_delay = min_delay
+        self._lock = threading.Lock()
+        self._latencies: Dict[str, Deque[float]] = defaultdict(lambda: deque(maxlen=window))
+        self.calls: Dict[str, int] = defaultdict(int)
+        self.issued: Dict[str, int] = defaultdict(int)
+        self.won: Dict[str, int] = defaultdict(int)
+
+    def observe(self, operation: str, seconds: float) -> None:
+        with self._lock:
+            self._latencies[operation].append(seconds)
+
+    def threshold(self, operation: str) -> Optional[float]:
+        """Seconds after which a call is hedged; None until enough calls were seen."""
+        with self._lock:
+            samples = sorted(self._latencies[operation])
+        if len(samples) < self.min_samples:
+            return None
+        return max(self.min_delay, samples[math.ceil(self.quantile * len(samples)) - 1])
+
+    def _reserve(self, operation: str) -> bool:
+        """Count a hedge if it stays within ``max_extra`` of all calls so far."""
+        with self._lock:
+            if sum(self.issued.values()) + 1 > self.max_extra * sum(self.calls.values()):
+                return False
+            self.issued[operation] += 1
+        metrics.HEDGED_REQUESTS.inc(operation=operation, outcome="issued")
+        return True
+
+    def call(self, operation: str, fn: Callable[[], T], discard: Optional[Callable[[T], Any]] = None) -> T:
+        """Run ``fn``, starting a duplicate if it outlasts the threshold; return the first answer.
+
+        Errors only count once both requests have failed. The late success
+        of a losing request is passed to ``discard``.
+        """
+        with self._lock:
+            self.calls[operation] += 1
+        threshold = self.threshold(operation)
+        if threshold is None:
+            started = time.perf_counter()
+            result = fn()
+            self.observe(operation, time.perf_counter() - started)
+            return result
+
+        answers: "queue.Queue[tuple]" = queue.Queue()
+        winner: Dict[str, bool] = {}
+        winner_lock = threading.Lock()
+
+        def attempt(hedge: bool) -> None:
+            started = time.perf_counter()
+            try:
+                result = fn()
+            except BaseException as exc:
+                answers.put((hedge, False, exc))
+                return
+            self.observe(operation, time.perf_counter() - started)
+            with winner_lock:
+                first = not winner
+                winner.setdefault("hedge", hedge)
+            if first:
+                answers.put((hedge, True, result))
+            elif discard is not None:
+                discard(result)
+
+        def start(hedge: bool) -> None:
+            name = f"hedge_{operation}" if hedge else f"hedged_{operation}"
+            threading.Thread(target=attempt, args=(hedge,), name=name, daemon=True).start()
+
+        start(False)
+        pending, hedged = 1, False
+        error: Optional[BaseException] = None
+        while True:
+            try:
+                hedge, ok, value = answers.get(timeout=None if hedged else threshold)
+            except queue.Empty:
+                hedged = True
+                if self._reserve(operation):
+                    start(True)
+                    pending += 1
+                continue
+            pending -= 1
+            if ok:
+                if hedge:
+                    with self._lock:
+                        self.won[operation] += 1
+                    metrics.HEDGED_REQUESTS.inc(operation=operation, outcome="won")
+                return value
+            error = error or value
+            if not pending:
+                raise error
+
+    def summary(self) -> str:
+        with self._lock:
+            calls, issued, won = sum(self.calls.values()), sum(self.issued.values()), sum(self.won.values())
+        share = f" ({issued / calls:.1%})" if calls else ""
+        return f"Hedged {issued} of {calls} call(s){share}; the duplicate answered first {won} time(s)."
+
+
+_hedger: Optional[Hedger] = None
+
+
+def enable(max_extra: Optional[float] = DEFAULT_MAX_EXTRA_PERCENT / 100) -> Optional[Hedger]:
+    """Start (or, with ``None``, stop) hedging, spending at most ``max_extra`` extra requests per call."""
+    global _hedger
+    _hedger = Hedger(max_extra) if max_extra is not None else None
+    return _hedger
+
+
+def call(operation: str, fn: Callable[[], T], discard: Optional[Callable[[T], Any]] = None) -> T:
+    hedger = _hedger
+    return fn() if hedger is None else hedger.call(operation, fn, discard)
+
+
+def add_hedge_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument(
+        "--hedge",
+        action="store_true",
+        help=(
+            "Send a duplicate of a speech or gating request that runs past its recent p95 "
+            "latency and use whichever answers first."
+        ),
+    )
+    parser.add_argument(
+        "--hedge-max-extra",
+        type=float,
+        default=float(os.environ.get("ANKI_HEDGE_MAX_EXTRA", str(DEFAULT_MAX_EXTRA_PERCENT))),
+        help="Most duplicate requests --hedge may send, as a percentage of all calls (default: %(default)s).",
+    )
+
+
+def enable_from_args(args: argparse.Namespace) -> Optional[Hedger]:
+    return enable(args.hedge_max_extra / 100 if args.hedge else None)
@@ -0,0 +1,98 @@
+"""Detect new or changed files in a drop folder once they stop changing.
+
+``HotFolder.scan`` polls one directory (not its subdirectories). A file is
+ready when its size and modification time have not changed for
+``settle_seconds``, so a PDF that is still being copied or uploaded is left
+alone until the writer is done. Each ready file is claimed with the
+signature it had, and it is not offered again until its contents change.
+Polling keeps this portable (network shares, Docker bind mounts) and free
+of extra dependencies.
+"""
+
+from pathlib import Path
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Tuple
+
+DEFAULT_SETTLE_SECONDS = 5.0
+DEFAULT_POLL_SECONDS = 2.0
+# Names browsers and copy tools give a file while it is still being written.
+PARTIAL_SUFFIXES = (".part", ".partial", ".tmp", ".crdownload", ".download")
+
+Signature = Tuple[int, int]
+
+
+class HotFolder:
+    def __init__(
+        self,
+        directory: Path,
+        suffixes: Iterable[str] = (".pdf",),
+        settle_seconds: float = DEFAULT_SETTLE_SECONDS,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.directory = Path(directory)
+        self.suffixes = tuple(suffix.lower() for suffix in suffixes)
+        self.settle_seconds = settle_seconds
+        self._clock = clock
+        self._lock = threading.Lock()
+        # Unclaimed files: last signature seen and when it was first seen.
+        self._pending: Dict[Path, Tuple[Signature, float]] = {}
+        self._claimed: Dict[Path, Signature] = {}
+
+    def _candidates(self) -> List[Path]:
+        try:
+            entries = list(self.directory.iterdir())
+        except FileNotFoundError:
+            return []
+        return [
+            path
+            for path in entries
+            if not path.name.startswith((".", "~"))
+            and path.suffix.lower() in self.suffixes
+            and not path.name.lower().endswith(PARTIAL_SUFFIXES)
+        ]
+
+    def scan(self) -> List[Path]:
+        """Claim and return the files that have settled since they were last handled."""
+        now = self._clock()
+        ready = []
+        present = set()
+        with self._lock:
+            for path in sorted(self._candidates()):
+                try:
+                    stat = path.stat()
+                except FileNotFoundError:
+                    continue
+                if not path.is_file():
+                    continue
+                present.add(path)
+                signature = (stat.st_size, stat.st_mtime_ns)
+                if self._claimed.get(path) == signature:
+                    continue
+                seen = self._pending.get(path)
+                if seen is None or seen[0] != signature:
+                    self._pending[path] = (signature, now)
+                    continue
+                if signature[0] > 0 and now - seen[1] >= self.settle_seconds:
+                    del self._pending[path]
+                    self._claimed[path] = signature
+                    ready.append(path)
+            # Archived or deleted files are forgotten, so a file dropped again under
+            # the same name counts as new.
+            for table in (self._pending, self._claimed):
+                for path in [path for path in table if path not in present]:
+                    del table[path]
+        return ready
+
+    def release(self, path: Path) -> None:
+        """Give a claimed file back so the next scan offers it again (e.g. the queue was full)."""
+        with self._lock:
+            signature = self._claimed.pop(path, None)
+            if signature is not None:
+                self._pending[path] = (signature, self._clock() - self.settle_seconds)
+
+    @property
+    def pending(self) -> int:
+        """Files seen but not yet settled or claimed."""
+        with self._lock:
+            return len(self._pending)
@@ -0,0 +1,166 @@
+"""Stale-while-revalidate cache for the web UI's model and deck listings.
+
+Entries are kept in memory and mirrored to ``media/listing_cache.json`` so a
+restarted server can answer straight away. A fresh entry is returned as is;
+an expired one is still returned, and a single background refresh replaces
+it. Only a key that has never been loaded makes the caller wait.
+
+Every key carries a version that ``invalidate`` bumps, so a load that
+started before the invalidation cannot store its (possibly outdated)
+result over the reload that replaces it.
+"""
+
+from concurrent.futures import Future, ThreadPoolExecutor
+import json
+import os
+from pathlib import Path
+import sys
+import threading
+import time
+from typing import Any, Callable, Collection, Dict, Optional, Tuple
+
+from utils import metrics
+from utils.common import MEDIA_DIR
+
+CACHE_PATH = MEDIA_DIR / "listing_cache.json"
+DEFAULT_TTL = 300.0
+
+
+class ListingCache:
+    def __init__(self, path: Optional[Path] = CACHE_PATH, refresh_workers: int = 2) -> None:
+        self.path = Path(path) if path is not None else None
+        # Re-entrant: a refresh that finishes instantly runs its callback under the lock.
+        self._lock = threading.RLock()
+        self._entries: Optional[Dict[str, Tuple[Any, float]]] = None
+        self._loaders: Dict[str, Callable[[], Any]] = {}
+        self._inflight: Dict[str, Future] = {}
+        self._versions: Dict[str, int] = {}
+        self._executor = ThreadPoolExecutor(max_workers=refresh_workers, thread_name_prefix="listing-refresh")
+
+    def _load_disk(self) -> Dict[str, Tuple[Any, float]]:
+        if self.path is None or not self.path.exists():
+            return {}
+        try:
+            with open(self.path, encoding="utf-8") as handle:
+                raw = json.load(handle)
+            return {key: (item["value"], float(item["stored_at"])) for key, item in raw.items()}
+        except (OSError, ValueError, KeyError, TypeError, AttributeError):
+            return {}
+
+    def _entries_locked(self) -> Dict[str, Tuple[Any, float]]:
+        if self._entries is None:
+            self._entries = self._load_disk()
+        return self._entries
+
+    def _persist_locked(self) -> None:
+        if self.path is None:
+            return
+        payload = {
+            key: {"value": value, "stored_at": stored_at}
+            for key, (value, stored_at) in self._entries_locked().items()
+        }
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            partial = self.path.with_name(f".{self.path.name}.partial")
+            with open(partial, "w", encoding="utf-8") as handle:
+                json.dump(payload, handle, ensure_ascii=False)
+            os.replace(partial, self.path)
+        except OSError as exc:
+            print(f"Could not write listing cache {self.path}: {exc}", file=sys.stderr)
+
+    def _run_loader(self, key: str, loader: Callable[[], Any], version: int) -> Any:
+        value = loader()
+        with self._lock:
+            # Superseded by an invalidation while loading: leave the entry to the newer load.
+            if self._versions.get(key, 0) == version:
+                self._entries_locked()[key] = (value, time.time())
+                self._persist_locked()
+        return value
+
+    def _refresh_locked(self, key: str, restart: bool = False) -> Future:
+        """Start (or join) the single in-flight load for ``key``; call with the lock held.
+
+        ``restart`` starts a new load even if one is in flight; the older one
+        still finishes but no longer writes to the entry.
+        """
+        future = None if restart else self._inflight.get(key)
+        if future is None:
+            if restart:
+                self._versions[key] = self._versions.get(key, 0) + 1
+            future = self._executor.submit(self._run_loader, key, self._loaders[key], self._versions.get(key, 0))
+            self._inflight[key] = future
+            future.add_done_callback(lambda done, key=key: self._finish(key, done))
+        return future
+
+    def _finish(self, key: str, future: Future) -> None:
+        with self._lock:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+        exc = future.exception()
+        if exc is not None:
+            print(f"Refreshing {key!r} failed: {exc}", file=sys.stderr)
+
+    def get(self, key: str, loader: Callable[[], Any], ttl: float = DEFAULT_TTL) -> Any:
+        """Return the cached value for ``key``, refreshing it in the background once stale.
+
+        ``loader`` must return something JSON-serialisable. Errors from a
+        synchronous first load propagate; errors from background refreshes
+        are logged and the stale value is kept.
+        """
+        with self._lock:
+            self._loaders[key] = loader
+            entry = self._entries_locked().get(key)
+            if entry is None:
+                result = "miss"
+                pending = self._refresh_locked(key)
+            elif time.time() - entry[1] < ttl:
+                result = "hit"
+            else:
+                result = "stale"
+                self._refresh_locked(key)
+        metrics.CACHE_LOOKUPS.inc(cache=key.split(":", 1)[0], result=result)
+        if entry is None:
+            return pending.result()
+        return entry[0]
+
+    def warm(self, key: str, loader: Callable[[], Any]) -> None:
+        """Load ``key`` in the background unless a value is already cached."""
+        with self._lock:
+            self._loaders[key] = loader
+            if key not in self._entries_locked():
+                self._refresh_locked(key)
+
+    def invalidate(self, *keys: str) -> None:
+        """Drop ``keys`` and reload those with a known loader in the background.
+
+        A load already in flight may predate whatever change prompted this, so
+        a new one always starts and the old one's result is discarded. A
+        ``get`` that arrives before the reload finishes waits for it rather
+        than starting another request.
+        """
+        with self._lock:
+            entries = self._entries_locked()
+            for key in keys:
+                entries.pop(key, None)
+            self._persist_locked()
+            for key in keys:
+                if key in self._loaders:
+                    self._refresh_locked(key, restart=True)
+                else:
+                    self._versions[key] = self._versions.get(key, 0) + 1
+
+    def prune(self, prefix: str, keep: Collection[str]) -> None:
+        """Forget every ``prefix`` key whose remainder is not in ``keep``."""
+        with self._lock:
+            entries = self._entries_locked()
+            stale = [
+                key
+                for key in set(entries) | set(self._loaders)
+                if key.startswith(prefix) and key[len(prefix) :] not in keep
+            ]
+            for key in stale:
+                entries.pop(key, None)
+                self._loaders.pop(key, None)
+                self._versions[key] = self._versions.get(key, 0) + 1
+            if stale:
+                self._persist_locked()
@@ -0,0 +1,249 @@
+"""SQLite index of the media files the generators have written.
+
+Each row maps a file under ``media/`` to the note it was made for, with its
+content hash, size and the generation parameters. The gallery answers from
+here instead of probing the filesystem, and ``AnkiMediaIndex.py gc`` uses
+it to find files whose notes no longer exist.
+
+A second table keeps one input fingerprint per note and media kind, so the
+generators can skip notes whose text and settings have not changed.
+"""
+
+import hashlib
+import json
+import re
+from pathlib import Path
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional
+
+from utils.common import AUDIO_DIR, HTML_TAG_RE, IMAGE_DIR, MEDIA_DIR, NBSP_RE, SOUND_TAG_RE
+
+INDEX_PATH = MEDIA_DIR / "media_index.sqlite3"
+MEDIA_DIRS = {"image": IMAGE_DIR, "audio": AUDIO_DIR}
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS media (
+    kind TEXT NOT NULL,
+    filename TEXT NOT NULL,
+    note_id INTEGER,
+    sha256 TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    params TEXT NOT NULL DEFAULT '{}',
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (kind, filename)
+);
+CREATE INDEX IF NOT EXISTS media_note ON media (note_id, kind);
+CREATE TABLE IF NOT EXISTS fingerprints (
+    kind TEXT NOT NULL,
+    note_id INTEGER NOT NULL,
+    fingerprint TEXT NOT NULL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (kind, note_id)
+);
+"""
+# SQLite's default limit on bound parameters is 999 on older builds.
+QUERY_CHUNK = 500
+
+
+def file_sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as handle:
+        for block in iter(lambda: handle.read(1 << 16), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+# Tags (images included), sound tags and ``&nbsp;``, replaced in one pass.
+MARKUP_RE = re.compile(f"{HTML_TAG_RE.pattern}|{SOUND_TAG_RE.pattern}|(?i:{NBSP_RE.pattern})")
+
+
+# Marks a stored fingerprint whose image is a low-quality draft.
+DRAFT_PREFIX = "draft:"
+
+
+def media_free_text(html: str) -> str:
+    """Field text without the media we attach ourselves, tags or extra whitespace.
+
+    Attaching audio or an image must not change a note's fingerprint.
+    """
+    return " ".join(MARKUP_RE.sub(" ", html or "").split())
+
+
+def fingerprint(*parts: str) -> str:
+    return hashlib.sha256(json.dumps(parts, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+def draft_fingerprint(value: str) -> str:
+    """The fingerprint stored for a draft image, so later runs upgrade it instead of keeping it."""
+    return f"{DRAFT_PREFIX}{value}"
+
+
+def note_id_from_filename(filename: str) -> Optional[int]:
+    """Generators name files ``{note_id}.ext``; older runs used ``{note_id}-suffix.ext``."""
+    stem = Path(filename).stem.split("-", 1)[0]
+    return int(stem) if stem.isdigit() else None
+
+
+class MediaIndex:
+    def __init__(self, path: Path = INDEX_PATH) -> None:
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), timeout=30, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(SCHEMA)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def record(
+        self,
+        kind: str,
+        note_id: Optional[int],
+        path: Path,
+        params: Optional[Dict[str, Any]] = None,
+    ) -> None:
+        """Insert or replace the row for a file that was just written."""
+        path = Path(path)
+        row = (
+            kind,
+            path.name,
+            note_id,
+            file_sha256(path),
+            path.stat().st_size,
+            json.dumps(params or {}, sort_keys=True, ensure_ascii=False),
+            time.time(),
+        )
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO media (kind, filename, note_id, sha256, size, params, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                row,
+            )
+
+    def lookup(self, note_ids: Iterable[int], kind: str) -> Dict[int, Dict[str, Any]]:
+        """Return the newest row per note ID for ``kind``."""
+        ids = list(note_ids)
+        found: Dict[int, Dict[str, Any]] = {}
+        with self._lock:
+            for start in range(0, len(ids), QUERY_CHUNK):
+                chunk = ids[start:start + QUERY_CHUNK]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT * FROM media WHERE kind = ? AND note_id IN ({placeholders}) "
+                    "ORDER BY updated_at",
+                    [kind, *chunk],
+                ).fetchall()
+                for row in rows:
+                    found[row["note_id"]] = dict(row)
+        return found
+
+    def by_filenames(self, filenames: Iterable[str], kind: str) -> Dict[str, Dict[str, Any]]:
+        names = list(dict.fromkeys(filenames))
+        found: Dict[str, Dict[str, Any]] = {}
+        with self._lock:
+            for start in range(0, len(names), QUERY_CHUNK):
+                chunk = names[start:start + QUERY_CHUNK]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT * FROM media WHERE kind = ? AND filename IN ({placeholders})",
+                    [kind, *chunk],
+                ).fetchall()
+                found.update((row["filename"], dict(row)) for row in rows)
+        return found
+
+    def rows(self, kind: Optional[str] = None) -> List[Dict[str, Any]]:
+        query = "SELECT * FROM media"
+        args: List[Any] = []
+        if kind:
+            query += " WHERE kind = ?"
+            args.append(kind)
+        with self._lock:
+            return [dict(row) for row in self._conn.execute(query, args).fetchall()]
+
+    def remove(self, kind: str, filenames: Iterable[str]) -> None:
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "DELETE FROM media WHERE kind = ? AND filename = ?",
+                [(kind, name) for name in filenames],
+            )
+
+    def fingerprints(self, kind: str, note_ids: Iterable[int]) -> Dict[int, str]:
+        ids = list(note_ids)
+        found: Dict[int, str] = {}
+        with self._lock:
+            for start in range(0, len(ids), QUERY_CHUNK):
+                chunk = ids[start:start + QUERY_CHUNK]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT note_id, fingerprint FROM fingerprints WHERE kind = ? AND note_id IN ({placeholders})",
+                    [kind, *chunk],
+                ).fetchall()
+                found.update((row["note_id"], row["fingerprint"]) for row in rows)
+        return found
+
+    def set_fingerprint(self, kind: str, note_id: int, value: str) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO fingerprints (kind, note_id, fingerprint, updated_at) VALUES (?, ?, ?, ?)",
+                (kind, note_id, value, time.time()),
+            )
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM media").fetchone()[0]
+
+    def rebuild(self, media_dirs: Optional[Dict[str, Path]] = None) -> int:
+        """Index files already on disk that have no row yet; return how many were added.
+
+        Rows whose file has disappeared are dropped at the same time.
+        """
+        media_dirs = media_dirs or MEDIA_DIRS
+        added = 0
+        for kind, directory in media_dirs.items():
+            known = {row["filename"] for row in self.rows(kind)}
+            present = set()
+            if directory.exists():
+                for path in directory.iterdir():
+                    if not path.is_file() or path.name.startswith("."):
+                        continue
+                    present.add(path.name)
+                    if path.name not in known:
+                        self.record(kind, note_id_from_filename(path.name), path)
+                        added += 1
+            self.remove(kind, known - present)
+        return added
+
+
+_default_index: Optional[MediaIndex] = None
+_default_lock = threading.Lock()
+
+
+def enable(path: Optional[Path] = INDEX_PATH) -> Optional[MediaIndex]:
+    """Open (or, with ``None``, close) the index that ``record`` writes to."""
+    global _default_index
+    with _default_lock:
+        if _default_index is not None:
+            _default_index.close()
+            _default_index = None
+        if path is not None:
+            _default_index = MediaIndex(path)
+        return _default_index
+
+
+def record(kind: str, note_id: Optional[int], path: Path, params: Optional[Dict[str, Any]] = None) -> None:
+    """Record a written file in the enabled index; a no-op when none is open."""
+    index = _default_index
+    if index is not None:
+        index.record(kind, note_id, path, params)
+
+
+def remove(kind: str, filenames: Iterable[str]) -> None:
+    """Drop rows for deleted files from the enabled index; a no-op when none is open."""
+    index = _default_index
+    if index is not None:
+        index.remove(kind, filenames)
@@ -0,0 +1,341 @@
+"""In-process counters, gauges and histograms with Prometheus text export.
+
+The CLI scripts report into the module-level ``REGISTRY`` and dump a JSON
+summary when they finish; the Flask app serves the same registry at
+``/metrics`` and folds in the summaries written by the jobs it launches.
+"""
+
+from contextlib import contextmanager
+import json
+import os
+from pathlib import Path
+import sys
+import threading
+import time
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+DEFAULT_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0)
+METRICS_FILE_ENV = "ANKI_METRICS_FILE"
+
+
+def _label_key(labels: Dict[str, Any]) -> LabelKey:
+    return tuple(sorted((str(key), str(value)) for key, value in labels.items()))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(key: LabelKey, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(key)
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _format_number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str) -> None:
+        self.name = name
+        self.help = help_text
+        self._lock = threading.Lock()
+        self._values: Dict[LabelKey, Any] = {}
+
+    def clear(self) -> None:
+        with self._lock:
+            self._values.clear()
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1.0, **labels: Any) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: Any) -> float:
+        with self._lock:
+            return self._values.get(_label_key(labels), 0.0)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(key)} {_format_number(value)}" for key, value in items]
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [{"labels": dict(key), "value": value} for key, value in items]
+
+    def merge(self, entries: List[Dict[str, Any]]) -> None:
+        for entry in entries:
+            self.inc(entry.get("value", 0.0), **entry.get("labels", {}))
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float, **labels: Any) -> None:
+        with self._lock:
+            self._values[_label_key(labels)] = float(value)
+
+    def dec(self, amount: float = 1.0, **labels: Any) -> None:
+        self.inc(-amount, **labels)
+
+    def merge(self, entries: List[Dict[str, Any]]) -> None:
+        # Gauges describe the reporting process; a finished job has nothing to add.
+        return
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> None:
+        super().__init__(name, help_text)
+        self.buckets = tuple(sorted(buckets))
+
+    def _series(self, key: LabelKey) -> Dict[str, Any]:
+        series = self._values.get(key)
+        if series is None:
+            series = {"counts": [0] * len(self.buckets), "count": 0, "sum": 0.0}
+            self._values[key] = series
+        return series
+
+    def observe(self, value: float, **labels: Any) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            series = self._series(key)
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series["counts"][index] += 1
+                    break
+            series["count"] += 1
+            series["sum"] += value
+
+    @contextmanager
+    def time(self, **labels: Any) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def count(self, **labels: Any) -> int:
+        with self._lock:
+            series = self._values.get(_label_key(labels))
+            return series["count"] if series else 0
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted((key, dict(series, counts=list(series["counts"]))) for key, series in self._values.items())
+        lines: List[str] = []
+        for key, series in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, series["counts"]):
+                cumulative += bucket_count
+                lines.append(
+                    f"{self.name}_bucket{_format_labels(key, ('le', _format_number(bound)))} {cumulative}"
+                )
+            lines.append(f"{self.name}_bucket{_format_labels(key, ('le', '+Inf'))} {series['count']}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {_format_number(series['sum'])}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {series['count']}")
+        return lines
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            items = sorted(self._values.items())
+            return [
+                {
+                    "labels": dict(key),
+                    "count": series["count"],
+                    "sum": round(series["sum"], 6),
+                    "mean": round(series["sum"] / series["count"], 6) if series["count"] else 0.0,
+                    "buckets": {
+                        _format_number(bound): bucket_count
+                        for bound, bucket_count in zip(self.buckets, series["counts"])
+                    },
+                }
+                for key, series in items
+            ]
+
+    def merge(self, entries: List[Dict[str, Any]]) -> None:
+        for entry in entries:
+            key = _label_key(entry.get("labels", {}))
+            buckets = entry.get("buckets", {})
+            with self._lock:
+                series = self._series(key)
+                for index, bound in enumerate(self.buckets):
+                    series["counts"][index] += int(buckets.get(_format_number(bound), 0))
+                series["count"] += int(entry.get("count", 0))
+                series["sum"] += float(entry.get("sum", 0.0))
+
+
+class Registry:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._metrics: Dict[str, _Metric] = {}
+
+    def _get_or_create(self, cls: type, name: str, help_text: str, **kwargs: Any) -> Any:
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = cls(name, help_text, **kwargs)
+                self._metrics[name] = metric
+            elif type(metric) is not cls:
+                raise ValueError(f"Metric {name} is already registered as a {metric.kind}.")
+            return metric
+
+    def counter(self, name: str, help_text: str) -> Counter:
+        return self._get_or_create(Counter, name, help_text)
+
+    def gauge(self, name: str, help_text: str) -> Gauge:
+        return self._get_or_create(Gauge, name, help_text)
+
+    def histogram(
+        self, name: str, help_text: str, buckets: Tuple[float, ...] = DEFAULT_BUCKETS
+    ) -> Histogram:
+        return self._get_or_create(Histogram, name, help_text, buckets=buckets)
+
+    def _sorted_metrics(self) -> List[_Metric]:
+        with self._lock:
+            return [self._metrics[name] for name in sorted(self._metrics)]
+
+    def render_prometheus(self) -> str:
+        lines: List[str] = []
+        for metric in self._sorted_metrics():
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def summary(self) -> Dict[str, Dict[str, Any]]:
+        result: Dict[str, Dict[str, Any]] = {"counter": {}, "gauge": {}, "histogram": {}}
+        for metric in self._sorted_metrics():
+            entries = metric.snapshot()
+            if entries:
+                result[metric.kind][metric.name] = entries
+        return result
+
+    def merge(self, summary: Dict[str, Dict[str, Any]]) -> None:
+        """Fold a summary produced by another process into this registry."""
+        with self._lock:
+            known = dict(self._metrics)
+        for kind in ("counter", "histogram"):
+            for name, entries in summary.get(kind, {}).items():
+                metric = known.get(name)
+                if metric is not None and metric.kind == kind:
+                    metric.merge(entries)
+
+    def reset(self) -> None:
+        for metric in self._sorted_metrics():
+            metric.clear()
+
+
+REGISTRY = Registry()
+
+OPENAI_REQUESTS = REGISTRY.counter(
+    "openai_requests_total", "OpenAI API calls by endpoint, model and outcome."
+)
+OPENAI_LATENCY = REGISTRY.histogram(
+    "openai_request_seconds", "OpenAI API call latency by endpoint and model."
+)
+ANKI_REQUESTS = REGISTRY.counter(
+    "anki_connect_requests_total", "AnkiConnect actions by name and outcome."
+)
+ANKI_LATENCY = REGISTRY.histogram(
+    "anki_connect_request_seconds",
+    "AnkiConnect round-trip time by action.",
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0),
+)
+OPENAI_USAGE = REGISTRY.counter(
+    "openai_usage_total", "OpenAI usage by endpoint, model and unit (tokens, characters, images)."
+)
+OPENAI_COST = REGISTRY.counter(
+    "openai_cost_dollars_total", "Estimated OpenAI spend in USD by endpoint and model."
+)
+CACHE_LOOKUPS = REGISTRY.counter("cache_lookups_total", "Cache lookups by cache name and result.")
+PREFILTER_DECISIONS = REGISTRY.counter(
+    "gating_prefilter_decisions_total", "Local gating pre-filter outcomes by source (rules, model, deferred)."
+)
+TTS_BATCHES = REGISTRY.counter(
+    "tts_batches_total", "Batched speech requests by outcome (split, fallback)."
+)
+RETRIES = REGISTRY.counter("retries_total", "Card operations retried after a transient error, by operation.")
+DEAD_LETTERS = REGISTRY.counter("dead_letters_total", "Cards written to the dead-letter file, by script.")
+CARDS_PROCESSED = REGISTRY.counter(
+    "cards_processed_total", "Cards finished by the media scripts, by script and status."
+)
+CARDS_PENDING = REGISTRY.gauge("cards_pending", "Cards submitted but not yet finished, by script.")
+JOBS_IN_PROGRESS = REGISTRY.gauge("jobs_in_progress", "Script jobs currently running, by script.")
+JOBS_TOTAL = REGISTRY.counter("jobs_total", "Script jobs launched by the web app, by script and outcome.")
+WATCH_FILES = REGISTRY.counter("watch_files_total", "PDFs handled by the hot-folder watcher, by outcome.")
+HEDGED_REQUESTS = REGISTRY.counter(
+    "hedged_requests_total", "Duplicate requests sent for slow calls, by operation and outcome (issued, won)."
+)
+QUEUE_LEASES = REGISTRY.counter(
+    "work_queue_leases_total", "Shared work-queue leases by outcome (claimed, expired, lost)."
+)
+
+
+@contextmanager
+def _track(counter: Counter, histogram: Histogram, **labels: Any) -> Iterator[None]:
+    started = time.perf_counter()
+    status = "error"
+    try:
+        yield
+        status = "ok"
+    finally:
+        histogram.observe(time.perf_counter() - started, **labels)
+        counter.inc(status=status, **labels)
+
+
+def track_openai(endpoint: str, model: str):
+    """Time an OpenAI call and count it as ok/error."""
+    return _track(OPENAI_REQUESTS, OPENAI_LATENCY, endpoint=endpoint, model=model or "default")
+
+
+def track_anki(action: str):
+    """Time an AnkiConnect round trip and count it as ok/error."""
+    return _track(ANKI_REQUESTS, ANKI_LATENCY, action=action)
+
+
+def report_run(stream=None) -> Dict[str, Dict[str, Any]]:
+    """Emit the end-of-run JSON summary for a CLI script.
+
+    The summary goes to stderr (keeping stdout for card-level progress) and,
+    when ``ANKI_METRICS_FILE`` is set, to that file so the web app can merge it.
+    """
+    summary = REGISTRY.summary()
+    payload = json.dumps(summary, sort_keys=True)
+    print(f"Metrics summary: {payload}", file=stream or sys.stderr)
+    target = os.environ.get(METRICS_FILE_ENV)
+    if target:
+        try:
+            Path(target).write_text(payload, encoding="utf-8")
+        except OSError as exc:
+            print(f"Warning: Failed to write metrics file {target}: {exc}", file=sys.stderr)
+    return summary
+
+
+def merge_file(path: Path) -> bool:
+    """Merge a summary written by ``report_run`` in a child process."""
+    try:
+        summary = json.loads(Path(path).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return False
+    REGISTRY.merge(summary)
+    return True
@@ -0,0 +1,161 @@
+"""A note's Front/Back fields, parsed once and shared by every consumer.
+
+The scripts and the web app read the same two fields for different
+purposes: gating inputs, image prompts, speech input and the gallery.
+``Note`` computes each of those views the first time it is asked for and
+keeps it, so a run cleans a field once instead of once per stage.
+It unpacks and indexes like the ``(note_id, front, back)`` tuples the
+scripts pass around, so code written against tuples accepts it unchanged.
+"""
+
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+from utils.common import HTML_TAG_RE, IMG_SRC_RE, IMG_TAG_RE, SOUND_TAG_RE
+
+
+def clean_text(text: str) -> str:
+    """Strip HTML tags and collapse whitespace."""
+    return " ".join(HTML_TAG_RE.sub(" ", text or "").split())
+
+
+def strip_image_tags(text: str) -> str:
+    """Remove any <img> tags so they can be replaced or deleted cleanly."""
+    return IMG_TAG_RE.sub("", text)
+
+
+def image_filename(html: str) -> str:
+    """Name of the first image a field references, or ``""``."""
+    match = IMG_SRC_RE.search(html or "")
+    return Path(match.group(1)).name if match else ""
+
+
+class _view:
+    """Compute a note attribute on first access and keep it in its slot."""
+
+    def __init__(self, compute: Callable[["Note"], Any]) -> None:
+        self.compute = compute
+        self.slot = f"_{compute.__name__}"
+        self.__doc__ = compute.__doc__
+
+    def __get__(self, note: Optional["Note"], owner: type) -> Any:
+        if note is None:
+            return self
+        value = getattr(note, self.slot)
+        if value is None:
+            value = self.compute(note)
+            setattr(note, self.slot, value)
+        return value
+
+
+_VIEWS = (
+    "front_without_images",
+    "back_without_images",
+    "front_without_sound",
+    "clean_front",
+    "clean_back",
+    "prompt_back",
+    "gating_front",
+    "spoken_front",
+    "image_filename",
+)
+
+
+class Note:
+    __slots__ = ("note_id", "front", "back") + tuple(f"_{name}" for name in _VIEWS)
+
+    def __init__(self, note_id: int, front: str, back: str) -> None:
+        self.note_id = note_id
+        self.front = front
+        self.back = back
+        self._front_without_images = self._back_without_images = self._front_without_sound = None
+        self._clean_front = self._clean_back = self._prompt_back = self._gating_front = None
+        self._spoken_front = self._image_filename = None
+
+    @classmethod
+    def of(cls, card: Union["Note", Tuple[int, str, str]]) -> "Note":
+        return card if isinstance(card, Note) else cls(*card)
+
+    @_view
+    def front_without_images(self) -> str:
+        return strip_image_tags(self.front)
+
+    @_view
+    def back_without_images(self) -> str:
+        return strip_image_tags(self.back)
+
+    @_view
+    def front_without_sound(self) -> str:
+        """The front with its ``[sound:...]`` tags removed, ready for new audio."""
+        return SOUND_TAG_RE.sub("", self.front)
+
+    @_view
+    def clean_front(self) -> str:
+        return clean_text(self.front)
+
+    @_view
+    def clean_back(self) -> str:
+        return clean_text(self.back)
+
+    @_view
+    def prompt_back(self) -> str:
+        """The back as it goes into gating and image prompts."""
+        return clean_text(self.back_without_images)
+
+    @_view
+    def gating_front(self) -> str:
+        return clean_text(self.front_without_images) or self.front_without_images
+
+    @_view
+    def spoken_front(self) -> str:
+        """The text sent to text-to-speech."""
+        return clean_text(self.front_without_sound)
+
+    @_view
+    def image_filename(self) -> str:
+        return image_filename(self.front) or image_filename(self.back)
+
+    @property
+    def has_sound(self) -> bool:
+        return "[sound" in self.front
+
+    @property
+    def has_image(self) -> bool:
+        return IMG_TAG_RE.search(self.front) is not None or IMG_TAG_RE.search(self.back) is not None
+
+    def __iter__(self) -> Iterator[Any]:
+        return iter((self.note_id, self.front, self.back))
+
+    def __getitem__(self, index: Any) -> Any:
+        return (self.note_id, self.front, self.back)[index]
+
+    def __len__(self) -> int:
+        return 3
+
+    def __eq__(self, other: object) -> bool:
+        if isinstance(other, (Note, tuple)):
+            return tuple(self) == tuple(other)
+        return NotImplemented
+
+    def __hash__(self) -> int:
+        return hash((self.note_id, self.front, self.back))
+
+    def __repr__(self) -> str:
+        return f"Note({self.note_id!r}, {self.front!r}, {self.back!r})"
+
+
+def from_notes_info(
+    infos: Iterable[Dict[str, Any]], note_ids: Optional[Iterable[int]] = None
+) -> List[Note]:
+    """Notes from a ``notesInfo`` answer; entries for deleted notes (``{}``) are left out.
+
+    ``note_ids`` are the IDs the request asked for, in order; without them each
+    entry's ``noteId`` is used.
+    """
+    infos = list(infos)
+    ids = list(note_ids) if note_ids is not None else [info.get("noteId") for info in infos]
+    return [
+        Note(note_id, info["fields"]["Front"]["value"], info["fields"]["Back"]["value"])
+        for note_id, info in zip(ids, infos)
+        if info
+    ]
@@ -0,0 +1,280 @@
+"""Retry transient card failures within a run, and dead-letter what still fails.
+
+``is_retryable`` sorts an error into transient (rate limits, timeouts,
+dropped connections, 5xx answers, a busy Anki collection) or permanent
+(bad requests, conflicts, exhausted quota, rejected notes, anything
+unrecognised). ``call`` re-runs a
+``(status, text, error)`` card function on transient errors with
+exponential backoff and full jitter, honouring ``Retry-After`` and never
+sleeping past the run's time budget.
+
+Cards that still fail are appended to a dead-letter JSONL file with their
+note, text, settings and error, so ``AnkiDeadLetter.py replay`` can
+reprocess only those cards instead of the whole deck.
+"""
+
+import argparse
+from datetime import datetime, timezone
+import json
+import os
+from pathlib import Path
+import random
+import threading
+import time
+import urllib.error
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from utils import metrics
+from utils.common import MEDIA_DIR
+
+DEAD_LETTER_PATH = MEDIA_DIR / "dead_letter.jsonl"
+DEFAULT_ATTEMPTS = 3
+BASE_DELAY = 1.0
+MAX_DELAY = 30.0
+RETRYABLE_STATUS = {408, 429}
+# SDK exception classes, matched by name so the SDK is not imported here.
+RETRYABLE_ERROR_NAMES = {"APIConnectionError", "APITimeoutError", "RateLimitError", "InternalServerError"}
+# API error codes that no amount of waiting fixes, even when sent with a 429.
+PERMANENT_ERROR_CODES = {"insufficient_quota"}
+# AnkiConnect answers these while the collection is briefly unavailable (e.g. during a sync).
+TRANSIENT_MESSAGES = ("collection is not available", "database is locked")
+
+
+class RetriesExhausted(Exception):
+    """A transient error that kept happening until the attempts ran out."""
+
+    def __init__(self, error: BaseException, attempts: int) -> None:
+        super().__init__(f"{error} (gave up after {attempts} attempts)")
+        self.error = error
+        self.attempts = attempts
+
+
+def _causes(error: BaseException) -> Iterable[BaseException]:
+    seen = set()
+    while error is not None and id(error) not in seen:
+        seen.add(id(error))
+        yield error
+        error = error.__cause__ or error.__context__
+
+
+def _status(error: BaseException) -> Optional[int]:
+    status = getattr(error, "status_code", None)
+    if status is None and isinstance(error, urllib.error.HTTPError):
+        status = error.code
+    return status if isinstance(status, int) else None
+
+
+def _error_code(error: BaseException) -> Optional[str]:
+    code = getattr(error, "code", None)
+    body = getattr(error, "body", None)
+    if not isinstance(code, str) and isinstance(body, dict):
+        code = body.get("code") or (body.get("error") or {}).get("code")
+    return code if isinstance(code, str) else None
+
+
+def is_retryable(error: BaseException) -> bool:
+    """True for errors that may succeed if the same call is made again later."""
+    if isinstance(error, RetriesExhausted):
+        error = error.error
+    for cause in _causes(error):
+        # Errors relayed from another process say so themselves.
+        if isinstance(getattr(cause, "retryable", None), bool):
+            return cause.retryable
+        if _error_code(cause) in PERMANENT_ERROR_CODES:
+            return False
+        status = _status(cause)
+        if status is not None:
+            return status in RETRYABLE_STATUS or status >= 500
+        names = {cls.__name__ for cls in type(cause).__mro__}
+        if names & RETRYABLE_ERROR_NAMES:
+            return True
+        if isinstance(cause, (ConnectionError, TimeoutError, urllib.error.URLError)):
+            return True
+        if any(message in str(cause).lower() for message in TRANSIENT_MESSAGES):
+            return True
+    return False
+
+
+def retry_after(error: BaseException) -> Optional[float]:
+    """Seconds the server asked us to wait, if it said."""
+    for cause in _causes(error):
+        headers = getattr(getattr(cause, "response", None), "headers", None) or getattr(cause, "headers", None)
+        value = headers.get("retry-after") if headers is not None else None
+        if value:
+            try:
+                return max(0.0, float(value))
+            except ValueError:
+                return None
+    return None
+
+
+class RetryPolicy:
+    def __init__(
+        self,
+        attempts: int = DEFAULT_ATTEMPTS,
+        base_delay: float = BASE_DELAY,
+        max_delay: float = MAX_DELAY,
+        budget: Any = None,
+        sleep: Callable[[float], None] = time.sleep,
+        rng: Callable[[], float] = random.random,
+    ) -> None:
+        self.attempts = max(1, attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        # A ``scheduling.RunBudget``; no backoff may outlast it.
+        self.budget = budget
+        self._sleep = sleep
+        self._rng = rng
+
+    def backoff(self, attempt: int, error: Optional[BaseException] = None) -> float:
+        """Delay before retry number ``attempt`` (1-based): full jitter over an exponential cap."""
+        requested = retry_after(error) if error is not None else None
+        if requested is not None:
+            return min(requested, self.max_delay)
+        return self._rng() * min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+
+    def call(self, fn: Callable[..., Tuple[str, str, Any]], *args: Any, **kwargs: Any) -> Tuple[str, str, Any]:
+        """Run a card function, retrying while it reports a retryable error."""
+        for attempt in range(1, self.attempts + 1):
+            status, text, error = fn(*args, **kwargs)
+            if status != "error" or not isinstance(error, BaseException) or not is_retryable(error):
+                return (status, text, error)
+            if attempt == self.attempts:
+                break
+            delay = self.backoff(attempt, error)
+            remaining = self.budget.remaining() if self.budget is not None else None
+            if remaining is not None and delay >= remaining:
+                break
+            metrics.RETRIES.inc(operation=getattr(fn, "__name__", "card").lstrip("_"))
+            self._sleep(delay)
+        return (status, text, RetriesExhausted(error, attempt) if attempt > 1 else error)
+
+
+_policy = RetryPolicy()
+
+
+def configure(attempts: int = DEFAULT_ATTEMPTS, budget: Any = None) -> RetryPolicy:
+    """Set the policy ``call`` uses for the rest of the run."""
+    global _policy
+    _policy = RetryPolicy(attempts, budget=budget)
+    return _policy
+
+
+def call(fn: Callable[..., Tuple[str, str, Any]], *args: Any, **kwargs: Any) -> Tuple[str, str, Any]:
+    return _policy.call(fn, *args, **kwargs)
+
+
+def add_retry_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument(
+        "--attempts",
+        type=int,
+        default=int(os.environ.get("ANKI_RETRY_ATTEMPTS", str(DEFAULT_ATTEMPTS))),
+        help=(
+            "Tries per card for transient errors (rate limits, timeouts, 5xx), with "
+            "exponential backoff between them (default: ANKI_RETRY_ATTEMPTS or %(default)s)."
+        ),
+    )
+    parser.add_argument(
+        "--dead-letter",
+        type=Path,
+        default=DEAD_LETTER_PATH,
+        help="JSONL file that records cards which still failed, for AnkiDeadLetter.py replay.",
+    )
+    parser.add_argument(
+        "--no-dead-letter",
+        action="store_true",
+        help="Do not record failed cards.",
+    )
+
+
+def entry_key(entry: Dict[str, Any]) -> Tuple[Any, ...]:
+    return (entry.get("script"), entry.get("note_id"), entry.get("apkg"))
+
+
+class DeadLetterFile:
+    def __init__(self, path: Path = DEAD_LETTER_PATH) -> None:
+        self.path = Path(path)
+        self._lock = threading.Lock()
+
+    def append(self, entry: Dict[str, Any]) -> None:
+        with self._lock:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as handle:
+                handle.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+    def entries(self) -> List[Dict[str, Any]]:
+        """The latest entry for each card; unreadable lines are skipped."""
+        if not self.path.exists():
+            return []
+        latest: Dict[Tuple[Any, ...], Dict[str, Any]] = {}
+        with self._lock, open(self.path, encoding="utf-8") as handle:
+            for line in handle:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                if isinstance(entry, dict) and entry.get("note_id") is not None:
+                    latest.pop(entry_key(entry), None)
+                    latest[entry_key(entry)] = entry
+        return list(latest.values())
+
+    def rewrite(self, entries: Iterable[Dict[str, Any]]) -> None:
+        """Replace the file's contents atomically; an empty list removes it."""
+        lines = [json.dumps(entry, ensure_ascii=False) + "\n" for entry in entries]
+        with self._lock:
+            if not lines:
+                self.path.unlink(missing_ok=True)
+                return
+            partial = self.path.with_name(self.path.name + ".partial")
+            partial.write_text("".join(lines), encoding="utf-8")
+            os.replace(partial, self.path)
+
+
+_dead_letters: Optional[DeadLetterFile] = None
+
+
+def enable_dead_letters(path: Optional[Path] = DEAD_LETTER_PATH) -> Optional[DeadLetterFile]:
+    """Start (or, with ``None``, stop) recording cards that fail for good."""
+    global _dead_letters
+    _dead_letters = DeadLetterFile(path) if path is not None else None
+    return _dead_letters
+
+
+def dead_letter_entry(
+    script: str,
+    card: Tuple[int, str, str],
+    error: Any,
+    *,
+    deck: str,
+    options: Dict[str, Any],
+    apkg: Optional[Path] = None,
+    stage: Optional[str] = None,
+    fingerprint: Optional[str] = None,
+) -> Dict[str, Any]:
+    """Everything needed to reprocess ``card`` later, plus why it failed."""
+    cause = error.error if isinstance(error, RetriesExhausted) else error
+    return {
+        "script": script,
+        "deck": deck,
+        "note_id": card[0],
+        "front": card[1],
+        "back": card[2],
+        "stage": stage,
+        "options": options,
+        "apkg": str(apkg) if apkg else None,
+        "fingerprint": fingerprint,
+        "error": str(error),
+        "error_type": type(cause).__name__,
+        "retryable": isinstance(cause, BaseException) and is_retryable(cause),
+        "attempts": error.attempts if isinstance(error, RetriesExhausted) else 1,
+        "failed_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+    }
+
+
+def dead_letter(script: str, card: Tuple[int, str, str], error: Any, **details: Any) -> None:
+    """Append a failed card to the enabled dead-letter file; a no-op when none is."""
+    target = _dead_letters
+    if target is None:
+        return
+    target.append(dead_letter_entry(script, card, error, **details))
+    metrics.DEAD_LETTERS.inc(script=script)
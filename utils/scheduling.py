@@ -0,0 +1,153 @@
+"""Work ordering and run budgets shared by the media generators.
+
+``review_priorities`` asks AnkiConnect when each note's cards come up next
+so a deck can be processed in review order: by the day each card is due,
+with a new card due on the day the deck's new-cards/day limit lets Anki
+introduce it, and suspended or buried cards last. ``RunBudget`` stops a
+run from starting new cards once its time limit has passed or its OpenAI
+spend (from ``utils.costs``) reaches its cost limit; in-flight cards still
+finish, so spend can overshoot by what the cards already running cost.
+"""
+
+from datetime import date
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from utils import costs
+
+ORDER_CHOICES = ("deck", "review")
+# cardsInfo per request; keeps each AnkiConnect body small.
+CARD_QUERY_CHUNK = 500
+# Anki card queues: 1 = learning (due is a timestamp), 3 = day learning,
+# 2 = review (due is a day number), 0 = new (due is the new-card position).
+# The rank only breaks ties between cards due on the same day.
+QUEUE_RANKS = {1: 0, 3: 1, 2: 2, 0: 3}
+UNSCHEDULED_RANK = 4
+# Day given to suspended and buried cards, which are never shown.
+NEVER = 1 << 62
+# Anki's default when the deck options cannot be read.
+DEFAULT_NEW_PER_DAY = 20
+# Days ahead resolved exactly; anything later sorts after them by due day.
+MAX_HORIZON_DAYS = 365
+
+# (days until due, queue rank, due)
+Priority = Tuple[int, int, int]
+
+
+def card_priority(card: Dict[str, Any], day: int) -> Priority:
+    rank = QUEUE_RANKS.get(card.get("queue"), UNSCHEDULED_RANK)
+    return (NEVER if rank == UNSCHEDULED_RANK else day, rank, int(card.get("due") or 0))
+
+
+def learning_day(due: int) -> int:
+    """Days from today until a learning card's ``due`` timestamp; 0 when already due."""
+    return max(0, (date.fromtimestamp(due) - date.today()).days)
+
+
+def new_card_days(deckname: str, invoke: Callable[..., Any], cards: List[Dict[str, Any]]) -> Dict[int, int]:
+    """Map new card IDs to the day Anki will introduce them, from the deck's new-cards/day limit.
+
+    Nothing is returned when the limit is 0, since such cards are never introduced.
+    """
+    config = invoke("getDeckConfig", deck=deckname) or {}
+    per_day = int((config.get("new") or {}).get("perDay", DEFAULT_NEW_PER_DAY))
+    if per_day <= 0:
+        return {}
+    ordered = sorted(cards, key=lambda card: int(card.get("due") or 0))
+    return {card["cardId"]: position // per_day for position, card in enumerate(ordered)}
+
+
+def scheduled_days(deckname: str, invoke: Callable[..., Any], horizon: int) -> Dict[int, int]:
+    """Map review and day-learning card IDs due within ``horizon`` days to their day, 0 when overdue.
+
+    AnkiConnect does not expose the collection's current day number, so
+    ``prop:due`` searches, which count from today, go in one ``multi`` request.
+    """
+    searches = ["prop:due<=0", *(f"prop:due={day}" for day in range(1, horizon + 1))]
+    # Version 6 per action, so each answer is a result/error pair.
+    actions = [
+        {"action": "findCards", "params": {"query": f'deck:"{deckname}" {search}'}, "version": 6}
+        for search in searches
+    ]
+    days: Dict[int, int] = {}
+    for day, answer in enumerate(invoke("multi", actions=actions)):
+        if answer.get("error") is not None:
+            raise RuntimeError(f"AnkiConnect search failed for deck '{deckname}': {answer['error']}")
+        for card_id in answer["result"]:
+            days.setdefault(card_id, day)
+    return days
+
+
+def review_priorities(deckname: str, invoke: Callable[..., Any]) -> Dict[int, Priority]:
+    """Return the most urgent card priority for every note in ``deckname``.
+
+    Cards due after the last new card or learning step, or more than
+    ``MAX_HORIZON_DAYS`` ahead, share the day after it and sort by due day.
+    ``invoke`` is the AnkiConnect helper from ``AnkiSync``.
+    """
+    card_ids = invoke("findCards", query=f'deck:"{deckname}"')
+    cards = [
+        card
+        for start in range(0, len(card_ids), CARD_QUERY_CHUNK)
+        for card in invoke("cardsInfo", cards=card_ids[start:start + CARD_QUERY_CHUNK])
+        if card
+    ]
+    days = new_card_days(deckname, invoke, [card for card in cards if card.get("queue") == 0])
+    days.update((card["cardId"], learning_day(int(card["due"]))) for card in cards if card.get("queue") == 1)
+    horizon = min(MAX_HORIZON_DAYS, max(days.values(), default=0) + 1)
+    if any(card.get("queue") in (2, 3) for card in cards):
+        scheduled = scheduled_days(deckname, invoke, horizon)
+        days.update(
+            (card["cardId"], scheduled[card["cardId"]])
+            for card in cards
+            if card.get("queue") in (2, 3) and card["cardId"] in scheduled
+        )
+    priorities: Dict[int, Priority] = {}
+    for card in cards:
+        note_id = card["note"]
+        priority = card_priority(card, min(days.get(card["cardId"], horizon + 1), horizon + 1))
+        if note_id not in priorities or priority < priorities[note_id]:
+            priorities[note_id] = priority
+    return priorities
+
+
+def order_by_review(
+    cards: Iterable[Tuple[int, str, str]], priorities: Dict[int, Priority]
+) -> List[Tuple[int, str, str]]:
+    """Sort ``(note_id, front, back)`` cards by priority; unknown notes keep their order at the end."""
+    unknown = (NEVER, UNSCHEDULED_RANK + 1, 0)
+    return sorted(cards, key=lambda card: priorities.get(card[0], unknown))
+
+
+class RunBudget:
+    def __init__(
+        self,
+        max_seconds: Optional[float] = None,
+        max_cost: Optional[float] = None,
+        spent: Callable[[], float] = costs.spent,
+    ) -> None:
+        self.started = time.monotonic()
+        self.max_seconds = max_seconds if max_seconds and max_seconds > 0 else None
+        self.max_cost = max_cost if max_cost and max_cost > 0 else None
+        self._spent = spent
+
+    def remaining(self) -> Optional[float]:
+        """Seconds left, or None when the run has no time limit."""
+        if self.max_seconds is None:
+            return None
+        return max(0.0, self.max_seconds - (time.monotonic() - self.started))
+
+    def exhausted(self) -> Optional[str]:
+        """Return why no new work may start, or None while within budget."""
+        if self.remaining() == 0.0:
+            return f"time budget of {self.max_seconds:g}s reached"
+        if self.max_cost is not None and self._spent() >= self.max_cost:
+            return f"cost budget of {costs.format_usd(self.max_cost)} reached"
+        return None
+
+    def call(self, text: str, fn: Callable[..., Tuple[str, str, Any]], *args: Any, **kwargs: Any) -> Tuple[str, str, Any]:
+        """Run ``fn`` unless the budget is spent, in which case report the card as deferred."""
+        reason = self.exhausted()
+        if reason is not None:
+            return ("deferred", text, reason)
+        return fn(*args, **kwargs)
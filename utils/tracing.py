@@ -0,0 +1,152 @@
+"""Opt-in span tracing with Chrome/Perfetto trace-event export.
+
+Spans are no-ops until a session is started with ``--trace FILE``, so the
+instrumentation can stay in hot paths. Sampled-out runs pay a single
+attribute check per span.
+"""
+
+import argparse
+from contextlib import contextmanager, nullcontext
+import cProfile
+import json
+import os
+from pathlib import Path
+import random
+import threading
+import time
+from typing import Any, Dict, Iterator, List, Optional
+
+_NULL_SPAN = nullcontext()
+
+
+class Tracer:
+    def __init__(self) -> None:
+        self.enabled = False
+        self._lock = threading.Lock()
+        self._events: List[Dict[str, Any]] = []
+        self._thread_names: Dict[int, str] = {}
+        self._origin = time.perf_counter()
+
+    def start(self) -> None:
+        with self._lock:
+            self._events = []
+            self._thread_names = {}
+            self._origin = time.perf_counter()
+        self.enabled = True
+
+    def stop(self) -> None:
+        self.enabled = False
+
+    def span(self, name: str, **args: Any):
+        if not self.enabled:
+            return _NULL_SPAN
+        return self._record(name, args)
+
+    @contextmanager
+    def _record(self, name: str, args: Dict[str, Any]) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            finished = time.perf_counter()
+            thread = threading.current_thread()
+            event = {
+                "name": name,
+                "ph": "X",
+                "ts": round((started - self._origin) * 1_000_000, 3),
+                "dur": round((finished - started) * 1_000_000, 3),
+                "pid": os.getpid(),
+                "tid": thread.ident,
+            }
+            if args:
+                event["args"] = {key: str(value) for key, value in args.items()}
+            with self._lock:
+                self._events.append(event)
+                self._thread_names.setdefault(thread.ident, thread.name)
+
+    def events(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            events = list(self._events)
+            thread_names = dict(self._thread_names)
+        metadata = [
+            {
+                "name": "thread_name",
+                "ph": "M",
+                "pid": os.getpid(),
+                "tid": tid,
+                "args": {"name": name},
+            }
+            for tid, name in thread_names.items()
+        ]
+        return metadata + events
+
+    def write(self, path: Path) -> int:
+        events = self.events()
+        Path(path).write_text(
+            json.dumps({"traceEvents": events, "displayTimeUnit": "ms"}),
+            encoding="utf-8",
+        )
+        return len(events)
+
+
+TRACER = Tracer()
+
+
+def span(name: str, **args: Any):
+    """Time a block as a complete ("X") trace event on the current thread."""
+    return TRACER.span(name, **args)
+
+
+def add_trace_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument(
+        "--trace",
+        type=Path,
+        help="Write a Chrome/Perfetto trace-event JSON file of per-stage timings.",
+    )
+    parser.add_argument(
+        "--trace-sample",
+        type=float,
+        default=float(os.environ.get("ANKI_TRACE_SAMPLE", "1.0")),
+        help="Probability that a run with --trace actually records (default: %(default)s).",
+    )
+    parser.add_argument(
+        "--profile",
+        type=Path,
+        help="Write a cProfile dump of the main thread (load with pstats or snakeviz).",
+    )
+
+
+@contextmanager
+def session(
+    trace_path: Optional[Path],
+    profile_path: Optional[Path] = None,
+    sample_rate: float = 1.0,
+) -> Iterator[None]:
+    """Record spans (and optionally profile) for the duration of the block."""
+    tracing = bool(trace_path) and random.random() < sample_rate
+    profiler = cProfile.Profile() if profile_path else None
+    if tracing:
+        TRACER.start()
+    if profiler:
+        profiler.enable()
+    try:
+        yield
+    finally:
+        if profiler:
+            profiler.disable()
+            profiler.dump_stats(str(profile_path))
+            print(f"Wrote profile to {profile_path}.")
+        if tracing:
+            TRACER.stop()
+            count = TRACER.write(trace_path)
+            print(f"Wrote {count} trace events to {trace_path}.")
+        elif trace_path:
+            print("Trace not recorded for this run (sampled out).")
+
+
+def session_from_args(args: argparse.Namespace):
+    return session(
+        getattr(args, "trace", None),
+        getattr(args, "profile", None),
+        getattr(args, "trace_sample", 1.0),
+    )
@@ -0,0 +1,335 @@
+"""A shared SQLite work queue for generating one deck's media on many machines.
+
+A coordinator submits a job (script, deck, settings) with one task per
+candidate card. Workers claim pending tasks under a lease, which they
+renew with heartbeats while they work, generate the media and report the
+AnkiConnect writes it needs. The coordinator is the only process that
+talks to Anki: it applies reported writes and marks the tasks done.
+
+A lease that is not renewed in time expires and the task goes back to
+pending for another worker; after ``MAX_CLAIMS`` expiries it is reported
+as failed instead, so a card that crashes every worker cannot loop
+forever. Each claim carries a fresh token and ``report`` only accepts the
+current one, so a worker that lost its lease cannot overwrite the result
+of the worker that took the card over: every card is written to Anki
+once.
+
+The file can live on a shared volume as long as it supports POSIX file
+locks (NFSv4, SMB with locking; not sshfs). It uses SQLite's default
+rollback journal, because WAL needs shared memory that network
+filesystems do not provide.
+"""
+
+import base64
+from contextlib import contextmanager
+import json
+from pathlib import Path
+import sqlite3
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Union
+import uuid
+
+from utils import metrics, retry
+from utils.common import MEDIA_DIR
+
+QUEUE_PATH = MEDIA_DIR / "work_queue.sqlite3"
+DEFAULT_LEASE_SECONDS = 120.0
+# Lease expiries before a card is given up on and reported as failed.
+MAX_CLAIMS = 3
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    script TEXT NOT NULL,
+    deck TEXT NOT NULL,
+    backend TEXT NOT NULL,
+    options TEXT NOT NULL DEFAULT '{}',
+    created_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS tasks (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    job_id INTEGER NOT NULL REFERENCES jobs (id),
+    note_id INTEGER NOT NULL,
+    front TEXT NOT NULL,
+    back TEXT NOT NULL,
+    fingerprint TEXT,
+    state TEXT NOT NULL DEFAULT 'pending',
+    worker TEXT,
+    lease_token TEXT,
+    lease_expires REAL,
+    claims INTEGER NOT NULL DEFAULT 0,
+    status TEXT,
+    text TEXT,
+    error TEXT,
+    retryable INTEGER NOT NULL DEFAULT 0,
+    operations TEXT,
+    updated_at REAL NOT NULL,
+    UNIQUE (job_id, note_id)
+);
+CREATE INDEX IF NOT EXISTS tasks_state ON tasks (state, lease_expires);
+"""
+STATES = ("pending", "leased", "reported", "done")
+
+
+class RemoteError(Exception):
+    """A card error reported by a worker, as text, with its retryability preserved."""
+
+    def __init__(self, message: str, retryable: bool = False) -> None:
+        super().__init__(message)
+        self.retryable = retryable
+
+
+class RecordedWrites:
+    """Stands in for ``DeckPackage``: records a card's writes as AnkiConnect actions.
+
+    Workers hand this to the scripts' ``process_card`` so nothing reaches
+    Anki from a worker; the actions travel back through the queue and the
+    coordinator sends them with ``multi``. Each action names API version 6,
+    without which ``multi`` returns bare results instead of result/error pairs.
+    """
+
+    def __init__(self) -> None:
+        self.actions: List[Dict[str, Any]] = []
+
+    def update_note_fields(self, note: Dict[str, Any]) -> None:
+        self.actions.append({"action": "updateNoteFields", "params": {"note": note}, "version": 6})
+
+    def add_media(self, filename: str, data: Union[bytes, Path]) -> None:
+        content = data if isinstance(data, bytes) else Path(data).read_bytes()
+        self.actions.append(
+            {
+                "action": "storeMediaFile",
+                "params": {
+                    "filename": filename,
+                    "data": base64.b64encode(content).decode("ascii"),
+                    "deleteExisting": True,
+                },
+                "version": 6,
+            }
+        )
+
+
+class WorkQueue:
+    def __init__(
+        self,
+        path: Path = QUEUE_PATH,
+        *,
+        max_claims: int = MAX_CLAIMS,
+        clock: Callable[[], float] = time.time,
+    ) -> None:
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_claims = max(1, max_claims)
+        # Leases are compared across machines, so this is wall-clock time.
+        self._clock = clock
+        self._lock = threading.Lock()
+        # Autocommit; every write below runs in an explicit BEGIN IMMEDIATE.
+        self._conn = sqlite3.connect(str(self.path), timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock:
+            self._conn.executescript(SCHEMA)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        """Hold the write lock on the database file from the first statement."""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._conn
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    def submit(
+        self,
+        script: str,
+        deck: str,
+        backend: str,
+        options: Dict[str, Any],
+        cards: Iterable[Any],
+        fingerprints: Optional[Dict[int, str]] = None,
+    ) -> int:
+        """Queue one task per ``(note_id, front, back)`` card; return the job ID."""
+        fingerprints = fingerprints or {}
+        now = self._clock()
+        with self._transaction() as conn:
+            job_id = conn.execute(
+                "INSERT INTO jobs (script, deck, backend, options, created_at) VALUES (?, ?, ?, ?, ?)",
+                (script, deck, backend, json.dumps(options, sort_keys=True, ensure_ascii=False), now),
+            ).lastrowid
+            conn.executemany(
+                "INSERT OR IGNORE INTO tasks (job_id, note_id, front, back, fingerprint, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [(job_id, card[0], card[1], card[2], fingerprints.get(card[0]), now) for card in cards],
+            )
+        return job_id
+
+    def _reclaim(self, conn: sqlite3.Connection, now: float) -> int:
+        expired = conn.execute(
+            "SELECT id, worker, claims FROM tasks WHERE state = 'leased' AND lease_expires < ?", (now,)
+        ).fetchall()
+        for row in expired:
+            if row["claims"] >= self.max_claims:
+                conn.execute(
+                    "UPDATE tasks SET state = 'reported', status = 'error', text = front, error = ?, "
+                    "retryable = 1, operations = NULL, lease_token = NULL, lease_expires = NULL, "
+                    "updated_at = ? WHERE id = ?",
+                    (
+                        f"Lease expired {row['claims']} time(s); last held by {row['worker']}.",
+                        now,
+                        row["id"],
+                    ),
+                )
+            else:
+                conn.execute(
+                    "UPDATE tasks SET state = 'pending', worker = NULL, lease_token = NULL, "
+                    "lease_expires = NULL, updated_at = ? WHERE id = ?",
+                    (now, row["id"]),
+                )
+        if expired:
+            metrics.QUEUE_LEASES.inc(len(expired), outcome="expired")
+        return len(expired)
+
+    def reclaim(self) -> int:
+        """Return expired leases to pending (or fail them); the number reclaimed."""
+        with self._transaction() as conn:
+            return self._reclaim(conn, self._clock())
+
+    def claim(
+        self,
+        worker: str,
+        backend: str,
+        limit: int = 1,
+        lease_seconds: float = DEFAULT_LEASE_SECONDS,
+    ) -> List[Dict[str, Any]]:
+        """Lease up to ``limit`` pending tasks for jobs that use ``backend``."""
+        now = self._clock()
+        claimed: List[Dict[str, Any]] = []
+        with self._transaction() as conn:
+            self._reclaim(conn, now)
+            rows = conn.execute(
+                "SELECT tasks.id, tasks.job_id, tasks.note_id, tasks.front, tasks.back, tasks.fingerprint, "
+                "jobs.script, jobs.deck, jobs.backend, jobs.options "
+                "FROM tasks JOIN jobs ON jobs.id = tasks.job_id "
+                "WHERE tasks.state = 'pending' AND jobs.backend = ? ORDER BY tasks.id LIMIT ?",
+                (backend, max(1, limit)),
+            ).fetchall()
+            for row in rows:
+                token = uuid.uuid4().hex
+                conn.execute(
+                    "UPDATE tasks SET state = 'leased', worker = ?, lease_token = ?, lease_expires = ?, "
+                    "claims = claims + 1, updated_at = ? WHERE id = ?",
+                    (worker, token, now + lease_seconds, now, row["id"]),
+                )
+                task = dict(row)
+                task["options"] = json.loads(task["options"])
+                task["token"] = token
+                claimed.append(task)
+        if claimed:
+            metrics.QUEUE_LEASES.inc(len(claimed), outcome="claimed")
+        return claimed
+
+    def heartbeat(self, held: Dict[int, str], lease_seconds: float = DEFAULT_LEASE_SECONDS) -> List[int]:
+        """Extend the leases in ``{task_id: token}``; return the IDs that are no longer held."""
+        if not held:
+            return []
+        now = self._clock()
+        lost = []
+        with self._transaction() as conn:
+            for task_id, token in held.items():
+                updated = conn.execute(
+                    "UPDATE tasks SET lease_expires = ?, updated_at = ? "
+                    "WHERE id = ? AND lease_token = ? AND state = 'leased'",
+                    (now + lease_seconds, now, task_id, token),
+                ).rowcount
+                if not updated:
+                    lost.append(task_id)
+        if lost:
+            metrics.QUEUE_LEASES.inc(len(lost), outcome="lost")
+        return lost
+
+    def report(
+        self,
+        task_id: int,
+        token: str,
+        status: str,
+        text: str,
+        error: Any = None,
+        operations: Optional[List[Dict[str, Any]]] = None,
+    ) -> bool:
+        """Store a task's result; False (and nothing stored) when the lease was lost."""
+        retryable = isinstance(error, BaseException) and retry.is_retryable(error)
+        with self._transaction() as conn:
+            updated = conn.execute(
+                "UPDATE tasks SET state = 'reported', status = ?, text = ?, error = ?, retryable = ?, "
+                "operations = ?, lease_token = NULL, lease_expires = NULL, updated_at = ? "
+                "WHERE id = ? AND lease_token = ? AND state = 'leased'",
+                (
+                    status,
+                    text,
+                    None if error is None else str(error),
+                    int(retryable),
+                    json.dumps(operations or [], ensure_ascii=False),
+                    self._clock(),
+                    task_id,
+                    token,
+                ),
+            ).rowcount
+        if not updated:
+            metrics.QUEUE_LEASES.inc(outcome="lost")
+        return bool(updated)
+
+    def reported(self, job_id: int, limit: int = 50) -> List[Dict[str, Any]]:
+        """Results waiting for the coordinator to apply, oldest first."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, note_id, front, back, fingerprint, worker, claims, status, text, error, "
+                "retryable, operations FROM tasks WHERE job_id = ? AND state = 'reported' ORDER BY id LIMIT ?",
+                (job_id, max(1, limit)),
+            ).fetchall()
+        results = []
+        for row in rows:
+            result = dict(row)
+            result["operations"] = json.loads(result["operations"] or "[]")
+            result["retryable"] = bool(result["retryable"])
+            results.append(result)
+        return results
+
+    def mark_done(self, task_ids: Iterable[int]) -> None:
+        """Close tasks whose writes were applied, dropping the media they carried."""
+        now = self._clock()
+        with self._transaction() as conn:
+            conn.executemany(
+                "UPDATE tasks SET state = 'done', operations = NULL, updated_at = ? "
+                "WHERE id = ? AND state = 'reported'",
+                [(now, task_id) for task_id in task_ids],
+            )
+
+    def job(self, job_id: int) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job["options"] = json.loads(job["options"])
+        return job
+
+    def jobs(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            rows = self._conn.execute("SELECT id FROM jobs ORDER BY id").fetchall()
+        return [self.job(row["id"]) for row in rows]
+
+    def counts(self, job_id: int) -> Dict[str, int]:
+        """Tasks per state for one job."""
+        counts = dict.fromkeys(STATES, 0)
+        with self._lock:
+            for row in self._conn.execute(
+                "SELECT state, COUNT(*) AS n FROM tasks WHERE job_id = ? GROUP BY state", (job_id,)
+            ):
+                counts[row["state"]] = row["n"]
+        return counts